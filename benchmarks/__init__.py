@@ -0,0 +1,3 @@
+"""
+Нагрузочные тесты (бенчмарки) для bookkeeper
+"""
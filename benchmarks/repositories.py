@@ -0,0 +1,232 @@
+"""
+Бенчмарк репозиториев
+
+Измеряет пропускную способность и перцентили времени выполнения операций
+MemoryRepository и SQLiteRepository на журналах расходов разного размера:
+одиночные add/get/update/delete, полная выборка get_all, выборка
+по условию, поиск по шаблону и пакетные add_many/delete_many.
+
+Результаты выводятся таблицей и могут быть сохранены в JSON. Сохраненный
+ранее файл можно передать как базовый (--baseline): операции, ставшие
+медленнее более чем на допуск, отмечаются как регрессии, и программа
+завершается с кодом 1.
+
+Пример:
+    python -m benchmarks.repositories --sizes 10000 100000 \\
+        --output results.json --baseline baseline.json
+"""
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from time import perf_counter
+from typing import Any, Callable, Iterator
+
+from bookkeeper.ledger_generator import DEFAULT_END, LedgerGenerator
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.abstract_repository import AbstractRepository
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+
+SIZES = [10_000, 100_000, 1_000_000]
+BACKENDS = ['memory', 'sqlite']
+CATEGORIES = list(range(1, 51))
+
+
+@dataclass
+class Result:
+    """
+    Результат измерения одной операции.
+    samples - время выполнения каждого вызова, секунды
+    """
+    backend: str
+    size: int
+    operation: str
+    samples: list[float]
+
+    @property
+    def key(self) -> str:
+        """ Ключ для сравнения с базовыми результатами """
+        return f"{self.backend}/{self.size}/{self.operation}"
+
+    def percentile(self, q: float) -> float:
+        """ q-й перцентиль времени выполнения, секунды """
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+    def as_dict(self) -> dict[str, float]:
+        """ Сводка результата """
+        return {'calls': len(self.samples),
+                'ops_per_sec': len(self.samples) / sum(self.samples),
+                'p50': self.percentile(50),
+                'p95': self.percentile(95),
+                'p99': self.percentile(99)}
+
+
+@contextmanager
+def open_repository(backend: str) -> Iterator[AbstractRepository[Expense]]:
+    """ Создать пустой репозиторий расходов для backend """
+    if backend == 'memory':
+        yield MemoryRepository[Expense]()
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        repo = SQLiteRepository[Expense](db_file=f"{tmp_dir}/bench.db", cls=Expense,
+                                         wal=True, synchronous="NORMAL")
+        try:
+            yield repo
+        finally:
+            repo.close()
+
+
+def measure(operation: Callable[[], Any], calls: int) -> list[float]:
+    """ Выполнить операцию calls раз, вернуть время каждого вызова """
+    samples = []
+    for _ in range(calls):
+        start = perf_counter()
+        operation()
+        samples.append(perf_counter() - start)
+    return samples
+
+
+def run_backend(backend: str, size: int,  # pylint: disable=too-many-arguments
+                calls: int, scan_calls: int, bulk_size: int, seed: int,
+                end: datetime = DEFAULT_END) -> list[Result]:
+    """
+    Заполнить репозиторий size расходами и измерить все операции.
+
+    Parameters
+    ----------
+    calls - число вызовов одиночных операций
+    scan_calls - число вызовов операций, читающих весь журнал
+    bulk_size - число записей в одном вызове пакетных операций
+    end - дата последнего расхода журнала (см. LedgerGenerator)
+    """
+    rnd = random.Random(seed)
+    generator = LedgerGenerator(seed, end)
+    results = []
+
+    with open_repository(backend) as repo:
+        pks = repo.add_many(generator.expenses(size, CATEGORIES))
+        new_exps = generator.expenses(calls + bulk_size * scan_calls, CATEGORIES)
+        added: list[int] = []
+        added_many: list[list[int]] = []
+
+        def add() -> None:
+            added.append(repo.add(next(new_exps)))
+
+        def update() -> None:
+            exp = repo.get(rnd.choice(pks))
+            if exp is not None:
+                exp.amount += 1
+                repo.update(exp)
+
+        def add_many() -> None:
+            batch = [next(new_exps) for _ in range(bulk_size)]
+            added_many.append(repo.add_many(batch))
+
+        operations: list[tuple[str, Callable[[], Any], int]] = [
+            ('add', add, calls),
+            ('get', lambda: repo.get(rnd.choice(pks)), calls),
+            ('update', update, calls),
+            ('delete', lambda: repo.delete(added.pop()), calls),
+            ('get_all', repo.get_all, scan_calls),
+            ('get_all_where', lambda: repo.get_all({'category': rnd.choice(CATEGORIES)}),
+             scan_calls),
+            ('get_all_by_pattern', lambda: repo.get_all_by_pattern({'comment': 'акци'}),
+             scan_calls),
+            ('add_many', add_many, scan_calls),
+            ('delete_many', lambda: repo.delete_many(added_many.pop()), scan_calls),
+        ]
+
+        for name, operation, n_calls in operations:
+            results.append(Result(backend, size, name, measure(operation, n_calls)))
+
+    return results
+
+
+def compare(results: list[Result], baseline: dict[str, dict[str, float]],
+            tolerance: float) -> dict[str, float]:
+    """
+    Сравнить результаты с базовыми. Вернуть {ключ: относительное изменение p50}
+    для всех операций, замедлившихся более чем на tolerance.
+    """
+    regressions = {}
+    for result in results:
+        base = baseline.get(result.key)
+        if base is None or base['p50'] <= 0:
+            continue
+        change = result.percentile(50) / base['p50'] - 1
+        if change > tolerance:
+            regressions[result.key] = change
+    return regressions
+
+
+def format_table(results: list[Result], baseline: dict[str, dict[str, float]]) -> str:
+    """ Представить результаты в виде текстовой таблицы """
+    header = (f"{'backend':<8} {'size':>9} {'operation':<20} {'ops/s':>12} "
+              f"{'p50, ms':>10} {'p95, ms':>10} {'p99, ms':>10} {'vs base':>8}")
+    lines = [header, '-' * len(header)]
+
+    for result in results:
+        stats = result.as_dict()
+        base = baseline.get(result.key)
+        delta = (f"{stats['p50'] / base['p50'] - 1:+.0%}"
+                 if base is not None and base['p50'] > 0 else "")
+        lines.append(f"{result.backend:<8} {result.size:>9} {result.operation:<20} "
+                     f"{stats['ops_per_sec']:>12.1f} {stats['p50'] * 1e3:>10.3f} "
+                     f"{stats['p95'] * 1e3:>10.3f} {stats['p99'] * 1e3:>10.3f} "
+                     f"{delta:>8}")
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    """ Точка входа командной строки """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=BACKENDS)
+    parser.add_argument('--calls', type=int, default=200,
+                        help="число вызовов одиночных операций")
+    parser.add_argument('--scan-calls', type=int, default=3,
+                        help="число вызовов операций над всем журналом")
+    parser.add_argument('--bulk-size', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--end', type=datetime.fromisoformat, default=DEFAULT_END,
+                        help="дата последнего расхода журнала, YYYY-MM-DD")
+    parser.add_argument('--output', help="сохранить результаты в JSON-файл")
+    parser.add_argument('--baseline', help="JSON-файл с базовыми результатами")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="допустимое замедление p50 (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    baseline: dict[str, dict[str, float]] = {}
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)
+
+    results = []
+    for size in args.sizes:
+        for backend in args.backends:
+            results += run_backend(backend, size, args.calls, args.scan_calls,
+                                   args.bulk_size, args.seed, args.end)
+
+    print(format_table(results, baseline))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump({r.key: r.as_dict() for r in results}, file, indent=2)
+
+    regressions = compare(results, baseline, args.tolerance)
+    for key, change in regressions.items():
+        print(f"REGRESSION {key}: p50 {change:+.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
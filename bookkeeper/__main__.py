@@ -2,6 +2,8 @@
 Простая программа для управления личными финансами.
 """
 
+import logging
+import os
 import sys
 
 from PySide6.QtWidgets import QApplication  # pylint: disable=no-name-in-module
@@ -9,25 +11,56 @@ from PySide6.QtWidgets import QApplication  # pylint: disable=no-name-in-module
 from bookkeeper.bookkeeper import Bookkeeper
 
 from bookkeeper.view.view import View
+from bookkeeper.view.refresh_scheduler import RefreshScheduler
 
-from bookkeeper.repository.abstract_repository import repository_factory
+from bookkeeper.repository.abstract_repository import SUMMARY_FIELDS
+from bookkeeper.repository.ledger_registry import LedgerRegistry
 from bookkeeper.repository.sqlite_repository import SQLiteRepository
+from bookkeeper.repository.instrumented_repository import RepositoryMetrics
+from bookkeeper.repository.query_tracer import QueryTracer
 
 ###################
 ## Main finction ##
 ###################
 
+REFRESH_DELAY = 0.03
+
 # Create the application and it's interface object:
 app = QApplication(sys.argv)
-view = View()
+view = View(background=True)
+
+# Repository statistics (dumped on exit if BOOKKEEPER_METRICS is set):
+metrics = None
+if "BOOKKEEPER_METRICS" in os.environ:
+    metrics = RepositoryMetrics()
+    metrics.dump_at_exit(os.environ["BOOKKEEPER_METRICS"])
+
+# Slow query log (enabled if BOOKKEEPER_SLOW_QUERY_MS is set):
+tracer = None
+if "BOOKKEEPER_SLOW_QUERY_MS" in os.environ:
+    logging.basicConfig(level=logging.WARNING)
+    slow_ms = float(os.environ["BOOKKEEPER_SLOW_QUERY_MS"])
+    tracer = QueryTracer(slow_threshold=slow_ms / 1000)
+
+# Ledgers (database files in the database directory), the recently used
+# ones are kept open for instant switching:
+ledgers = LedgerRegistry("database", SQLiteRepository,
+                         wal=True, synchronous="NORMAL",
+                         metrics=metrics, tracer=tracer,
+                         closure="parent", indexes=("category",),
+                         summary=SUMMARY_FIELDS)
+ledger = ledgers.open(os.environ.get("BOOKKEEPER_LEDGER", "bookkeeper"))
 
-# Repo factory:
-repo_gen = repository_factory(SQLiteRepository, db_file="database/bookkeeper.db")
+# Coalesce view updates made within REFRESH_DELAY seconds:
+refresh = RefreshScheduler(view, delay=REFRESH_DELAY, schedule=view.schedule_refresh)
 
-bookkeeper_app = Bookkeeper(view, repo_gen)
+bookkeeper_app = Bookkeeper(view, ledger, refresh=refresh, ledgers=ledgers)
 
 # Execute it!
 bookkeeper_app.start_app()
 
-# Exit program on application exit:
-sys.exit(app.exec())
\ No newline at end of file
+# Exit program on application exit (after the pending operations):
+exit_code = app.exec()
+view.wait_idle()
+ledgers.close()
+sys.exit(exit_code)
@@ -0,0 +1,257 @@
+"""
+Аналитика расходов на NumPy
+
+Суммы, категории и даты расходов хранятся столбцами в массивах NumPy
+(ExpenseColumns), поэтому отчеты считаются векторными операциями, а не
+перебором объектов Expense. Столбцы загружаются из любого репозитория
+порциями (AbstractRepository.iter_columns) и только для записей, которых
+еще нет в кеше. Если задана шина событий, кеш обновляется при каждом
+изменении расходов, иначе перед отчетом дочитываются новые записи.
+
+Отчеты ExpenseAnalytics:
+    category_totals  - суммы по категориям (bincount)
+    period_totals    - суммы по дням или месяцам (bincount)
+    percentiles      - процентили сумм расходов
+    moving_average   - скользящее среднее дневных сумм
+    month_deltas     - изменение месячных сумм относительно предыдущего месяца
+"""
+
+from typing import Any, Iterable, Sequence
+
+import numpy as np
+from numpy.typing import NDArray
+
+from bookkeeper.events import EventBus, ExpenseAdded, ExpensesAdded, ExpenseChanged, \
+                              ExpensesDeleted
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.abstract_repository import AbstractRepository
+from bookkeeper.utils import to_epoch
+
+# Fields read from the repository besides the primary key:
+EXPENSE_COLUMNS = ('amount', 'category', 'expense_date')
+
+# Numpy units of the report periods:
+PERIOD_UNITS = {'day': 'D', 'month': 'M'}
+
+
+class ExpenseColumns:
+    """
+    Столбцы расходов: pk, amount, category и date (секунды от начала эпохи).
+
+    Массивы выделяются с запасом, поэтому добавление строк не копирует
+    столбцы каждый раз. Удаленные строки помечаются в alive и вычищаются,
+    когда их становится больше, чем живых.
+    """
+
+    def __init__(self, capacity: int = 1024) -> None:
+        self.pk = np.zeros(capacity, np.int64)
+        self.amount = np.zeros(capacity, np.int64)
+        self.category = np.zeros(capacity, np.int64)
+        self.date = np.zeros(capacity, np.int64)
+        self.alive = np.zeros(capacity, bool)
+
+        # Number of used rows (alive or not) and the row of every alive pk:
+        self.size = 0
+        self.rows: dict[int, int] = {}
+
+        # The greatest primary key ever loaded (the next load starts after it):
+        self.max_pk = 0
+
+        # Alive rows, cached until the next change:
+        self._view: dict[str, NDArray[np.int64]] | None = None
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _reserve(self, count: int) -> None:
+        capacity = len(self.pk)
+        if self.size + count <= capacity:
+            return
+        capacity = max(2 * capacity, self.size + count)
+        for name in ('pk', 'amount', 'category', 'date', 'alive'):
+            column = getattr(self, name)
+            grown = np.zeros(capacity, column.dtype)
+            grown[:self.size] = column[:self.size]
+            setattr(self, name, grown)
+
+    def extend(self, rows: Sequence[tuple[Any, ...]]) -> None:
+        """
+        Добавить строки (pk, amount, category, expense_date).
+        Строки с уже известными pk заменяют прежние значения.
+        """
+        if not rows:
+            return
+        pks, amounts, categories, dates = zip(*rows)
+        self.remove(pk for pk in pks if pk in self.rows)
+
+        self._reserve(len(rows))
+        part = slice(self.size, self.size + len(rows))
+        self.pk[part] = pks
+        self.amount[part] = [int(amount) for amount in amounts]
+        self.category[part] = categories
+        self.date[part] = to_epoch(dates)
+        self.alive[part] = True
+
+        self.rows.update(zip(pks, range(self.size, self.size + len(rows))))
+        self.size += len(rows)
+        self.max_pk = max(self.max_pk, *pks)
+        self._view = None
+
+    def add(self, exps: Iterable[Expense]) -> None:
+        """ Добавить (или заменить) расходы """
+        self.extend([(exp.pk, exp.amount, exp.category, exp.expense_date)
+                     for exp in exps])
+
+    def remove(self, pks: Iterable[int]) -> None:
+        """ Удалить строки расходов pks (неизвестные пропускаются) """
+        for pk in pks:
+            row = self.rows.pop(pk, None)
+            if row is not None:
+                self.alive[row] = False
+                self._view = None
+
+        # Compact once the removed rows outnumber the alive ones:
+        if self.size - len(self.rows) > len(self.rows):
+            keep = np.flatnonzero(self.alive[:self.size])
+            for name in ('pk', 'amount', 'category', 'date', 'alive'):
+                column = getattr(self, name)
+                column[:len(keep)] = column[keep]
+            self.size = len(keep)
+            self.rows = dict(zip(self.pk[:self.size].tolist(), range(self.size)))
+
+    def load(self, repo: AbstractRepository[Expense], chunk_size: int = 10000) -> int:
+        """
+        Дочитать из репозитория расходы с pk больше уже загруженных,
+        вернуть число прочитанных строк.
+        """
+        count = 0
+        for chunk in repo.iter_columns(EXPENSE_COLUMNS, self.max_pk, chunk_size):
+            self.extend(chunk)
+            count += len(chunk)
+        return count
+
+    def view(self) -> dict[str, NDArray[np.int64]]:
+        """ Столбцы живых строк: {'pk': ..., 'amount': ..., ...} """
+        if self._view is None:
+            alive = self.alive[:self.size]
+            self._view = {name: getattr(self, name)[:self.size][alive]
+                          for name in ('pk', 'amount', 'category', 'date')}
+        return self._view
+
+
+class ExpenseAnalytics:
+    """
+    Отчеты по расходам репозитория repo (см. описание модуля).
+
+    Parameters
+    ----------
+    repo - репозиторий расходов
+    bus - шина событий контроллера: если задана, кеш столбцов обновляется
+          по событиям, иначе перед каждым отчетом дочитываются новые записи
+          (изменения и удаления без шины не отслеживаются)
+    chunk_size - число строк в одной порции загрузки
+    """
+
+    def __init__(self, repo: AbstractRepository[Expense], bus: EventBus | None = None,
+                 chunk_size: int = 10000) -> None:
+        self.repo = repo
+        self.bus = bus
+        self.chunk_size = chunk_size
+        self.columns = ExpenseColumns()
+        self.loaded = False
+
+        if bus is not None:
+            bus.subscribe(ExpenseAdded, lambda event: self.on_added((event.expense,)))
+            bus.subscribe(ExpensesAdded, lambda event: self.on_added(event.expenses))
+            bus.subscribe(ExpenseChanged, lambda event: self.on_added((event.new,)))
+            bus.subscribe(ExpensesDeleted, self.on_deleted)
+
+    def on_added(self, exps: Iterable[Expense]) -> None:
+        """ Добавить (заменить) расходы в кеше столбцов """
+        # Before the first load the rows are read from the repository anyway:
+        if self.loaded:
+            self.columns.add(exps)
+
+    def on_deleted(self, event: ExpensesDeleted) -> None:
+        """ Удалить расходы из кеша столбцов """
+        if self.loaded:
+            self.columns.remove(exp.pk for exp in event.expenses)
+
+    def data(self) -> dict[str, NDArray[np.int64]]:
+        """ Актуальные столбцы расходов """
+        if not self.loaded or self.bus is None:
+            self.columns.load(self.repo, self.chunk_size)
+            self.loaded = True
+        return self.columns.view()
+
+    #############
+    ## Reports ##
+    #############
+
+    def category_totals(self) -> dict[int, int]:
+        """ Суммы расходов по id категорий """
+        data = self.data()
+        if data['pk'].size == 0:
+            return {}
+        totals = np.bincount(data['category'], weights=data['amount'])
+        present = np.bincount(data['category']) > 0
+        return dict(zip(np.flatnonzero(present).tolist(),
+                        totals[present].astype(np.int64).tolist()))
+
+    def period_totals(self, unit: str = 'day') -> tuple[NDArray[Any], NDArray[np.int64]]:
+        """
+        Суммы расходов по дням (unit="day") или месяцам (unit="month"),
+        от первого периода с расходами до последнего, включая пустые.
+        Возвращает массив периодов (datetime64) и массив сумм.
+        """
+        if unit not in PERIOD_UNITS:
+            raise ValueError(f"Неизвестный период \"{unit}\"")
+        data = self.data()
+        periods = data['date'].astype('datetime64[s]').astype(
+            f'datetime64[{PERIOD_UNITS[unit]}]')
+        if periods.size == 0:
+            return periods, np.zeros(0, np.int64)
+
+        first = periods.min()
+        offsets = (periods - first).astype(np.int64)
+        totals = np.bincount(offsets, weights=data['amount']).astype(np.int64)
+        return first + np.arange(len(totals)), totals
+
+    def percentiles(self, q: Sequence[float],
+                    category: int | None = None) -> NDArray[np.float64]:
+        """ Процентили q (от 0 до 100) сумм расходов (одной категории) """
+        data = self.data()
+        amounts = data['amount']
+        if category is not None:
+            amounts = amounts[data['category'] == category]
+        if amounts.size == 0:
+            return np.full(len(q), np.nan)
+        return np.percentile(amounts, q)
+
+    def moving_average(self, window: int) -> tuple[NDArray[Any], NDArray[np.float64]]:
+        """
+        Скользящее среднее дневных сумм за window дней (дни без расходов -
+        нули). Значение для дня - среднее за этот день и window - 1
+        предыдущих, первые window - 1 дней пропускаются.
+        """
+        if window < 1:
+            raise ValueError("Окно должно быть не меньше одного дня")
+        days, totals = self.period_totals('day')
+        if len(totals) < window:
+            return days[:0], np.zeros(0)
+
+        sums = np.cumsum(np.concatenate(([0], totals)))
+        return days[window - 1:], (sums[window:] - sums[:-window]) / window
+
+    def month_deltas(self) -> tuple[NDArray[Any], NDArray[np.int64], NDArray[np.float64]]:
+        """
+        Изменение месячных сумм: массив месяцев (начиная со второго),
+        разность с предыдущим месяцем и ее доля от суммы предыдущего
+        месяца (nan, если в нем не было расходов).
+        """
+        months, totals = self.period_totals('month')
+        deltas = np.diff(totals)
+        previous = totals[:-1].astype(np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratios = np.where(previous > 0, deltas / previous, np.nan)
+        return months[1:], deltas, ratios
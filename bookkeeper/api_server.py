@@ -0,0 +1,546 @@
+"""
+Локальный HTTP-сервер с JSON API поверх Bookkeeper
+
+Позволяет другим программам на том же компьютере читать и записывать
+данные без графического интерфейса. Сервер построен на asyncio: соединения
+обслуживаются одновременно, а работа с контроллером и репозиториями
+выполняется пулом рабочих потоков. Контроллер не рассчитан на
+одновременные вызовы, поэтому изменения выполняются по очереди.
+GET-запросы читают данные прямо из репозиториев (у каждого потока
+SQLiteRepository открывает собственное соединение с базой данных) и
+выполняются параллельно, не дожидаясь записи; хранилища в памяти
+читаются по очереди с изменениями.
+
+Ответы на GET-запросы помечаются ETag - версией данных (см.
+Bookkeeper.data_version), которая учитывает и изменения, сделанные
+другими процессами с той же базой данных. Если версия не изменилась,
+на запрос с заголовком If-None-Match отвечает 304 без тела, а повторный
+запрос без заголовка получает готовый ответ из кеша.
+
+Методы:
+    GET    /categories
+    POST   /categories         {"name": ..., "parent": ...}
+    GET    /expenses?offset=0&limit=100&category=...
+    POST   /expenses           {"amount": ..., "category": ..., "comment": ...}
+                               или список таких объектов (один пакет)
+    DELETE /expenses/PK
+    GET    /budgets
+    PUT    /budgets/PERIOD     {"limit": ...} (null - удалить бюджет), PERIOD -
+                               hour, day, week, month или скользящее окно
+                               (24h, 7d, 2w)
+    GET    /summary?month=YYYY-MM
+                               суммы по категориям (за месяц или за все время)
+                               и за текущие периоды
+    GET    /analytics?days=30  суммы по категориям, процентили сумм расходов,
+                               изменения по месяцам (за всю историю) и
+                               недельное скользящее среднее дневных сумм
+                               за последние days дней (days ограничивает
+                               только скользящее среднее)
+
+Если задан архив (--archive, см. archive_repository), отчеты /summary и
+/analytics строятся по всей истории: основному репозиторию вместе с
+архивом (UnionRepository).
+
+Пример:
+    python -m bookkeeper.api_server --db database/bookkeeper.db --port 8080
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import re
+import sys
+import threading
+from contextlib import AbstractContextManager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from typing import Any, Callable
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+
+from bookkeeper.analytics import ExpenseAnalytics
+from bookkeeper.bookkeeper import Bookkeeper
+from bookkeeper.models.budget import Period, SpendingTotals
+from bookkeeper.models.category import Category
+from bookkeeper.models.category_index import CategoryIndex
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.abstract_repository import AbstractRepository
+from bookkeeper.repository.archive_repository import ArchiveRepository, \
+                                                     UnionRepository
+from bookkeeper.repository.ledger_registry import open_ledger
+from bookkeeper.utils import to_datetime
+from bookkeeper.view.batch_view import BatchView
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY = 16 * 1024 * 1024
+MAX_LIMIT = 1000
+
+
+class HttpError(Exception):
+    """ Ошибка, которая передается клиенту с кодом status """
+
+    def __init__(self, status: HTTPStatus, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass
+class Request:
+    """ Разобранный HTTP-запрос """
+    method: str
+    target: str
+    headers: dict[str, str]
+    body: bytes = b''
+    path: str = field(init=False)
+    query: dict[str, str] = field(init=False)
+
+    def __post_init__(self) -> None:
+        url = urlsplit(self.target)
+        self.path = url.path
+        self.query = dict(parse_qsl(url.query))
+
+    def json(self) -> Any:
+        """ Тело запроса в формате JSON """
+        try:
+            return json.loads(self.body)
+        except ValueError as exc:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Тело запроса - не JSON") from exc
+
+    def int_param(self, name: str, default: int) -> int:
+        """ Целочисленный параметр строки запроса """
+        try:
+            value = int(self.query.get(name, default))
+        except ValueError as exc:
+            raise HttpError(HTTPStatus.BAD_REQUEST,
+                            f"Параметр {name} должен быть целым числом") from exc
+        if value < 0:
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"Параметр {name} меньше нуля")
+        return value
+
+
+@dataclass
+class Response:
+    """ Ответ: код, тело в JSON и версия данных, по которой построен ответ """
+    status: HTTPStatus
+    body: bytes = b''
+    version: str | None = None
+
+
+def category_json(cat: Category) -> dict[str, Any]:
+    """ Категория в виде словаря для JSON """
+    return {'pk': cat.pk, 'name': cat.name, 'parent': cat.parent}
+
+
+def expense_json(exp: Expense) -> dict[str, Any]:
+    """ Расход в виде словаря для JSON """
+    return {'pk': exp.pk, 'amount': int(exp.amount), 'category': exp.category,
+            'expense_date': to_datetime(exp.expense_date).isoformat(),
+            'comment': exp.comment}
+
+
+Handler = Callable[..., tuple[HTTPStatus, Any]]
+
+
+class ApiServer:  # pylint: disable=too-many-instance-attributes
+    """
+    HTTP-сервер API (см. описание модуля).
+
+    Parameters
+    ----------
+    app - контроллер, обычно с представлением BatchView
+    workers - число рабочих потоков
+    archive - архив старых расходов для отчетов
+    """
+
+    def __init__(self, app: Bookkeeper, workers: int = 4,
+                 archive: ArchiveRepository | None = None) -> None:
+        self.app = app
+        self.archive = archive
+        self.executor = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix="api")
+
+        # The controller is changed by one thread at a time:
+        self.write_lock = threading.Lock()
+
+        # Repositories keeping a data version are databases with connections
+        # of their own per thread, the others (in memory) are not read while
+        # they are written:
+        self.read_lock: AbstractContextManager[Any] = nullcontext()
+        if app.expense_repo.data_version() is None:
+            self.read_lock = self.write_lock
+
+        # Encoded GET responses of the data version cache_version by target:
+        self.cache: dict[str, Response] = {}
+        self.cache_version: str | None = None
+        self.cache_lock = threading.Lock()
+
+        # The reports cover the archived expenses as well:
+        self.reports_repo: AbstractRepository[Expense] = app.expense_repo
+        if archive is not None:
+            self.reports_repo = UnionRepository(app.expense_repo, archive)
+
+        # Expense columns for the reports of the data version analytics_version:
+        self.analytics = ExpenseAnalytics(self.reports_repo)
+        self.analytics_version: str | None = None
+        self.analytics_lock = threading.Lock()
+
+        self.routes: list[tuple[str, re.Pattern[str], Handler]] = [
+            ('GET',    re.compile(r'/categories'),              self.get_categories),
+            ('POST',   re.compile(r'/categories'),              self.post_category),
+            ('GET',    re.compile(r'/expenses'),                self.get_expenses),
+            ('POST',   re.compile(r'/expenses'),                self.post_expenses),
+            ('DELETE', re.compile(r'/expenses/(?P<pk>\d+)'),    self.delete_expense),
+            ('GET',    re.compile(r'/budgets'),                 self.get_budgets),
+            ('PUT',    re.compile(r'/budgets/(?P<period>\w+)'), self.put_budget),
+            ('GET',    re.compile(r'/summary'),                 self.get_summary),
+            ('GET',    re.compile(r'/analytics'),               self.get_analytics),
+        ]
+
+    ###############
+    ## Transport ##
+    ###############
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080) -> asyncio.Server:
+        """ Запустить сервер (port=0 - любой свободный порт) """
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    async def handle_connection(self, reader: asyncio.StreamReader,
+                                writer: asyncio.StreamWriter) -> None:
+        """ Обслужить соединение: запросы выполняются по очереди (keep-alive) """
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader)
+                except HttpError as exc:
+                    writer.write(self.encode(self.error(exc), keep_alive=False))
+                    break
+                if request is None:
+                    break
+
+                keep_alive = request.headers.get('connection', '').lower() != 'close'
+                response = await self.respond(request)
+                writer.write(self.encode(response, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def read_request(reader: asyncio.StreamReader) -> Request | None:
+        """ Прочитать запрос, None - соединение закрыто клиентом """
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, _ = line.decode('latin-1').split()
+        except ValueError as exc:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Неверная строка запроса") from exc
+
+        headers = {}
+        while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length', 0) or 0)
+        except ValueError as exc:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Неверная длина запроса") from exc
+        if not 0 <= length <= MAX_BODY:
+            raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Слишком большой запрос")
+        body = await reader.readexactly(length) if length else b''
+        return Request(method.upper(), target, headers, body)
+
+    @staticmethod
+    def encode(response: Response, keep_alive: bool) -> bytes:
+        """ Ответ в виде байтов HTTP/1.1 """
+        lines = [f"HTTP/1.1 {response.status.value} {response.status.phrase}",
+                 "Content-Type: application/json; charset=utf-8",
+                 f"Content-Length: {len(response.body)}",
+                 f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        if response.version is not None:
+            lines.append(f'ETag: "{response.version}"')
+        return ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + response.body
+
+    @staticmethod
+    def error(exc: HttpError) -> Response:
+        """ Ответ с сообщением об ошибке """
+        body = json.dumps({'error': str(exc)}, ensure_ascii=False).encode()
+        return Response(exc.status, body)
+
+    #############
+    ## Routing ##
+    #############
+
+    def route(self, request: Request) -> tuple[Handler, dict[str, str]]:
+        """ Найти обработчик запроса и параметры пути """
+        allowed = False
+        for method, pattern, handler in self.routes:
+            match = pattern.fullmatch(request.path)
+            if match is None:
+                continue
+            if method == request.method:
+                return handler, match.groupdict()
+            allowed = True
+        if allowed:
+            raise HttpError(HTTPStatus.METHOD_NOT_ALLOWED, "Метод не поддерживается")
+        raise HttpError(HTTPStatus.NOT_FOUND, f"Неизвестный путь {request.path}")
+
+    async def respond(self, request: Request) -> Response:
+        """ Выполнить запрос в рабочем потоке и получить ответ """
+        try:
+            handler, params = self.route(request)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, self.call,
+                                              handler, request, params)
+        except HttpError as exc:
+            return self.error(exc)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Request %s %s failed", request.method, request.target)
+            return self.error(HttpError(HTTPStatus.INTERNAL_SERVER_ERROR,
+                                        "Внутренняя ошибка"))
+
+    def data_version(self) -> str:
+        """ Версия данных контроллера вместе с архивом (для ETag) """
+        version = self.app.data_version()
+        if self.archive is not None:
+            version += f".{self.archive.data_version()}"
+        return version
+
+    def call(self, handler: Handler, request: Request,
+             params: dict[str, str]) -> Response:
+        """ Вызвать обработчик (в рабочем потоке) и закодировать ответ """
+        if request.method != 'GET':
+            with self.write_lock:
+                status, data = self.run(handler, request, params)
+            return Response(status, self.dump(data))
+
+        # The version is read before the data: a change in between only
+        # means a full answer to the next request instead of 304.
+        version = self.data_version()
+        if request.headers.get('if-none-match') == f'"{version}"':
+            return Response(HTTPStatus.NOT_MODIFIED, version=version)
+        with self.cache_lock:
+            cached = self.cache.get(request.target)
+        if cached is not None and cached.version == version:
+            return cached
+
+        with self.read_lock:
+            status, data = self.run(handler, request, params)
+        response = Response(status, self.dump(data), version)
+        with self.cache_lock:
+            if version != self.cache_version:
+                self.cache.clear()
+                self.cache_version = version
+            self.cache[request.target] = response
+        return response
+
+    @staticmethod
+    def run(handler: Handler, request: Request,
+            params: dict[str, str]) -> tuple[HTTPStatus, Any]:
+        """ Вызвать обработчик, ошибки ввода контроллера - 400 """
+        try:
+            return handler(request, **params)
+        except ValueError as exc:
+            raise HttpError(HTTPStatus.BAD_REQUEST, str(exc)) from exc
+
+    @staticmethod
+    def dump(data: Any) -> bytes:
+        """ Тело ответа в JSON """
+        return json.dumps(data, ensure_ascii=False).encode() if data is not None else b''
+
+    ##############
+    ## Handlers ##
+    ##############
+
+    # Handlers return the data to be encoded. The changing ones run under
+    # the write lock and use the controller, the GET ones read the
+    # repositories: the controller caches are not read while they change.
+    # pylint: disable=unused-argument
+
+    def get_categories(self, request: Request) -> tuple[HTTPStatus, Any]:
+        """ GET /categories """
+        return HTTPStatus.OK, [category_json(cat)
+                               for cat in self.app.category_repo.get_all()]
+
+    def post_category(self, request: Request) -> tuple[HTTPStatus, Any]:
+        """ POST /categories """
+        data = request.json()
+        if not isinstance(data, dict) or not isinstance(data.get('name'), str):
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Нужно название категории (name)")
+        self.app.add_category(data['name'], data.get('parent'))
+        return HTTPStatus.CREATED, category_json(self.app.get_category(data['name']))
+
+    def get_expenses(self, request: Request) -> tuple[HTTPStatus, Any]:
+        """ GET /expenses: страница расходов в порядке добавления """
+        offset = request.int_param('offset', 0)
+        limit = min(request.int_param('limit', 100), MAX_LIMIT)
+
+        if 'category' in request.query:
+            name = request.query['category']
+            cat = CategoryIndex(self.app.category_repo.get_all()).get(name)
+            if cat is None:
+                raise HttpError(HTTPStatus.BAD_REQUEST,
+                                f"Категории \"{name}\" не существует")
+            exps = self.app.expense_repo.get_all_in_subtree(
+                'category', self.app.category_repo, cat.pk)
+        else:
+            exps = self.app.expense_repo.get_all()
+        return HTTPStatus.OK, {'total': len(exps), 'offset': offset, 'limit': limit,
+                               'items': [expense_json(exp)
+                                         for exp in exps[offset:offset + limit]]}
+
+    def post_expenses(self, request: Request) -> tuple[HTTPStatus, Any]:
+        """ POST /expenses: один расход или список (пакетная запись) """
+        data = request.json()
+        items = data if isinstance(data, list) else [data]
+        exps = []
+        for i, item in enumerate(items):
+            if not isinstance(item, dict) or not {'amount', 'category'} <= item.keys():
+                raise HttpError(HTTPStatus.BAD_REQUEST, f"Расход {i}: нужны "
+                                "сумма (amount) и категория (category)")
+            exps.append(self.app.make_expense(str(item['amount']), str(item['category']),
+                                              str(item.get('comment', ''))))
+        self.app.add_expenses(exps)
+        return HTTPStatus.CREATED, {'pks': [exp.pk for exp in exps]}
+
+    def delete_expense(self, request: Request, pk: str) -> tuple[HTTPStatus, Any]:
+        """ DELETE /expenses/PK """
+        if int(pk) not in self.app.expenses:
+            raise HttpError(HTTPStatus.NOT_FOUND, f"Расхода с pk={pk} не существует")
+        self.app.delete_expenses({int(pk)})
+        return HTTPStatus.NO_CONTENT, None
+
+    def get_budgets(self, request: Request) -> tuple[HTTPStatus, Any]:
+        """ GET /budgets """
+        return HTTPStatus.OK, [{'pk': budget.pk, 'period': budget.name,
+                                'limit': budget.limitation, 'spent': budget.spent}
+                               for budget in self.app.budget_repo.get_all()]
+
+    def put_budget(self, request: Request, period: str) -> tuple[HTTPStatus, Any]:
+        """ PUT /budgets/PERIOD """
+        data = request.json()
+        if not isinstance(data, dict) or 'limit' not in data:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Нужен лимит (limit)")
+        limit = "" if data['limit'] is None else str(data['limit'])
+        pk = next((budget.pk for budget in self.app.budgets
+                   if budget.name == period), None)
+        self.app.modify_budget(pk, limit, period)
+        return self.get_budgets(request)
+
+    def get_summary(self, request: Request) -> tuple[HTTPStatus, Any]:
+        """ GET /summary: суммы по категориям (с подкатегориями) и за периоды """
+        month = request.query.get('month')
+        if month is not None and not re.fullmatch(r'\d{4}-\d{2}', month):
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Месяц задается в виде YYYY-MM")
+
+        # Monthly totals of the repository, not the expenses themselves:
+        tree = CategoryIndex(self.app.category_repo.get_all()).tree()
+        own: dict[int, int] = dict.fromkeys(tree.by_pk, 0)
+        for (_, cat_pk), (amount, _) in self.reports_repo.get_totals(
+                'month', month, month).items():
+            if cat_pk in own:
+                own[cat_pk] += amount
+
+        # Children follow their parent in the pre-order, so walking it
+        # backwards adds each subtree total to the parent's one:
+        total = dict(own)
+        for cat in reversed(tree.order):
+            if cat.parent in total:
+                total[cat.parent] += total[cat.pk]
+
+        # The current periods, from the daily and monthly totals as well:
+        periods = SpendingTotals()
+        periods.load(self.app.expense_repo)
+
+        return HTTPStatus.OK, {
+            'month': month,
+            'total': sum(own.values()),
+            'periods': {period.name.lower(): periods.spent(period)
+                        for period in Period},
+            'categories': [{'pk': cat.pk, 'name': cat.name, 'path': tree.path_of(cat.pk),
+                            'own': own[cat.pk], 'total': total[cat.pk]}
+                           for cat in tree],
+        }
+
+    def get_analytics(self, request: Request) -> tuple[HTTPStatus, Any]:
+        """
+        GET /analytics: отчеты ExpenseAnalytics по всей истории; days
+        ограничивает только скользящее среднее
+        """
+        days = request.int_param('days', 30)
+        if days < 1:
+            raise HttpError(HTTPStatus.BAD_REQUEST,
+                            "Параметр days должен быть положительным")
+
+        # Other processes may change and delete expenses, which no event
+        # reports: the columns are read again once the data version changes.
+        with self.analytics_lock:
+            version = self.data_version()
+            if version != self.analytics_version:
+                self.analytics = ExpenseAnalytics(self.reports_repo)
+                self.analytics_version = version
+            analytics = self.analytics
+            categories = analytics.category_totals()
+            percentiles = analytics.percentiles([50, 90, 99])
+            months, deltas, ratios = analytics.month_deltas()
+            _, totals = analytics.period_totals('month')
+            week_days, averages = analytics.moving_average(7)
+
+        return HTTPStatus.OK, {
+            'categories': categories,
+            'percentiles': {str(q): None if math.isnan(value) else value
+                            for q, value in zip([50, 90, 99], percentiles.tolist())},
+            'months': [{'month': month, 'total': total, 'delta': delta,
+                        'ratio': None if math.isnan(ratio) else ratio}
+                       for month, total, delta, ratio in zip(
+                           np.datetime_as_string(months).tolist(), totals[1:].tolist(),
+                           deltas.tolist(), ratios.tolist())],
+            'moving_average': [{'day': day, 'value': value}
+                               for day, value in zip(
+                                   np.datetime_as_string(week_days[-days:]).tolist(),
+                                   averages[-days:].tolist())],
+        }
+
+
+async def serve(server: ApiServer, host: str, port: int) -> None:
+    """ Запустить сервер и обслуживать запросы до остановки """
+    async with await server.start(host, port) as aio_server:
+        for sock in aio_server.sockets:
+            address, port = sock.getsockname()[:2]
+            print(f"Сервер запущен: http://{address}:{port}")
+        await aio_server.serve_forever()
+
+
+def main(argv: list[str] | None = None) -> int:
+    """ Точка входа командной строки """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument('--db', help="файл базы данных (по умолчанию - в памяти)")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=4,
+                        help="число рабочих потоков")
+    parser.add_argument('--archive', help="файл архива старых расходов")
+    args = parser.parse_args(argv)
+
+    repo_gen, archive = open_ledger(args)
+    server = ApiServer(Bookkeeper(BatchView(), repo_gen), workers=args.workers,
+                       archive=archive)
+    try:
+        asyncio.run(serve(server, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.executor.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
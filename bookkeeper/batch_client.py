@@ -0,0 +1,298 @@
+"""
+Пакетный режим: выполнение сценария команд без графического интерфейса
+
+Сценарий читается построчно из файла или стандартного ввода и выполняется
+через контроллер Bookkeeper с представлением BatchView. Подряд идущие
+расходы записываются пакетами по batch_size (один вызов add_many, для
+SQLite - одна транзакция). В конце выводится сводка: число команд,
+ошибок и скорость выполнения.
+
+Аргументы команд разделяются пробелами, аргументы с пробелами берутся
+в кавычки, текст после # пропускается:
+    category NAME [PARENT]             - добавить категорию
+    expense AMOUNT CATEGORY [COMMENT]  - добавить расход
+    delete expense PK [PK ...]         - удалить расходы
+    delete category NAME               - удалить категорию
+    budget PERIOD [LIMIT]              - задать лимит (без LIMIT - удалить бюджет)
+                                         на hour, day, week, month или
+                                         скользящее окно (24h, 7d, 2w)
+    report [CATEGORY]                  - вывести бюджеты или сумму расходов
+                                         категории с подкатегориями
+    undo, redo                         - отменить или повторить действие
+                                         (пакет расходов - одно действие)
+    totals check                       - сверить таблицы сумм с расходами
+    totals rebuild                     - пересчитать таблицы сумм
+    archive YYYY-MM-DD                 - перенести расходы раньше даты в архив
+                                         (нужен --archive); report CATEGORY
+                                         тогда учитывает и архивные расходы
+
+Ошибка в команде выводится с номером строки, выполнение продолжается.
+
+Пример:
+    python -m bookkeeper.batch_client script.txt --db database/bookkeeper.db
+"""
+
+import argparse
+import shlex
+import sys
+from dataclasses import dataclass
+from datetime import datetime
+from time import perf_counter
+from typing import Callable, Iterable, TextIO
+
+from bookkeeper.bookkeeper import Bookkeeper
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.abstract_repository import AbstractRepository
+from bookkeeper.repository.archive_repository import ArchiveRepository, \
+                                                     UnionRepository, archive_expenses
+from bookkeeper.repository.ledger_registry import open_ledger
+from bookkeeper.view.batch_view import BatchView
+
+
+@dataclass
+class BatchStats:
+    """
+    Сводка о выполнении сценария.
+    """
+    commands: int = 0
+    expenses: int = 0
+    batches: int = 0
+    errors: int = 0
+    seconds: float = 0.0
+
+    @property
+    def commands_per_second(self) -> float:
+        """ Скорость выполнения, команд в секунду """
+        return self.commands / self.seconds if self.seconds > 0 else 0.0
+
+
+class BatchRunner:  # pylint: disable=too-many-instance-attributes
+    """
+    Исполнитель сценария команд (см. описание модуля).
+
+    Parameters
+    ----------
+    app - контроллер, обычно с представлением BatchView
+    batch_size - наибольшее число расходов в одном пакете
+    output - поток для отчетов
+    errors - поток для сообщений об ошибках
+    archive - архив старых расходов
+    """
+
+    def __init__(self, app: Bookkeeper,  # pylint: disable=too-many-arguments
+                 batch_size: int = 1000,
+                 output: TextIO = sys.stdout, errors: TextIO = sys.stderr,
+                 archive: ArchiveRepository | None = None) -> None:
+        self.app = app
+        self.batch_size = batch_size
+        self.output = output
+        self.errors = errors
+        self.stats = BatchStats()
+
+        # Checked, but not yet written expenses:
+        self.pending: list[Expense] = []
+
+        # The reports cover the archived expenses as well:
+        self.archive = archive
+        self.reports_repo: AbstractRepository[Expense] = app.expense_repo
+        if archive is not None:
+            self.reports_repo = UnionRepository(app.expense_repo, archive)
+
+        self.commands: dict[str, Callable[[list[str]], None]] = {
+            'category': self.add_category,
+            'expense': self.add_expense,
+            'delete': self.delete,
+            'budget': self.set_budget,
+            'report': self.report,
+            'undo': self.undo,
+            'redo': self.redo,
+            'totals': self.totals,
+            'archive': self.archive_before,
+        }
+
+    def run(self, lines: Iterable[str]) -> BatchStats:
+        """ Выполнить сценарий, вернуть сводку """
+        start = perf_counter()
+        for number, line in enumerate(lines, 1):
+            try:
+                args = shlex.split(line, comments=True)
+                if not args:
+                    continue
+                self.stats.commands += 1
+                self.execute(args)
+            except ValueError as exc:
+                self.stats.errors += 1
+                print(f"строка {number}: {exc}", file=self.errors)
+        self.flush()
+        self.stats.seconds = perf_counter() - start
+        return self.stats
+
+    def execute(self, args: list[str]) -> None:
+        """ Выполнить одну команду (название и аргументы) """
+        command = self.commands.get(args[0])
+        if command is None:
+            raise ValueError(f"неизвестная команда \"{args[0]}\"")
+
+        # Everything except new expenses sees (and may undo) the written ones:
+        if args[0] != 'expense':
+            self.flush()
+        command(args[1:])
+
+    def flush(self) -> None:
+        """ Записать накопленные расходы одним пакетом """
+        if not self.pending:
+            return
+        exps, self.pending = self.pending, []
+        with self.app.refresh.batch():
+            self.app.add_expenses(exps)
+        self.stats.expenses += len(exps)
+        self.stats.batches += 1
+
+    ##############
+    ## Commands ##
+    ##############
+
+    @staticmethod
+    def check_args(args: list[str], least: int, most: int) -> None:
+        """ Проверить число аргументов команды """
+        if not least <= len(args) <= most:
+            raise ValueError(f"неверное число аргументов: {len(args)}")
+
+    def add_category(self, args: list[str]) -> None:
+        """ category NAME [PARENT] """
+        self.check_args(args, 1, 2)
+        with self.app.refresh.batch():
+            self.app.add_category(*args)
+
+    def add_expense(self, args: list[str]) -> None:
+        """ expense AMOUNT CATEGORY [COMMENT] """
+        self.check_args(args, 2, 3)
+        self.pending.append(self.app.make_expense(*args))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def delete(self, args: list[str]) -> None:
+        """ delete expense PK [PK ...] | delete category NAME """
+        self.check_args(args, 2, sys.maxsize)
+        kind, targets = args[0], args[1:]
+        with self.app.refresh.batch():
+            if kind == 'expense':
+                try:
+                    pks = {int(pk) for pk in targets}
+                except ValueError as exc:
+                    raise ValueError("id расхода должен быть целым числом") from exc
+                self.app.delete_expenses(pks)
+            elif kind == 'category':
+                self.check_args(targets, 1, 1)
+                self.app.delete_category(targets[0])
+            else:
+                raise ValueError(f"нельзя удалить \"{kind}\"")
+
+    def set_budget(self, args: list[str]) -> None:
+        """ budget PERIOD [LIMIT] """
+        self.check_args(args, 1, 2)
+        period, limit = args[0], args[1] if len(args) > 1 else ""
+        pk = next((budget.pk for budget in self.app.budgets
+                   if budget.name == period), None)
+        with self.app.refresh.batch():
+            self.app.modify_budget(pk, limit, period)
+
+    def report(self, args: list[str]) -> None:
+        """ report [CATEGORY] """
+        self.check_args(args, 0, 1)
+        if args:
+            cat = self.app.get_category(args[0])
+            exps = self.reports_repo.get_all_in_subtree('category',
+                                                        self.app.category_repo, cat.pk)
+            print(f"{args[0]}: {sum(int(exp.amount) for exp in exps)} "
+                  f"({len(exps)} расходов)", file=self.output)
+            return
+
+        print(f"категорий: {len(self.app.categories)}, "
+              f"расходов: {len(self.app.expenses)}", file=self.output)
+        for budget in self.app.budgets:
+            print(f"{budget.name}: {budget.spent} / {budget.limitation}",
+                  file=self.output)
+
+    def undo(self, args: list[str]) -> None:
+        """ undo """
+        self.check_args(args, 0, 0)
+        with self.app.refresh.batch():
+            self.app.undo()
+
+    def redo(self, args: list[str]) -> None:
+        """ redo """
+        self.check_args(args, 0, 0)
+        with self.app.refresh.batch():
+            self.app.redo()
+
+    def totals(self, args: list[str]) -> None:
+        """ totals check | totals rebuild """
+        self.check_args(args, 1, 1)
+        repo = self.app.expense_repo
+        if args[0] == 'rebuild':
+            repo.rebuild_totals()
+            print("суммы пересчитаны", file=self.output)
+        elif args[0] == 'check':
+            diff = repo.check_totals()
+            for (unit, period, cat_pk), (stored, actual) in sorted(diff.items()):
+                print(f"{unit} {period}, категория {cat_pk}: {stored[0]} ({stored[1]}) "
+                      f"вместо {actual[0]} ({actual[1]})", file=self.output)
+            if diff:
+                raise ValueError(f"суммы расходятся с расходами: {len(diff)}")
+            print("суммы верны", file=self.output)
+        else:
+            raise ValueError(f"неизвестное действие \"{args[0]}\"")
+
+    def archive_before(self, args: list[str]) -> None:
+        """ archive YYYY-MM-DD """
+        self.check_args(args, 1, 1)
+        if self.archive is None:
+            raise ValueError("архив не задан")
+        try:
+            cutoff = datetime.fromisoformat(args[0])
+        except ValueError as exc:
+            raise ValueError("дата задается в виде YYYY-MM-DD") from exc
+
+        moved = archive_expenses(self.app.expense_repo, self.archive, cutoff)
+        with self.app.refresh.batch():
+            self.app.update_expenses()
+
+        # The undo history may refer to the expenses moved to the read-only
+        # archive (as on a ledger switch, it is dropped):
+        self.app.history.clear()
+        print(f"в архив перенесено расходов: {moved}", file=self.output)
+
+
+def main(argv: list[str] | None = None) -> int:
+    """ Точка входа командной строки """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument('script', nargs='?',
+                        help="файл сценария (по умолчанию - стандартный ввод)")
+    parser.add_argument('--db', help="файл базы данных (по умолчанию - в памяти)")
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help="число расходов в одной транзакции")
+    parser.add_argument('--archive', help="файл архива старых расходов")
+    args = parser.parse_args(argv)
+
+    repo_gen, archive = open_ledger(args)
+    view = BatchView()
+    runner = BatchRunner(Bookkeeper(view, repo_gen), batch_size=args.batch_size,
+                         archive=archive)
+
+    if args.script is None:
+        stats = runner.run(sys.stdin)
+    else:
+        with open(args.script, encoding="utf-8") as script:
+            stats = runner.run(script)
+
+    print(f"команд: {stats.commands}, расходов: {stats.expenses} "
+          f"({stats.batches} пакетов), ошибок: {stats.errors}")
+    if view.budget_warnings:
+        print(f"превышений бюджета: {view.budget_warnings}")
+    print(f"время: {stats.seconds:.2f} с, {stats.commands_per_second:.0f} команд/с")
+    return 1 if stats.errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,43 +1,122 @@
+from contextlib import ExitStack, contextmanager
+from dataclasses import replace
 from datetime import datetime
 
-from typing import Callable, Any
-
-from bookkeeper.view.abstract_view import AbstractView
+from typing import Callable, Any, Iterator
+
+from bookkeeper.view.abstract_view     import AbstractView
+from bookkeeper.view.refresh_scheduler import RefreshScheduler
+from bookkeeper.commands           import CommandHistory, AddExpense, AddExpenses, \
+                                          DeleteExpenses, ModifyExpense, AddCategory, \
+                                          DeleteCategory, DeleteCategoryTree, \
+                                          MoveCategory, ModifyBudget
+from bookkeeper.events             import EventBus, Event, ExpenseEvent, ExpenseAdded, \
+                                          ExpensesAdded, ExpenseChanged, \
+                                          ExpensesDeleted, CategoryEvent, CategoryAdded, \
+                                          CategoryRemoved, CategoryTreeAdded, \
+                                          CategoryTreeRemoved, CategoryMoved, \
+                                          BudgetsChanged, ForecastsChanged
 
 from bookkeeper.repository.abstract_repository import AbstractRepository
+from bookkeeper.repository.ledger_registry     import LedgerRegistry
+
+from bookkeeper.models.category       import Category
+from bookkeeper.models.category_index import CategoryIndex
+from bookkeeper.models.expense        import Expense
+from bookkeeper.models.budget         import Budget, SpendingTotals
+from bookkeeper.models.forecast       import DailyTotals, Forecast, forecast_budgets
 
-from bookkeeper.models.category import Category
-from bookkeeper.models.expense  import Expense
-from bookkeeper.models.budget   import Budget
+def copy_budget(budget: Budget) -> Budget:
+    # Budget takes the period name in __init__, so dataclasses.replace fails:
+    return Budget(budget.limitation, budget.name, budget.spent, budget.pk)
 
 class Bookkeeper:
 
     # Class fields:
-    view          : AbstractView
-    category_repo : AbstractRepository[Category]
-    budget_repo   : AbstractRepository[Budget]
-    expense_repo  : AbstractRepository[Expense]
+    view           : AbstractView
+    refresh        : RefreshScheduler
+    bus            : EventBus
+    category_repo  : AbstractRepository[Category]
+    budget_repo    : AbstractRepository[Budget]
+    expense_repo   : AbstractRepository[Expense]
+
+    # Category lookup shared with the view:
+    category_index : CategoryIndex
+
+    # Cached expenses by primary key:
+    expenses       : dict[int, Expense]
+
+    # Running totals of the current day/week/month spendings:
+    totals         : SpendingTotals
+
+    # Spendings by day and the budget forecasts made from them:
+    daily          : DailyTotals
+    forecasts      : list[Forecast]
+
+    # Undo/redo log of the user changes:
+    history        : CommandHistory
+
+    # Number of published changes (see also data_version):
+    version        : int
+
+    # Ledgers to switch between and the name of the open one:
+    ledgers        : LedgerRegistry | None
+    ledger_name    : str | None
 
     def __init__(self,
                  view               : AbstractView,
-                 repository_factory : Callable[[Any], AbstractRepository[Any]]):
+                 repository_factory : Callable[[Any], AbstractRepository[Any]],
+                 bus                : EventBus | None = None,
+                 refresh            : RefreshScheduler | None = None,
+                 ledgers            : LedgerRegistry | None = None):
 
         # Abstract out of the view details:
         self.view = view
 
+        # View updates are coalesced and pushed once per user action:
+        self.refresh = refresh if refresh is not None else RefreshScheduler(view)
+
+        # Changes are published as events after the repository write:
+        self.bus = bus if bus is not None else EventBus()
+        self.version = 0
+
+        # Events of an open transaction wait for its commit:
+        self.in_transaction = False
+        self.pending_events: list[Event] = []
+        self.subscribe_state()
+        self.subscribe_view()
+
+        self.history = CommandHistory()
+
+        # The repositories may come from a ledger of the registry:
+        self.ledgers     = ledgers
+        self.ledger_name = getattr(repository_factory, 'name', None)
+
+        with self.refresh.batch():
+            self.load(repository_factory)
+            if self.ledgers is not None:
+                self.view.set_ledger_switch_handler(
+                    self.refresh.batched(self.open_ledger))
+                self.view.set_ledgers(self.ledgers.names(), self.ledger_name)
+
+    def load(self, repository_factory: Callable[[Any], AbstractRepository[Any]]) -> None:
+        batched = self.refresh.batched
+
         #########################
         ## Category repository ##
         #########################
 
         self.category_repo = repository_factory(Category)
 
-        self.categories = self.category_repo.get_all()
+        self.categories     = self.category_repo.get_all()
+        self.category_index = CategoryIndex(self.categories)
 
         # Configure view:
-        self.view.set_categories(self.categories)
+        self.view.set_category_index(self.category_index)
+        self.refresh.set_categories(self.category_snapshot())
 
-        self.view.set_category_add_handler   (self.add_category)
-        self.view.set_category_delete_handler(self.delete_category)
+        self.view.set_category_add_handler   (batched(self.add_category))
+        self.view.set_category_delete_handler(batched(self.delete_category))
         self.view.set_category_checker       (self.cat_checker)
 
         #######################
@@ -50,7 +129,7 @@ class Bookkeeper:
         self.budgets = self.budget_repo.get_all()
 
         # Configure view handlers:
-        self.view.set_budget_modify_handler(self.modify_budget)
+        self.view.set_budget_modify_handler(batched(self.modify_budget))
 
         ########################
         ## Expense repository ##
@@ -59,88 +138,264 @@ class Bookkeeper:
         self.expense_repo = repository_factory(Expense)
 
         self.update_expenses()
-        self.view.set_expense_add_handler   (self.add_expense)
-        self.view.set_expense_delete_handler(self.delete_expenses)
-        self.view.set_expense_modify_handler(self.modify_expense)
+        self.view.set_expense_add_handler   (batched(self.add_expense))
+        self.view.set_expense_delete_handler(batched(self.delete_expenses))
+        self.view.set_expense_modify_handler(batched(self.modify_expense))
+
+        self.view.set_undo_handler(batched(self.undo))
+        self.view.set_redo_handler(batched(self.redo))
 
     def start_app(self) -> None:
         self.view.show_main_window()
 
+    #########################
+    ## Event subscriptions ##
+    #########################
+
+    def subscribe_state(self) -> None:
+        # Caches and budget accounting go first, so that the view
+        # subscribers below see the updated state:
+        self.bus.subscribe(CategoryAdded,       self.on_category_added)
+        self.bus.subscribe(CategoryRemoved,     self.on_category_removed)
+        self.bus.subscribe(CategoryTreeAdded,   self.on_category_tree_added)
+        self.bus.subscribe(CategoryTreeRemoved, self.on_category_tree_removed)
+        self.bus.subscribe(CategoryMoved,       self.on_category_moved)
+        self.bus.subscribe(ExpenseAdded,        self.on_expense_added)
+        self.bus.subscribe(ExpensesAdded,       self.on_expenses_added)
+        self.bus.subscribe(ExpenseChanged,      self.on_expense_changed)
+        self.bus.subscribe(ExpensesDeleted,     self.on_expenses_deleted)
+        self.bus.subscribe(ExpenseEvent,        lambda event: self.update_budgets())
+        self.bus.subscribe(Event,               self.on_change)
+
+    def subscribe_view(self) -> None:
+        # The view is updated through the refresh scheduler:
+        refresh = self.refresh
+
+        def expenses_added(event: ExpensesAdded) -> None:
+            for exp in event.expenses:
+                refresh.expense_added(exp)
+
+        self.bus.subscribe(CategoryEvent,
+                           lambda event: refresh.set_categories(self.category_snapshot()))
+        self.bus.subscribe(ExpenseAdded,
+                           lambda event: refresh.expense_added(event.expense))
+        self.bus.subscribe(ExpensesAdded, expenses_added)
+        self.bus.subscribe(ExpenseChanged,
+                           lambda event: refresh.expense_changed(event.new))
+        self.bus.subscribe(ExpensesDeleted,
+                           lambda event: refresh.expenses_removed(
+                               {exp.pk for exp in event.expenses}))
+        self.bus.subscribe(BudgetsChanged,
+                           lambda event: refresh.set_budgets(list(event.budgets)))
+        self.bus.subscribe(ForecastsChanged,
+                           lambda event: refresh.set_forecasts(list(event.forecasts)))
+
+    def category_snapshot(self) -> list[Category]:
+        # Copies for the view: it may draw them in the GUI thread while the
+        # next operation changes the categories (see CategoryIndex.set_parent):
+        return [replace(cat) for cat in self.categories]
+
+    def on_change(self, _event: Event) -> None:
+        self.version += 1
+
+    def data_version(self) -> str:
+        # Version of the data, e.g. for HTTP ETags: the repositories count
+        # the changes made by other processes as well, the own counter tells
+        # apart the ledgers and the repositories without versions:
+        versions = [self.version] + [repo.data_version() for repo in
+                                     (self.category_repo, self.budget_repo,
+                                      self.expense_repo)]
+        return '.'.join(str(version) for version in versions if version is not None)
+
+    def on_category_added(self, event: CategoryAdded) -> None:
+        self.category_index.add(event.category)
+        self.categories.append(event.category)
+
+    def on_category_removed(self, event: CategoryRemoved) -> None:
+        self.category_index.remove(event.category)
+        for child in event.children:
+            self.category_index.set_parent(self.category_index.by_pk[child.pk],
+                                           child.parent)
+        self.categories = list(self.category_index)
+
+    def on_category_tree_added(self, event: CategoryTreeAdded) -> None:
+        for cat in event.categories:
+            self.category_index.add(cat)
+        self.categories += event.categories
+
+    def on_category_tree_removed(self, event: CategoryTreeRemoved) -> None:
+        for cat in event.categories:
+            self.category_index.remove(cat)
+        self.categories = list(self.category_index)
+
+    def on_category_moved(self, event: CategoryMoved) -> None:
+        self.category_index.set_parent(self.category_index.by_pk[event.category.pk],
+                                       event.category.parent)
+
+    def on_expense_added(self, event: ExpenseAdded) -> None:
+        self.expenses[event.expense.pk] = event.expense
+        self.totals.add(event.expense)
+        self.daily.add(event.expense)
+
+    def on_expenses_added(self, event: ExpensesAdded) -> None:
+        for exp in event.expenses:
+            self.expenses[exp.pk] = exp
+            self.totals.add(exp)
+            self.daily.add(exp)
+
+    def on_expense_changed(self, event: ExpenseChanged) -> None:
+        self.expenses[event.new.pk] = event.new
+        self.totals.remove(event.old)
+        self.totals.add(event.new)
+        self.daily.remove(event.old)
+        self.daily.add(event.new)
+
+    def on_expenses_deleted(self, event: ExpensesDeleted) -> None:
+        for exp in event.expenses:
+            self.expenses.pop(exp.pk, None)
+            self.totals.remove(exp)
+            self.daily.remove(exp)
+
     #########################
     ## Category operations ##
     #########################
 
-    def cat_checker(self, cat_name: str) -> None:
-        if cat_name not in [c.name for c in self.categories]:
+    def get_category(self, cat_name: str) -> Category:
+        cat = self.category_index.get(cat_name)
+        if cat is None:
             raise ValueError(f"Категории \"{cat_name}\" не существует")
+        return cat
+
+    def cat_checker(self, cat_name: str) -> None:
+        self.get_category(cat_name)
 
     def add_category(self, name: str, parent: str | None = None) -> None:
 
         # Category existent:
-        if name in [c.name for c in self.categories]:
+        if name in self.category_index:
             raise ValueError(f"Категория \"{name}\" уже существует")
 
         # No parent category:
-        if parent is not None:
-            if parent not in [c.name for c in self.categories]:
-                raise ValueError(f"Категории \"{parent}\" не существует")
-            parent_pk = self.category_repo.get_all(where={'name':parent})[0].pk
-        else:
-            parent_pk = None
+        parent_pk = self.get_category(parent).pk if parent is not None else None
 
         # Create category:
         cat = Category(name, parent_pk)
 
-        # Update:
-        # - Internal state
-        # - Repository
-        # - View
-        self.categories.append(cat)
+        # Update the repository, then internal state and view:
         self.category_repo.add(cat)
-        self.view.set_categories(self.categories)
+        self.publish(CategoryAdded(cat))
+
+        self.history.record(AddCategory(replace(cat)))
 
     def delete_category(self, cat_name: str) -> None:
         # No categories to delete:
-        cats = self.category_repo.get_all(where={"name":cat_name})
-
-        if len(cats) == 0:
-            raise ValueError(f"Категории \"{cat_name}\" не существует")
-
+        cat = self.get_category(cat_name)
+        exps = tuple(exp for exp in self.expenses.values() if exp.category == cat.pk)
+
+        with self.transaction():
+            children = self.remove_category(cat)
+            self.remove_expenses(exps)
+
+        self.history.record(DeleteCategory(replace(cat),
+                                           tuple(child.pk for child in children),
+                                           tuple(replace(exp) for exp in exps)))
+
+    def insert_category(self, cat: Category, children_pks: tuple[int, ...]) -> None:
+        # Put back a removed category with its former primary key:
+        cat = replace(cat)
+        with self.transaction():
+            self.category_repo.restore_many([cat])
+
+            # Return the children moved to the parent on removal. The
+            # index follows the events, once the repository has the changes:
+            children = [child for pk in children_pks
+                        if (child := self.category_index.get_by_pk(pk)) is not None]
+            moved = [replace(child, parent=cat.pk) for child in children]
+            self.category_repo.update_many(moved)
+
+            self.publish(CategoryAdded(cat))
+            for child, old in zip(moved, children):
+                self.publish(CategoryMoved(child, old.parent))
+
+    def remove_category(self, cat: Category) -> list[Category]:
         # Repo operation:
-        cat = cats[0]
         self.category_repo.delete(cat.pk)
 
-        # Update parent category for all children ("your papa is gone :("):
-        for child in self.category_repo.get_all(where={'parent':cat.pk}):
-            child.parent = cat.parent
-            self.category_repo.update(child)
-
-        # Update internal state:
-        self.categories = self.category_repo.get_all()
-
-        # Update view:
-        self.view.set_categories(self.categories)
-
-        # Update expense repo:
-        for exp in self.expense_repo.get_all(where={'category':cat.pk}):
-            self.expense_repo.delete(exp.pk)
-
-        # Uodate expenses:
-        self.update_expenses()
+        # Update parent category for all children ("your papa is gone :("),
+        # the index follows the event:
+        children = [replace(child, parent=cat.parent)
+                    for child in self.category_index.children_of(cat.pk)]
+        self.category_repo.update_many(children)
+
+        self.publish(CategoryRemoved(cat, tuple(children)))
+        return children
+
+    def delete_category_tree(self, cat_name: str) -> None:
+        # Remove the category with all the subcategories and their expenses:
+        cat = self.get_category(cat_name)
+
+        with self.transaction():
+            cats = self.remove_category_tree(cat)
+            pks = {c.pk for c in cats}
+            exps = tuple(exp for exp in self.expenses.values() if exp.category in pks)
+            self.remove_expenses(exps)
+
+        self.history.record(DeleteCategoryTree(tuple(replace(c) for c in cats),
+                                               tuple(replace(exp) for exp in exps)))
+
+    def move_category(self, cat_name: str, parent: str | None) -> None:
+        cat = self.get_category(cat_name)
+        parent_pk = self.get_category(parent).pk if parent is not None else None
+
+        # The category can't become a subcategory of itself:
+        tree = self.category_index.tree()
+        if parent_pk is not None and (parent_pk == cat.pk
+                                      or tree.is_descendant(parent_pk, cat.pk)):
+            raise ValueError(f"Нельзя перенести категорию \"{cat.name}\" "
+                             + "в ее же подкатегорию")
+
+        old_parent = cat.parent
+        self.reparent_category(cat.pk, parent_pk)
+        self.history.record(MoveCategory(cat.pk, old_parent, parent_pk))
+
+    def insert_categories(self, cats: tuple[Category, ...]) -> None:
+        # Put back a removed subtree with the former primary keys:
+        cats = tuple(replace(cat) for cat in cats)
+        self.category_repo.restore_many(cats)
+        self.publish(CategoryTreeAdded(cats))
+
+    def remove_category_tree(self, cat: Category) -> list[Category]:
+        # One repository call for the whole subtree:
+        cats = self.category_repo.delete_subtree(cat.pk)
+        self.publish(CategoryTreeRemoved(tuple(cats)))
+        return cats
+
+    def reparent_category(self, pk: int, parent: int | None) -> None:
+        cat = self.category_index.by_pk[pk]
+        old_parent = cat.parent
+
+        # Subcategories follow their parent, so only one row is updated.
+        # The index follows the event, once the repository has moved the subtree:
+        self.category_repo.move_subtree(pk, parent)
+        self.publish(CategoryMoved(replace(cat, parent=parent), old_parent))
 
     ########################
     ## Expense operations ##
     ########################
 
     def update_expenses(self) -> None:
-
-        self.expenses = self.expense_repo.get_all()
-        self.view.set_expenses(self.expenses)
+        # Full reload, used on startup only. Mutations below apply deltas
+        # to the cached expenses and push only the changed rows to the view.
+        self.expenses = {exp.pk: exp for exp in self.expense_repo.get_all()}
+        self.refresh.set_expenses(list(self.expenses.values()))
 
         # Update budgets as they have expanses inside:
-        self.update_budgets()
+        self.totals = SpendingTotals(self.expenses.values())
+        self.daily = DailyTotals(self.expenses.values())
+        self.forecasts = []
+        self.reload_budgets()
 
-    def add_expense(self, amount: str, cat_name: str, comment: str="") -> None:
+    def make_expense(self, amount: str, cat_name: str, comment: str="") -> Expense:
 
         # Parse user input:
         try:
@@ -153,30 +408,48 @@ class Bookkeeper:
             raise ValueError("Введите положительную величину покупки.")
 
         # Get expense category (to link to it's id):
-        cats = self.category_repo.get_all(where={"name":cat_name.lower()})
+        cat = self.get_category(cat_name)
 
-        if len(cats) == 0:
-            raise ValueError(f"Категории \"{cat_name}\" не существует")
+        # Create the expense (not saved yet):
+        return Expense(amount_int, cat.pk, comment=comment)
 
-        # Create the expense:
-        cat = cats[0]
-        new_exp = Expense(amount_int, cat.pk, comment=comment)
+    def add_expense(self, amount: str, cat_name: str, comment: str="") -> None:
+
+        new_exp = self.make_expense(amount, cat_name, comment)
 
         self.expense_repo.add(new_exp)
-        self.update_expenses()
+        self.publish(ExpenseAdded(new_exp))
+
+        self.history.record(AddExpense(replace(new_exp)))
+
+        self.check_budgets()
+
+    def add_expenses(self, exps: list[Expense]) -> None:
+        # Bulk insert of the expenses made by make_expense: one add_many
+        # call, one event and one budget update for the whole batch:
+        if not exps:
+            return
+        self.expense_repo.add_many(exps)
+        self.publish(ExpensesAdded(tuple(exps)))
+
+        self.history.record(AddExpenses(tuple(replace(exp) for exp in exps)))
 
+        self.check_budgets()
+
+    def check_budgets(self) -> None:
         # Check budget limits:
         for budget in self.budgets:
             if budget.spent > budget.limitation:
                 self.view.not_on_budget_message()
                 return
 
-
     def delete_expenses(self, exp_pks: set[int]) -> None:
 
-        for pk in exp_pks:
-            self.expense_repo.delete(pk)
-        self.update_expenses()
+        exps = tuple(self.expenses[pk] for pk in exp_pks if pk in self.expenses)
+        self.expense_repo.delete_many(list(exp_pks))
+        self.publish(ExpensesDeleted(exps))
+
+        self.history.record(DeleteExpenses(tuple(replace(exp) for exp in exps)))
 
     def modify_expense(self, pk: int, attr: str, new_val: str) -> None:
 
@@ -185,20 +458,21 @@ class Bookkeeper:
         if exp is None:
             raise ValueError(f"Расхода с pk=\"{pk}\" не существует")
 
+        # Keep the old values to subtract from the totals (the repository
+        # may return the very object that gets modified below):
+        old_exp = replace(exp)
+
         # Modify category:
         if attr == "category":
-            # Parse string:
-            cat_name = new_val.lower()
-
-            if cat_name not in [c.name for c in self.categories]:
-                self.view.set_expenses(self.expenses)
-                raise ValueError(f"Категории \"{cat_name}\" не существует")
-
             # Get category pk:
-            cat_pk = self.category_repo.get_all(where={'name':cat_name})[0].pk
+            cat = self.category_index.get(new_val)
+
+            if cat is None:
+                self.revert_expense(pk)
+                raise ValueError(f"Категории \"{new_val.lower()}\" не существует")
 
             # Update expense pk:
-            setattr(exp, attr, cat_pk)
+            setattr(exp, attr, cat.pk)
 
         # Modify amount:
         if attr == "amount":
@@ -206,12 +480,13 @@ class Bookkeeper:
             try:
                 amount = int(new_val)
             except ValueError as exc:
+                self.revert_expense(pk)
                 raise ValueError("Чем это Вы расплачивались?\n"
                                     + "Введите сумму целым числом.") from exc
 
             # Check for negative amount:
             if amount <= 0:
-                self.view.set_expenses(self.expenses)
+                self.revert_expense(pk)
                 raise ValueError("Удачная покупка! Записывать не буду.")
 
             setattr(exp, attr, amount)
@@ -223,52 +498,107 @@ class Bookkeeper:
                 time = datetime.fromisoformat(new_val).isoformat(
                             sep='\t', timespec='minutes')
             except ValueError as exc:
-                self.view.set_expenses(self.expenses)
+                self.revert_expense(pk)
                 raise ValueError("Неправильный формат даты.") from exc
 
             setattr(exp, attr, time)
 
         # Update the expense:
         self.expense_repo.update(exp)
-
-        # Update view and expenses in the budget:
-        self.update_expenses()
+        self.publish(ExpenseChanged(old_exp, exp))
+
+        self.history.record(ModifyExpense(old_exp, replace(exp)))
+
+    def insert_expenses(self, exps: tuple[Expense, ...]) -> None:
+        # Put back removed expenses with their former primary keys. The
+        # repository gets copies, so the recorded commands stay intact:
+        exps = tuple(replace(exp) for exp in exps)
+        self.expense_repo.restore_many(exps)
+        self.publish(ExpensesAdded(exps))
+
+    def remove_expenses(self, exps: tuple[Expense, ...]) -> None:
+        exps = tuple(self.expenses.get(exp.pk, exp) for exp in exps)
+        self.expense_repo.delete_many([exp.pk for exp in exps])
+        self.publish(ExpensesDeleted(exps))
+
+    def replace_expense(self, old: Expense, new: Expense) -> None:
+        new = replace(new)
+        self.expense_repo.update(new)
+        self.publish(ExpenseChanged(self.expenses.get(old.pk, old), new))
+
+    def get_category_expenses(self, cat_name: str) -> list[Expense]:
+        # Expenses of the category and all its subcategories:
+        cat = self.get_category(cat_name)
+        return self.expense_repo.get_all_in_subtree('category', self.category_repo,
+                                                    cat.pk)
+
+    def revert_expense(self, pk: int) -> None:
+        # Restore the row edited in the view to the cached value:
+        if pk in self.expenses:
+            self.refresh.expense_changed(self.expenses[pk])
 
     #######################
     ## Budget operations ##
     #######################
 
-    def update_budgets(self) -> None:
+    def update_budgets(self, force_view: bool = False) -> None:
+
+        # Recount the totals once the day (or hour) is over, from the daily
+        # and monthly totals of the repository rather than all expenses:
+        if not self.totals.is_current():
+            self.totals.load(self.expense_repo)
 
-        # Update budget integrity:
-        for budget in self.budget_repo.get_all():
-            budget.update_spent(self.expense_repo)
-            self.budget_repo.update(budget)
+        # Rolling windows slide on, dropping the expenses left behind:
+        self.totals.advance()
 
-        # Update internal representation and view:
+        # Write back only the budgets whose spendings have changed:
+        changed = force_view
+        for budget in self.budgets:
+            spent = self.totals.budget_spent(budget)
+            if budget.spent != spent:
+                budget.spent = spent
+                self.budget_repo.update(budget)
+                changed = True
+
+        # Update view:
+        if changed:
+            self.publish(BudgetsChanged(tuple(self.budgets)))
+
+        # Forecasts move with every expense (and with time), so they are
+        # recounted on each update but published only when they change:
+        forecasts = forecast_budgets(self.daily, self.budgets)
+        if forecasts != self.forecasts:
+            self.forecasts = forecasts
+            self.publish(ForecastsChanged(tuple(forecasts)))
+
+    def reload_budgets(self) -> None:
+        # Re-read budgets after the budget set itself has been changed:
         self.budgets = self.budget_repo.get_all()
-        self.view.set_budgets(self.budgets)
+        self.totals.track(self.budgets, self.expenses.values())
+        self.update_budgets(force_view=True)
 
     def modify_budget(self, pk: int | None, new_limit: str, period: str) -> None:
 
         # Remove budget if no spendings limit is set:
         if new_limit == "":
-            if pk is not None:
-                self.budget_repo.delete(pk)
-            self.update_budgets()
+            budget = self.budget_repo.get(pk) if pk is not None else None
+            if budget is not None:
+                self.budget_repo.delete(budget.pk)
+                self.history.record(ModifyBudget(copy_budget(budget), None))
+            self.reload_budgets()
             return
 
         # Parse limit as integer:
         try:
             new_limit_int = int(new_limit)
         except ValueError as exc:
-            self.update_budgets()
+            self.reload_budgets()
             raise ValueError("Неправильный формат.\n"
                                 + "Введите сумму целым числом.") from exc
 
         # Handler nagative limit:
         if new_limit_int < 0:
-            self.update_budgets()
+            self.reload_budgets()
             raise ValueError("За этот период придется заработать.")
 
         # Handle nonexistent primary key:
@@ -276,14 +606,118 @@ class Bookkeeper:
             # Insert newly-created budget:
             budget_new = Budget(limitation=new_limit_int, period=period)
             self.budget_repo.add(budget_new)
+            self.history.record(ModifyBudget(None, copy_budget(budget_new)))
         else:
             # Or update existing one:
             budget_old = self.budget_repo.get(pk)
             if budget_old is None:
                 raise ValueError(f"Бюджета с pk=\"{pk}\" не существует")
 
+            before = copy_budget(budget_old)
             budget_old.limitation = new_limit_int
             self.budget_repo.update(budget_old)
+            self.history.record(ModifyBudget(before, copy_budget(budget_old)))
 
         # Final update:
-        self.update_budgets()
\ No newline at end of file
+        self.reload_budgets()
+
+    def replace_budget(self, old: Budget | None, new: Budget | None) -> None:
+        if new is None:
+            if old is not None:
+                self.budget_repo.delete(old.pk)
+        elif old is None:
+            self.budget_repo.restore_many([copy_budget(new)])
+        else:
+            self.budget_repo.update(copy_budget(new))
+
+        # Spendings are recounted anyway:
+        self.reload_budgets()
+
+    #############
+    ## Ledgers ##
+    #############
+
+    def open_ledger(self, name: str) -> None:
+        # Open a ledger of the registry (a new one is created):
+        if self.ledgers is None:
+            raise ValueError("Список журналов не задан")
+        name = name.strip()
+        if name == self.ledger_name:
+            return
+        self.switch_ledger(self.ledgers.open(name))
+        self.view.set_ledgers(self.ledgers.names(), name)
+
+    def switch_ledger(self,
+                      repository_factory : Callable[[Any], AbstractRepository[Any]]
+                      ) -> None:
+        # Reload everything from other repositories. The view gets the new
+        # data in one refresh and keeps its widgets:
+        with self.refresh.batch():
+            self.load(repository_factory)
+        self.ledger_name = getattr(repository_factory, 'name', None)
+
+        # The undo history refers to the records of the previous ledger:
+        self.history.clear()
+        self.version += 1
+
+    ###################
+    ## Undo and redo ##
+    ###################
+
+    def undo(self) -> None:
+        # A command of several steps is undone (and redone) as a whole:
+        with self.transaction():
+            self.history.undo(self)
+
+    def redo(self) -> None:
+        with self.transaction():
+            self.history.redo(self)
+
+    #################
+    ## Transaction ##
+    #################
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        # The repository writes of the block are committed or rolled back
+        # together (the repositories of one database file share a single
+        # transaction). Its events are published after the commit, so the
+        # subscribers never see the rolled back changes. The repositories
+        # without transactions keep the steps already made, so the cached
+        # state is reloaded after a failure:
+        if self.in_transaction:
+            yield
+            return
+
+        self.in_transaction = True
+        try:
+            with ExitStack() as stack:
+                for repo in (self.category_repo, self.expense_repo, self.budget_repo):
+                    stack.enter_context(repo.transaction())
+                yield
+        except Exception:
+            self.pending_events.clear()
+            self.reload_state()
+            raise
+        finally:
+            self.in_transaction = False
+
+        events, self.pending_events = self.pending_events, []
+        for event in events:
+            self.bus.publish(event)
+
+    def publish(self, event: Event) -> None:
+        # Publish the event now or, inside a transaction, after its commit:
+        if self.in_transaction:
+            self.pending_events.append(event)
+        else:
+            self.bus.publish(event)
+
+    def reload_state(self) -> None:
+        # Read the categories, budgets and expenses from the repositories:
+        self.categories = self.category_repo.get_all()
+        self.category_index.rebuild(self.categories)
+        self.refresh.set_categories(self.category_snapshot())
+
+        self.budgets = self.budget_repo.get_all()
+        self.update_expenses()
@@ -0,0 +1,302 @@
+"""
+Журнал команд для отмены и повтора изменений
+
+Каждое изменение данных в Bookkeeper записывается как команда, которая
+хранит все необходимое для обратной операции: удаленные записи, прежние
+значения измененного расхода, список подкатегорий, перенесенных при
+удалении категории. Отмена и повтор выполняются пакетными операциями
+репозитория (restore_many, delete_many, update_many), а не по одной
+записи.
+
+Журнал ограничен по числу команд и по общему числу хранимых записей:
+при переполнении забываются самые старые команды.
+"""
+
+from collections import deque
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Protocol
+
+from bookkeeper.models.budget import Budget
+from bookkeeper.models.category import Category
+from bookkeeper.models.expense import Expense
+
+if TYPE_CHECKING:
+    from bookkeeper.bookkeeper import Bookkeeper
+
+
+class Command(Protocol):
+    """
+    Команда: изменение, которое можно отменить и повторить.
+    size - число хранимых командой записей
+    """
+
+    @property
+    def size(self) -> int:
+        """ Число хранимых записей """
+
+    def undo(self, app: 'Bookkeeper') -> None:
+        """ Отменить изменение """
+
+    def redo(self, app: 'Bookkeeper') -> None:
+        """ Повторить изменение """
+
+
+@dataclass(frozen=True)
+class AddExpense:
+    """ Добавление расхода """
+    expense: Expense
+
+    @property
+    def size(self) -> int:
+        """ Число хранимых записей """
+        return 1
+
+    def undo(self, app: 'Bookkeeper') -> None:
+        """ Отменить изменение """
+        app.remove_expenses((self.expense,))
+
+    def redo(self, app: 'Bookkeeper') -> None:
+        """ Повторить изменение """
+        app.insert_expenses((self.expense,))
+
+
+@dataclass(frozen=True)
+class AddExpenses:
+    """ Пакетное добавление расходов """
+    expenses: tuple[Expense, ...]
+
+    @property
+    def size(self) -> int:
+        """ Число хранимых записей """
+        return len(self.expenses)
+
+    def undo(self, app: 'Bookkeeper') -> None:
+        """ Отменить изменение """
+        app.remove_expenses(self.expenses)
+
+    def redo(self, app: 'Bookkeeper') -> None:
+        """ Повторить изменение """
+        app.insert_expenses(self.expenses)
+
+
+@dataclass(frozen=True)
+class DeleteExpenses:
+    """ Удаление расходов """
+    expenses: tuple[Expense, ...]
+
+    @property
+    def size(self) -> int:
+        """ Число хранимых записей """
+        return len(self.expenses)
+
+    def undo(self, app: 'Bookkeeper') -> None:
+        """ Отменить изменение """
+        app.insert_expenses(self.expenses)
+
+    def redo(self, app: 'Bookkeeper') -> None:
+        """ Повторить изменение """
+        app.remove_expenses(self.expenses)
+
+
+@dataclass(frozen=True)
+class ModifyExpense:
+    """ Изменение расхода: old - прежние значения, new - новые """
+    old: Expense
+    new: Expense
+
+    @property
+    def size(self) -> int:
+        """ Число хранимых записей """
+        return 2
+
+    def undo(self, app: 'Bookkeeper') -> None:
+        """ Отменить изменение """
+        app.replace_expense(self.new, self.old)
+
+    def redo(self, app: 'Bookkeeper') -> None:
+        """ Повторить изменение """
+        app.replace_expense(self.old, self.new)
+
+
+@dataclass(frozen=True)
+class AddCategory:
+    """ Добавление категории """
+    category: Category
+
+    @property
+    def size(self) -> int:
+        """ Число хранимых записей """
+        return 1
+
+    def undo(self, app: 'Bookkeeper') -> None:
+        """ Отменить изменение """
+        app.remove_category(self.category)
+
+    def redo(self, app: 'Bookkeeper') -> None:
+        """ Повторить изменение """
+        app.insert_category(self.category, ())
+
+
+@dataclass(frozen=True)
+class DeleteCategory:
+    """
+    Удаление категории вместе с ее расходами.
+    children - id подкатегорий, перенесенных к родителю удаленной категории
+    """
+    category: Category
+    children: tuple[int, ...]
+    expenses: tuple[Expense, ...]
+
+    @property
+    def size(self) -> int:
+        """ Число хранимых записей """
+        return 1 + len(self.children) + len(self.expenses)
+
+    def undo(self, app: 'Bookkeeper') -> None:
+        """ Отменить изменение """
+        app.insert_category(self.category, self.children)
+        app.insert_expenses(self.expenses)
+
+    def redo(self, app: 'Bookkeeper') -> None:
+        """ Повторить изменение """
+        app.remove_category(self.category)
+        app.remove_expenses(self.expenses)
+
+
+@dataclass(frozen=True)
+class DeleteCategoryTree:
+    """
+    Удаление категории вместе со всеми подкатегориями и их расходами.
+    categories[0] - корень удаленного поддерева
+    """
+    categories: tuple[Category, ...]
+    expenses: tuple[Expense, ...]
+
+    @property
+    def size(self) -> int:
+        """ Число хранимых записей """
+        return len(self.categories) + len(self.expenses)
+
+    def undo(self, app: 'Bookkeeper') -> None:
+        """ Отменить изменение """
+        app.insert_categories(self.categories)
+        app.insert_expenses(self.expenses)
+
+    def redo(self, app: 'Bookkeeper') -> None:
+        """ Повторить изменение """
+        app.remove_category_tree(self.categories[0])
+        app.remove_expenses(self.expenses)
+
+
+@dataclass(frozen=True)
+class MoveCategory:
+    """ Перенос категории с id pk от родителя old к родителю new """
+    pk: int
+    old: int | None
+    new: int | None
+
+    @property
+    def size(self) -> int:
+        """ Число хранимых записей """
+        return 1
+
+    def undo(self, app: 'Bookkeeper') -> None:
+        """ Отменить изменение """
+        app.reparent_category(self.pk, self.old)
+
+    def redo(self, app: 'Bookkeeper') -> None:
+        """ Повторить изменение """
+        app.reparent_category(self.pk, self.new)
+
+
+@dataclass(frozen=True)
+class ModifyBudget:
+    """
+    Изменение бюджета: old - бюджет до изменения (None, если его не было),
+    new - после изменения (None, если бюджет удален)
+    """
+    old: Budget | None
+    new: Budget | None
+
+    @property
+    def size(self) -> int:
+        """ Число хранимых записей """
+        return 2
+
+    def undo(self, app: 'Bookkeeper') -> None:
+        """ Отменить изменение """
+        app.replace_budget(self.new, self.old)
+
+    def redo(self, app: 'Bookkeeper') -> None:
+        """ Повторить изменение """
+        app.replace_budget(self.old, self.new)
+
+
+class CommandHistory:
+    """
+    Журнал команд с многоуровневой отменой и повтором.
+
+    Parameters
+    ----------
+    limit - максимальное число команд в журнале
+    max_rows - максимальное число записей, хранимых всеми командами
+    """
+
+    def __init__(self, limit: int = 100, max_rows: int = 100_000) -> None:
+        self.limit = limit
+        self.max_rows = max_rows
+        self.done: deque[Command] = deque()
+        self.undone: list[Command] = []
+        self.rows = 0
+
+    @property
+    def can_undo(self) -> bool:
+        """ Есть ли команды для отмены """
+        return bool(self.done)
+
+    @property
+    def can_redo(self) -> bool:
+        """ Есть ли команды для повтора """
+        return bool(self.undone)
+
+    def record(self, command: Command) -> None:
+        """ Записать выполненную команду. Отмененные команды забываются. """
+        self.rows -= sum(cmd.size for cmd in self.undone)
+        self.undone.clear()
+
+        self.done.append(command)
+        self.rows += command.size
+        while self.done and (len(self.done) > self.limit or self.rows > self.max_rows):
+            self.rows -= self.done.popleft().size
+
+    def undo(self, app: 'Bookkeeper') -> Command:
+        """ Отменить последнюю выполненную команду """
+        if not self.done:
+            raise ValueError("Нечего отменять.")
+        command = self.done.pop()
+        try:
+            command.undo(app)
+        except Exception:
+            self.done.append(command)
+            raise
+        self.undone.append(command)
+        return command
+
+    def redo(self, app: 'Bookkeeper') -> Command:
+        """ Повторить последнюю отмененную команду """
+        if not self.undone:
+            raise ValueError("Нечего повторять.")
+        command = self.undone.pop()
+        try:
+            command.redo(app)
+        except Exception:
+            self.undone.append(command)
+            raise
+        self.done.append(command)
+        return command
+
+    def clear(self) -> None:
+        """ Очистить журнал """
+        self.done.clear()
+        self.undone.clear()
+        self.rows = 0
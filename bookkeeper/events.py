@@ -0,0 +1,217 @@
+"""
+Шина событий предметной области
+
+Контроллер публикует события после записи изменений в репозиторий,
+а представление, учет бюджетов и кеши подписываются только на нужные
+им события. Подписка на базовый класс (например, ExpenseEvent) получает
+все события-наследники.
+
+Доставка бывает синхронной (обработчик вызывается внутри publish) и
+отложенной (событие ставится в очередь и доставляется при вызове flush,
+например, из цикла обработки событий интерфейса).
+"""
+
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, TypeVar
+
+from bookkeeper.models.budget import Budget
+from bookkeeper.models.forecast import Forecast
+from bookkeeper.models.category import Category
+from bookkeeper.models.expense import Expense
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Event:
+    """ Базовый класс событий """
+
+
+@dataclass(frozen=True)
+class ExpenseEvent(Event):
+    """ Изменение списка расходов """
+
+
+@dataclass(frozen=True)
+class ExpenseAdded(ExpenseEvent):
+    """ Добавлен расход """
+    expense: Expense
+
+
+@dataclass(frozen=True)
+class ExpensesAdded(ExpenseEvent):
+    """ Добавлены (восстановлены) расходы """
+    expenses: tuple[Expense, ...]
+
+
+@dataclass(frozen=True)
+class ExpenseChanged(ExpenseEvent):
+    """ Изменен расход: old - копия до изменения, new - после """
+    old: Expense
+    new: Expense
+
+
+@dataclass(frozen=True)
+class ExpensesDeleted(ExpenseEvent):
+    """ Удалены расходы """
+    expenses: tuple[Expense, ...]
+
+
+@dataclass(frozen=True)
+class CategoryEvent(Event):
+    """ Изменение списка категорий """
+
+
+@dataclass(frozen=True)
+class CategoryAdded(CategoryEvent):
+    """ Добавлена категория """
+    category: Category
+
+
+@dataclass(frozen=True)
+class CategoryRemoved(CategoryEvent):
+    """ Удалена категория, ее подкатегории children перенесены к ее родителю """
+    category: Category
+    children: tuple[Category, ...] = ()
+
+
+@dataclass(frozen=True)
+class CategoryTreeAdded(CategoryEvent):
+    """ Добавлены (восстановлены) категории, родители - раньше потомков """
+    categories: tuple[Category, ...]
+
+
+@dataclass(frozen=True)
+class CategoryTreeRemoved(CategoryEvent):
+    """ Удалена категория categories[0] вместе со всеми подкатегориями """
+    categories: tuple[Category, ...]
+
+
+@dataclass(frozen=True)
+class CategoryMoved(CategoryEvent):
+    """ Категория (с подкатегориями) перенесена от родителя old_parent """
+    category: Category
+    old_parent: int | None
+
+
+@dataclass(frozen=True)
+class BudgetsChanged(Event):
+    """ Изменились лимиты или потраченные суммы бюджетов """
+    budgets: tuple[Budget, ...]
+
+
+@dataclass(frozen=True)
+class ForecastsChanged(Event):
+    """ Изменился прогноз по бюджетам """
+    forecasts: tuple[Forecast, ...]
+
+
+E = TypeVar('E', bound=Event)
+
+
+@dataclass
+class Subscription:
+    """ Подписка обработчика handler на события типа event_type """
+    event_type: type[Event]
+    handler: Callable[[Any], None]
+    queued: bool = False
+
+
+class EventBus:
+    """
+    Шина событий. Обработчики вызываются в порядке подписки.
+    События, опубликованные обработчиком, доставляются после того, как
+    текущее событие получат все подписчики, поэтому каждый подписчик видит
+    события в порядке публикации.
+    Исключение в синхронном обработчике передается тому, кто опубликовал
+    событие, но только после доставки этого и всех ожидающих событий
+    остальным подписчикам: их состояние не расходится с опубликованным.
+    Если ошибок несколько, передается первая, остальные записываются в журнал.
+    """
+
+    def __init__(self) -> None:
+        self._subscriptions: list[Subscription] = []
+        self._routes: dict[type[Event], list[Subscription]] = {}
+        self._queue: deque[tuple[Callable[[Any], None], Event]] = deque()
+        self._published: deque[Event] = deque()
+        self._dispatching = False
+
+    def subscribe(self, event_type: type[E], handler: Callable[[E], None],
+                  queued: bool = False) -> Callable[[], None]:
+        """
+        Подписаться на события типа event_type и его наследников.
+
+        Parameters
+        ----------
+        event_type - тип событий
+        handler - обработчик, получает событие
+        queued - доставлять события при вызове flush, а не сразу
+
+        Returns
+        -------
+        Функция, отменяющая подписку
+        """
+        subscription = Subscription(event_type, handler, queued)
+        self._subscriptions.append(subscription)
+        self._routes.clear()
+
+        def unsubscribe() -> None:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+                self._routes.clear()
+        return unsubscribe
+
+    def _route(self, event_type: type[Event]) -> list[Subscription]:
+        route = self._routes.get(event_type)
+        if route is None:
+            route = [s for s in self._subscriptions
+                     if issubclass(event_type, s.event_type)]
+            self._routes[event_type] = route
+        return route
+
+    def publish(self, event: Event) -> None:
+        """ Опубликовать событие """
+        self._published.append(event)
+        if self._dispatching:
+            return
+
+        self._dispatching = True
+        errors: list[Exception] = []
+        try:
+            while self._published:
+                self._dispatch(self._published.popleft(), errors)
+        finally:
+            self._dispatching = False
+            self._published.clear()
+
+        if errors:
+            for exc in errors[1:]:
+                logger.error("Event handler failed", exc_info=exc)
+            raise errors[0]
+
+    def _dispatch(self, event: Event, errors: list[Exception]) -> None:
+        for subscription in self._route(type(event)):
+            if subscription.queued:
+                self._queue.append((subscription.handler, event))
+                continue
+            try:
+                subscription.handler(event)
+            except Exception as exc:  # pylint: disable=broad-except
+                # Reported once the other subscribers have got the events:
+                errors.append(exc)
+
+    @property
+    def pending(self) -> int:
+        """ Число событий в очереди отложенной доставки """
+        return len(self._queue)
+
+    def flush(self) -> int:
+        """ Доставить отложенные события, вернуть их число """
+        delivered = 0
+        while self._queue:
+            handler, event = self._queue.popleft()
+            handler(event)
+            delivered += 1
+        return delivered
@@ -0,0 +1,294 @@
+"""
+Генератор синтетических журналов расходов
+
+Создает воспроизводимые (при одинаковом seed) наборы данных для нагрузочного
+тестирования и профилирования:
+- глубокое дерево категорий, начинающееся с типичных категорий
+  (как в create_db_table.py) и дополняемое подкатегориями;
+- неравномерное распределение трат по категориям (закон Ципфа) с
+  характерной для каждой категории суммой;
+- сезонность дат: больше трат в декабре и по выходным;
+- комментарии и бюджеты, согласованные со средними тратами.
+
+История заканчивается фиксированной датой (DEFAULT_END или --end), поэтому
+журнал не зависит от дня запуска.
+
+Данные записываются в любые репозитории через пакетные методы (add_many).
+
+Пример:
+    python -m bookkeeper.ledger_generator --db database/load.db \\
+        --categories 500 --expenses 1000000 --seed 42
+"""
+
+import argparse
+import math
+import random
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from itertools import accumulate
+from time import perf_counter
+from typing import Iterator
+
+from bookkeeper.models.budget import Budget
+from bookkeeper.models.category import Category
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.abstract_repository import AbstractRepository
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+from bookkeeper.utils import read_tree
+
+BASE_TREE = '''
+продукты
+    мясо
+        сырое мясо
+        мясные продукты
+    сладости
+    хлеб
+    напитки
+        кофе
+        чай
+        сок
+        вода
+развлечения
+    кино
+    театр
+    концерт
+    ресторан
+транспорт
+    бензин
+    метро
+    такси
+    билеты
+        билеты на поезд
+        билеты на самолет
+        билеты на автобус
+книги
+одежда
+товары для дома
+лекарства
+'''.splitlines()
+
+COMMENTS = ['по акции', 'на неделю', 'с друзьями', 'подарок', 'в дорогу',
+            'к празднику', 'срочно', 'для дома', 'на работу', 'по пути домой']
+SHOPS = ['Пятерочка', 'Перекресток', 'Магнит', 'ВкусВилл', 'Азбука вкуса',
+         'Озон', 'Wildberries', 'Лента', 'Ашан', 'Дикси']
+
+MAX_DEPTH = 8
+
+# The last day of the generated history (the same ledger on every run):
+DEFAULT_END = datetime(2024, 12, 31, 21)
+
+
+@dataclass
+class LedgerStats:
+    """
+    Сводка о сгенерированном журнале.
+    """
+    categories: int = 0
+    expenses: int = 0
+    budgets: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        """ Скорость заполнения, записей в секунду """
+        rows = self.categories + self.expenses + self.budgets
+        return rows / self.seconds if self.seconds > 0 else 0.0
+
+
+class LedgerGenerator:
+    """
+    Генератор данных журнала.
+
+    Parameters
+    ----------
+    seed - зерно генератора случайных чисел
+    end - дата последнего расхода
+    days - длина истории в днях
+    """
+
+    def __init__(self, seed: int = 0, end: datetime = DEFAULT_END,
+                 days: int = 730) -> None:
+        self.rnd = random.Random(seed)
+        self.end = end.replace(microsecond=0)
+        self.days = days
+
+        # Per-day weights: yearly peak at the end of December, busier weekends.
+        first_day = self.end - timedelta(days=days - 1)
+        weights = []
+        for i in range(days):
+            day = first_day + timedelta(days=i)
+            yday = day.timetuple().tm_yday
+            season = 1 + 0.25 * math.cos(2 * math.pi * (yday - 358) / 365)
+            weekend = 1.3 if day.weekday() >= 5 else 1.0
+            weights.append(season * weekend)
+
+        self.first_day = first_day.replace(hour=0, minute=0, second=0)
+        self.day_cum_weights = list(accumulate(weights))
+
+    def category_tree(self, count: int) -> list[tuple[str, str | None]]:
+        """
+        Сгенерировать дерево из count категорий в виде списка пар
+        "потомок-родитель" в порядке топологической сортировки
+        (см. utils.read_tree).
+        """
+        tree = read_tree(BASE_TREE)[:count]
+        n_base = len(tree)
+        depth = {name: 0 for name, _ in tree}
+        for name, parent in tree:
+            if parent is not None:
+                depth[name] = depth[parent] + 1
+
+        names = [name for name, _ in tree]
+        while len(tree) < count:
+            # Prefer deeper parents to get a deep hierarchy:
+            parent = max(self.rnd.sample(names, min(3, len(names))),
+                         key=lambda n: depth[n])
+            if depth[parent] >= MAX_DEPTH - 1:
+                parent = self.rnd.choice(names[:n_base])
+
+            name = f"{parent.split(' #')[0]} #{len(tree)}"
+            tree.append((name, parent))
+            depth[name] = depth[parent] + 1
+            names.append(name)
+        return tree
+
+    def expenses(self, count: int, category_pks: list[int]) -> Iterator[Expense]:
+        """
+        Сгенерировать count расходов по категориям category_pks
+        в хронологическом порядке.
+        """
+        # Zipf-distributed category popularity and per-category typical amount:
+        ranked = category_pks[:]
+        self.rnd.shuffle(ranked)
+        cat_cum_weights = list(accumulate(1 / (rank + 1) ** 1.1
+                                          for rank in range(len(ranked))))
+        median = {pk: math.exp(self.rnd.gauss(math.log(500), 1.0)) for pk in ranked}
+
+        days = self.rnd.choices(range(self.days),
+                                cum_weights=self.day_cum_weights, k=count)
+        dates = sorted(self.first_day + timedelta(
+            days=day, seconds=self.rnd.randrange(8 * 3600, 23 * 3600),
+            microseconds=self.rnd.randrange(1, 1000000)) for day in days)
+        cats = self.rnd.choices(ranked, cum_weights=cat_cum_weights, k=count)
+
+        for expense_date, cat in zip(dates, cats):
+            amount = max(1, int(self.rnd.lognormvariate(math.log(median[cat]), 0.6)))
+
+            added_date = expense_date + timedelta(minutes=self.rnd.randrange(600))
+
+            yield Expense(amount, cat, expense_date=expense_date,
+                          added_date=added_date, comment=self.comment())
+
+    def comment(self) -> str:
+        """ Случайный комментарий к расходу (часто пустой) """
+        roll = self.rnd.random()
+        if roll < 0.4:
+            return ''
+        if roll < 0.7:
+            return self.rnd.choice(COMMENTS)
+        if roll < 0.9:
+            return self.rnd.choice(SHOPS)
+        return f"{self.rnd.choice(COMMENTS)}, {self.rnd.choice(SHOPS)}"
+
+    def budgets(self, total_spent: int) -> list[Budget]:
+        """ Бюджеты на день, неделю и месяц чуть выше средних трат """
+        per_day = total_spent / self.days
+        return [Budget(int(round(per_day * days * 1.1, -2)), period)
+                for days, period in [(1, "day"), (7, "week"), (30, "month")]]
+
+
+def add_category_tree(tree: list[tuple[str, str | None]],
+                      repo: AbstractRepository[Category]) -> list[Category]:
+    """
+    Записать дерево категорий в репозиторий одним пакетным вызовом
+    (см. Category.create_from_tree).
+    """
+    return Category.create_from_tree(tree, repo)
+
+
+def fill_ledger(  # pylint: disable=too-many-arguments
+                category_repo: AbstractRepository[Category],
+                expense_repo: AbstractRepository[Expense],
+                budget_repo: AbstractRepository[Budget] | None = None,
+                n_categories: int = 100,
+                n_expenses: int = 10000,
+                seed: int = 0,
+                batch_size: int = 10000,
+                end: datetime = DEFAULT_END) -> LedgerStats:
+    """
+    Заполнить репозитории синтетическим журналом.
+
+    Parameters
+    ----------
+    category_repo, expense_repo, budget_repo - репозитории для заполнения
+        (бюджеты не создаются, если budget_repo не задан)
+    n_categories - число категорий
+    n_expenses - число расходов
+    seed - зерно генератора
+    batch_size - число расходов в одном вызове add_many
+    end - дата последнего расхода
+
+    Returns
+    -------
+    Сводка LedgerStats
+    """
+    start = perf_counter()
+    generator = LedgerGenerator(seed, end)
+    stats = LedgerStats()
+
+    cats = add_category_tree(generator.category_tree(n_categories), category_repo)
+    stats.categories = len(cats)
+
+    total_spent = 0
+    batch: list[Expense] = []
+    for exp in generator.expenses(n_expenses, [c.pk for c in cats]):
+        batch.append(exp)
+        total_spent += exp.amount
+        if len(batch) >= batch_size:
+            expense_repo.add_many(batch)
+            batch = []
+    expense_repo.add_many(batch)
+    stats.expenses = n_expenses
+
+    if budget_repo is not None:
+        stats.budgets = len(budget_repo.add_many(generator.budgets(total_spent)))
+
+    stats.seconds = perf_counter() - start
+    return stats
+
+
+def main(argv: list[str] | None = None) -> int:
+    """ Точка входа командной строки """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument('--db', help="файл базы данных (по умолчанию - в памяти)")
+    parser.add_argument('--categories', type=int, default=100)
+    parser.add_argument('--expenses', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--no-budgets', action='store_true')
+    parser.add_argument('--end', type=datetime.fromisoformat, default=DEFAULT_END,
+                        help="дата последнего расхода, YYYY-MM-DD")
+    args = parser.parse_args(argv)
+
+    repos: list[AbstractRepository] = []  # type: ignore[type-arg]
+    for model in [Category, Expense, Budget]:
+        if args.db is None:
+            repos.append(MemoryRepository())
+        else:
+            repos.append(SQLiteRepository(db_file=args.db, cls=model,
+                                          wal=True, synchronous="NORMAL"))
+
+    stats = fill_ledger(repos[0], repos[1], None if args.no_budgets else repos[2],
+                        n_categories=args.categories, n_expenses=args.expenses,
+                        seed=args.seed, batch_size=args.batch_size, end=args.end)
+
+    print(f"категорий: {stats.categories}, расходов: {stats.expenses}, "
+          f"бюджетов: {stats.budgets}")
+    print(f"время: {stats.seconds:.2f} с, {stats.rows_per_second:.0f} записей/с")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,12 +1,54 @@
 """
 Модель бюджета
+
+Бюджет ограничивает расходы за календарный период (час, день, неделю,
+месяц) или за скользящее окно из нескольких часов, дней или недель
+("24h", "7d", "2w" - последние 24 часа, 7 дней, 2 недели).
 """
 
+import re
+from bisect import insort
+from collections import deque
 from dataclasses import dataclass
+from datetime import datetime, timedelta
 from enum import Enum
+from heapq import heappop, heappush
+from typing import Hashable, Iterable
+
+from bookkeeper.repository.abstract_repository import AbstractRepository
+from bookkeeper.models.expense import Expense
+from bookkeeper.utils import to_datetime
 
 Period = Enum('Period', ["HOUR", "DAY", "WEEK", "MONTH"])
 
+# Units of the rolling windows ("7d" - the last 7 days):
+WINDOW_UNITS = {"h": Period.HOUR, "d": Period.DAY, "w": Period.WEEK}
+WINDOW_PATTERN = re.compile(r'([1-9]\d*)([hdw])')
+
+# Lengths of the periods a rolling window can be made of:
+PERIOD_LENGTHS = {Period.HOUR: timedelta(hours=1),
+                  Period.DAY: timedelta(days=1),
+                  Period.WEEK: timedelta(weeks=1)}
+
+
+def parse_period(period: str, window: int = 0) -> tuple[Period, int]:
+    """
+    Период бюджета и длина скользящего окна (в периодах, 0 - календарный
+    период) по названию: "hour", "day", "week", "month" или окно вида
+    "7d" (число часов h, дней d или недель w).
+    """
+    match = WINDOW_PATTERN.fullmatch(period)
+    if match is not None:
+        return WINDOW_UNITS[match[2]], int(match[1])
+    if period.upper() not in Period.__members__ or period != period.lower():
+        raise ValueError(f"unknown period \"{period}\" for budget\n"
+                         + "should be \"hour\", \"day\", \"week\", \"month\" "
+                         + "or a rolling window like \"24h\", \"7d\", \"2w\"")
+    parsed = Period[period.upper()]
+    if window < 0 or (window > 0 and parsed not in PERIOD_LENGTHS):
+        raise ValueError(f"no rolling window of {window} for period \"{period}\"")
+    return parsed, window
+
 
 @dataclass(slots=True)
 class Budget:
@@ -14,49 +56,233 @@ class Budget:
     period     : Period   # The period to be budgeted
     spent      : int = 0  # The amount of money spent in the period
     pk         : int = 0  # Primary key
+    window     : int = 0  # Periods in the rolling window (0 - calendar period)
 
     def __init__(self, limitation: int, period: str,
-                       spent: int = 0, pk: int = 0):
-        # Parse the period:
-        if period == "day":
-            self.period = Period.DAY
-        elif period == "week":
-            self.period = Period.WEEK
-        elif period == "month":
-            self.period = Period.MONTH
-        else:
-            raise ValueError(f"unknown period \"{period}\" for budget\n"
-                             + "should be \"day\", \"week\" or \"month\"")
+                       spent: int = 0, pk: int = 0, window: int = 0):
+        # Parse the period (and the rolling window):
+        self.period, self.window = parse_period(period, window)
 
         # Set other parameters:
         self.limitation = limitation
         self.spent      = spent
         self.pk         = pk
 
-    def update_spent(self, expense_repo: AbstractRepository[Expense]) -> None:
-        # Generate timestamp for operation:
-        date = datetime.now().isoformat()[:10] # YYYY-MM-DD format
+    @property
+    def name(self) -> str:
+        """ Название периода: "day" или скользящее окно вида "7d" """
+        if self.window:
+            return f"{self.window}{self.period.name[0].lower()}"
+        return self.period.name.lower()
+
+    @property
+    def length(self) -> timedelta:
+        """ Длина скользящего окна """
+        return self.window * PERIOD_LENGTHS.get(self.period, timedelta(0))
+
+
+def period_key(period: Period, date: datetime) -> Hashable:
+    """
+    Ключ периода, содержащего дату: у дат из одного дня (недели, месяца)
+    ключи совпадают.
+    """
+    if period == Period.HOUR:
+        return date.date(), date.hour
+    if period == Period.DAY:
+        return date.date()
+    if period == Period.WEEK:
+        return date.isocalendar()[:2]
+    return date.year, date.month
+
+
+def period_range(period: Period, date: datetime) -> tuple[str, str, str]:
+    """
+    Единица таблицы сумм ("day" или "month") и ключи ее первого и
+    последнего периодов, покрывающих день, неделю или месяц с датой date
+    (см. AbstractRepository.get_totals).
+    """
+    day = date.date()
+    if period == Period.WEEK:
+        monday = day - timedelta(days=day.weekday())
+        return "day", monday.isoformat(), (monday + timedelta(days=6)).isoformat()
+    if period == Period.MONTH:
+        return "month", day.isoformat()[:7], day.isoformat()[:7]
+    return "day", day.isoformat(), day.isoformat()
+
+
+class SlidingWindowSum:
+    """
+    Сумма расходов за скользящее окно длины length, заканчивающееся
+    моментом now: учитываются расходы в промежутке (now - length, now].
+
+    Расходы окна хранятся в очереди по времени. Новый расход обычно
+    добавляется в ее конец, а при сдвиге окна (advance) вышедшие из него
+    расходы снимаются с начала, поэтому каждый расход обрабатывается
+    за O(1) в среднем. Удаление записывается как расход с обратным знаком
+    в тот же момент: обе записи выходят из окна одновременно. Расходы
+    с датой позже now ждут в куче, пока окно до них не дойдет.
+    """
+
+    def __init__(self, length: timedelta, exps: Iterable[Expense] = (),
+                 now: datetime | None = None) -> None:
+        self.length = length
+        self.now = now if now is not None else datetime.now()
+        self.total = 0
+
+        # Amounts inside the window (by time) and the ones after it (heap):
+        self.entries: deque[tuple[datetime, int]] = deque()
+        self.pending: list[tuple[datetime, int]] = []
+
+        for exp in exps:
+            self.add(exp)
+
+    def __len__(self) -> int:
+        return len(self.entries) + len(self.pending)
+
+    def advance(self, now: datetime | None = None) -> None:
+        """ Сдвинуть конец окна в момент now (назад окно не сдвигается) """
+        now = now if now is not None else datetime.now()
+        if now <= self.now:
+            return
+        self.now = now
+
+        # The pending amounts come after all the entries:
+        while self.pending and self.pending[0][0] <= now:
+            date, amount = heappop(self.pending)
+            self.entries.append((date, amount))
+            self.total += amount
+
+        start = now - self.length
+        while self.entries and self.entries[0][0] <= start:
+            self.total -= self.entries.popleft()[1]
+
+    def _change(self, exp: Expense, sign: int) -> None:
+        date = to_datetime(exp.expense_date)
+        amount = sign * int(exp.amount)
+        if date > self.now:
+            heappush(self.pending, (date, amount))
+        elif date > self.now - self.length:
+            # Expenses back in time are rare, they are inserted in place:
+            if not self.entries or self.entries[-1][0] <= date:
+                self.entries.append((date, amount))
+            else:
+                insort(self.entries, (date, amount))
+            self.total += amount
+
+    def add(self, exp: Expense) -> None:
+        """ Учесть новый расход """
+        self._change(exp, 1)
+
+    def remove(self, exp: Expense) -> None:
+        """ Исключить удаленный расход (или старую версию измененного) """
+        self._change(exp, -1)
+
+
+class SpendingTotals:
+    """
+    Суммы расходов за текущие час, день, неделю и месяц, а также за
+    скользящие окна бюджетов (см. SlidingWindowSum и track).
+
+    Суммы пересчитываются целиком только при создании и при смене периода
+    (rebuild по расходам или load по таблицам сумм репозитория), а при
+    добавлении, изменении и удалении расхода изменяются на величину этого
+    расхода (add, remove), поэтому не требуют просмотра всех расходов.
+    Скользящие окна при смене периода не пересчитываются, а сдвигаются
+    (advance).
+    """
+
+    def __init__(self, exps: Iterable[Expense] = (),
+                 now: datetime | None = None) -> None:
+        self.keys: dict[Period, Hashable] = {}
+        self.totals: dict[Period, int] = {}
+        self.windows: dict[timedelta, SlidingWindowSum] = {}
+        self.rebuild(exps, now)
+
+    def rebuild(self, exps: Iterable[Expense], now: datetime | None = None) -> None:
+        """ Пересчитать суммы для периодов (и окон), содержащих момент now """
+        now = now if now is not None else datetime.now()
+        exps = list(exps)
+        self.keys = {period: period_key(period, now) for period in Period}
+        self.totals = dict.fromkeys(Period, 0)
+        self.windows = {length: SlidingWindowSum(length, now=now)
+                        for length in self.windows}
+        for exp in exps:
+            self.add(exp)
+
+    def track(self, budgets: Iterable[Budget], exps: Iterable[Expense],
+              now: datetime | None = None) -> None:
+        """
+        Вести скользящие окна бюджетов budgets: окна, которых еще нет,
+        заполняются по расходам exps, окна без бюджетов удаляются.
+        """
+        lengths = {budget.length for budget in budgets if budget.window}
+        self.windows = {length: self.windows[length] if length in self.windows
+                        else SlidingWindowSum(length, exps, now)
+                        for length in lengths}
+
+    def advance(self, now: datetime | None = None) -> None:
+        """ Сдвинуть скользящие окна в момент now """
+        now = now if now is not None else datetime.now()
+        for window in self.windows.values():
+            window.advance(now)
+
+    def load(self, expense_repo: AbstractRepository[Expense],
+             now: datetime | None = None) -> None:
+        """
+        Пересчитать суммы для периодов, содержащих момент now, по дневным
+        и месячным суммам репозитория (см. get_totals). Расходы читаются
+        только для суммы за час и только если за день они есть.
+        """
+        now = now if now is not None else datetime.now()
+        self.keys = {period: period_key(period, now) for period in Period}
+        self.totals = dict.fromkeys(Period, 0)
+
+        today = now.date().isoformat()
+        unit, first, last = period_range(Period.WEEK, now)
+        for (day, _), (total, _) in expense_repo.get_totals(unit, first, last).items():
+            self.totals[Period.WEEK] += total
+            if day == today:
+                self.totals[Period.DAY] += total
+
+        unit, first, last = period_range(Period.MONTH, now)
+        self.totals[Period.MONTH] = sum(
+            total for total, _ in expense_repo.get_totals(unit, first, last).values())
 
-        if self.period == Period.DAY:
-            date_mask   = f"{date}"
-            period_exps = expense_repo.get_all_by_pattern(patterns={"expense_date":date_mask})
+        if self.totals[Period.DAY]:
+            for exp in expense_repo.get_all_by_pattern({'expense_date': today}):
+                if period_key(Period.HOUR, to_datetime(exp.expense_date)) \
+                        == self.keys[Period.HOUR]:
+                    self.totals[Period.HOUR] += int(exp.amount)
 
-        elif self.period == Period.WEEK:
-            weekday_now    = datetime.now().weekday()
-            day_now        = datetime.fromisoformat(date)
-            first_week_day = day_now - timedelta(days=weekday_now)
+    def is_current(self, now: datetime | None = None) -> bool:
+        """ Проверить, что текущий день (и час) не сменился с момента пересчета """
+        now = now if now is not None else datetime.now()
+        return self.keys[Period.HOUR] == period_key(Period.HOUR, now)
 
-            period_exps = []
-            for i in range(7):
-                weekday   = first_week_day + timedelta(days=i)
-                date_mask = f"{weekday.isoformat()[:10]}"
+    def _change(self, exp: Expense, sign: int) -> None:
+        date = to_datetime(exp.expense_date)
+        for period, key in self.keys.items():
+            if period_key(period, date) == key:
+                self.totals[period] += sign * int(exp.amount)
 
-                period_exps += expense_repo.get_all_by_pattern(patterns={"expense_date":date_mask})
+    def add(self, exp: Expense) -> None:
+        """ Учесть новый расход """
+        self._change(exp, 1)
+        for window in self.windows.values():
+            window.add(exp)
 
-        elif self.period == Period.MONTH:
-            date_mask = f"{date[:7]}-"
+    def remove(self, exp: Expense) -> None:
+        """ Исключить удаленный расход (или старую версию измененного) """
+        self._change(exp, -1)
+        for window in self.windows.values():
+            window.remove(exp)
 
-            period_exps = expense_repo.get_all_by_pattern(patterns={"expense_date":date_mask})
+    def spent(self, period: Period) -> int:
+        """ Сумма расходов за текущий период """
+        return self.totals[period]
 
-        # Update money spent:
-        self.spent = sum([int(exp.amount) for exp in period_exps])  # pylint: disable=consider-using-generator
\ No newline at end of file
+    def budget_spent(self, budget: Budget) -> int:
+        """ Сумма расходов за период или скользящее окно бюджета """
+        if budget.window:
+            return self.windows[budget.length].total
+        return self.totals[budget.period]
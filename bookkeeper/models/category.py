@@ -1,11 +1,11 @@
 """
 Модель категории расходов
 """
-from collections import defaultdict
 from dataclasses import dataclass
-from typing import Iterator
+from typing import Iterable, Iterator
 
 from ..repository.abstract_repository import AbstractRepository
+from ..utils import iter_tree
 
 
 @dataclass
@@ -55,7 +55,8 @@ class Category:
         if parent is None:
             return
         yield parent
-        yield from parent.get_all_parents(repo)
+        # The rest of the chain in one repository call:
+        yield from repo.get_ancestors(parent.pk)
 
     def get_subcategories(self,
                           repo: AbstractRepository['Category']
@@ -72,18 +73,7 @@ class Category:
         -------
         Объекты Category, являющиеся подкатегориями разного уровня ниже данной.
         """
-
-        def get_children(graph: dict[int | None, list['Category']],
-                         root: int) -> Iterator['Category']:
-            """ dfs in graph from root """
-            for x in graph[root]:
-                yield x
-                yield from get_children(graph, x.pk)
-
-        subcats = defaultdict(list)
-        for cat in repo.get_all():
-            subcats[cat.parent].append(cat)
-        return get_children(subcats, self.pk)
+        yield from repo.get_descendants(self.pk)
 
     @classmethod
     def create_from_tree(
@@ -111,8 +101,66 @@ class Category:
         Список созданных объектов Category
         """
         created: dict[str, Category] = {}
-        for child, parent in tree:
-            cat = cls(child, created[parent].pk if parent is not None else None)
-            repo.add(cat)
-            created[child] = cat
+
+        def new_categories() -> Iterator[Category]:
+            # The parent is produced earlier, so its pk is already set:
+            for child, parent in tree:
+                cat = cls(child, created[parent].pk if parent is not None else None)
+                created[child] = cat
+                yield cat
+
+        repo.add_many(new_categories())
         return list(created.values())
+
+    @classmethod
+    def import_tree(
+            cls,
+            lines: Iterable[str],
+            repo: AbstractRepository['Category']) -> list['Category']:
+        """
+        Импортировать дерево категорий из текста с отступами (см.
+        utils.iter_tree). Текст читается построчно, поэтому можно передать
+        открытый файл любого размера, а категории записываются одним
+        пакетным вызовом repo.add_many (для SQLiteRepository - одна
+        транзакция, при любой ошибке не записывается ничего).
+
+        Дерево сливается с уже имеющимся в репозитории: категория, которая
+        уже есть у того же родителя, не создается повторно, а ее
+        подкатегории добавляются к существующей. Родители находятся
+        по названию, поэтому названия категорий должны быть уникальны.
+
+        Parameters
+        ----------
+        lines - строки текста (файл или список строк)
+        repo - репозиторий для сохранения объектов
+
+        Returns
+        -------
+        Список созданных объектов Category
+
+        Raises
+        ------
+        IndentationError - неверный отступ (номер строки в атрибуте lineno)
+        ValueError - категория уже есть у другого родителя
+        """
+        known: dict[str, Category] = {cat.name: cat for cat in repo.get_all()}
+        created: list[Category] = []
+
+        def new_categories() -> Iterator[Category]:
+            # Parents are known or produced earlier, so their pk is already set:
+            for line, name, parent in iter_tree(lines):
+                parent_pk = known[parent].pk if parent is not None else None
+                cat = known.get(name)
+                if cat is not None:
+                    if cat.parent != parent_pk:
+                        raise ValueError(
+                            f"Строка {line}: категория \"{name}\" "
+                            f"уже существует в другом разделе")
+                    continue
+                cat = cls(name, parent_pk)
+                known[name] = cat
+                created.append(cat)
+                yield cat
+
+        repo.add_many(new_categories())
+        return created
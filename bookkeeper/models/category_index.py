@@ -0,0 +1,100 @@
+"""
+Модуль описывает индекс категорий в оперативной памяти
+"""
+
+from collections import defaultdict
+from typing import Iterable, Iterator
+
+from bookkeeper.models.category import Category
+from bookkeeper.models.category_tree import CategoryTree
+
+
+class CategoryIndex:
+    """
+    Индекс категорий: поиск категории по названию (без учета регистра
+    и пробелов по краям) и по id, а также списки непосредственных
+    подкатегорий. Все операции выполняются за O(1) без обращения
+    к репозиторию, поэтому индекс нужно обновлять вместе с репозиторием.
+
+    version увеличивается при каждом изменении индекса - по нему можно
+    определить, что закешированные производные данные устарели
+    (так устроен кеш дерева категорий, см. tree).
+    """
+
+    def __init__(self, cats: Iterable[Category] = ()) -> None:
+        self.by_name: dict[str, Category] = {}
+        self.by_pk: dict[int, Category] = {}
+        self.children: defaultdict[int | None, dict[int, Category]] = defaultdict(dict)
+        self.version = 0
+        self._tree: CategoryTree | None = None
+        self.rebuild(cats)
+
+    @staticmethod
+    def key(name: str) -> str:
+        """ Нормализованное название категории """
+        return name.strip().lower()
+
+    def rebuild(self, cats: Iterable[Category]) -> None:
+        """ Построить индекс заново """
+        self.by_name.clear()
+        self.by_pk.clear()
+        self.children.clear()
+        for cat in cats:
+            self.add(cat)
+        self.version += 1
+
+    def add(self, cat: Category) -> None:
+        """ Добавить категорию (с уже присвоенным id) """
+        self.by_name[self.key(cat.name)] = cat
+        self.by_pk[cat.pk] = cat
+        self.children[cat.parent][cat.pk] = cat
+        self.version += 1
+
+    def remove(self, cat: Category) -> None:
+        """ Удалить категорию. Ее подкатегории остаются в индексе. """
+        self.by_name.pop(self.key(cat.name), None)
+        self.by_pk.pop(cat.pk, None)
+        self.children[cat.parent].pop(cat.pk, None)
+        self.version += 1
+
+    def set_parent(self, cat: Category, parent: int | None) -> None:
+        """ Перенести категорию к другому родителю """
+        self.children[cat.parent].pop(cat.pk, None)
+        cat.parent = parent
+        self.children[parent][cat.pk] = cat
+        self.version += 1
+
+    def tree(self) -> CategoryTree:
+        """ Дерево категорий, построенное заново, если индекс изменился """
+        tree = self._tree
+        if tree is None or tree.version != self.version:
+            # Snapshot the version first: a concurrent change makes it stale:
+            version = self.version
+            tree = self._tree = CategoryTree(list(self.by_pk.values()), version)
+        return tree
+
+    def get(self, name: str) -> Category | None:
+        """ Категория по названию или None """
+        return self.by_name.get(self.key(name))
+
+    def get_by_pk(self, pk: int) -> Category | None:
+        """ Категория по id или None """
+        return self.by_pk.get(pk)
+
+    def name_of(self, pk: int) -> str:
+        """ Название категории по id (пустая строка, если категории нет) """
+        cat = self.by_pk.get(pk)
+        return cat.name if cat is not None else ""
+
+    def children_of(self, pk: int | None) -> list[Category]:
+        """ Непосредственные подкатегории (для pk=None - категории верхнего уровня) """
+        return list(self.children.get(pk, {}).values())
+
+    def __contains__(self, name: object) -> bool:
+        return isinstance(name, str) and self.key(name) in self.by_name
+
+    def __iter__(self) -> Iterator[Category]:
+        return iter(self.by_pk.values())
+
+    def __len__(self) -> int:
+        return len(self.by_pk)
@@ -0,0 +1,106 @@
+"""
+Модуль описывает дерево категорий в оперативной памяти
+"""
+
+from typing import Iterable, Iterator
+
+from bookkeeper.models.category import Category
+
+
+class CategoryTree:
+    """
+    Снимок иерархии категорий: списки подкатегорий, глубина и путь
+    каждой категории, а также порядок обхода в глубину (pre-order).
+    Поддерево категории занимает в этом порядке непрерывный отрезок,
+    поэтому проверка "является ли потомком" и выборка поддерева
+    выполняются без обхода.
+
+    Дерево строится целиком за O(n) и не меняется. Номер version берется
+    из источника (см. CategoryIndex.tree): по нему определяют, что снимок
+    устарел и дерево нужно построить заново.
+
+    Категории, родителя которых нет в списке, считаются категориями
+    верхнего уровня. Категории, образующие цикл, в обход не попадают.
+    """
+
+    SEPARATOR: str = " → "
+
+    def __init__(self, cats: Iterable[Category], version: int = 0) -> None:
+        self.version = version
+        self.by_pk: dict[int, Category] = {cat.pk: cat for cat in cats}
+        self.children: dict[int | None, list[Category]] = {None: []}
+        self.depth: dict[int, int] = {}
+        self.path: dict[int, str] = {}
+        self.order: list[Category] = []
+        self.position: dict[int, int] = {}
+        self.end: dict[int, int] = {}  # Position after the last descendant
+
+        for cat in self.by_pk.values():
+            self.children.setdefault(cat.pk, [])
+            parent = cat.parent if cat.parent in self.by_pk else None
+            self.children.setdefault(parent, []).append(cat)
+
+        self._walk()
+
+    def _walk(self) -> None:
+        # Iterative pre-order walk (deep trees don't hit the recursion limit).
+        # Each stack entry is a category and whether its subtree is done:
+        stack = [(cat, False) for cat in reversed(self.children[None])]
+        while stack:
+            cat, done = stack.pop()
+            if done:
+                self.end[cat.pk] = len(self.order)
+                continue
+
+            parent = self.by_pk.get(cat.parent) if cat.parent is not None else None
+            if parent is None:
+                self.depth[cat.pk] = 0
+                self.path[cat.pk] = cat.name
+            else:
+                self.depth[cat.pk] = self.depth[parent.pk] + 1
+                self.path[cat.pk] = self.path[parent.pk] + self.SEPARATOR + cat.name
+
+            self.position[cat.pk] = len(self.order)
+            self.order.append(cat)
+
+            stack.append((cat, True))
+            stack += [(child, False) for child in reversed(self.children[cat.pk])]
+
+    def children_of(self, pk: int | None) -> list[Category]:
+        """ Непосредственные подкатегории (для pk=None - категории верхнего уровня) """
+        return self.children.get(pk, [])
+
+    def depth_of(self, pk: int) -> int:
+        """ Глубина категории (0 у категорий верхнего уровня) """
+        return self.depth[pk]
+
+    def path_of(self, pk: int) -> str:
+        """ Путь к категории: названия от верхнего уровня, например "еда → мясо" """
+        return self.path[pk]
+
+    def subtree(self, pk: int) -> list[Category]:
+        """ Категория и все ее подкатегории в порядке обхода в глубину """
+        return self.order[self.position[pk]:self.end[pk]]
+
+    def descendants(self, pk: int) -> list[Category]:
+        """ Все подкатегории разного уровня (без самой категории) """
+        return self.order[self.position[pk] + 1:self.end[pk]]
+
+    def ancestors(self, pk: int) -> list[Category]:
+        """ Все родительские категории от непосредственного родителя вверх """
+        result = []
+        cat = self.by_pk[pk]
+        for _ in range(self.depth[pk]):
+            cat = self.by_pk[cat.parent]  # type: ignore[index]
+            result.append(cat)
+        return result
+
+    def is_descendant(self, pk: int, ancestor: int) -> bool:
+        """ Является ли категория pk подкатегорией (любого уровня) ancestor """
+        return self.position[ancestor] < self.position[pk] < self.end[ancestor]
+
+    def __iter__(self) -> Iterator[Category]:
+        return iter(self.order)
+
+    def __len__(self) -> int:
+        return len(self.order)
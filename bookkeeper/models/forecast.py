@@ -0,0 +1,183 @@
+"""
+Прогноз расходов по бюджетам
+
+Прогноз строится по дневным суммам расходов (DailyTotals), которые
+обновляются при каждом изменении расхода за O(1), поэтому пересчет после
+добавления расхода - несколько векторных операций над массивами из
+десятков элементов, независимо от длины истории. Ожидаемые траты на
+каждый оставшийся день периода - среднее за этот день недели, смешанное
+со средним за последние дни.
+"""
+
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Iterable
+
+import numpy as np
+from numpy.typing import NDArray
+
+from bookkeeper.models.budget import Budget, Period
+from bookkeeper.models.expense import Expense
+from bookkeeper.utils import to_datetime, to_epoch
+
+# Forecast history: weeks of the weekday profile, days of the trailing
+# average and the weight of the profile in the expected daily spending:
+FORECAST_WEEKS = 8
+FORECAST_TRAILING_DAYS = 28
+FORECAST_PROFILE_WEIGHT = 0.5
+
+# 1970-01-01 (day 0) is a Thursday, so Monday is 0 in (day + 3) % 7:
+EPOCH = date(1970, 1, 1)
+
+
+def epoch_day(value: datetime | date | str) -> int:
+    """ Номер дня от начала эпохи для даты (datetime, date или строки ISO 8601) """
+    if not isinstance(value, date):
+        value = to_datetime(value)
+    if isinstance(value, datetime):
+        value = value.date()
+    return (value - EPOCH).days
+
+
+class DailyTotals:
+    """
+    Суммы расходов по дням: элемент totals[i] - сумма за день first + i
+    (дни считаются от начала эпохи). Массив растет с запасом в обе стороны,
+    поэтому добавление и удаление расхода не пересчитывают остальные дни.
+    """
+
+    def __init__(self, exps: Iterable[Expense] = ()) -> None:
+        self.first = 0
+        self.totals = np.zeros(0, np.int64)
+        self.rebuild(exps)
+
+    def rebuild(self, exps: Iterable[Expense]) -> None:
+        """ Пересчитать суммы по всем расходам (одним вызовом bincount) """
+        exps = list(exps)
+        if not exps:
+            self.first, self.totals = 0, np.zeros(0, np.int64)
+            return
+        days = to_epoch([exp.expense_date for exp in exps]) // 86400
+        amounts = np.array([int(exp.amount) for exp in exps], np.int64)
+        self.first = int(days.min())
+        self.totals = np.bincount(days - self.first,
+                                  weights=amounts).astype(np.int64)
+
+    def _reserve(self, day: int) -> None:
+        if self.totals.size == 0:
+            self.first, self.totals = day, np.zeros(32, np.int64)
+        elif day < self.first:
+            pad = max(self.first - day, self.totals.size)
+            self.totals = np.concatenate((np.zeros(pad, np.int64), self.totals))
+            self.first -= pad
+        elif day >= self.first + self.totals.size:
+            pad = max(day - self.first - self.totals.size + 1, self.totals.size)
+            self.totals = np.concatenate((self.totals, np.zeros(pad, np.int64)))
+
+    def add(self, exp: Expense, sign: int = 1) -> None:
+        """ Учесть новый расход """
+        day = epoch_day(exp.expense_date)
+        self._reserve(day)
+        self.totals[day - self.first] += sign * int(exp.amount)
+
+    def remove(self, exp: Expense) -> None:
+        """ Исключить удаленный расход (или старую версию измененного) """
+        self.add(exp, -1)
+
+    def window(self, start: int, stop: int) -> NDArray[np.int64]:
+        """ Суммы за дни с start по stop - 1 (дни вне массива - нули) """
+        result = np.zeros(max(stop - start, 0), np.int64)
+        lo, hi = max(start, self.first), min(stop, self.first + self.totals.size)
+        if lo < hi:
+            result[lo - start:hi - start] = self.totals[lo - self.first:hi - self.first]
+        return result
+
+    def first_spending(self) -> int | None:
+        """ Первый день с расходами (None - расходов нет) """
+        days = np.flatnonzero(self.totals)
+        return self.first + int(days[0]) if days.size else None
+
+
+@dataclass(slots=True)
+class Forecast:
+    """
+    Прогноз по бюджету.
+    period - период бюджета
+    projected - ожидаемая сумма расходов к концу периода
+    breach - день, когда ожидается превышение лимита (None - не ожидается)
+    """
+    period: Period
+    projected: int
+    breach: date | None = None
+
+
+def daily_rates(daily: DailyTotals, today: int) -> NDArray[np.float64]:
+    """
+    Ожидаемые траты за день для каждого дня недели (с понедельника):
+    среднее за этот день недели за последние FORECAST_WEEKS недель,
+    смешанное со средним за последние FORECAST_TRAILING_DAYS дней.
+    Учитываются только дни до сегодняшнего, начиная с первого дня
+    с расходами.
+    """
+    first = daily.first_spending()
+    start = today - 7 * FORECAST_WEEKS
+    days = np.arange(start, today)
+    valid = days >= (first if first is not None else today)
+    totals = daily.window(start, today) * valid
+    if not valid.any():
+        return np.zeros(7)
+
+    weekdays = (days + 3) % 7
+    counts = np.bincount(weekdays, weights=valid, minlength=7)
+    profile = np.bincount(weekdays, weights=totals, minlength=7) / np.maximum(counts, 1)
+
+    recent = valid[-FORECAST_TRAILING_DAYS:]
+    trailing = totals[-FORECAST_TRAILING_DAYS:].sum() / max(recent.sum(), 1)
+    return np.asarray(FORECAST_PROFILE_WEIGHT * profile
+                      + (1 - FORECAST_PROFILE_WEIGHT) * trailing)
+
+
+def period_days(period: Period, day: date) -> tuple[date, date]:
+    """ Первый и последний дни периода бюджета, содержащего день day """
+    if period == Period.WEEK:
+        monday = day - timedelta(days=day.weekday())
+        return monday, monday + timedelta(days=6)
+    if period == Period.MONTH:
+        following = (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+        return day.replace(day=1), following - timedelta(days=1)
+    return day, day
+
+
+def forecast_budgets(daily: DailyTotals, budgets: Iterable[Budget],
+                     now: datetime | None = None) -> list[Forecast]:
+    """
+    Прогноз по бюджетам на момент now: к уже потраченному (budget.spent)
+    добавляются ожидаемые траты за остаток сегодняшнего дня и за каждый
+    оставшийся день периода (см. daily_rates). Для бюджетов на час и на
+    скользящее окно прогноз не строится.
+    """
+    now = now if now is not None else datetime.now()
+    today = epoch_day(now)
+    rates = daily_rates(daily, today)
+    elapsed = (now - datetime.combine(now.date(), datetime.min.time())) \
+        / timedelta(days=1)
+
+    forecasts = []
+    for budget in budgets:
+        # Only the days of a calendar period can be forecast:
+        if budget.window or budget.period == Period.HOUR:
+            continue
+        _, last = period_days(budget.period, now.date())
+        days = np.arange(today, epoch_day(last) + 1)
+        expected = rates[(days + 3) % 7]
+        expected[0] *= 1 - elapsed
+        spending = budget.spent + np.cumsum(expected)
+
+        over = np.flatnonzero(spending > budget.limitation)
+        breach = None
+        if budget.spent > budget.limitation:
+            breach = now.date()
+        elif over.size:
+            breach = EPOCH + timedelta(days=int(days[over[0]]))
+        forecasts.append(Forecast(budget.period, int(round(spending[-1])), breach))
+    return forecasts
@@ -8,7 +8,10 @@
 """
 
 from abc import ABC, abstractmethod
-from typing import Generic, TypeVar, Protocol, Any
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Generic, TypeVar, Protocol, Any, Callable, Iterable, Iterator, \
+                   Sequence
 
 
 class Model(Protocol):  # pylint: disable=too-few-public-methods
@@ -20,6 +23,53 @@ class Model(Protocol):  # pylint: disable=too-few-public-methods
 
 T = TypeVar('T', bound=Model)
 
+# Fields (date, group, value) summed up in the summary tables:
+SUMMARY_FIELDS = ('expense_date', 'category', 'amount')
+
+# Length of the period key: YYYY-MM-DD or YYYY-MM:
+SUMMARY_UNITS = {'day': 10, 'month': 7}
+
+# Summaries: {(period key, group): (total, count)}
+Totals = dict[tuple[str, Any], tuple[int, int]]
+
+# Mismatches: {(unit, period key, group): (stored, actual)}
+TotalsDiff = dict[tuple[str, str, Any], tuple[tuple[int, int], tuple[int, int]]]
+
+
+def summary_key(unit: str, date: Any) -> str:
+    """
+    Ключ периода unit ("day" или "month"), содержащего дату date
+    (datetime или строка в формате ISO): "YYYY-MM-DD" или "YYYY-MM".
+    """
+    if unit not in SUMMARY_UNITS:
+        raise ValueError(f"Unknown summary unit \"{unit}\"")
+    return str(date)[:SUMMARY_UNITS[unit]]
+
+
+def summarize(objs: Iterable[Any], unit: str,
+              fields: tuple[str, str, str] = SUMMARY_FIELDS) -> Totals:
+    """
+    Посчитать суммы поля value и число объектов по периодам unit
+    и значениям поля group, fields - поля (date, group, value).
+    """
+    date, group, value = fields
+    totals: dict[tuple[str, Any], tuple[int, int]] = {}
+    for obj in objs:
+        key = (summary_key(unit, getattr(obj, date)), getattr(obj, group))
+        total, count = totals.get(key, (0, 0))
+        totals[key] = (total + int(getattr(obj, value)), count + 1)
+    return totals
+
+
+def compare_totals(unit: str, stored: Totals, actual: Totals) -> TotalsDiff:
+    """
+    Сравнить хранимые суммы с посчитанными заново, вернуть расхождения
+    в виде {(unit, ключ периода, группа): (хранимая, настоящая)}.
+    """
+    return {(unit, *key): (stored.get(key, (0, 0)), actual.get(key, (0, 0)))
+            for key in stored.keys() | actual.keys()
+            if stored.get(key, (0, 0)) != actual.get(key, (0, 0))}
+
 
 class AbstractRepository(ABC, Generic[T]):
     """
@@ -30,6 +80,20 @@ class AbstractRepository(ABC, Generic[T]):
     get_all
     update
     delete
+
+    Пакетные методы (add_many, update_many, delete_many) и поиск по образцу
+    (get_all_by_pattern) имеют реализацию по умолчанию через одиночные
+    операции и get_all и могут быть переопределены более эффективными.
+    Восстановление удаленных объектов (restore_many) по умолчанию не
+    поддерживается.
+
+    Методы работы с деревьями (get_descendants, get_ancestors, delete_subtree,
+    move_subtree) применимы к объектам со ссылкой на родителя в поле field.
+    Реализация по умолчанию читает все записи одним вызовом get_all.
+
+    Суммы по периодам (get_totals) по умолчанию также считаются по всем
+    записям. Репозитории, которые хранят их готовыми, поддерживают
+    их пересчет (rebuild_totals) и проверку (check_totals).
     """
 
     @abstractmethod
@@ -39,6 +103,13 @@ class AbstractRepository(ABC, Generic[T]):
         также записать id в атрибут pk.
         """
 
+    def add_many(self, objs: Iterable[T]) -> list[int]:
+        """
+        Добавить несколько объектов, вернуть список их id,
+        также записать id в атрибут pk каждого объекта.
+        """
+        return [self.add(obj) for obj in objs]
+
     @abstractmethod
     def get(self, pk: int) -> T | None:
         """ Получить объект по id """
@@ -51,7 +122,6 @@ class AbstractRepository(ABC, Generic[T]):
         если условие не задано (по умолчанию), вернуть все записи
         """
 
-    @abstractmethod
     def get_all_by_pattern(self, patterns: dict[str, str]) -> list[T]:
         """
         Получить все записи по некоторому условию
@@ -60,29 +130,204 @@ class AbstractRepository(ABC, Generic[T]):
         переданное значение должно содержаться внутри реального
         значения поля.
         """
+        return [obj for obj in self.get_all()
+                if all(value in str(getattr(obj, attr))
+                       for attr, value in patterns.items())]
 
     @abstractmethod
     def update(self, obj: T) -> None:
         """ Обновить данные об объекте. Объект должен содержать поле pk. """
 
+    def update_many(self, objs: Iterable[T]) -> None:
+        """ Обновить данные о нескольких объектах """
+        for obj in objs:
+            self.update(obj)
+
+    def restore_many(self, objs: Iterable[T]) -> None:
+        """
+        Вернуть в репозиторий ранее удаленные объекты с их прежними id
+        (атрибут pk должен быть заполнен). Одиночной операции с заданным
+        id нет, поэтому по умолчанию восстановление не поддерживается.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support restore")
+
     @abstractmethod
     def delete(self, pk: int) -> None:
         """ Удалить запись """
 
+    def delete_many(self, pks: Iterable[int]) -> None:
+        """ Удалить несколько записей """
+        for pk in pks:
+            self.delete(pk)
+
+    def iter_columns(self, fields: Sequence[str], after: int = 0,
+                     chunk_size: int = 10000) -> Iterator[list[tuple[Any, ...]]]:
+        """
+        Читать значения полей fields записей с id больше after в порядке
+        возрастания id порциями не больше chunk_size строк вида
+        (id, значение1, значение2, ...). Объекты моделей не создаются,
+        если хранилище позволяет читать поля напрямую.
+        """
+        objs = sorted((obj for obj in self.get_all() if obj.pk > after),
+                      key=lambda obj: obj.pk)
+        for start in range(0, len(objs), chunk_size):
+            yield [(obj.pk, *(getattr(obj, field) for field in fields))
+                   for obj in objs[start:start + chunk_size]]
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """
+        Выполнить операции блока как одно целое: при исключении в блоке
+        откатываются все его изменения. По умолчанию изменения не
+        откатываются - так ведут себя хранилища без транзакций.
+        """
+        yield
+
+    def data_version(self) -> int | None:
+        """
+        Номер версии данных хранилища: меняется при каждом изменении, в том
+        числе сделанном другим процессом. По умолчанию - None: хранилище
+        версий не ведет, его меняет только этот процесс.
+        """
+        return None
+
+    ##################
+    ## Tree methods ##
+    ##################
+
+    def get_descendants(self, pk: int, field: str = 'parent') -> list[T]:
+        """
+        Получить все объекты поддерева с корнем pk, не считая самого корня:
+        сначала непосредственных потомков, затем их потомков и т.д.
+        """
+        children: defaultdict[Any, list[T]] = defaultdict(list)
+        for obj in self.get_all():
+            children[getattr(obj, field)].append(obj)
+
+        # Breadth-first, the seen set guards against cycles in broken data:
+        result: list[T] = []
+        seen = {pk}
+        parents = [pk]
+        while parents:
+            level = [child for parent in parents for child in children[parent]
+                     if child.pk not in seen]
+            seen.update(child.pk for child in level)
+            result += level
+            parents = [child.pk for child in level]
+        return result
+
+    def get_ancestors(self, pk: int, field: str = 'parent') -> list[T]:
+        """
+        Получить всех предков объекта pk: от родителя до корня дерева.
+        """
+        objs = {obj.pk: obj for obj in self.get_all()}
+
+        result: list[T] = []
+        seen = {pk}
+        obj = objs.get(pk)
+        while obj is not None:
+            obj = objs.get(getattr(obj, field))
+            if obj is None or obj.pk in seen:
+                break
+            seen.add(obj.pk)
+            result.append(obj)
+        return result
+
+    def delete_subtree(self, pk: int, field: str = 'parent') -> list[T]:
+        """
+        Удалить объект pk вместе со всеми его потомками.
+        Вернуть удаленные объекты, корень поддерева - первым.
+        """
+        root = self.get(pk)
+        if root is None:
+            raise ValueError(f"Unable to delete subtree of nonexistent pk={pk}")
+
+        objs = [root] + self.get_descendants(pk, field)
+        self.delete_many([obj.pk for obj in objs])
+        return objs
+
+    def move_subtree(self, pk: int, parent: int | None, field: str = 'parent') -> None:
+        """
+        Перенести объект pk (вместе с его потомками) к родителю parent.
+        Объект нельзя сделать потомком самого себя.
+        """
+        ancestors = self.get_ancestors(parent, field) if parent is not None else []
+        if parent == pk or pk in [obj.pk for obj in ancestors]:
+            raise ValueError(f"Unable to move pk={pk} into its own subtree")
+
+        obj = self.get(pk)
+        if obj is None:
+            raise ValueError(f"Unable to move nonexistent pk={pk}")
+        setattr(obj, field, parent)
+        self.update(obj)
+
+    def get_all_in_subtree(self, field: str, tree: 'AbstractRepository[Any]',
+                           pk: int) -> list[T]:
+        """
+        Получить все записи, поле field которых ссылается на объект pk
+        репозитория-дерева tree или на любого из его потомков
+        (например, все расходы категории вместе с подкатегориями).
+        """
+        pks = {pk} | {obj.pk for obj in tree.get_descendants(pk)}
+        return [obj for obj in self.get_all() if getattr(obj, field) in pks]
+
+    #####################
+    ## Summary methods ##
+    #####################
+
+    def get_totals(self, unit: str, first: str | None = None, last: str | None = None,
+                   fields: tuple[str, str, str] = SUMMARY_FIELDS) -> Totals:
+        """
+        Получить суммы поля value и число записей по дням (unit="day") или
+        месяцам (unit="month") и значениям поля group.
+
+        Parameters
+        ----------
+        unit - "day" или "month"
+        first, last - ключи первого и последнего периодов (включительно),
+                      например "2023-03-01" или "2023-03"; если не заданы -
+                      без ограничения
+        fields - поля (date, group, value)
+
+        Returns
+        -------
+        Словарь {(ключ периода, группа): (сумма, число записей)}
+        """
+        return {key: total
+                for key, total in summarize(self.get_all(), unit, fields).items()
+                if (first is None or key[0] >= first)
+                and (last is None or key[0] <= last)}
+
+    def rebuild_totals(self) -> None:
+        """ Пересчитать хранимые суммы (по умолчанию они не хранятся) """
+
+    def check_totals(self) -> TotalsDiff:
+        """
+        Сравнить хранимые суммы с записями, вернуть расхождения
+        {(unit, ключ периода, группа): (хранимая, настоящая)}, где суммы -
+        пары (сумма, число записей). Пустой словарь - суммы верны.
+        """
+        return {}
+
+
 def repository_factory(
     repo_type : Any,
-    db_file   : str | None = None
+    db_file   : str | None = None,
+    **options : Any
 ) -> Callable[[Model], Any]:
     """
     Конкретная фабрика абстрактных репозиториев:
     больше абстракции богу абстракции!
+
+    Дополнительные именованные аргументы (options) передаются
+    конструктору репозитория без изменений.
     """
 
     if db_file is None:
         def repo_gen_nofile(model: Model) -> Any:
-            return repo_type[model](cls=model)
+            return repo_type[model](cls=model, **options)
         return repo_gen_nofile
 
     def repo_gen_withfile(model: Model) -> Any:
-        return repo_type[model](db_file=db_file, cls=model)
+        return repo_type[model](db_file=db_file, cls=model, **options)
     return repo_gen_withfile
@@ -0,0 +1,405 @@
+"""
+Модуль описывает архив старых расходов
+
+Расходы старше заданной даты переносятся из основной ("горячей") таблицы
+в отдельный файл SQLite. В архиве записи хранятся в кластеризованной
+таблице WITHOUT ROWID, упорядоченной по дате расхода, а рядом хранятся
+предварительно посчитанные суммы по месяцам и категориям. Основная таблица
+и ее индексы остаются небольшими, поэтому повседневные запросы интерфейса
+не замедляются по мере роста истории.
+
+Архив доступен только для чтения через ArchiveRepository. Для отчетов,
+которым нужна вся история, предназначен UnionRepository, объединяющий
+основной репозиторий с архивом. Основной репозиторий не выдает повторно
+ключи перенесенных записей (см. SQLiteRepository), поэтому pk расхода
+уникален во всех частях объединения.
+"""
+
+import heapq
+import itertools
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Iterable, Iterator, Sequence
+
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.abstract_repository import AbstractRepository, T, \
+                                                SUMMARY_FIELDS, SUMMARY_UNITS, \
+                                                Totals, summarize
+from bookkeeper.repository.sqlite_repository import SQLiteDatabase
+from bookkeeper.utils import to_datetime
+
+# Number of primary keys in one "pk IN (...)" query:
+PK_CHUNK = 500
+
+
+class ArchiveRepository(SQLiteDatabase, AbstractRepository[Expense]):
+    """
+    Репозиторий архивных расходов, доступный только для чтения.
+    Пополняется функцией archive_expenses().
+
+    Соединения, транзакции и повторные попытки при блокировках такие же,
+    как у SQLiteRepository: параметры options передаются SQLiteDatabase
+    (wal, synchronous, busy_timeout, retry, tracer и т.д.).
+    """
+
+    FIELDS = ('amount', 'category', 'expense_date', 'added_date', 'comment')
+
+    QUERIES = {
+        'create': """
+            CREATE TABLE IF NOT EXISTS expense_archive (
+                expense_date TEXT    NOT NULL,
+                pk           INTEGER NOT NULL,
+                amount       INTEGER NOT NULL,
+                category     INTEGER,
+                added_date   TEXT,
+                comment      TEXT,
+                PRIMARY KEY (expense_date, pk)
+            ) WITHOUT ROWID""",
+        # The primary keys of the expenses are unique in the archive too
+        # (the index replaces the non-unique expense_archive_pk):
+        'drop_old_pk_index': "DROP INDEX IF EXISTS expense_archive_pk",
+        'create_pk_index': """
+            CREATE UNIQUE INDEX IF NOT EXISTS expense_archive_pk_key
+                ON expense_archive (pk)""",
+        'create_totals': """
+            CREATE TABLE IF NOT EXISTS expense_month_total (
+                month    TEXT    NOT NULL,
+                category INTEGER NOT NULL,
+                total    INTEGER NOT NULL,
+                count    INTEGER NOT NULL,
+                PRIMARY KEY (month, category)
+            ) WITHOUT ROWID""",
+        'insert': """
+            INSERT OR REPLACE INTO expense_archive
+                (expense_date, pk, amount, category, added_date, comment)
+            VALUES (?, ?, ?, ?, ?, ?)""",
+        'clear_totals': """
+            DELETE FROM expense_month_total WHERE month >= ? AND month <= ?""",
+        'refresh_totals': """
+            INSERT INTO expense_month_total
+            SELECT substr(expense_date, 1, 7), category, sum(amount), count(*)
+              FROM expense_archive
+             WHERE expense_date >= ? AND expense_date < ?
+             GROUP BY 1, 2""",
+        'day_totals': """
+            SELECT substr(expense_date, 1, 10), category, sum(amount), count(*)
+              FROM expense_archive
+             WHERE expense_date >= ? AND expense_date < ?
+             GROUP BY 1, 2""",
+        'select': """
+            SELECT pk, amount, category, expense_date, added_date, comment
+              FROM expense_archive""",
+    }
+
+    def __init__(self, db_file: str, **options: Any) -> None:
+        SQLiteDatabase.__init__(self, db_file, **options)
+        self.write(self.create)
+
+    def create(self, con: sqlite3.Connection) -> None:
+        """ Создать таблицы архива, если их еще нет """
+        for query in ['create', 'drop_old_pk_index', 'create_pk_index',
+                      'create_totals']:
+            self.execute(con, self.QUERIES[query])
+        self.create_change_counter(con)
+
+    @staticmethod
+    def _date_to_str(value: datetime | str) -> str:
+        return to_datetime(value).isoformat(sep=' ', timespec='microseconds')
+
+    @staticmethod
+    def _row_to_expense(row: tuple[Any, ...]) -> Expense:
+        pk, amount, category, expense_date, added_date, comment = row
+        return Expense(amount, category,
+                       expense_date=datetime.fromisoformat(expense_date),
+                       added_date=datetime.fromisoformat(added_date),
+                       comment=comment, pk=pk)
+
+    def _select(self, where: str = "", params: Iterable[Any] = ()) -> list[Expense]:
+        query = self.QUERIES['select'] + where + " ORDER BY expense_date, pk"
+        rows = self.read(lambda con: self.fetch_all(con, query, list(params)))
+        return [self._row_to_expense(row) for row in rows]
+
+    ##########################
+    ## Read-only operations ##
+    ##########################
+
+    def add(self, obj: Expense) -> int:
+        raise ValueError("Archive repository is read-only")
+
+    def get(self, pk: int) -> Expense | None:
+        exps = self._select(" WHERE pk = ?", [pk])
+        return exps[0] if exps else None
+
+    def get_all(self, where: dict[str, Any] | None = None) -> list[Expense]:
+        if not where:
+            return self._select()
+
+        for field_name in where:
+            if field_name not in self.FIELDS:
+                raise ValueError(f"Unknown field {field_name}")
+        conditions = " AND ".join(f"{field_name} = ?" for field_name in where)
+        return self._select(f" WHERE {conditions}", where.values())
+
+    def get_all_by_pattern(self, patterns: dict[str, str]) -> list[Expense]:
+        for field_name in patterns:
+            if field_name not in self.FIELDS:
+                raise ValueError(f"Unknown field {field_name}")
+        conditions = " AND ".join(f"{field_name} LIKE ?" for field_name in patterns)
+        return self._select(f" WHERE {conditions}",
+                            [f"%{v}%" for v in patterns.values()])
+
+    def update(self, obj: Expense) -> None:
+        raise ValueError("Archive repository is read-only")
+
+    def restore_many(self, objs: Iterable[Expense]) -> None:
+        raise ValueError("Archive repository is read-only")
+
+    def delete(self, pk: int) -> None:
+        raise ValueError("Archive repository is read-only")
+
+    def iter_columns(self, fields: Sequence[str], after: int = 0,
+                     chunk_size: int = 10000) -> Iterator[list[tuple[Any, ...]]]:
+        for field in fields:
+            if field not in self.FIELDS:
+                raise ValueError(f"Unknown field {field}")
+
+        # Keyset pagination over the unique index of the primary keys:
+        query = (f"SELECT {', '.join(('pk', *fields))} FROM expense_archive "
+                 "WHERE pk > ? ORDER BY pk LIMIT ?")
+        while True:
+            rows = self.read(lambda con: self.fetch_all(con, query, [after, chunk_size]))
+            if not rows:
+                return
+            yield rows
+            after = rows[-1][0]
+
+    def get_totals(self, unit: str, first: str | None = None, last: str | None = None,
+                   fields: tuple[str, str, str] = SUMMARY_FIELDS) -> Totals:
+        if tuple(fields) != SUMMARY_FIELDS:
+            return super().get_totals(unit, first, last, fields)
+        if unit not in SUMMARY_UNITS:
+            raise ValueError(f"Unknown summary unit \"{unit}\"")
+
+        if unit == 'month':
+            totals = self.month_totals()
+            return {key: total for key, total in totals.items()
+                    if (first is None or key[0] >= first)
+                    and (last is None or key[0] <= last)}
+
+        # Days are summed over the clustered key range, "~" sorts after any date:
+        rows = self.read(lambda con: self.fetch_all(
+            con, self.QUERIES['day_totals'], [first or "", (last or "~") + "~"]))
+        return {(day, cat): (total, count) for day, cat, total, count in rows}
+
+    def get_between(self, start: datetime, end: datetime) -> list[Expense]:
+        """
+        Получить архивные расходы с датой в полуинтервале [start, end).
+        Использует кластеризованный ключ, поэтому не просматривает весь архив.
+        """
+        return self._select(" WHERE expense_date >= ? AND expense_date < ?",
+                            [self._date_to_str(start), self._date_to_str(end)])
+
+    def month_totals(self,
+                     month: str | None = None
+                     ) -> dict[tuple[str, int], tuple[int, int]]:
+        """
+        Получить предварительно посчитанные суммы расходов.
+
+        Parameters
+        ----------
+        month - месяц в формате YYYY-MM, если не задан - все месяцы
+
+        Returns
+        -------
+        Словарь {(месяц, id категории): (сумма, число расходов)}
+        """
+        query = "SELECT month, category, total, count FROM expense_month_total"
+        params = []
+        if month is not None:
+            query += " WHERE month = ?"
+            params.append(month)
+
+        rows = self.read(lambda con: self.fetch_all(con, query, params))
+        return {(m, cat): (total, count) for m, cat, total, count in rows}
+
+    def store(self, exps: list[Expense]) -> None:
+        """
+        Записать расходы в архив и пересчитать суммы затронутых месяцев.
+        Повторная запись тех же расходов не создает дубликатов, а расход,
+        записанный заново с другой датой, заменяет прежнюю запись.
+        """
+        if not exps:
+            return
+
+        rows = [(self._date_to_str(exp.expense_date), exp.pk, exp.amount,
+                 exp.category, self._date_to_str(exp.added_date), exp.comment)
+                for exp in exps]
+        months = {row[0][:7] for row in rows}
+
+        def store_rows(con: sqlite3.Connection) -> None:
+            # Months of the replaced records change as well:
+            pks = [row[1] for row in rows]
+            for start in range(0, len(pks), PK_CHUNK):
+                chunk = pks[start:start + PK_CHUNK]
+                months.update(date[:7] for date, in self.fetch_all(
+                    con, "SELECT expense_date FROM expense_archive "
+                         f"WHERE pk IN ({', '.join('?' * len(chunk))})", chunk))
+
+            self.executemany(con, self.QUERIES['insert'], rows)
+
+            # Months are compared as text, "YYYY-MM~" sorts after any date:
+            self.execute(con, self.QUERIES['clear_totals'], [min(months), max(months)])
+            self.execute(con, self.QUERIES['refresh_totals'],
+                         [min(months), max(months) + "~"])
+
+        self.write(store_rows)
+
+
+def archive_expenses(hot_repo: AbstractRepository[Expense],
+                     archive: ArchiveRepository,
+                     cutoff: datetime) -> int:
+    """
+    Перенести в архив все расходы с датой раньше cutoff.
+    Сначала расходы записываются в архив, затем удаляются из основного
+    репозитория, поэтому при сбое между шагами данные не теряются, а
+    повторный запуск не создает дубликатов.
+
+    Parameters
+    ----------
+    hot_repo - основной репозиторий расходов
+    archive - архив
+    cutoff - граница: переносятся расходы строго раньше этой даты
+
+    Returns
+    -------
+    Число перенесенных расходов
+    """
+    old_exps = [exp for exp in hot_repo.get_all()
+                if to_datetime(exp.expense_date) < cutoff]
+
+    archive.store(old_exps)
+    hot_repo.delete_many([exp.pk for exp in old_exps])
+
+    return len(old_exps)
+
+
+class UnionRepository(AbstractRepository[T]):
+    """
+    Объединение основного репозитория с архивными для построения отчетов.
+    Чтение выполняется из всех репозиториев, запись - только в основной.
+    """
+
+    def __init__(self, hot_repo: AbstractRepository[T],
+                 *cold_repos: AbstractRepository[T]) -> None:
+        self.hot_repo = hot_repo
+        self.cold_repos = cold_repos
+
+    def add(self, obj: T) -> int:
+        return self.hot_repo.add(obj)
+
+    def get(self, pk: int) -> T | None:
+        for repo in (self.hot_repo, *self.cold_repos):
+            obj = repo.get(pk)
+            if obj is not None:
+                return obj
+        return None
+
+    def _merge(self, results: Iterable[list[T]], hot: list[T]) -> list[T]:
+        # An interrupted archive_expenses() leaves copies of the archived
+        # records in the hot repository, they are returned once:
+        seen = {obj.pk for obj in hot}
+        merged = []
+        for objs in results:
+            for obj in objs:
+                if obj.pk not in seen:
+                    seen.add(obj.pk)
+                    merged.append(obj)
+        return merged + hot
+
+    def get_all(self, where: dict[str, Any] | None = None) -> list[T]:
+        return self._merge((repo.get_all(where) for repo in self.cold_repos),
+                           self.hot_repo.get_all(where))
+
+    def get_all_by_pattern(self, patterns: dict[str, str]) -> list[T]:
+        return self._merge((repo.get_all_by_pattern(patterns)
+                            for repo in self.cold_repos),
+                           self.hot_repo.get_all_by_pattern(patterns))
+
+    def iter_columns(self, fields: Sequence[str], after: int = 0,
+                     chunk_size: int = 10000) -> Iterator[list[tuple[Any, ...]]]:
+        # Every repository yields rows in the order of pk: the streams are
+        # merged, the hot repository goes first and wins on equal keys.
+        streams = [itertools.chain.from_iterable(
+                       repo.iter_columns(fields, after, chunk_size))
+                   for repo in (self.hot_repo, *self.cold_repos)]
+        chunk: list[tuple[Any, ...]] = []
+        last = after
+        for row in heapq.merge(*streams, key=lambda row: row[0]):
+            if row[0] == last:
+                continue
+            last = row[0]
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def get_totals(self, unit: str, first: str | None = None, last: str | None = None,
+                   fields: tuple[str, str, str] = SUMMARY_FIELDS) -> Totals:
+        totals: Totals = {}
+        for repo in (*self.cold_repos, self.hot_repo):
+            for key, (total, count) in repo.get_totals(unit, first, last,
+                                                       fields).items():
+                old_total, old_count = totals.get(key, (0, 0))
+                totals[key] = (old_total + total, old_count + count)
+
+        # Records both in the hot repository and in an archive are counted once:
+        copies = self._copies(first and first[:7], last and last[:7], fields)
+        for key, (total, count) in summarize(copies, unit, fields).items():
+            if key in totals:
+                old_total, old_count = totals[key]
+                totals[key] = (old_total - total, old_count - count)
+        return {key: total for key, total in totals.items() if total[1] > 0}
+
+    def _copies(self, first: str | None, last: str | None,
+                fields: tuple[str, str, str]) -> list[T]:
+        # Copies are left only by an interrupted archive_expenses(), on the
+        # days of the archived months. These days are found by the stored
+        # totals, so only their records are read (usually there are none):
+        months = {month for repo in self.cold_repos
+                  for month, _ in repo.get_totals('month', first, last, fields)}
+        if not months:
+            return []
+        days = {day for day, _ in self.hot_repo.get_totals(
+                    'day', min(months) + "-01", max(months) + "-31", fields)
+                if day[:7] in months}
+
+        date = fields[0]
+        return [obj for day in sorted(days)
+                for obj in self.hot_repo.get_all_by_pattern({date: day})
+                if any(repo.get(obj.pk) is not None for repo in self.cold_repos)]
+
+    def update(self, obj: T) -> None:
+        self.hot_repo.update(obj)
+
+    def update_many(self, objs: Iterable[T]) -> None:
+        self.hot_repo.update_many(objs)
+
+    def restore_many(self, objs: Iterable[T]) -> None:
+        self.hot_repo.restore_many(objs)
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        with self.hot_repo.transaction():
+            yield
+
+    def data_version(self) -> int | None:
+        # The counters only grow, so does their sum:
+        versions = [repo.data_version() for repo in (self.hot_repo, *self.cold_repos)]
+        known = [version for version in versions if version is not None]
+        return sum(known) if known else None
+
+    def delete(self, pk: int) -> None:
+        self.hot_repo.delete(pk)
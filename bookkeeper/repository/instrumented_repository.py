@@ -0,0 +1,310 @@
+"""
+Модуль описывает сбор статистики обращений к репозиториям
+
+RepositoryMetrics накапливает для каждой пары (модель, метод) число вызовов,
+гистограмму времени выполнения (с оценками p50/p95/p99), число возвращенных
+записей и объем декодированных данных. Статистику можно получить во время
+работы (snapshot) или сохранить в JSON при завершении программы.
+
+Источники статистики:
+InstrumentedRepository - обертка над любым репозиторием
+SQLiteRepository - встроенные точки замера (аргумент metrics)
+"""
+
+import atexit
+import json
+import math
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Any, Callable, Iterable, Iterator, Sequence
+
+from bookkeeper.repository.abstract_repository import AbstractRepository, T, Model, \
+                                                SUMMARY_FIELDS, Totals, TotalsDiff
+
+
+class LatencyHistogram:
+    """
+    Гистограмма времени выполнения с геометрическими интервалами:
+    каждый следующий интервал в 2**(1/4) раз шире предыдущего, начиная
+    с 1 мкс. Занимает постоянный объем памяти, относительная погрешность
+    оценки перцентилей не превышает 19%.
+    """
+
+    MIN_LATENCY = 1e-6
+    BUCKETS_PER_OCTAVE = 4
+    NUM_BUCKETS = 128  # up to ~4 hours
+
+    def __init__(self) -> None:
+        self.buckets = [0] * self.NUM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        """ Учесть одно измерение """
+        if seconds <= self.MIN_LATENCY:
+            index = 0
+        else:
+            index = int(math.log2(seconds / self.MIN_LATENCY)
+                        * self.BUCKETS_PER_OCTAVE) + 1
+            index = min(index, self.NUM_BUCKETS - 1)
+
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q: float) -> float:
+        """ Оценка q-го перцентиля (0 < q <= 100), секунды """
+        if self.count == 0:
+            return 0.0
+
+        rank = math.ceil(self.count * q / 100)
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= rank:
+                upper = self.MIN_LATENCY * 2 ** (index / self.BUCKETS_PER_OCTAVE)
+                return min(upper, self.max)
+        return self.max
+
+
+class OperationStats:  # pylint: disable=too-few-public-methods
+    """
+    Статистика одного метода одной модели.
+    """
+
+    def __init__(self) -> None:
+        self.latency = LatencyHistogram()
+        self.rows = 0
+        self.nbytes = 0
+
+    def as_dict(self) -> dict[str, float]:
+        """ Представление статистики в виде словаря """
+        return {'count': self.latency.count,
+                'total_time': self.latency.total,
+                'p50': self.latency.percentile(50),
+                'p95': self.latency.percentile(95),
+                'p99': self.latency.percentile(99),
+                'max': self.latency.max,
+                'rows': self.rows,
+                'bytes': self.nbytes}
+
+
+class RepositoryMetrics:
+    """
+    Потокобезопасный накопитель статистики обращений к репозиториям.
+    """
+
+    def __init__(self) -> None:
+        self._stats: dict[tuple[str, str], OperationStats] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, method: str, seconds: float,
+               rows: int = 0, nbytes: int = 0) -> None:
+        """
+        Учесть один вызов метода.
+
+        Parameters
+        ----------
+        model - название модели (таблицы)
+        method - название метода репозитория
+        seconds - время выполнения
+        rows - число прочитанных или записанных записей
+        nbytes - объем декодированных данных в байтах
+        """
+        with self._lock:
+            stats = self._stats.get((model, method))
+            if stats is None:
+                stats = self._stats[(model, method)] = OperationStats()
+            stats.latency.add(seconds)
+            stats.rows += rows
+            stats.nbytes += nbytes
+
+    def snapshot(self) -> dict[str, dict[str, dict[str, float]]]:
+        """
+        Текущая статистика в виде {модель: {метод: {показатель: значение}}}
+        """
+        result: dict[str, dict[str, dict[str, float]]] = {}
+        with self._lock:
+            for (model, method), stats in sorted(self._stats.items()):
+                result.setdefault(model, {})[method] = stats.as_dict()
+        return result
+
+    def reset(self) -> None:
+        """ Обнулить статистику """
+        with self._lock:
+            self._stats.clear()
+
+    def to_json(self) -> str:
+        """ Статистика в формате JSON """
+        return json.dumps(self.snapshot(), indent=2, ensure_ascii=False)
+
+    def dump(self, path: str) -> None:
+        """ Сохранить статистику в JSON-файл """
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(self.to_json())
+
+    def dump_at_exit(self, path: str) -> None:
+        """ Сохранить статистику в JSON-файл при завершении программы """
+        atexit.register(self.dump, path)
+
+
+def estimate_size(rows: Iterable[Iterable[Any]]) -> int:
+    """
+    Оценить объем данных, декодированных из строк результата запроса:
+    длина строк и bytes, 8 байт на число, 0 на NULL.
+    """
+    nbytes = 0
+    for row in rows:
+        for value in row:
+            if isinstance(value, (str, bytes)):
+                nbytes += len(value)
+            elif value is not None:
+                nbytes += 8
+    return nbytes
+
+
+class InstrumentedRepository(AbstractRepository[T]):
+    """
+    Обертка над репозиторием, записывающая статистику каждого вызова
+    в RepositoryMetrics. Не изменяет поведение обернутого репозитория.
+    """
+
+    def __init__(self, repo: AbstractRepository[T], model: str,
+                 metrics: RepositoryMetrics) -> None:
+        self.repo = repo
+        self.model = model
+        self.metrics = metrics
+
+    def __getattr__(self, name: str) -> Any:
+        # Backend-specific attributes (close(), lock_stats, ...) are passed through:
+        return getattr(self.repo, name)
+
+    def _timed(self, method: str, operation: Callable[[], Any],
+               count_rows: Callable[[Any], int]) -> Any:
+        start = perf_counter()
+        result = operation()
+        self.metrics.record(self.model, method, perf_counter() - start,
+                            rows=count_rows(result))
+        return result
+
+    def add(self, obj: T) -> int:
+        pk: int = self._timed('add', lambda: self.repo.add(obj), lambda _: 1)
+        return pk
+
+    def add_many(self, objs: Iterable[T]) -> list[int]:
+        # The objects are passed on as is: the wrapped repository may consume
+        # a generator lazily (see SQLiteRepository.add_many):
+        pks: list[int] = self._timed('add_many', lambda: self.repo.add_many(objs), len)
+        return pks
+
+    def get(self, pk: int) -> T | None:
+        obj: T | None = self._timed('get', lambda: self.repo.get(pk),
+                                    lambda res: int(res is not None))
+        return obj
+
+    def get_all(self, where: dict[str, Any] | None = None) -> list[T]:
+        objs: list[T] = self._timed('get_all', lambda: self.repo.get_all(where), len)
+        return objs
+
+    def get_all_by_pattern(self, patterns: dict[str, str]) -> list[T]:
+        objs: list[T] = self._timed('get_all_by_pattern',
+                                    lambda: self.repo.get_all_by_pattern(patterns),
+                                    len)
+        return objs
+
+    def update(self, obj: T) -> None:
+        self._timed('update', lambda: self.repo.update(obj), lambda _: 1)
+
+    def update_many(self, objs: Iterable[T]) -> None:
+        objs = list(objs)
+        self._timed('update_many', lambda: self.repo.update_many(objs),
+                    lambda _: len(objs))
+
+    def restore_many(self, objs: Iterable[T]) -> None:
+        objs = list(objs)
+        self._timed('restore_many', lambda: self.repo.restore_many(objs),
+                    lambda _: len(objs))
+
+    def delete(self, pk: int) -> None:
+        self._timed('delete', lambda: self.repo.delete(pk), lambda _: 1)
+
+    def delete_many(self, pks: Iterable[int]) -> None:
+        pks = list(pks)
+        self._timed('delete_many', lambda: self.repo.delete_many(pks),
+                    lambda _: len(pks))
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        with self.repo.transaction():
+            yield
+
+    def data_version(self) -> int | None:
+        return self.repo.data_version()
+
+    def iter_columns(self, fields: Sequence[str], after: int = 0,
+                     chunk_size: int = 10000) -> Iterator[list[tuple[Any, ...]]]:
+        # Every chunk is recorded as a call of its own:
+        chunks = iter(self.repo.iter_columns(fields, after, chunk_size))
+        while True:
+            chunk: list[tuple[Any, ...]] | None = self._timed(
+                'iter_columns', lambda: next(chunks, None),
+                lambda res: len(res) if res is not None else 0)
+            if chunk is None:
+                return
+            yield chunk
+
+    def get_descendants(self, pk: int, field: str = 'parent') -> list[T]:
+        objs: list[T] = self._timed('get_descendants',
+                                    lambda: self.repo.get_descendants(pk, field), len)
+        return objs
+
+    def get_ancestors(self, pk: int, field: str = 'parent') -> list[T]:
+        objs: list[T] = self._timed('get_ancestors',
+                                    lambda: self.repo.get_ancestors(pk, field), len)
+        return objs
+
+    def delete_subtree(self, pk: int, field: str = 'parent') -> list[T]:
+        objs: list[T] = self._timed('delete_subtree',
+                                    lambda: self.repo.delete_subtree(pk, field), len)
+        return objs
+
+    def get_all_in_subtree(self, field: str, tree: AbstractRepository[Any],
+                           pk: int) -> list[T]:
+        objs: list[T] = self._timed(
+            'get_all_in_subtree',
+            lambda: self.repo.get_all_in_subtree(field, tree, pk), len)
+        return objs
+
+    def move_subtree(self, pk: int, parent: int | None, field: str = 'parent') -> None:
+        self._timed('move_subtree', lambda: self.repo.move_subtree(pk, parent, field),
+                    lambda _: 1)
+
+    def get_totals(self, unit: str, first: str | None = None, last: str | None = None,
+                   fields: tuple[str, str, str] = SUMMARY_FIELDS) -> Totals:
+        totals: Totals = self._timed(
+            'get_totals', lambda: self.repo.get_totals(unit, first, last, fields), len)
+        return totals
+
+    def rebuild_totals(self) -> None:
+        self._timed('rebuild_totals', self.repo.rebuild_totals, lambda _: 0)
+
+    def check_totals(self) -> TotalsDiff:
+        diff: TotalsDiff = self._timed('check_totals', self.repo.check_totals, len)
+        return diff
+
+
+def instrumented_factory(
+    repo_factory : Callable[[Model], Any],
+    metrics      : RepositoryMetrics
+) -> Callable[[Model], Any]:
+    """
+    Обернуть фабрику репозиториев (см. repository_factory) так, чтобы
+    каждый созданный репозиторий записывал статистику в metrics.
+    """
+    def repo_gen(model: Model) -> Any:
+        name = getattr(model, '__name__', str(model)).lower()
+        return InstrumentedRepository(repo_factory(model), name, metrics)
+    return repo_gen
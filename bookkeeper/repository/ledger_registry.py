@@ -0,0 +1,176 @@
+"""
+Модуль описывает реестр журналов (отдельных баз данных)
+
+Каждый журнал (семейный бюджет, проект и т.п.) хранится в своем файле
+базы данных в общем каталоге. Реестр открывает журналы по требованию и
+держит открытыми репозитории нескольких последних из них, поэтому
+переключение на недавний журнал не требует заново открывать соединения
+и проверять таблицы. Число открытых журналов ограничено (вытесняется
+давно не использованный), а журналы, простаивающие дольше idle_timeout,
+закрываются при следующем открытии или вызове evict_idle.
+
+Клиенты командной строки открывают журнал и архив функцией open_ledger.
+"""
+
+import argparse
+import os
+import re
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Callable
+
+from bookkeeper.repository.abstract_repository import Model, SUMMARY_FIELDS, \
+                                                repository_factory
+from bookkeeper.repository.archive_repository import ArchiveRepository
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+
+
+class Ledger:
+    """
+    Открытый журнал: репозитории всех моделей одного файла базы данных.
+    Объект можно передать Bookkeeper вместо repository_factory - каждая
+    модель получает один и тот же репозиторий при повторных вызовах.
+    """
+
+    def __init__(self, name: str, factory: Callable[[Model], Any]) -> None:
+        self.name = name
+        self.factory = factory
+        self.repos: dict[Any, Any] = {}
+        self.last_used = monotonic()
+
+    def __call__(self, model: Model) -> Any:
+        repo = self.repos.get(model)
+        if repo is None:
+            repo = self.repos[model] = self.factory(model)
+        return repo
+
+    def close(self) -> None:
+        """ Закрыть соединения всех репозиториев журнала """
+        for repo in self.repos.values():
+            close = getattr(repo, 'close', None)
+            if close is not None:
+                close()
+        self.repos.clear()
+
+
+class LedgerRegistry:
+    """
+    Реестр журналов в каталоге directory.
+
+    Parameters
+    ----------
+    directory - каталог с файлами журналов (NAME.db)
+    repo_type - класс репозитория (см. repository_factory)
+    capacity - наибольшее число одновременно открытых журналов
+    idle_timeout - время простоя (в секундах), после которого журнал закрывается
+    options - дополнительные аргументы конструктора репозитория
+    """
+
+    SUFFIX: str = ".db"
+    NAME_PATTERN = re.compile(r'[^/\\:*?"<>|]+')
+
+    def __init__(self, directory: str, repo_type: Any,
+                 capacity: int = 4, idle_timeout: float = 600.0,
+                 **options: Any) -> None:
+        if capacity < 1:
+            raise ValueError("capacity must be positive")
+        self.directory = directory
+        self.repo_type = repo_type
+        self.capacity = capacity
+        self.idle_timeout = idle_timeout
+        self.options = options
+
+        # Open ledgers from the least to the most recently used:
+        self.ledgers: OrderedDict[str, Ledger] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def path(self, name: str) -> str:
+        """ Путь к файлу журнала """
+        if not self.NAME_PATTERN.fullmatch(name) or name.strip() != name \
+                or name.startswith('.'):
+            raise ValueError(f"Недопустимое название журнала \"{name}\"")
+        return os.path.join(self.directory, name + self.SUFFIX)
+
+    def names(self) -> list[str]:
+        """ Названия всех журналов каталога (в том числе закрытых) """
+        try:
+            files = os.listdir(self.directory)
+        except FileNotFoundError:
+            files = []
+        names = {file[:-len(self.SUFFIX)] for file in files if file.endswith(self.SUFFIX)}
+        with self.lock:
+            names.update(self.ledgers)
+        return sorted(names)
+
+    def open(self, name: str) -> Ledger:
+        """
+        Открыть журнал (или создать, если его нет) и отметить его как
+        последний использованный. Лишние и простаивающие журналы закрываются.
+        """
+        path = self.path(name)
+        with self.lock:
+            ledger = self.ledgers.get(name)
+            if ledger is None:
+                os.makedirs(self.directory, exist_ok=True)
+                ledger = Ledger(name, repository_factory(self.repo_type, db_file=path,
+                                                         **self.options))
+                self.ledgers[name] = ledger
+            self.ledgers.move_to_end(name)
+            ledger.last_used = monotonic()
+
+            evicted = self._evict(ledger.last_used)
+        for old in evicted:
+            old.close()
+        return ledger
+
+    def _evict(self, now: float) -> list[Ledger]:
+        # Called under the lock. The most recently used ledger always stays:
+        evicted = []
+        for name, ledger in list(self.ledgers.items())[:-1]:
+            if len(self.ledgers) > self.capacity \
+                    or now - ledger.last_used > self.idle_timeout:
+                evicted.append(self.ledgers.pop(name))
+        return evicted
+
+    def evict_idle(self, now: float | None = None) -> list[str]:
+        """ Закрыть простаивающие журналы, вернуть их названия """
+        with self.lock:
+            evicted = self._evict(now if now is not None else monotonic())
+        for ledger in evicted:
+            ledger.close()
+        return [ledger.name for ledger in evicted]
+
+    def close(self) -> None:
+        """ Закрыть все журналы """
+        with self.lock:
+            ledgers = list(self.ledgers.values())
+            self.ledgers.clear()
+        for ledger in ledgers:
+            ledger.close()
+
+
+def open_ledger(args: argparse.Namespace
+                ) -> tuple[Callable[[Model], Any], ArchiveRepository | None]:
+    """
+    Открыть журнал и архив по аргументам командной строки клиентов:
+    args.db - файл базы данных (None - репозитории в памяти),
+    args.archive - файл архива старых расходов (None - без архива).
+
+    Returns
+    -------
+    Фабрика репозиториев для Bookkeeper и архив
+    """
+    if args.db is None:
+        repo_gen: Callable[[Model], Any] = lambda model: MemoryRepository()
+    else:
+        repo_gen = repository_factory(SQLiteRepository, db_file=args.db,
+                                      wal=True, synchronous="NORMAL",
+                                      closure="parent", indexes=("category",),
+                                      summary=SUMMARY_FIELDS)
+
+    archive = None
+    if args.archive is not None:
+        archive = ArchiveRepository(args.archive, wal=True, synchronous="NORMAL")
+    return repo_gen, archive
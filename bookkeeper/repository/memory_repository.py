@@ -2,27 +2,153 @@
 Модуль описывает репозиторий, работающий в оперативной памяти
 """
 
+from collections import defaultdict
 from itertools import count
-from typing import Any
+from typing import Any, Iterable, Iterator, Sequence
 
-from bookkeeper.repository.abstract_repository import AbstractRepository, T
+from bookkeeper.repository.abstract_repository import AbstractRepository, T, \
+                                                SUMMARY_FIELDS, SUMMARY_UNITS, \
+                                                Totals, TotalsDiff, summary_key, \
+                                                summarize, compare_totals
+
+
+class ParentIndex:
+    """
+    Список смежности дерева объектов по полю field (ссылке на родителя).
+    Хранит значение поля на момент записи в репозиторий, поэтому
+    изменения объекта учитываются только после update.
+    """
+
+    def __init__(self, field: str, objs: Iterable[Any] = ()) -> None:
+        self.field = field
+        self.parents: dict[int, Any] = {}
+        self.children: defaultdict[Any, dict[int, None]] = defaultdict(dict)
+        for obj in objs:
+            self.set(obj)
+
+    def set(self, obj: Any) -> None:
+        """ Добавить объект или обновить его родителя """
+        self.discard(obj.pk)
+        parent = getattr(obj, self.field)
+        self.parents[obj.pk] = parent
+        self.children[parent][obj.pk] = None
+
+    def discard(self, pk: int) -> None:
+        """ Удалить объект из индекса (его потомки остаются) """
+        if pk in self.parents:
+            self.children[self.parents.pop(pk)].pop(pk, None)
+
+    def descendants(self, pk: int) -> list[int]:
+        """ id всех потомков pk, уровень за уровнем """
+        result: list[int] = []
+        seen = {pk}
+        level = [pk]
+        while level:
+            level = [child for parent in level for child in self.children.get(parent, ())
+                     if child not in seen]
+            seen.update(level)
+            result += level
+        return result
+
+    def ancestors(self, pk: int) -> list[int]:
+        """ id всех предков pk от родителя до корня """
+        result: list[int] = []
+        seen = {pk}
+        parent = self.parents.get(pk)
+        while parent in self.parents and parent not in seen:
+            seen.add(parent)
+            result.append(parent)
+            parent = self.parents[parent]
+        return result
+
+
+class SummaryIndex:
+    """
+    Суммы поля value по дням и месяцам и значениям поля group
+    (fields - поля (date, group, value)). Как и ParentIndex, хранит вклад
+    каждого объекта на момент записи, чтобы при update и delete вычесть
+    прежние значения.
+    """
+
+    def __init__(self, fields: tuple[str, str, str], objs: Iterable[Any] = ()) -> None:
+        self.fields = fields
+        self.entries: dict[int, tuple[str, Any, int]] = {}
+        self.totals: dict[str, dict[tuple[str, Any], list[int]]] = {
+            unit: {} for unit in SUMMARY_UNITS}
+        for obj in objs:
+            self.set(obj)
+
+    def _change(self, entry: tuple[str, Any, int], sign: int) -> None:
+        date, group, value = entry
+        for unit, totals in self.totals.items():
+            key = (summary_key(unit, date), group)
+            total = totals.setdefault(key, [0, 0])
+            total[0] += sign * value
+            total[1] += sign
+            if total[1] == 0:
+                del totals[key]
+
+    def set(self, obj: Any) -> None:
+        """ Учесть объект или его новые значения """
+        self.discard(obj.pk)
+        date, group, value = self.fields
+        entry = (str(getattr(obj, date)), getattr(obj, group), int(getattr(obj, value)))
+        self.entries[obj.pk] = entry
+        self._change(entry, 1)
+
+    def discard(self, pk: int) -> None:
+        """ Исключить объект из сумм """
+        entry = self.entries.pop(pk, None)
+        if entry is not None:
+            self._change(entry, -1)
+
+    def get(self, unit: str, first: str | None, last: str | None) -> Totals:
+        """ Суммы за периоды с first по last (см. get_totals) """
+        return {key: (total, count) for key, (total, count) in self.totals[unit].items()
+                if (first is None or key[0] >= first)
+                and (last is None or key[0] <= last)}
 
 
 class MemoryRepository(AbstractRepository[T]):
     """
     Репозиторий, работающий в оперативной памяти. Хранит данные в словаре.
+    Для операций с деревьями строится список смежности, а для сумм по
+    периодам - индекс сумм (при первом обращении), которые затем
+    поддерживаются при каждом изменении.
     """
 
     def __init__(self) -> None:
         self._container: dict[int, T] = {}
         self._counter = count(1)
+        self._trees: dict[str, ParentIndex] = {}
+        self._summaries: dict[tuple[str, str, str], SummaryIndex] = {}
+
+    def _tree(self, field: str) -> ParentIndex:
+        tree = self._trees.get(field)
+        if tree is None:
+            tree = self._trees[field] = ParentIndex(field, self._container.values())
+        return tree
+
+    def _summary(self, fields: tuple[str, str, str]) -> SummaryIndex:
+        summary = self._summaries.get(fields)
+        if summary is None:
+            summary = self._summaries[fields] = SummaryIndex(fields,
+                                                             self._container.values())
+        return summary
+
+    def _store(self, obj: T) -> None:
+        self._container[obj.pk] = obj
+        for tree in self._trees.values():
+            tree.set(obj)
+        for summary in self._summaries.values():
+            summary.set(obj)
 
     def add(self, obj: T) -> int:
         if getattr(obj, 'pk', None) != 0:
             raise ValueError(f'trying to add object {obj} with filled `pk` attribute')
         pk = next(self._counter)
-        self._container[pk] = obj
         obj.pk = pk
+        self._store(obj)
         return pk
 
     def get(self, pk: int) -> T | None:
@@ -36,12 +162,76 @@ class MemoryRepository(AbstractRepository[T]):
 
     def get_all_by_pattern(self, patterns: dict[str, str]) -> list[T]:
         return [obj for obj in self._container.values()
-                if all(value in getattr(obj, attr) for attr, value in patterns.items())]
+                if all(value in str(getattr(obj, attr))
+                       for attr, value in patterns.items())]
 
     def update(self, obj: T) -> None:
         if obj.pk == 0:
             raise ValueError('attempt to update object with unknown primary key')
-        self._container[obj.pk] = obj
+        self._store(obj)
 
     def delete(self, pk: int) -> None:
         self._container.pop(pk)
+        for tree in self._trees.values():
+            tree.discard(pk)
+        for summary in self._summaries.values():
+            summary.discard(pk)
+
+    def iter_columns(self, fields: Sequence[str], after: int = 0,
+                     chunk_size: int = 10000) -> Iterator[list[tuple[Any, ...]]]:
+        pks = sorted(pk for pk in self._container if pk > after)
+        for start in range(0, len(pks), chunk_size):
+            objs = [self._container[pk] for pk in pks[start:start + chunk_size]]
+            yield [(obj.pk, *(getattr(obj, field) for field in fields)) for obj in objs]
+
+    def restore_many(self, objs: Iterable[T]) -> None:
+        objs = list(objs)
+        for obj in objs:
+            if obj.pk == 0 or obj.pk in self._container:
+                raise ValueError(f'unable to restore object with pk={obj.pk}')
+        for obj in objs:
+            self._store(obj)
+
+    def get_descendants(self, pk: int, field: str = 'parent') -> list[T]:
+        return [self._container[child] for child in self._tree(field).descendants(pk)]
+
+    def get_ancestors(self, pk: int, field: str = 'parent') -> list[T]:
+        return [self._container[parent] for parent in self._tree(field).ancestors(pk)]
+
+    def delete_subtree(self, pk: int, field: str = 'parent') -> list[T]:
+        if pk not in self._container:
+            raise ValueError(f'unable to delete subtree of nonexistent pk={pk}')
+        pks = [pk] + self._tree(field).descendants(pk)
+        objs = [self._container[pk] for pk in pks]
+        for obj in objs:
+            self.delete(obj.pk)
+        return objs
+
+    def move_subtree(self, pk: int, parent: int | None, field: str = 'parent') -> None:
+        obj = self._container.get(pk)
+        if obj is None:
+            raise ValueError(f'unable to move nonexistent pk={pk}')
+        if parent is not None and (parent == pk
+                                   or pk in self._tree(field).ancestors(parent)):
+            raise ValueError(f'unable to move pk={pk} into its own subtree')
+        setattr(obj, field, parent)
+        self._store(obj)
+
+    def get_totals(self, unit: str, first: str | None = None, last: str | None = None,
+                   fields: tuple[str, str, str] = SUMMARY_FIELDS) -> Totals:
+        if unit not in SUMMARY_UNITS:
+            raise ValueError(f'unknown summary unit "{unit}"')
+        return self._summary(fields).get(unit, first, last)
+
+    def rebuild_totals(self) -> None:
+        # The indexes are built again on the next request:
+        self._summaries.clear()
+
+    def check_totals(self) -> TotalsDiff:
+        diff: TotalsDiff = {}
+        for fields, summary in self._summaries.items():
+            for unit in SUMMARY_UNITS:
+                diff.update(compare_totals(
+                    unit, summary.get(unit, None, None),
+                    summarize(self._container.values(), unit, fields)))
+        return diff
@@ -0,0 +1,156 @@
+"""
+Модуль описывает трассировку SQL-запросов
+
+QueryTracer записывает каждый выполненный запрос с параметрами и временем
+выполнения. Для медленных запросов (дольше порога) дополнительно
+выполняется EXPLAIN QUERY PLAN, план пишется в журнал, а полный просмотр
+больших таблиц (SCAN без индекса) отмечается отдельно - так находятся
+недостающие индексы.
+"""
+
+import logging
+import re
+import sqlite3
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Sequence
+
+logger = logging.getLogger('bookkeeper.sql')
+
+# "SCAN expense" (SQLite >= 3.36) or "SCAN TABLE expense" (older versions):
+_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\w+)(.*)$')
+
+# Plans name the tables by their aliases ("FROM expense AS e", "JOIN node n"),
+# the lookahead also finds overlapping pairs ("FROM w JOIN expense e"):
+_ALIAS_RE = re.compile(r'(?=\b(?:FROM|JOIN)\s+(\w+)\s+(?:AS\s+)?(\w+))',
+                       re.IGNORECASE)
+
+
+@dataclass
+class TracedQuery:
+    """
+    Запись о выполненном запросе.
+    sql - текст запроса
+    params - параметры запроса
+    duration - время выполнения, секунды
+    plan - план выполнения (только для медленных запросов)
+    full_scans - большие таблицы, просматриваемые целиком без индекса
+    """
+    sql: str
+    params: Sequence[Any]
+    duration: float
+    plan: list[str] | None = None
+    full_scans: list[str] = field(default_factory=list)
+
+
+class QueryTracer:
+    """
+    Трассировщик SQL-запросов.
+
+    Parameters
+    ----------
+    slow_threshold - порог медленного запроса, секунды
+    large_table_rows - начиная с какого числа строк таблица считается большой
+    max_entries - сколько последних запросов хранить
+    """
+
+    def __init__(self, slow_threshold: float = 0.05,
+                 large_table_rows: int = 10000,
+                 max_entries: int = 1000) -> None:
+        self.slow_threshold = slow_threshold
+        self.large_table_rows = large_table_rows
+        self.queries: deque[TracedQuery] = deque(maxlen=max_entries)
+        self.slow_queries: deque[TracedQuery] = deque(maxlen=max_entries)
+        self._lock = threading.Lock()
+
+    def trace(self, con: sqlite3.Connection, sql: str,
+              params: Sequence[Any], duration: float) -> TracedQuery:
+        """
+        Записать выполненный запрос. Если запрос медленный, получить его
+        план на том же соединении и записать в журнал.
+        """
+        entry = TracedQuery(sql, params, duration)
+        logger.debug("%.6fs %s %r", duration, sql, params)
+
+        if duration >= self.slow_threshold:
+            entry.plan = self.explain(con, sql, params)
+            try:
+                entry.full_scans = self.find_full_scans(con, entry.plan, sql)
+            except Exception:  # pylint: disable=broad-except
+                # The query itself has succeeded, tracing must not fail it:
+                logger.exception("unable to find full scans in %s", sql)
+
+            logger.warning("slow query (%.3fs): %s %r\n  plan:\n    %s",
+                           duration, sql, params, "\n    ".join(entry.plan))
+            for table in entry.full_scans:
+                logger.warning("full scan of large table %s, consider an index",
+                               table)
+
+        with self._lock:
+            self.queries.append(entry)
+            if entry.plan is not None:
+                self.slow_queries.append(entry)
+        return entry
+
+    @staticmethod
+    def explain(con: sqlite3.Connection, sql: str, params: Sequence[Any]) -> list[str]:
+        """ Получить план выполнения запроса (столбец detail) """
+        try:
+            rows = con.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        except sqlite3.Error as exc:
+            return [f"<unable to explain: {exc}>"]
+        return [row[-1] for row in rows]
+
+    def find_full_scans(self, con: sqlite3.Connection, plan: list[str],
+                        sql: str = "") -> list[str]:
+        """
+        Найти в плане большие таблицы, которые просматриваются целиком
+        без использования индекса. Учитываются только таблицы базы данных
+        (не подзапросы и CTE); псевдонимы таблиц ищутся в тексте запроса sql.
+        """
+        aliases: dict[str, str] = {alias: table
+                                   for table, alias in _ALIAS_RE.findall(sql)}
+        tables = []
+        for detail in plan:
+            match = _SCAN_RE.match(detail.strip())
+            if match is None or 'USING' in match.group(2):
+                continue
+
+            table = aliases.get(match.group(1), match.group(1))
+            if table not in tables and self.is_table(con, table) \
+                    and self.table_rows(con, table) >= self.large_table_rows:
+                tables.append(table)
+        return tables
+
+    @staticmethod
+    def is_table(con: sqlite3.Connection, name: str) -> bool:
+        """ Есть ли в базе данных таблица name """
+        try:
+            row = con.execute("SELECT count(*) FROM sqlite_master "
+                              "WHERE type = 'table' AND name = ?", [name]).fetchone()
+        except sqlite3.Error:
+            return False
+        return bool(row[0])
+
+    @staticmethod
+    def table_rows(con: sqlite3.Connection, table: str) -> int:
+        """
+        Оценить число строк в таблице. Для таблиц с ROWID используется
+        max(ROWID) - это не требует просмотра всей таблицы.
+        Если оценить не удалось, возвращается 0.
+        """
+        try:
+            try:
+                row = con.execute(f"SELECT max(ROWID) FROM {table}").fetchone()
+            except sqlite3.OperationalError:
+                row = con.execute(f"SELECT count(*) FROM {table}").fetchone()
+        except sqlite3.Error:
+            return 0
+        return int(row[0] or 0)
+
+    def clear(self) -> None:
+        """ Очистить записанные запросы """
+        with self._lock:
+            self.queries.clear()
+            self.slow_queries.clear()
@@ -0,0 +1,142 @@
+"""
+Модуль описывает политику повторных попыток для обращений к SQLite
+
+Если с одной базой данных одновременно работают несколько процессов
+(графический интерфейс, create_db_table.py, импорт), запрос может получить
+ошибку SQLITE_BUSY или SQLITE_LOCKED. Вместо того чтобы сразу показывать ее
+пользователю, операция повторяется с экспоненциально растущей случайной
+задержкой, а время ожидания блокировок накапливается в статистике.
+"""
+
+import random
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, TypeVar
+
+R = TypeVar('R')
+
+# Primary result codes of busy/locked errors (extended codes share low byte):
+SQLITE_BUSY = 5
+SQLITE_LOCKED = 6
+
+
+class DatabaseBusyError(ValueError):
+    """
+    База данных оставалась заблокированной после всех повторных попыток.
+    Наследуется от ValueError, чтобы интерфейс показал ее как обычную ошибку.
+    """
+
+
+def is_lock_error(exc: BaseException) -> bool:
+    """ Является ли исключение ошибкой SQLITE_BUSY/SQLITE_LOCKED """
+    if not isinstance(exc, sqlite3.OperationalError):
+        return False
+
+    code = getattr(exc, 'sqlite_errorcode', None)
+    if code is not None:
+        return code & 0xff in (SQLITE_BUSY, SQLITE_LOCKED)
+
+    message = str(exc).lower()
+    return 'locked' in message or 'busy' in message
+
+
+@dataclass
+class LockStats:
+    """
+    Статистика ожидания блокировок.
+    acquisitions - число захватов блокировки на запись
+    retries - число повторных попыток
+    failures - число операций, так и не дождавшихся блокировки
+    wait_time - суммарное время ожидания (захват и задержки), секунды
+    max_wait - максимальное время ожидания одной операции, секунды
+    """
+    acquisitions: int = 0
+    retries: int = 0
+    failures: int = 0
+    wait_time: float = 0.0
+    max_wait: float = 0.0
+    _lock: threading.Lock = field(default_factory=threading.Lock,
+                                  repr=False, compare=False)
+
+    def record_wait(self, seconds: float) -> None:
+        """ Учесть время ожидания одной операции """
+        with self._lock:
+            self.acquisitions += 1
+            self.wait_time += seconds
+            self.max_wait = max(self.max_wait, seconds)
+
+    def record_retry(self, seconds: float) -> None:
+        """ Учесть повторную попытку с задержкой seconds """
+        with self._lock:
+            self.retries += 1
+            self.wait_time += seconds
+
+    def record_failure(self) -> None:
+        """ Учесть операцию, завершившуюся ошибкой блокировки """
+        with self._lock:
+            self.failures += 1
+
+    def as_dict(self) -> dict[str, float]:
+        """ Текущие значения счетчиков """
+        with self._lock:
+            return {'acquisitions': self.acquisitions,
+                    'retries': self.retries,
+                    'failures': self.failures,
+                    'wait_time': self.wait_time,
+                    'max_wait': self.max_wait}
+
+
+@dataclass
+class RetryPolicy:
+    """
+    Политика повторных попыток.
+    attempts - максимальное число попыток (включая первую)
+    base_delay - задержка перед первым повтором, секунды
+    max_delay - верхняя граница задержки, секунды
+    jitter - доля задержки, выбираемая случайно (0 - без разброса)
+    max_wait - предел общего времени операции вместе с ожиданием
+               блокировки внутри SQLite (busy_timeout), секунды:
+               повтор, который его превысил бы, не выполняется
+    """
+    attempts: int = 6
+    base_delay: float = 0.02
+    max_delay: float = 1.0
+    jitter: float = 0.5
+    max_wait: float = 2.0
+
+    def delays(self) -> Iterator[float]:
+        """ Последовательность задержек между попытками """
+        for attempt in range(self.attempts - 1):
+            delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+            yield delay * (1 - self.jitter * random.random())
+
+    def run(self, operation: Callable[[], R], stats: LockStats | None = None) -> R:
+        """
+        Выполнить операцию, повторяя ее при ошибках блокировки.
+        Если все попытки исчерпаны, выбрасывается DatabaseBusyError.
+        """
+        delays = self.delays()
+        start = time.monotonic()
+        while True:
+            try:
+                return operation()
+            except sqlite3.OperationalError as exc:
+                if not is_lock_error(exc):
+                    raise
+
+                delay = next(delays, None)
+                if delay is not None and \
+                        time.monotonic() - start + delay > self.max_wait:
+                    delay = None
+                if delay is None:
+                    if stats is not None:
+                        stats.record_failure()
+                    raise DatabaseBusyError(
+                        "База данных занята другим процессом, "
+                        "попробуйте повторить операцию позже") from exc
+
+                if stats is not None:
+                    stats.record_retry(delay)
+                time.sleep(delay)
@@ -2,34 +2,339 @@
 Модуль описывает репозиторий, работающий поверх СУБД SQLite
 """
 
+import dataclasses
+import itertools
 import sqlite3
+import threading
+from contextlib import contextmanager
 from inspect import get_annotations
-from typing import Any, Callable
+from time import perf_counter
+from typing import Any, Callable, Iterable, Iterator, Sequence, TypeVar
 from datetime import datetime
+from enum import Enum
 
-from bookkeeper.repository.abstract_repository import AbstractRepository, T
+from bookkeeper.repository.abstract_repository import AbstractRepository, T, \
+                                                SUMMARY_FIELDS, SUMMARY_UNITS, \
+                                                Totals, TotalsDiff, compare_totals
+from bookkeeper.repository.retry_policy import RetryPolicy, LockStats
+from bookkeeper.repository.instrumented_repository import RepositoryMetrics, \
+                                                         estimate_size
+from bookkeeper.repository.query_tracer import QueryTracer
 
+R = TypeVar('R')
 
-class SQLiteRepository(AbstractRepository[T]):
+# Connections of the transactions open in the current thread by database
+# file (see SQLiteDatabase.transaction):
+_transactions = threading.local()
+
+
+class SQLiteDatabase:  # pylint: disable=too-many-instance-attributes
+    """
+    Соединения с файлом базы данных SQLite.
+
+    Каждый поток получает собственное соединение с базой данных с общими
+    настройками (PRAGMA), поэтому объект можно использовать одновременно
+    из нескольких потоков. В режиме WAL читатели не блокируют писателя
+    и наоборот.
+
+    Запись выполняется в транзакциях BEGIN IMMEDIATE. Если база данных
+    занята другим процессом, операция повторяется согласно политике retry,
+    а время ожидания блокировок накапливается в lock_stats. Несколько
+    операций, в том числе разных объектов с одним файлом, объединяются
+    в одну транзакцию блоком transaction().
+
+    Каждая транзакция записи увеличивает счетчик изменений файла
+    (таблица change_counter, см. data_version), поэтому изменения,
+    сделанные другими процессами, тоже видны по номеру версии.
+
+    Parameters
+    ----------
+    db_file - путь к файлу базы данных
+    wal - включить журнал WAL (PRAGMA journal_mode = WAL)
+    synchronous - значение PRAGMA synchronous ("OFF", "NORMAL", "FULL")
+    cache_size - значение PRAGMA cache_size (страниц или -КиБ)
+    mmap_size - значение PRAGMA mmap_size (байт)
+    busy_timeout - время ожидания блокировки внутри SQLite за одну попытку,
+                   в миллисекундах (общее время ограничивает retry.max_wait)
+    retry - политика повторных попыток при SQLITE_BUSY/SQLITE_LOCKED
+    tracer - трассировщик SQL-запросов (см. QueryTracer)
+    """
+
+    def __init__(self, db_file: str,  # pylint: disable=too-many-arguments
+                 wal: bool = False,
+                 synchronous: str | None = None,
+                 cache_size: int | None = None,
+                 mmap_size: int | None = None,
+                 busy_timeout: int = 200,
+                 retry: RetryPolicy | None = None,
+                 tracer: QueryTracer | None = None) -> None:
+        self.db_file = db_file
+
+        # Connection settings, applied once per thread connection:
+        self.pragmas = ["PRAGMA foreign_keys = ON",
+                        f"PRAGMA busy_timeout = {int(busy_timeout)}"]
+        if wal:
+            self.pragmas.append("PRAGMA journal_mode = WAL")
+        if synchronous is not None:
+            self.pragmas.append(f"PRAGMA synchronous = {synchronous}")
+        if cache_size is not None:
+            self.pragmas.append(f"PRAGMA cache_size = {int(cache_size)}")
+        if mmap_size is not None:
+            self.pragmas.append(f"PRAGMA mmap_size = {int(mmap_size)}")
+
+        # Lock handling:
+        self.retry = retry if retry is not None else RetryPolicy()
+        self.lock_stats = LockStats()
+
+        # SQL statements log:
+        self.tracer = tracer
+
+        # Per-thread connections:
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+
+    def connection(self) -> sqlite3.Connection:
+        """
+        Получить соединение с базой данных, принадлежащее текущему потоку.
+        Соединение создается при первом обращении из потока и
+        переиспользуется всеми последующими запросами этого потока.
+        Внутри блока transaction() возвращается соединение этого блока.
+        """
+        cons: dict[str, sqlite3.Connection] = getattr(_transactions, 'cons', {})
+        shared = cons.get(self.db_file)
+        if shared is not None:
+            return shared
+
+        con: sqlite3.Connection | None = getattr(self._local, 'con', None)
+        if con is None:
+            # Transactions are controlled explicitly (see write()):
+            con = sqlite3.connect(self.db_file, check_same_thread=False,
+                                  isolation_level=None)
+            for pragma in self.pragmas:
+                con.execute(pragma)
+
+            self._local.con = con
+            with self._connections_lock:
+                self._connections.append(con)
+        return con
+
+    def close(self) -> None:
+        """ Закрыть соединения всех потоков """
+        with self._connections_lock:
+            for con in self._connections:
+                con.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    def write(self, operation: Callable[[sqlite3.Connection], R]) -> R:
+        """
+        Выполнить операцию записи в транзакции BEGIN IMMEDIATE.
+        Блокировка на запись захватывается в начале транзакции, поэтому
+        конфликт с другим писателем обнаруживается сразу, а не при COMMIT.
+        При ошибках блокировки транзакция откатывается и повторяется целиком.
+        Внутри блока transaction() операция выполняется в его транзакции.
+        """
+        def attempt() -> R:
+            con = self.connection()
+            if con.in_transaction:
+                return operation(con)
+
+            start = perf_counter()
+            con.execute("BEGIN IMMEDIATE")
+            self.lock_stats.record_wait(perf_counter() - start)
+
+            try:
+                result = operation(con)
+                self.count_change(con)
+                con.execute("COMMIT")
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+            return result
+
+        return self.retry.run(attempt, self.lock_stats)
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """
+        Выполнить операции блока в одной транзакции BEGIN IMMEDIATE: они
+        фиксируются вместе или вместе откатываются при исключении. В блоке
+        все объекты SQLiteDatabase с тем же файлом в этом потоке работают
+        через его соединение, вложенные блоки присоединяются к внешнему.
+        При ошибках блокировки повторяется только начало транзакции.
+        """
+        con = self.connection()
+        if con.in_transaction:
+            yield
+            return
+
+        def begin() -> None:
+            start = perf_counter()
+            con.execute("BEGIN IMMEDIATE")
+            self.lock_stats.record_wait(perf_counter() - start)
+
+        self.retry.run(begin, self.lock_stats)
+        cons = _transactions.__dict__.setdefault('cons', {})
+        cons[self.db_file] = con
+        try:
+            yield
+            self.count_change(con)
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        finally:
+            del cons[self.db_file]
+
+    def create_change_counter(self, con: sqlite3.Connection) -> None:
+        """ Создать счетчик изменений файла (вызывается при создании таблиц) """
+        self.execute(con, "CREATE TABLE IF NOT EXISTS change_counter ("
+                          "version INTEGER NOT NULL)")
+        self.execute(con, "INSERT INTO change_counter SELECT 0 "
+                          "WHERE NOT EXISTS (SELECT * FROM change_counter)")
+
+    def count_change(self, con: sqlite3.Connection) -> None:
+        """ Учесть транзакцию записи в счетчике изменений (перед COMMIT) """
+        # Like BEGIN and COMMIT, the counter is not traced:
+        con.execute("UPDATE change_counter SET version = version + 1")
+
+    def data_version(self) -> int | None:
+        """
+        Номер версии данных файла - значение счетчика изменений: растет
+        с каждой транзакцией записи, в том числе другого процесса.
+        """
+        # PRAGMA data_version does not change on the commits of the same
+        # connection, so the file keeps a counter of its own:
+        return int(self.read(lambda con: self.fetch_all(
+            con, "SELECT version FROM change_counter"))[0][0])
+
+    def read(self, operation: Callable[[sqlite3.Connection], R]) -> R:
+        """
+        Выполнить операцию чтения, повторяя ее при ошибках блокировки.
+        """
+        return self.retry.run(lambda: operation(self.connection()), self.lock_stats)
+
+    def execute(self, con: sqlite3.Connection, query: str,
+                params: Sequence[Any] = ()) -> sqlite3.Cursor:
+        """ Выполнить запрос, записав его в трассировщик (если он задан) """
+        if self.tracer is None:
+            return con.execute(query, params)
+
+        start = perf_counter()
+        cur = con.execute(query, params)
+        self.tracer.trace(con, query, params, perf_counter() - start)
+        return cur
+
+    def executemany(self, con: sqlite3.Connection, query: str,
+                    params: Iterable[Sequence[Any]]) -> sqlite3.Cursor:
+        """
+        Выполнить запрос для каждого набора параметров (см. execute).
+        Параметры могут задаваться генератором: наборы читаются по мере
+        выполнения запроса.
+        """
+        if self.tracer is None:
+            return con.executemany(query, params)
+
+        # The first parameter set is traced (it may be consumed lazily):
+        params = iter(params)
+        first = next(params, None)
+        if first is not None:
+            params = itertools.chain((first,), params)
+
+        start = perf_counter()
+        cur = con.executemany(query, params)
+        self.tracer.trace(con, query, first if first is not None else (),
+                          perf_counter() - start)
+        return cur
+
+    def fetch_all(self, con: sqlite3.Connection, query: str,
+                  params: Sequence[Any] = ()) -> list[Any]:
+        """
+        Выполнить запрос на чтение и получить все строки результата.
+        В трассировку попадает время вместе с получением строк.
+        """
+        if self.tracer is None:
+            return con.execute(query, params).fetchall()
+
+        start = perf_counter()
+        rows = con.execute(query, params).fetchall()
+        self.tracer.trace(con, query, params, perf_counter() - start)
+        return rows
+
+
+class SQLiteRepository(SQLiteDatabase, AbstractRepository[T]):
     """
     Репозиторий, предназначенный для работы с СУБД SQLite
+
+    Соединения, транзакции записи и повторные попытки при блокировках -
+    те же, что у SQLiteDatabase, поэтому репозиторий можно использовать
+    одновременно из нескольких потоков (например, интерфейс пишет, а
+    фоновый отчет читает).
+
+    Первичные ключи не используются повторно: наибольший выданный ключ
+    каждой таблицы хранится в таблице pk_floor, и после удаления последних
+    записей (например, при переносе в архив) новые записи получают
+    ключи больше него.
+
+    Parameters
+    ----------
+    db_file - путь к файлу базы данных
+    cls - класс хранимых объектов
+    wal, synchronous, cache_size, mmap_size, busy_timeout, retry, tracer -
+        настройки соединений (см. SQLiteDatabase)
+    metrics - накопитель статистики обращений (см. RepositoryMetrics)
+    closure - поле ссылки на родителя (например, "parent"). Если оно есть
+              у хранимого класса, рядом с таблицей ведется таблица замыкания
+              <таблица>_closure(ancestor, descendant, depth) со всеми парами
+              "предок-потомок". Ее поддерживают триггеры на добавление,
+              удаление и смену родителя, а операции с деревом и выборки по
+              поддереву (get_all_in_subtree) становятся индексными запросами.
+    indexes - поля, по которым нужно создать индексы (поля, которых нет
+              у хранимого класса, пропускаются)
+    summary - поля (date, group, value), например SUMMARY_FIELDS. Если они
+              есть у хранимого класса, рядом с таблицей ведутся таблицы
+              сумм <таблица>_daily и <таблица>_monthly(period, group,
+              total, count) с суммами value по дням (месяцам) и значениям
+              group. Их поддерживают триггеры на добавление, удаление и
+              изменение записей, а get_totals читает готовые суммы вместо
+              просмотра всех записей.
     """
 
     # Class static variables:
     DEFAULT_DATE_FORMAT: str
     DEFAULT_DATE_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
 
-    def __init__(self, db_file: str, cls: type) -> None:
+    def __init__(self, db_file: str, cls: type,  # pylint: disable=too-many-arguments
+                 wal: bool = False,
+                 synchronous: str | None = None,
+                 cache_size: int | None = None,
+                 mmap_size: int | None = None,
+                 busy_timeout: int = 200,
+                 retry: RetryPolicy | None = None,
+                 metrics: RepositoryMetrics | None = None,
+                 tracer: QueryTracer | None = None,
+                 closure: str | None = None,
+                 indexes: Iterable[str] = (),
+                 summary: Sequence[str] | None = None) -> None:
         # Type annotations:
-        self.db_file: str  # Database file
         self.table_name: str  # Name of a table in database
         self.cls: Callable[[], T]  # Class constructor of type T
         self.fields: dict[str, type]  # Field of a class to be stored
         self.queries: dict[str, str]  # Shortcuts of SQL queries to be made
+        self.metrics: RepositoryMetrics | None  # Per-operation statistics
+        self.closure_field: str | None  # Parent field kept in the closure table
+        self.closure_table: str | None  # Name of the closure table
+        self.summary_fields: tuple[str, str, str] | None  # Summed up fields
+        self.summary_tables: dict[str, str]  # Names of the summary tables by unit
+
+        # Connections (and their settings) to the database file:
+        SQLiteDatabase.__init__(self, db_file, wal=wal, synchronous=synchronous,
+                                cache_size=cache_size, mmap_size=mmap_size,
+                                busy_timeout=busy_timeout, retry=retry, tracer=tracer)
 
         # Initialization:
         self.table_name = cls.__name__.lower()
-        self.db_file = db_file
         self.fields = get_annotations(cls, eval_str=True)
         self.fields.pop('pk')
         self.cls = cls
@@ -40,20 +345,271 @@ class SQLiteRepository(AbstractRepository[T]):
         ph_upd = ", ".join([f"{field}=?" for field in self.fields.keys()])
 
         self.queries = {
-            'foreign_keys': "PRAGMA foreign_keys = ON",
             'create': f"CREATE TABLE IF NOT EXISTS {self.table_name} ({names})",
-            'add': f"INSERT INTO {self.table_name} ({names}) VALUES ({pholder})",
+            'add_with_pk': f"INSERT INTO {self.table_name} (ROWID, {names}) "
+                           + f"VALUES (?, {pholder})",
+            'max_pk': f"SELECT max(coalesce(max(ROWID), 0), coalesce(("
+                      f"SELECT pk FROM pk_floor WHERE name = '{self.table_name}'), 0)) "
+                      f"FROM {self.table_name}",
+            'raise_pk_floor': "UPDATE pk_floor SET pk = max(pk, ?) WHERE name = ?",
             'get': f"SELECT ROWID, * FROM {self.table_name} WHERE ROWID = ?",
             'get_all': f"SELECT ROWID, * FROM {self.table_name}",
             'update': f"UPDATE {self.table_name} SET {ph_upd} WHERE ROWID = ?",
             'delete': f"DELETE FROM {self.table_name} WHERE ROWID = ?",
         }
 
-        # Create the requested table in the database file:
-        with sqlite3.connect(self.db_file) as con:
-            cur = con.cursor()
-            cur.execute(self.queries['create'])
-        con.close()
+        # Diagnostics:
+        self.metrics = metrics
+
+        # Create the requested table in the database file (or add the columns
+        # of the fields that appeared in the class after the table was made):
+        self.write(self.create_table)
+
+        # Indexes on the requested fields present in the model:
+        index_queries = [f"CREATE INDEX IF NOT EXISTS {self.table_name}_{field} "
+                         + f"ON {self.table_name} ({field})"
+                         for field in indexes if field in self.fields]
+        if index_queries:
+            self.write(lambda con: [self.execute(con, query) for query in index_queries])
+
+        # Ancestor-descendant pairs of the tree (if the model is a tree):
+        self.closure_field = closure if closure in self.fields else None
+        self.closure_table = None
+        if self.closure_field is not None:
+            self.closure_table = f"{self.table_name}_closure"
+            self.write(self.create_closure)
+
+        # Daily and monthly totals (if the model has the summed up fields):
+        self.summary_fields = None
+        self.summary_tables = {}
+        if summary is not None and all(field in self.fields for field in summary):
+            date, group, value = summary
+            self.summary_fields = (date, group, value)
+            self.summary_tables = {'day': f"{self.table_name}_daily",
+                                   'month': f"{self.table_name}_monthly"}
+            self.write(self.create_summary)
+
+    def add_columns(self, con: sqlite3.Connection) -> None:
+        """
+        Добавить в таблицу столбцы полей, которых в ней нет (таблица
+        создана прежней версией класса). Значение по умолчанию берется из
+        описания поля dataclass, иначе новый столбец заполняется NULL.
+        Столбцы добавляются в конец таблицы, поэтому новые поля должны
+        объявляться в классе после прежних.
+        """
+        columns = {row[1] for row in
+                   self.fetch_all(con, f"PRAGMA table_info({self.table_name})")}
+        defaults: dict[str, Any] = {}
+        if dataclasses.is_dataclass(self.cls):
+            defaults = {field.name: field.default
+                        for field in dataclasses.fields(self.cls)}
+
+        for name in self.fields:
+            if name in columns:
+                continue
+            default = defaults.get(name, dataclasses.MISSING)
+            if isinstance(default, Enum):
+                default = default.name.lower()
+            if isinstance(default, str):
+                clause = " DEFAULT '" + default.replace("'", "''") + "'"
+            elif isinstance(default, (int, float)):
+                clause = f" DEFAULT {default!r}"
+            else:
+                clause = ""
+            self.execute(con, f"ALTER TABLE {self.table_name} ADD COLUMN {name}{clause}")
+
+    def create_table(self, con: sqlite3.Connection) -> None:
+        """
+        Создать таблицу (или добавить в нее недостающие столбцы) и таблицу
+        наибольших выданных ключей pk_floor, общую для всех таблиц файла.
+        Для новой таблицы ключи начинаются с начала, для существующей
+        без записи в pk_floor - с наибольшего имеющегося.
+        """
+        existed = self.fetch_all(
+            con, "SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name = ?",
+            [self.table_name])[0][0]
+        self.execute(con, self.queries['create'])
+        self.add_columns(con)
+
+        self.create_change_counter(con)
+        self.execute(con, "CREATE TABLE IF NOT EXISTS pk_floor ("
+                          "name TEXT PRIMARY KEY, pk INTEGER NOT NULL) WITHOUT ROWID")
+        self.execute(con, f"INSERT OR {'IGNORE' if existed else 'REPLACE'} "
+                          f"INTO pk_floor SELECT ?, coalesce(max(ROWID), 0) "
+                          f"FROM {self.table_name}", [self.table_name])
+
+    def raise_pk_floor(self, con: sqlite3.Connection, pk: int) -> None:
+        """ Учесть выданный (или восстановленный) ключ pk """
+        self.execute(con, self.queries['raise_pk_floor'], [pk, self.table_name])
+
+    def next_pk(self, con: sqlite3.Connection) -> int:
+        """ Ключ для новой записи (вызывается внутри транзакции записи) """
+        return int(self.fetch_all(con, self.queries['max_pk'])[0][0]) + 1
+
+    def create_closure(self, con: sqlite3.Connection) -> None:
+        """
+        Создать таблицу замыкания и поддерживающие ее триггеры.
+        Для уже существующего дерева таблица заполняется заново.
+        """
+        table, closure, field = self.table_name, self.closure_table, self.closure_field
+        subtree = f"(SELECT descendant FROM {closure} WHERE ancestor = %s.ROWID)"
+        existed = self.fetch_all(
+            con, "SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name = ?",
+            [closure])[0][0]
+
+        statements = [
+            f"CREATE TABLE IF NOT EXISTS {closure} ("
+            "ancestor INTEGER, descendant INTEGER, depth INTEGER, "
+            "PRIMARY KEY (ancestor, descendant)) WITHOUT ROWID",
+            f"CREATE INDEX IF NOT EXISTS {closure}_descendant "
+            f"ON {closure} (descendant, depth)",
+
+            # A new node is linked to itself and to all ancestors of its parent:
+            f"CREATE TRIGGER IF NOT EXISTS {closure}_insert AFTER INSERT ON {table} "
+            "BEGIN "
+            f"INSERT OR REPLACE INTO {closure} VALUES (NEW.ROWID, NEW.ROWID, 0); "
+            f"INSERT OR REPLACE INTO {closure} SELECT ancestor, NEW.ROWID, depth + 1 "
+            f"FROM {closure} WHERE descendant = NEW.{field}; "
+            "END",
+
+            # The moved subtree is cut off its old ancestors and linked to the new:
+            f"CREATE TRIGGER IF NOT EXISTS {closure}_move AFTER UPDATE OF {field} "
+            f"ON {table} WHEN OLD.{field} IS NOT NEW.{field} "
+            "BEGIN "
+            f"DELETE FROM {closure} WHERE descendant IN {subtree % 'NEW'} "
+            f"AND ancestor NOT IN {subtree % 'NEW'}; "
+            f"INSERT OR REPLACE INTO {closure} "
+            f"SELECT a.ancestor, d.descendant, a.depth + d.depth + 1 "
+            f"FROM {closure} AS a, {closure} AS d "
+            f"WHERE a.descendant = NEW.{field} AND d.ancestor = NEW.ROWID; "
+            "END",
+
+            # Children of a removed node become roots until they are moved:
+            f"CREATE TRIGGER IF NOT EXISTS {closure}_delete AFTER DELETE ON {table} "
+            "BEGIN "
+            f"DELETE FROM {closure} WHERE descendant IN {subtree % 'OLD'} "
+            f"AND ancestor IN "
+            f"(SELECT ancestor FROM {closure} WHERE descendant = OLD.ROWID); "
+            "END",
+        ]
+        for statement in statements:
+            self.execute(con, statement)
+
+        if not existed:
+            self.fill_closure(con)
+
+    def fill_closure(self, con: sqlite3.Connection) -> None:
+        """ Заполнить таблицу замыкания заново по ссылкам на родителей """
+        table, closure, field = self.table_name, self.closure_table, self.closure_field
+        self.execute(con, f"DELETE FROM {closure}")
+        self.execute(
+            con,
+            f"WITH RECURSIVE walk(ancestor, descendant, depth) AS ("
+            f"SELECT ROWID, ROWID, 0 FROM {table} UNION ALL "
+            f"SELECT w.ancestor, t.ROWID, w.depth + 1 FROM {table} AS t "
+            f"JOIN walk AS w ON t.{field} = w.descendant "
+            f"LIMIT (SELECT count(*) * count(*) FROM {table})) "
+            f"INSERT INTO {closure} SELECT ancestor, descendant, min(depth) FROM walk "
+            f"GROUP BY ancestor, descendant")
+
+    def rebuild_closure(self) -> None:
+        """
+        Перестроить таблицу замыкания (например, после добавления потомков
+        раньше их родителей или изменения базы данных в обход репозитория).
+        """
+        if self.closure_table is None:
+            raise ValueError(f"No closure table for {self.table_name}")
+        self.write(self.fill_closure)
+
+    def create_summary(self, con: sqlite3.Connection) -> None:
+        """
+        Создать таблицы сумм и поддерживающие их триггеры.
+        Для уже существующих записей таблицы заполняются заново.
+        """
+        if self.summary_fields is None:
+            return
+        table = self.table_name
+        date, group, value = self.summary_fields
+        existed = self.fetch_all(
+            con, "SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name = ?",
+            [self.summary_tables['day']])[0][0]
+
+        for unit, summary in self.summary_tables.items():
+            key = f"substr(%s.{date}, 1, {SUMMARY_UNITS[unit]})"
+            add = (f"INSERT INTO {summary} VALUES ({key % 'NEW'}, NEW.{group}, "
+                   f"NEW.{value}, 1) ON CONFLICT (period, {group}) DO UPDATE "
+                   f"SET total = total + excluded.total, count = count + 1; ")
+            where = f"WHERE period = {key % 'OLD'} AND {group} = OLD.{group}"
+            remove = (f"UPDATE {summary} SET total = total - OLD.{value}, "
+                      f"count = count - 1 {where}; "
+                      f"DELETE FROM {summary} {where} AND count = 0; ")
+
+            statements = [
+                f"CREATE TABLE IF NOT EXISTS {summary} ("
+                f"period TEXT NOT NULL, {group} NOT NULL, "
+                "total INTEGER NOT NULL, count INTEGER NOT NULL, "
+                f"PRIMARY KEY (period, {group})) WITHOUT ROWID",
+                f"CREATE TRIGGER IF NOT EXISTS {summary}_insert AFTER INSERT ON {table} "
+                f"BEGIN {add}END",
+                f"CREATE TRIGGER IF NOT EXISTS {summary}_delete AFTER DELETE ON {table} "
+                f"BEGIN {remove}END",
+                f"CREATE TRIGGER IF NOT EXISTS {summary}_update "
+                f"AFTER UPDATE OF {date}, {group}, {value} ON {table} "
+                f"BEGIN {remove}{add}END",
+            ]
+            for statement in statements:
+                self.execute(con, statement)
+
+        if not existed:
+            self.fill_summary(con)
+
+    def fill_summary(self, con: sqlite3.Connection) -> None:
+        """ Заполнить таблицы сумм заново по всем записям """
+        if self.summary_fields is None:
+            return
+        date, group, value = self.summary_fields
+        for unit, summary in self.summary_tables.items():
+            self.execute(con, f"DELETE FROM {summary}")
+            self.execute(con, f"INSERT INTO {summary} "
+                              f"SELECT substr({date}, 1, {SUMMARY_UNITS[unit]}), "
+                              f"{group}, sum({value}), count(*) "
+                              f"FROM {self.table_name} GROUP BY 1, 2")
+
+    def record(self, method: str, start: float,
+               rows: int = 0, nbytes: int = 0) -> None:
+        """
+        Записать статистику вызова метода, начавшегося в момент start
+        (значение perf_counter()), если сбор статистики включен.
+        """
+        if self.metrics is not None:
+            self.metrics.record(self.table_name, method,
+                                perf_counter() - start, rows, nbytes)
+
+    def select(self, method: str, query: str, params: list[Any]) -> list[T]:
+        """
+        Выполнить запрос на чтение и преобразовать строки в объекты.
+        """
+        start = perf_counter()
+        rows = self.read(lambda con: self.fetch_all(con, query, params))
+        objs = [self.generate_object(self.fields, row) for row in rows]
+
+        if self.metrics is not None:
+            self.record(method, start, len(rows), estimate_size(rows))
+        return objs
+
+    def encode(self, obj: T) -> list[Any]:
+        """
+        Получить значения полей объекта в виде, пригодном для записи
+        в базу данных. Перечисления (Enum) записываются строчными
+        названиями элементов, например Period.DAY - как "day".
+        """
+        values = []
+        for field_name in self.fields:
+            value = getattr(obj, field_name)
+            if isinstance(value, Enum):
+                value = value.name.lower()
+            values.append(value)
+        return values
 
     def generate_object(self, fields: dict[str, type], values: list[Any]) -> T:
         """
@@ -66,7 +622,9 @@ class SQLiteRepository(AbstractRepository[T]):
             field_type = fields[field_name]
 
             if field_type == datetime:
-                field_value = datetime.strptime(field_value, self.DEFAULT_DATE_FORMAT)
+                # fromisoformat() is much faster than strptime() and also
+                # accepts dates stored without microseconds:
+                field_value = datetime.fromisoformat(field_value)
 
             class_arguments[field_name] = field_value
 
@@ -81,90 +639,360 @@ class SQLiteRepository(AbstractRepository[T]):
             raise ValueError(f"Unable to add object {obj} with filled `pk` attribute")
 
         # Generate the query:
-        values = [getattr(obj, x) for x in self.fields]
-
-        with sqlite3.connect(self.db_file) as con:
-            cur = con.cursor()
-            cur.execute(self.queries['foreign_keys'])
+        values = self.encode(obj)
 
-            # Insert row into database:
-            cur.execute(self.queries['add'], values)
-        con.close()
+        # Insert row into database, the primary key is allocated inside
+        # the write transaction:
+        def insert_row(con: sqlite3.Connection) -> int:
+            pk = self.next_pk(con)
+            self.execute(con, self.queries['add_with_pk'], [pk] + values)
+            self.raise_pk_floor(con, pk)
+            return pk
 
-        if cur.lastrowid is not None:
-            obj.pk = cur.lastrowid
+        start = perf_counter()
+        obj.pk = self.write(insert_row)
+        self.record('add', start, rows=1)
 
         return obj.pk
 
+    def add_many(self, objs: Iterable[T]) -> list[int]:
+        # Objects are taken one at a time inside the write transaction and go
+        # to a single executemany. Each object gets its pk before the next one
+        # is requested, so a generator may refer to the objects it has already
+        # produced (see Category.import_tree). Any error rolls back all rows.
+        added: list[T] = []
+
+        def rows(max_pk: int) -> Iterator[list[Any]]:
+            for obj in objs:
+                if getattr(obj, 'pk', None) != 0:
+                    raise ValueError(
+                        f"Unable to add object {obj} with filled `pk` attribute")
+                # Primary keys are allocated inside the write transaction,
+                # so no other writer can take them:
+                obj.pk = max_pk + 1 + len(added)
+                added.append(obj)
+                yield [obj.pk] + self.encode(obj)
+
+        def insert_rows(con: sqlite3.Connection) -> None:
+            max_pk = self.next_pk(con) - 1
+            self.executemany(con, self.queries['add_with_pk'], rows(max_pk))
+            self.raise_pk_floor(con, max_pk + len(added))
+
+        start = perf_counter()
+        try:
+            self.write(insert_rows)
+        except BaseException:
+            for obj in added:
+                obj.pk = 0
+            raise
+        self.record('add_many', start, rows=len(added))
+
+        return [obj.pk for obj in added]
+
+    def iter_columns(self, fields: Sequence[str], after: int = 0,
+                     chunk_size: int = 10000) -> Iterator[list[tuple[Any, ...]]]:
+        for field in fields:
+            if field not in self.fields:
+                raise ValueError(f"Unknown field \"{field}\" in {self.table_name}")
+
+        # Keyset pagination: every chunk is an indexed range read of ROWID:
+        query = (f"SELECT ROWID, {', '.join(fields)} FROM {self.table_name} "
+                 "WHERE ROWID > ? ORDER BY ROWID LIMIT ?")
+        while True:
+            start = perf_counter()
+            rows = self.read(lambda con: self.fetch_all(con, query, [after, chunk_size]))
+            if self.metrics is not None:
+                self.record('iter_columns', start, len(rows), estimate_size(rows))
+            if not rows:
+                return
+            yield rows
+            after = rows[-1][0]
+
     def get(self, pk: int) -> T | None:
-        # Generate the query:
-        with sqlite3.connect(self.db_file) as con:
-            cur = con.cursor()
-            rows = cur.execute(self.queries['get'], [pk]).fetchall()
-        con.close()
+        objs = self.select('get', self.queries['get'], [pk])
 
         # Check result:
-        num_rows = len(rows)
+        num_rows = len(objs)
         if num_rows == 0:
             return None
         if num_rows > 1:
             raise ValueError(f"Several entries found with pk={pk}")
 
-        # Generate the resulting object:
-        return self.generate_object(self.fields, rows[0])
+        return objs[0]
 
     def get_all(self, where: dict[str, Any] | None = None) -> list[T]:
+        return self.get_all_where('get_all', where)
+
+    def get_all_where(self, method: str, where: dict[str, Any] | None,
+                      operator: str = "=") -> list[T]:
+        """
+        Получить все записи по условию where (см. get_all), записав
+        статистику под названием method. Поля сравниваются со значениями
+        оператором operator ("=" или "LIKE").
+        """
         # Generate the query:
         query_base = self.queries['get_all']
 
-        with sqlite3.connect(self.db_file) as con:
-            cur = con.cursor()
-
-            if where is not None:
-                conditions = " AND ".join([f"{field} = ?" for field in where.keys()])
-                query = query_base + f" WHERE {conditions}"
+        if where is not None:
+            conditions = " AND ".join([f"{field} {operator} ?" for field in where.keys()])
+            query = query_base + f" WHERE {conditions}"
+            params = list(where.values())
+        else:
+            query = query_base
+            params = []
 
-                rows = cur.execute(query, list(where.values())).fetchall()
-            else:
-                rows = cur.execute(query_base).fetchall()
-        con.close()
-
-        return [self.generate_object(self.fields, row) for row in rows]
+        return self.select(method, query, params)
 
     def get_all_by_pattern(self, patterns: dict[str, str]) -> list[T]:
         # Insert '%' sign to allow pattern-matching
         values = [f"%{v}%" for v in patterns.values()]
         where = dict(zip(patterns.keys(), values))
 
-        # Call regular get_all():
-        return self.get_all(where=where)
+        return self.get_all_where('get_all_by_pattern', where, operator="LIKE")
 
     def update(self, obj: T) -> None:
         if getattr(obj, 'pk', None) is None:
             raise ValueError("Unable to update object without `pk` attribute")
 
-        values = [getattr(obj, field) for field in self.fields] + [obj.pk]
-
-        with sqlite3.connect(self.db_file) as con:
-            cur = con.cursor()
-            cur.execute(self.queries['foreign_keys'])
+        values = self.encode(obj) + [obj.pk]
 
+        def update_row(con: sqlite3.Connection) -> None:
             # Update the entry with ROWID=pk:
-            print(self.queries['update'])
-            print(values)
-
-            cur.execute(self.queries['update'], values)
+            cur = self.execute(con, self.queries['update'], values)
 
             if cur.rowcount == 0:
                 raise ValueError(f"Unable to update object with pk={obj.pk}")
-        con.close()
 
-    def delete(self, pk: int) -> None:
-        with sqlite3.connect(self.db_file) as con:
-            cur = con.cursor()
+        start = perf_counter()
+        self.write(update_row)
+        self.record('update', start, rows=1)
+
+    def update_many(self, objs: Iterable[T]) -> None:
+        rows = [self.encode(obj) + [obj.pk] for obj in objs]
+
+        def update_rows(con: sqlite3.Connection) -> None:
+            # Update all entries in a single transaction:
+            cur = self.executemany(con, self.queries['update'], rows)
+            if cur.rowcount != len(rows):
+                raise ValueError("Unable to update some of the objects")
 
+        start = perf_counter()
+        self.write(update_rows)
+        self.record('update_many', start, rows=len(rows))
+
+    def delete(self, pk: int) -> None:
+        def delete_row(con: sqlite3.Connection) -> None:
             # Remove the entry with ROWID=pk:
-            cur.execute(self.queries['delete'], [pk])
+            cur = self.execute(con, self.queries['delete'], [pk])
             if cur.rowcount == 0:
                 raise ValueError("Unable to delete object with pk={pk}")
-        con.close()
+
+        start = perf_counter()
+        self.write(delete_row)
+        self.record('delete', start, rows=1)
+
+    def delete_many(self, pks: Iterable[int]) -> None:
+        params = [[pk] for pk in pks]
+
+        def delete_rows(con: sqlite3.Connection) -> None:
+            # Remove all entries in a single transaction:
+            cur = self.executemany(con, self.queries['delete'], params)
+            if cur.rowcount != len(params):
+                raise ValueError("Unable to delete some of the objects")
+
+        start = perf_counter()
+        self.write(delete_rows)
+        self.record('delete_many', start, rows=len(params))
+
+    def restore_many(self, objs: Iterable[T]) -> None:
+        rows = []
+        for obj in objs:
+            if getattr(obj, 'pk', 0) == 0:
+                raise ValueError(f"Unable to restore object {obj} without `pk`")
+            rows.append([obj.pk] + self.encode(obj))
+
+        def insert_rows(con: sqlite3.Connection) -> None:
+            # Rows get back their ROWIDs, all in a single transaction:
+            try:
+                self.executemany(con, self.queries['add_with_pk'], rows)
+            except sqlite3.IntegrityError as exc:
+                raise ValueError("Unable to restore objects with taken pk") from exc
+            if rows:
+                self.raise_pk_floor(con, max(row[0] for row in rows))
+
+        start = perf_counter()
+        self.write(insert_rows)
+        self.record('restore_many', start, rows=len(rows))
+
+    ##################
+    ## Tree methods ##
+    ##################
+
+    def tree_query(self, field: str, up: bool) -> str:
+        """
+        Запрос, обходящий дерево по полю field от объекта с id, переданным
+        параметром: вниз (к потомкам) или вверх (к предкам). Результат -
+        таблица tree(id, depth), в которую может входить и сам объект.
+        Если для поля ведется таблица замыкания, обход - выборка из нее,
+        иначе - рекурсивный запрос. Число шагов рекурсии ограничено
+        размером таблицы, поэтому запрос завершается и на данных с циклами.
+        """
+        if field not in self.fields:
+            raise ValueError(f"Unknown field \"{field}\" in {self.table_name}")
+
+        # Single indexed lookup in the closure table:
+        if field == self.closure_field:
+            column, key = ("ancestor", "descendant") if up else ("descendant", "ancestor")
+            return (f"WITH tree(id, depth) AS (SELECT {column}, depth "
+                    f"FROM {self.closure_table} WHERE {key} = ?) ")
+
+        table = self.table_name
+        if up:
+            start = f"SELECT {field}, 1 FROM {table} WHERE ROWID = ?"
+            step = f"SELECT t.{field}, w.depth + 1 FROM {table} AS t " \
+                   + "JOIN walk AS w ON t.ROWID = w.id"
+        else:
+            start = "SELECT ?, 0"
+            step = f"SELECT t.ROWID, w.depth + 1 FROM {table} AS t " \
+                   + f"JOIN walk AS w ON t.{field} = w.id"
+        return (f"WITH RECURSIVE walk(id, depth) AS ({start} UNION ALL {step} "
+                f"LIMIT (SELECT count(*) FROM {table})), "
+                f"tree(id, depth) AS (SELECT id, min(depth) FROM walk GROUP BY id) ")
+
+    def select_tree(self, method: str, field: str, up: bool, pk: int) -> list[T]:
+        """ Объекты, найденные запросом tree_query, по возрастанию глубины """
+        query = (self.tree_query(field, up)
+                 + f"SELECT t.ROWID, t.* FROM {self.table_name} AS t "
+                 + "JOIN tree ON t.ROWID = tree.id WHERE tree.id != ? "
+                 + "ORDER BY tree.depth, t.ROWID")
+        return self.select(method, query, [pk, pk])
+
+    def get_descendants(self, pk: int, field: str = 'parent') -> list[T]:
+        return self.select_tree('get_descendants', field, False, pk)
+
+    def get_ancestors(self, pk: int, field: str = 'parent') -> list[T]:
+        return self.select_tree('get_ancestors', field, True, pk)
+
+    def delete_subtree(self, pk: int, field: str = 'parent') -> list[T]:
+        subtree = self.tree_query(field, up=False)
+        select_query = (subtree
+                        + f"SELECT t.ROWID, t.* FROM {self.table_name} AS t "
+                        + "JOIN tree ON t.ROWID = tree.id ORDER BY tree.depth, t.ROWID")
+        delete_query = (subtree + f"DELETE FROM {self.table_name} "
+                        + "WHERE ROWID IN (SELECT id FROM tree)")
+
+        def delete_rows(con: sqlite3.Connection) -> list[Any]:
+            # The subtree is read and removed inside one transaction:
+            rows = self.fetch_all(con, select_query, [pk])
+            if not rows:
+                raise ValueError(f"Unable to delete subtree of nonexistent pk={pk}")
+            self.execute(con, delete_query, [pk])
+            return rows
+
+        start = perf_counter()
+        rows = self.write(delete_rows)
+        self.record('delete_subtree', start, rows=len(rows))
+        return [self.generate_object(self.fields, row) for row in rows]
+
+    def move_subtree(self, pk: int, parent: int | None, field: str = 'parent') -> None:
+        # The new parent must not be inside the moved subtree:
+        query = (self.tree_query(field, up=False)
+                 + f"UPDATE {self.table_name} SET {field} = ? WHERE ROWID = ? "
+                 + "AND (? IS NULL OR ? NOT IN (SELECT id FROM tree))")
+
+        def update_row(con: sqlite3.Connection) -> None:
+            # Cursor.rowcount is not set for statements starting with WITH:
+            changes = con.total_changes
+            self.execute(con, query, [pk, parent, pk, parent, parent])
+            if con.total_changes == changes:
+                raise ValueError(f"Unable to move pk={pk} under parent={parent}")
+
+        start = perf_counter()
+        self.write(update_row)
+        self.record('move_subtree', start, rows=1)
+
+    def get_all_in_subtree(self, field: str, tree: AbstractRepository[Any],
+                           pk: int) -> list[T]:
+        # A single join with the closure table of a tree in the same database
+        # (wrappers such as InstrumentedRepository pass the attributes through):
+        closure = getattr(tree, 'closure_table', None)
+        if closure is None or getattr(tree, 'db_file', None) != self.db_file:
+            return super().get_all_in_subtree(field, tree, pk)
+        if field not in self.fields:
+            raise ValueError(f"Unknown field \"{field}\" in {self.table_name}")
+
+        query = (f"SELECT t.ROWID, t.* FROM {closure} AS c "
+                 f"JOIN {self.table_name} AS t ON t.{field} = c.descendant "
+                 f"WHERE c.ancestor = ?")
+        return self.select('get_all_in_subtree', query, [pk])
+
+    #####################
+    ## Summary methods ##
+    #####################
+
+    def get_totals(self, unit: str, first: str | None = None, last: str | None = None,
+                   fields: tuple[str, str, str] = SUMMARY_FIELDS) -> Totals:
+        if tuple(fields) != self.summary_fields:
+            return super().get_totals(unit, first, last, fields)
+        if unit not in self.summary_tables:
+            raise ValueError(f"Unknown summary unit \"{unit}\"")
+
+        query = (f"SELECT period, {fields[1]}, total, count "
+                 f"FROM {self.summary_tables[unit]}")
+        conditions, params = [], []
+        if first is not None:
+            conditions.append("period >= ?")
+            params.append(first)
+        if last is not None:
+            conditions.append("period <= ?")
+            params.append(last)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+
+        start = perf_counter()
+        rows = self.read(lambda con: self.fetch_all(con, query, params))
+        self.record('get_totals', start, len(rows))
+        return {(period, group): (total, count) for period, group, total, count in rows}
+
+    def rebuild_totals(self) -> None:
+        """
+        Пересчитать таблицы сумм (например, после изменения базы данных
+        в обход репозитория или в версии без триггеров).
+        """
+        if self.summary_fields is not None:
+            self.write(self.fill_summary)
+
+    def check_totals(self) -> TotalsDiff:
+        if self.summary_fields is None:
+            return {}
+        date, group, value = self.summary_fields
+
+        def compare(con: sqlite3.Connection) -> TotalsDiff:
+            diff: TotalsDiff = {}
+            for unit, summary in self.summary_tables.items():
+                stored = self.fetch_all(con, f"SELECT period, {group}, total, count "
+                                             f"FROM {summary}")
+                actual = self.fetch_all(
+                    con, f"SELECT substr({date}, 1, {SUMMARY_UNITS[unit]}), {group}, "
+                         f"sum({value}), count(*) FROM {self.table_name} GROUP BY 1, 2")
+                diff.update(compare_totals(
+                    unit, {(row[0], row[1]): (row[2], row[3]) for row in stored},
+                    {(row[0], row[1]): (row[2], row[3]) for row in actual}))
+            return diff
+
+        def snapshot(con: sqlite3.Connection) -> TotalsDiff:
+            # Both sides are read inside one deferred transaction (the same
+            # snapshot): it takes no write lock and does not stop writers in
+            # the WAL mode.
+            if con.in_transaction:
+                return compare(con)
+            con.execute("BEGIN")
+            try:
+                return compare(con)
+            finally:
+                con.execute("ROLLBACK")
+
+        start = perf_counter()
+        diff = self.read(snapshot)
+        self.record('check_totals', start)
+        return diff
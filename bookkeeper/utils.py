@@ -2,18 +2,59 @@
 Вспомогательные функции
 """
 
-from typing import Iterable, Iterator
+from datetime import datetime
+from typing import Any, Iterable, Iterator, Sequence
+
+import numpy as np
+from numpy.typing import NDArray
 
 
 def _get_indent(line: str) -> int:
     return len(line) - len(line.lstrip())
 
 
-def _lines_with_indent(lines: Iterable[str]) -> Iterator[tuple[int, str]]:
-    for line in lines:
+def iter_tree(lines: Iterable[str]) -> Iterator[tuple[int, str, str | None]]:
+    """
+    Читать структуру дерева из текста на основе отступов построчно, не
+    загружая текст целиком. Для каждого элемента выдается тройка
+    (номер строки, элемент, родитель) в порядке следования строк, т.е.
+    в порядке топологической сортировки. Родитель элемента верхнего
+    уровня - None. Строки нумеруются с 1 с учетом пустых строк.
+
+    Parameters
+    ----------
+    lines - Итерируемый объект, содержащий строки текста (файл или список строк)
+
+    Yields
+    -------
+    Тройки (номер строки, потомок, родитель)
+
+    Raises
+    ------
+    IndentationError - отступ строки не совпадает ни с одним из внешних уровней,
+    в атрибуте lineno - номер этой строки
+    """
+    parents: list[tuple[str | None, int]] = []
+    last_indent = -1
+    last_name = None
+    for number, line in enumerate(lines, 1):
         if not line or line.isspace():
             continue
-        yield _get_indent(line), line.strip()
+        indent = _get_indent(line)
+        name = line.strip()
+        if indent > last_indent:
+            parents.append((last_name, last_indent))
+        elif indent < last_indent:
+            while indent < last_indent:
+                _, last_indent = parents.pop()
+            if indent != last_indent:
+                raise IndentationError(
+                    'unindent does not match any outer indentation level',
+                    (getattr(lines, 'name', None), number, indent + 1,
+                     line.rstrip('\n')))
+        yield number, name, parents[-1][0]
+        last_name = name
+        last_indent = indent
 
 
 def read_tree(lines: Iterable[str]) -> list[tuple[str, str | None]]:
@@ -32,7 +73,7 @@ def read_tree(lines: Iterable[str]) -> list[tuple[str, str | None]]:
     [('parent', None), ('child1', 'parent'),
      ('child2', 'child1'), ('child3', 'parent')]
 
-    Пустые строки игнорируются.
+    Пустые строки игнорируются. Для больших текстов см. iter_tree.
 
     Parameters
     ----------
@@ -42,22 +83,33 @@ def read_tree(lines: Iterable[str]) -> list[tuple[str, str | None]]:
     -------
     Список пар "потомок-родитель"
     """
-    parents: list[tuple[str | None, int]] = []
-    last_indent = -1
-    last_name = None
-    result: list[tuple[str, str | None]] = []
-    for i, (indent, name) in enumerate(_lines_with_indent(lines)):
-        if indent > last_indent:
-            parents.append((last_name, last_indent))
-        elif indent < last_indent:
-            while indent < last_indent:
-                _, last_indent = parents.pop()
-            if indent != last_indent:
-                raise IndentationError(
-                    f'unindent does not match any outer indentation '
-                    f'level in line {i}:\n'
-                )
-        result.append((name, parents[-1][0]))
-        last_name = name
-        last_indent = indent
-    return result
+    return [(name, parent) for _, name, parent in iter_tree(lines)]
+
+
+def to_datetime(value: datetime | str) -> datetime:
+    """
+    Привести дату к объекту datetime. Даты расходов могут храниться
+    как объекты datetime или как строки в формате ISO 8601 (в том числе
+    с табуляцией в качестве разделителя даты и времени).
+
+    Parameters
+    ----------
+    value - дата в виде datetime или строки
+
+    Returns
+    -------
+    Объект datetime
+    """
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value.strip())
+
+
+def to_epoch(dates: Sequence[Any]) -> NDArray[np.int64]:
+    """
+    Преобразовать даты (datetime или строки ISO 8601, в том числе
+    с табуляцией между датой и временем) в секунды от начала эпохи.
+    Часовой пояс не учитывается: даты сравниваются как записаны.
+    """
+    texts = [str(date).replace('\t', ' ') for date in dates]
+    return np.array(texts, dtype='datetime64[s]').astype(np.int64)
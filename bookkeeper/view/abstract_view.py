@@ -1,8 +1,10 @@
 from typing import Protocol, Callable
 
-from bookkeeper.models.category import Category
-from bookkeeper.models.expense  import Expense
-from bookkeeper.models.budget   import Budget
+from bookkeeper.models.category       import Category
+from bookkeeper.models.category_index import CategoryIndex
+from bookkeeper.models.expense        import Expense
+from bookkeeper.models.budget         import Budget
+from bookkeeper.models.forecast       import Forecast
 
 class AbstractView(Protocol):
     """
@@ -15,12 +17,27 @@ class AbstractView(Protocol):
     def set_categories(self, cats : list[Category]) -> None:
         pass
 
+    def set_category_index(self, index : CategoryIndex) -> None:
+        pass
+
     def set_expenses(self, cats : list[Expense]) -> None:
         pass
 
+    def expense_added(self, exp : Expense) -> None:
+        pass
+
+    def expense_changed(self, exp : Expense) -> None:
+        pass
+
+    def expenses_removed(self, exp_pks : set[int]) -> None:
+        pass
+
     def set_budgets(self, cats : list[Budget]) -> None:
         pass
 
+    def set_forecasts(self, forecasts : list[Forecast]) -> None:
+        pass
+
     def set_category_add_handler(
         self,
         cat_add_handler: Callable[[str, str | None], None]
@@ -49,5 +66,17 @@ class AbstractView(Protocol):
     ) -> None:
         pass
 
+    def set_undo_handler(self, undo_handler: Callable[[], None]) -> None:
+        pass
+
+    def set_redo_handler(self, redo_handler: Callable[[], None]) -> None:
+        pass
+
+    def set_ledgers(self, names : list[str], active : str | None) -> None:
+        pass
+
+    def set_ledger_switch_handler(self, handler: Callable[[str], None]) -> None:
+        pass
+
     def not_on_budget_message(self) -> None:
         pass
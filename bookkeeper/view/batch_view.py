@@ -0,0 +1,126 @@
+import sys
+from typing import Callable, Any, TextIO
+
+from bookkeeper.models.category       import Category
+from bookkeeper.models.category_index import CategoryIndex
+from bookkeeper.models.expense        import Expense
+from bookkeeper.models.budget         import Budget
+from bookkeeper.models.forecast       import Forecast
+
+class BatchView:
+    """
+    Представление без графического интерфейса для пакетного режима
+    (см. bookkeeper.batch_client).
+
+    Запоминает обработчики контроллера и последние переданные списки
+    категорий и бюджетов. Сами расходы не хранятся: они есть в кеше
+    контроллера. Предупреждение о превышении бюджета выводится в поток
+    output один раз, повторные только подсчитываются.
+    """
+
+    def __init__(self, output: TextIO = sys.stdout):
+        self.output = output
+
+        self.handlers       : dict[str, Callable[..., Any]] = {}
+        self.categories     : list[Category] = []
+        self.category_index : CategoryIndex | None = None
+        self.budgets        : list[Budget] = []
+        self.forecasts      : list[Forecast] = []
+        self.ledgers        : list[str] = []
+        self.ledger         : str | None = None
+
+        # Number of expense rows pushed by the controller:
+        self.expense_updates = 0
+
+        # Number of over budget warnings:
+        self.budget_warnings = 0
+
+    #######################
+    ## Show-like methods ##
+    #######################
+
+    def show_main_window(self) -> None:
+        pass
+
+    def set_categories(self, cats : list[Category]) -> None:
+        self.categories = cats
+
+    def set_category_index(self, index : CategoryIndex) -> None:
+        self.category_index = index
+
+    def set_expenses(self, exps : list[Expense]) -> None:
+        self.expense_updates += len(exps)
+
+    def expense_added(self, exp : Expense) -> None:
+        self.expense_updates += 1
+
+    def expense_changed(self, exp : Expense) -> None:
+        self.expense_updates += 1
+
+    def expenses_removed(self, exp_pks : set[int]) -> None:
+        self.expense_updates += len(exp_pks)
+
+    def set_budgets(self, budgets : list[Budget]) -> None:
+        self.budgets = budgets
+
+    def set_forecasts(self, forecasts : list[Forecast]) -> None:
+        self.forecasts = forecasts
+
+    def set_ledgers(self, names : list[str], active : str | None) -> None:
+        self.ledgers = names
+        self.ledger  = active
+
+    def not_on_budget_message(self) -> None:
+        if self.budget_warnings == 0:
+            print("Внимание: бюджет превышен.", file=self.output)
+        self.budget_warnings += 1
+
+    ###########################
+    ## Controller's handlers ##
+    ###########################
+
+    def set_category_add_handler(
+        self,
+        cat_add_handler: Callable[[str, str | None], None]
+    ) -> None:
+        self.handlers['category_add'] = cat_add_handler
+
+    def set_category_delete_handler(
+        self,
+        cat_delete_handler: Callable[[str], None]
+    ) -> None:
+        self.handlers['category_delete'] = cat_delete_handler
+
+    def set_category_checker(self, cat_checker: Callable[[str], None]) -> None:
+        self.handlers['category_check'] = cat_checker
+
+    def set_budget_modify_handler(self, handler: Callable[['int | None', str, str],
+                                                        None]) -> None:
+        self.handlers['budget_modify'] = handler
+
+    def set_expense_add_handler(
+        self,
+        exp_add_handler: Callable[[str, str, str], None]
+    ) -> None:
+        self.handlers['expense_add'] = exp_add_handler
+
+    def set_expense_delete_handler(
+        self,
+        exp_delete_handler: Callable[[set[int]], None]
+    ) -> None:
+        self.handlers['expense_delete'] = exp_delete_handler
+
+    def set_expense_modify_handler(
+        self,
+        exp_modify_handler: Callable[[int, str, str], None]
+    ) -> None:
+        self.handlers['expense_modify'] = exp_modify_handler
+
+    def set_undo_handler(self, undo_handler: Callable[[], None]) -> None:
+        self.handlers['undo'] = undo_handler
+
+    def set_redo_handler(self, redo_handler: Callable[[], None]) -> None:
+        self.handlers['redo'] = redo_handler
+
+    def set_ledger_switch_handler(self, handler: Callable[[str], None]) -> None:
+        self.handlers['ledger_switch'] = handler
@@ -3,7 +3,13 @@ from typing import Callable, Any
 from PySide6        import QtWidgets
 from PySide6.QtCore import Signal, Qt  # pylint: disable=no-name-in-module
 
-from bookkeeper.models.budget import Budget, Period
+from bookkeeper.models.budget   import Budget, Period
+from bookkeeper.models.forecast import Forecast
+
+# Calendar periods always shown in the table and their row labels:
+PERIOD_LABELS = {Period.DAY: "День", Period.WEEK: "Неделя",
+                 Period.MONTH: "Месяц", Period.HOUR: "Час"}
+
 
 class BudgetTableWidget(QtWidgets.QTableWidget):
     """
@@ -29,10 +35,10 @@ class BudgetTableWidget(QtWidgets.QTableWidget):
                               2:"month"}
 
         # Table configuration:
-        self.setColumnCount(3)
+        self.setColumnCount(5)
         self.setRowCount(3)
 
-        hheaders = "Бюджет Потрачено Остаток".split()
+        hheaders = "Бюджет Потрачено Остаток Прогноз Превышение".split()
         self.setHorizontalHeaderLabels(hheaders)
 
         vheaders = "День Неделя Месяц".split()
@@ -49,6 +55,13 @@ class BudgetTableWidget(QtWidgets.QTableWidget):
         # On double click set "cell edited" handler
         self.cellDoubleClicked.connect(self.double_click)
 
+    def set_periods(self, periods: list[str], labels: list[str]) -> None:
+        # One row per budget period with the given header labels:
+        self.setRowCount(len(periods))
+        self.setVerticalHeaderLabels(labels)
+
+        self.row_to_period = dict(enumerate(periods))
+
     def double_click(self, row: int, columns: int) -> None:
         # Unused arguments:
         del row, columns
@@ -91,14 +104,26 @@ class BudgetTableWidget(QtWidgets.QTableWidget):
                 else:
                     self.item(row_i, col_j).setFlags(Qt.ItemIsEnabled)  # type: ignore
 
+    def add_forecasts(self, data: list[list[str]], column: int = 3) -> None:
+        # Fill the read-only forecast columns:
+        for row_i, row in enumerate(data):
+            for col_j, obj in enumerate(row, start=column):
+                item = QtWidgets.QTableWidgetItem(obj)
+                item.setTextAlignment(Qt.AlignCenter)  # type: ignore
+                item.setFlags(Qt.ItemIsEnabled)        # type: ignore
+                self.setItem(row_i, col_j, item)
+
 
 class LabeledBudgetTable(QtWidgets.QGroupBox):
     """
     Виджет для бюджета с подписью.
     """
 
-    budgets : list[Budget]
-    data    : list[list[str]]
+    budgets       : list[Budget]
+    periods       : list[str]
+    data          : list[list[str]]
+    forecasts     : list[Forecast]
+    forecast_data : list[list[str]]
 
     def __init__(
         self,
@@ -123,19 +148,39 @@ class LabeledBudgetTable(QtWidgets.QGroupBox):
 
         self.setLayout(self.vbox)
 
+        self.periods       = [period.name.lower() for period in PERIOD_LABELS]
+        self.table.set_periods(self.periods, list(PERIOD_LABELS.values()))
+
+        self.forecasts     = []
+        self.forecast_data = self.forecasts_to_data(self.forecasts)
+
     def set_budgets(self, budgets: list[Budget]) -> None:
         self.budgets = budgets
+
+        # Rolling windows get their own rows after the calendar periods:
+        windows      = sorted({bdg.name for bdg in budgets if bdg.window})
+        self.periods = [period.name.lower() for period in PERIOD_LABELS] + windows
         self.data    = self.budgets_to_data(self.budgets)
 
+        # Clearing the table also clears the forecasts, so show them again:
         self.table.clearContents()
+        self.table.set_periods(self.periods, list(PERIOD_LABELS.values()) + windows)
+        self.forecast_data = self.forecasts_to_data(self.forecasts)
         self.table.add_data(self.data)
+        self.table.add_forecasts(self.forecast_data)
+
+    def set_forecasts(self, forecasts: list[Forecast]) -> None:
+        self.forecasts     = forecasts
+        self.forecast_data = self.forecasts_to_data(self.forecasts)
+
+        self.table.add_forecasts(self.forecast_data)
 
     def budgets_to_data(self, budgets: list[Budget]) -> list[list[str]]:
         data = []
 
         # Iterate over subtables:
-        for period in [Period.DAY, Period.WEEK, Period.MONTH]:
-            budgets_for_period = [bdg for bdg in budgets if bdg.period == period]
+        for period in self.periods:
+            budgets_for_period = [bdg for bdg in budgets if bdg.name == period]
 
             if len(budgets_for_period) == 0:
                 data.append(["- Не установлен -", "", "", ""])
@@ -145,4 +190,20 @@ class LabeledBudgetTable(QtWidgets.QGroupBox):
                              str(bdg.spent),
                              str(bdg.limitation - bdg.spent),
                              str(bdg.pk)])
-        return data
\ No newline at end of file
+        return data
+
+    def forecasts_to_data(self, forecasts: list[Forecast]) -> list[list[str]]:
+        data = []
+
+        # Iterate over subtables (hourly and rolling budgets have no forecast):
+        for period in self.periods:
+            forecasts_for_period = [fct for fct in forecasts
+                                    if fct.period.name.lower() == period]
+
+            if len(forecasts_for_period) == 0:
+                data.append(["", ""])
+            else:
+                fct = forecasts_for_period[0]
+                data.append([str(fct.projected),
+                             fct.breach.strftime("%d.%m.%Y") if fct.breach else "-"])
+        return data
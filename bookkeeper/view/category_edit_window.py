@@ -3,7 +3,8 @@ from typing import Callable, Any
 from PySide6        import QtWidgets
 from PySide6.QtCore import Qt  # pylint: disable=no-name-in-module
 
-from bookkeeper.models.category import Category
+from bookkeeper.models.category       import Category
+from bookkeeper.models.category_tree  import CategoryTree
 from bookkeeper.view.labeled    import LabeledComboBoxInput, LabeledLineInput
 
 class CategoryEditWindow(QtWidgets.QWidget):
@@ -87,12 +88,17 @@ class CategoryEditWindow(QtWidgets.QWidget):
         # Set categories when the class is all set up:
         self.set_categories(cats)
 
-    def set_categories(self, cats: list[Category]) -> None:
+    def set_categories(
+        self,
+        cats : list[Category],
+        tree : CategoryTree | None = None
+    ) -> None:
         self.categories = cats
+        self.tree       = tree if tree is not None else CategoryTree(cats)
 
         self.cat_names = [c.name for c in cats]
 
-        # Recursively traverse categories adding subcategories into the tree:
+        # Build the widget items from the pre-ordered category tree:
         cat_hierarchy = self.find_children()
 
         self.cat_tree.clear()
@@ -128,18 +134,22 @@ class CategoryEditWindow(QtWidgets.QWidget):
         self.cat_add_parent.clear()
 
 
-    def find_children(self, parent_pk: int | None = None) -> list[QtWidgets.QTreeWidgetItem]:
+    def find_children(self) -> list[QtWidgets.QTreeWidgetItem]:
 
-        items = []
-        children = [c for c in self.categories if c.parent == parent_pk]
-        for child in children:
-            item = QtWidgets.QTreeWidgetItem([child.name])
+        # Parents come before their children in pre-order, so one pass is enough:
+        top_items = []
+        items     : dict[int, QtWidgets.QTreeWidgetItem] = {}
+        for cat in self.tree:
+            item = QtWidgets.QTreeWidgetItem([cat.name])
+            item.setToolTip(0, self.tree.path_of(cat.pk))
+            items[cat.pk] = item
 
-            item.addChildren(self.find_children(parent_pk=child.pk))
+            if self.tree.depth_of(cat.pk) == 0:
+                top_items.append(item)
+            else:
+                items[cat.parent].addChild(item)  # type: ignore[index]
 
-            items.append(item)
-
-        return items
+        return top_items
 
     def double_clicked(self, item: QtWidgets.QTreeWidgetItem, column: int) -> None:
         clicked_cat_name = item.text(column)
@@ -15,6 +15,9 @@ class ExpenseTableWidget(QtWidgets.QTableWidget):
 
     data : list[list[str]]
 
+    # Minimal number of rows shown:
+    MIN_ROWS = 20
+
     def __init__(
         self,
         expense_modify_handler : Callable[[int, str, Any], None],
@@ -24,12 +27,13 @@ class ExpenseTableWidget(QtWidgets.QTableWidget):
         super().__init__(*args, **kwargs)
 
         self.expense_modify_handler = expense_modify_handler
+        self.data = []
 
         self.col_to_attr = {0:"expense_date", 1:"amount", 2:"category", 3:"comment"}
 
         # Table configuration:
         self.setColumnCount(4)
-        self.setRowCount(20)
+        self.setRowCount(self.MIN_ROWS)
 
         headers = "Дата Сумма Категория Комментарий".split()
         self.setHorizontalHeaderLabels(headers)
@@ -77,12 +81,37 @@ class ExpenseTableWidget(QtWidgets.QTableWidget):
 
     def add_data(self, data: list[list[str]]) -> None:
         self.data = data
+        self.setRowCount(max(self.MIN_ROWS, len(data)))
         for row_i, row in enumerate(data):
-            for item_j, item in enumerate(row[:-1]):
-                self.setItem(
-                    row_i, item_j,
-                    QtWidgets.QTableWidgetItem(item.capitalize())
-                )
+            self.set_row(row_i, row)
+
+    def set_row(self, row_i: int, row: list[str]) -> None:
+        for item_j, item in enumerate(row[:-1]):
+            self.setItem(
+                row_i, item_j,
+                QtWidgets.QTableWidgetItem(item.capitalize())
+            )
+
+    def append_row(self, row: list[str]) -> None:
+        self.data.append(row)
+
+        # Grow the table only when all the empty rows are filled:
+        if self.rowCount() < len(self.data):
+            self.insertRow(len(self.data) - 1)
+        self.set_row(len(self.data) - 1, row)
+
+    def update_row(self, row_i: int, row: list[str]) -> None:
+        self.data[row_i] = row
+        self.set_row(row_i, row)
+
+    def remove_rows(self, rows: list[int]) -> None:
+        # Remove from the bottom so that the upper indices stay valid:
+        for row_i in sorted(rows, reverse=True):
+            self.removeRow(row_i)
+            del self.data[row_i]
+
+        if self.rowCount() < self.MIN_ROWS:
+            self.setRowCount(self.MIN_ROWS)
 
 class LabeledExpenseTable(QtWidgets.QGroupBox):
     """
@@ -91,6 +120,7 @@ class LabeledExpenseTable(QtWidgets.QGroupBox):
 
     expenses : list[Expense]
     data     : list[list[str]]
+    rows     : dict[int, int]  # Expense pk -> table row
 
     def __init__(
         self,
@@ -105,12 +135,16 @@ class LabeledExpenseTable(QtWidgets.QGroupBox):
         self.category_pk_to_name    = category_pk_to_name
         self.expanse_delete_handler = expanse_delete_handler
 
+        self.expenses = []
+        self.rows     = {}
+
         # Label:
         self.label = QtWidgets.QLabel("<b>Последние траты</b>")
         self.label.setAlignment(Qt.AlignCenter) # type: ignore
 
         # Expense table:
         self.table = ExpenseTableWidget(expense_modify_handler)
+        self.data  = self.table.data  # Rows are shared with the table
 
         # Delete button:
         self.del_button = QtWidgets.QPushButton('Удалить выбранные траты')
@@ -134,25 +168,52 @@ class LabeledExpenseTable(QtWidgets.QGroupBox):
         self.table.clearContents()
         self.table.add_data(self.data)
 
+        self.rows = {exp.pk: row_i for row_i, exp in enumerate(self.expenses)}
+
+    def expense_added(self, exp: Expense) -> None:
+        # Append a single row, the rest of the table is untouched:
+        self.rows[exp.pk] = len(self.expenses)
+        self.expenses.append(exp)
+        self.table.append_row(self.exp_to_row(exp))
+
+    def expense_changed(self, exp: Expense) -> None:
+        row_i = self.rows.get(exp.pk)
+        if row_i is None:
+            self.expense_added(exp)
+            return
+
+        self.expenses[row_i] = exp
+        self.table.update_row(row_i, self.exp_to_row(exp))
+
+    def expenses_removed(self, exp_pks: set[int]) -> None:
+        rows = [self.rows.pop(pk) for pk in exp_pks if pk in self.rows]
+        if not rows:
+            return
+
+        self.table.remove_rows(rows)
+        for row_i in sorted(rows, reverse=True):
+            del self.expenses[row_i]
+
+        # Only the rows below the first removed one are shifted:
+        for row_i in range(min(rows), len(self.expenses)):
+            self.rows[self.expenses[row_i].pk] = row_i
+
+    def exp_to_row(self, exp: Expense) -> list[str]:
+        # Visualize category fields:
+        item = ["","","","",str(exp.pk)]
+        if exp.expense_date:
+            item[0] = str(exp.expense_date)
+        if exp.amount:
+            item[1] = str(exp.amount)
+        if exp.category:
+            item[2] = str(
+                self.category_pk_to_name(exp.category))
+        if exp.comment:
+            item[3] = str(exp.comment)
+        return item
+
     def exps_to_data(self, exps: list[Expense]) -> list[list[str]]:
-        data = []
-        for exp in exps:
-            # Visualize category fields:
-            item = ["","","","",str(exp.pk)]
-            if exp.expense_date:
-                item[0] = str(exp.expense_date)
-            if exp.amount:
-                item[1] = str(exp.amount)
-            if exp.category:
-                item[2] = str(
-                    self.category_pk_to_name(exp.category))
-            if exp.comment:
-                item[3] = str(exp.comment)
-
-            # Insert category visualization:
-            data.append(item)
-
-        return data
+        return [self.exp_to_row(exp) for exp in exps]
 
     def delete_selected_expenses(self) -> None:
         # List of primary keys to delete:
@@ -0,0 +1,182 @@
+import threading
+from contextlib import contextmanager
+from typing import Callable, Any, Iterator
+
+from bookkeeper.view.abstract_view import AbstractView
+
+from bookkeeper.models.category import Category
+from bookkeeper.models.expense  import Expense
+from bookkeeper.models.budget   import Budget
+from bookkeeper.models.forecast import Forecast
+
+class RefreshScheduler:
+    """
+    Планировщик обновления интерфейса.
+
+    Принимает те же вызовы, что и представление, но только отмечает
+    разделы (категории, расходы, бюджеты) как устаревшие. Все накопленные
+    изменения передаются представлению одним вызовом flush(): сразу,
+    через schedule (например, в следующем проходе цикла событий или после
+    задержки delay), либо при выходе из блока batch().
+
+    Изменения можно отмечать из фонового потока: flush() выполняется
+    в том потоке, куда его передает schedule.
+    """
+
+    # Expense deltas:
+    ADDED   : str = "added"
+    CHANGED : str = "changed"
+
+    def __init__(
+        self,
+        view     : AbstractView,
+        delay    : float = 0.0,
+        schedule : Callable[[float, Callable[[], None]], Any] | None = None
+    ):
+        self.view     = view
+        self.delay    = delay
+        self.schedule = schedule
+
+        # Dirty sections:
+        self.categories : list[Category] | None = None
+        self.expenses   : list[Expense]  | None = None
+        self.budgets    : list[Budget]   | None = None
+        self.forecasts  : list[Forecast] | None = None
+
+        # Pending expense deltas (pk -> (delta kind, expense)) and removals:
+        self.exp_deltas  : dict[int, tuple[str, Expense]] = {}
+        self.exp_removed : set[int] = set()
+
+        self.batch_depth = 0
+        self.scheduled   = False
+        self.lock        = threading.Lock()
+
+        # Number of flushes actually pushed to the view:
+        self.flush_count = 0
+
+    ##################
+    ## View methods ##
+    ##################
+
+    def set_categories(self, cats: list[Category]) -> None:
+        with self.lock:
+            self.categories = cats
+        self.request_flush()
+
+    def set_expenses(self, exps: list[Expense]) -> None:
+        # The full list supersedes the deltas collected so far:
+        with self.lock:
+            self.expenses = exps
+            self.exp_deltas.clear()
+            self.exp_removed.clear()
+        self.request_flush()
+
+    def expense_added(self, exp: Expense) -> None:
+        with self.lock:
+            self.exp_deltas[exp.pk] = (self.ADDED, exp)
+        self.request_flush()
+
+    def expense_changed(self, exp: Expense) -> None:
+        # An expense added in the same batch is still added:
+        with self.lock:
+            kind = self.exp_deltas.get(exp.pk, (self.CHANGED, exp))[0]
+            self.exp_deltas[exp.pk] = (kind, exp)
+        self.request_flush()
+
+    def expenses_removed(self, exp_pks: set[int]) -> None:
+        with self.lock:
+            for pk in exp_pks:
+                # Added and removed in the same batch - nothing to show:
+                kind, _ = self.exp_deltas.pop(pk, (self.CHANGED, None))
+                if kind != self.ADDED:
+                    self.exp_removed.add(pk)
+        self.request_flush()
+
+    def set_budgets(self, budgets: list[Budget]) -> None:
+        with self.lock:
+            self.budgets = budgets
+        self.request_flush()
+
+    def set_forecasts(self, forecasts: list[Forecast]) -> None:
+        with self.lock:
+            self.forecasts = forecasts
+        self.request_flush()
+
+    ################
+    ## Scheduling ##
+    ################
+
+    def request_flush(self) -> None:
+        with self.lock:
+            if self.batch_depth > 0 or self.scheduled:
+                return
+            self.scheduled = self.schedule is not None
+
+        if self.schedule is None:
+            self.flush()
+        else:
+            self.schedule(self.delay, self.flush)
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        # Collect all the changes made inside the block into one flush:
+        with self.lock:
+            self.batch_depth += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.batch_depth -= 1
+                outermost = self.batch_depth == 0
+            if outermost:
+                self.request_flush()
+
+    def batched(self, operation: Callable[..., Any]) -> Callable[..., Any]:
+        # Wrap a handler so that each call is a single batch:
+        def inner(*args: Any, **kwargs: Any) -> Any:
+            with self.batch():
+                return operation(*args, **kwargs)
+        return inner
+
+    @property
+    def dirty(self) -> bool:
+        return (self.categories is not None or self.expenses is not None
+                or self.budgets is not None or self.forecasts is not None
+                or bool(self.exp_deltas) or bool(self.exp_removed))
+
+    def flush(self) -> None:
+        with self.lock:
+            self.scheduled = False
+            if self.batch_depth > 0 or not self.dirty:
+                return
+
+            categories, self.categories = self.categories, None
+            expenses,   self.expenses   = self.expenses,   None
+            budgets,    self.budgets    = self.budgets,    None
+            forecasts,  self.forecasts  = self.forecasts,  None
+            deltas,     self.exp_deltas  = self.exp_deltas,  {}
+            removed,    self.exp_removed = self.exp_removed, set()
+
+        # Categories go first as expense rows show category names:
+        if categories is not None:
+            self.view.set_categories(categories)
+
+        # Full list, then the changes made after it:
+        if expenses is not None:
+            self.view.set_expenses(expenses)
+        if removed:
+            self.view.expenses_removed(removed)
+        for kind, exp in deltas.values():
+            if kind == self.ADDED:
+                self.view.expense_added(exp)
+            else:
+                self.view.expense_changed(exp)
+
+        if budgets is not None:
+            self.view.set_budgets(budgets)
+
+        # Forecasts are shown next to the budget rows:
+        if forecasts is not None:
+            self.view.set_forecasts(forecasts)
+
+        self.flush_count += 1
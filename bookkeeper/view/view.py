@@ -1,16 +1,24 @@
-from typing import Callable, Any
+import time
+from typing import Callable, Any, Hashable
 
-from PySide6 import QtWidgets
+from PySide6 import QtWidgets, QtCore, QtGui
 
 from bookkeeper.view.main_window          import MainWindow
 from bookkeeper.view.budget_table         import LabeledBudgetTable
 from bookkeeper.view.new_expense          import NewExpense
 from bookkeeper.view.expense_table        import LabeledExpenseTable
 from bookkeeper.view.category_edit_window import CategoryEditWindow
+from bookkeeper.view.labeled              import LabeledComboBoxInput
+from bookkeeper.view.worker               import GuiInvoker, Worker, in_background
 
-from bookkeeper.models.category import Category
-from bookkeeper.models.expense  import Expense
-from bookkeeper.models.budget   import Budget
+from bookkeeper.models.category       import Category
+from bookkeeper.models.category_index import CategoryIndex
+from bookkeeper.models.expense        import Expense
+from bookkeeper.models.budget         import Budget
+from bookkeeper.models.forecast       import Forecast
+
+# Longest postponement of a view refresh while the worker is busy, seconds:
+REFRESH_MAX_DEFER = 0.5
 
 # Utility function:
 def try_for_widget(
@@ -34,7 +42,9 @@ class View:
     cats_edit_window : CategoryEditWindow
 
     # Internal representation:
-    categories : list[Category] = []
+    categories     : list[Category] = []
+    category_index : CategoryIndex
+    own_index      : bool  # The index is not shared with the presenter
     expenses   : list[Expense]
     budgets    : list[Budget]
 
@@ -49,11 +59,23 @@ class View:
 
     bdg_modify_handler : Callable[[int | None, str, str], None]
 
-    def __init__(self) -> None:
+    undo_handler       : Callable[[], None]
+    redo_handler       : Callable[[], None]
+
+    ledger_switch_handler : Callable[[str], None]
+
+    def __init__(self, background: bool = False) -> None:
         self.app = QtWidgets.QApplication.instance()
         if self.app is None:
             raise RuntimeError("Unable to locate the open QApplication instance")
 
+        # Run presenter operations in a background thread (if enabled):
+        self.invoker = GuiInvoker()
+        self.worker  = Worker(self.show_error, self.set_busy) if background else None
+
+        self.category_index = CategoryIndex()
+        self.own_index      = True
+
         self.config_category_edit()
         self.budget_table = LabeledBudgetTable(self.modify_budget)
         self.new_expense  = NewExpense(self.categories,
@@ -84,6 +106,19 @@ class View:
                                       self.expense_table)
         self.main_window.resize(1000, 800)
 
+        # Undo/redo shortcuts (Ctrl+Z and Ctrl+Shift+Z or Ctrl+Y):
+        self.undo_shortcut = QtGui.QShortcut(QtGui.QKeySequence.Undo,  # type: ignore
+                                             self.main_window, self.undo)
+        self.redo_shortcut = QtGui.QShortcut(QtGui.QKeySequence.Redo,  # type: ignore
+                                             self.main_window, self.redo)
+
+        # Ledger selector, shown once the presenter sets the ledgers. A new
+        # name typed in creates a ledger:
+        self.ledger_box = LabeledComboBoxInput("Журнал", [])
+        self.ledger_box.combo_box.textActivated.connect(self.switch_ledger)
+        self.ledger_box.hide()
+        self.main_window.vbox.insertWidget(0, self.ledger_box)
+
     #######################
     ## Show-like methods ##
     #######################
@@ -94,6 +129,55 @@ class View:
     def show_category_edit(self) -> None:
         self.cats_edit_window.show()
 
+    def call_later(self, delay: float, callback: Callable[[], None]) -> None:
+        # Run callback from the event loop after delay seconds (callable
+        # from any thread, the timer is started in the GUI thread):
+        self.invoker.call(
+            lambda: QtCore.QTimer.singleShot(int(delay * 1000), callback))
+
+    def schedule_refresh(self, delay: float, flush: Callable[[], None]) -> None:
+        # Schedule for RefreshScheduler. While the worker has more queued
+        # operations, the refresh is superseded by the one after them: it
+        # is postponed (up to REFRESH_MAX_DEFER) and the collected changes
+        # of expenses, categories and budgets are drawn once.
+        deadline = time.monotonic() + delay + REFRESH_MAX_DEFER
+
+        def run() -> None:
+            if (self.worker is not None and self.worker.busy
+                    and time.monotonic() < deadline):
+                QtCore.QTimer.singleShot(max(int(delay * 1000), 10), run)
+            else:
+                flush()
+
+        self.call_later(delay, run)
+
+    #################################
+    ## Background handler dispatch ##
+    #################################
+
+    def wrap_handler(
+        self,
+        handler : Callable[..., Any],
+        key     : Callable[..., Hashable] | None = None
+    ) -> Callable[..., Any]:
+        # Synchronous call with an error dialog or a background operation:
+        if self.worker is None:
+            return try_for_widget(handler, self.main_window)
+        return in_background(handler, self.worker, key)
+
+    def show_error(self, msg: str) -> None:
+        QtWidgets.QMessageBox.critical(self.main_window, 'Ошибка', msg)
+
+    def set_busy(self, busy: bool) -> None:
+        if busy:
+            QtWidgets.QApplication.setOverrideCursor(QtCore.Qt.BusyCursor)  # type: ignore
+        else:
+            QtWidgets.QApplication.restoreOverrideCursor()
+
+    def wait_idle(self) -> None:
+        if self.worker is not None:
+            self.worker.wait()
+
     #########################
     ## Category operations ##
     #########################
@@ -104,14 +188,14 @@ class View:
         cat_add_handler: Callable[[str, str | None], None]
     ) -> None:
         # Add exception-handling to argument handler:
-        self.cat_add_handler = try_for_widget(cat_add_handler, self.main_window)
+        self.cat_add_handler = self.wrap_handler(cat_add_handler)
 
     def set_category_delete_handler(
         self,
         cat_delete_handler: Callable[[str], None]
     ) -> None:
         # Add exception-handling to argument handler:
-        self.cat_delete_handler = try_for_widget(cat_delete_handler, self.main_window)
+        self.cat_delete_handler = self.wrap_handler(cat_delete_handler)
 
     def set_category_checker(
         self,
@@ -124,15 +208,24 @@ class View:
 
     # Direct operations:
     def category_pk_to_name(self, pk: int) -> str:
-        name = [c.name for c in self.categories if int(c.pk) == int(pk)]
-        if len(name):
-            return str(name[0])
-        return ""
+        return self.category_index.name_of(int(pk))
+
+    def set_category_index(self, index: CategoryIndex) -> None:
+        # The presenter keeps the shared index in sync with the repository.
+        # In the background mode it does so in the worker thread, so the view
+        # keeps its own index of the category snapshots (see set_categories):
+        if self.worker is not None:
+            return
+        self.category_index = index
+        self.own_index      = False
 
     def set_categories(self, cats: list[Category]) -> None:
         self.categories = cats
+        if self.own_index:
+            self.category_index.rebuild(cats)
         self.new_expense.set_categories(self.categories)
-        self.cats_edit_window.set_categories(self.categories)
+        self.cats_edit_window.set_categories(self.categories,
+                                             self.category_index.tree())
 
     def add_category(self, name: str, parent: str | None) -> None:
         self.cat_add_handler(name, parent)
@@ -149,25 +242,37 @@ class View:
         self,
         exp_add_handler : Callable[[str, str, str], None]
     ) -> None:
-        self.exp_add_handler = try_for_widget(exp_add_handler, self.main_window)
+        self.exp_add_handler = self.wrap_handler(exp_add_handler)
 
     def set_expense_delete_handler(
         self,
         exp_delete_handler : Callable[[set[int]], None]
     ) -> None:
-        self.exp_delete_handler = try_for_widget(exp_delete_handler, self.main_window)
+        self.exp_delete_handler = self.wrap_handler(exp_delete_handler)
 
     def set_expense_modify_handler(
         self,
         exp_modify_handler : Callable[[int, str, str], None]
     ) -> None:
-        self.exp_modify_handler = try_for_widget(exp_modify_handler, self.main_window)
+        # A newer value of the same cell supersedes a queued one:
+        self.exp_modify_handler = self.wrap_handler(
+            exp_modify_handler, key=lambda pk, attr, new_val: ('expense', pk, attr))
 
     # Direct operations:
     def set_expenses(self, exps: list[Expense]) -> None:
         self.expenses = exps
         self.expense_table.set_expenses(self.expenses)
 
+    # Incremental updates (only the changed rows are redrawn):
+    def expense_added(self, exp: Expense) -> None:
+        self.expense_table.expense_added(exp)
+
+    def expense_changed(self, exp: Expense) -> None:
+        self.expense_table.expense_changed(exp)
+
+    def expenses_removed(self, exp_pks: set[int]) -> None:
+        self.expense_table.expenses_removed(exp_pks)
+
     def add_expense(self, amount: str, cat_name: str, comment: str = "") -> None:
         self.exp_add_handler(amount, cat_name, comment)
 
@@ -201,7 +306,9 @@ class View:
         self,
         bdg_modify_handler : Callable[[int | None, str, str], None]
     ) -> None:
-        self.bdg_modify_handler = try_for_widget(bdg_modify_handler, self.main_window)
+        # A newer limit for the same budget supersedes a queued one:
+        self.bdg_modify_handler = self.wrap_handler(
+            bdg_modify_handler, key=lambda pk, new_limit, period: ('budget', period))
 
     # Direct operations:
     def set_budgets(
@@ -211,6 +318,12 @@ class View:
         self.budgets = budgets
         self.budget_table.set_budgets(self.budgets)
 
+    def set_forecasts(
+        self,
+        forecasts : list[Forecast]
+    ) -> None:
+        self.budget_table.set_forecasts(forecasts)
+
     def modify_budget(
         self,
         pk        : int | None,
@@ -222,4 +335,57 @@ class View:
     def not_on_budget_message(self) -> None:
         msg = "Бюджет исчерпан"
 
-        QtWidgets.QMessageBox.warning(self.main_window, 'Нужно больше золота!', msg)
\ No newline at end of file
+        # May be called from the background thread:
+        self.invoker.call(lambda: QtWidgets.QMessageBox.warning(
+            self.main_window, 'Нужно больше золота!', msg))
+
+    ###################
+    ## Undo and redo ##
+    ###################
+
+    # Handler-wrapping:
+    def set_undo_handler(
+        self,
+        undo_handler : Callable[[], None]
+    ) -> None:
+        self.undo_handler = self.wrap_handler(undo_handler)
+
+    def set_redo_handler(
+        self,
+        redo_handler : Callable[[], None]
+    ) -> None:
+        self.redo_handler = self.wrap_handler(redo_handler)
+
+    # Direct operations:
+    def undo(self) -> None:
+        self.undo_handler()
+
+    def redo(self) -> None:
+        self.redo_handler()
+
+    #############
+    ## Ledgers ##
+    #############
+
+    # Handler-wrapping:
+    def set_ledger_switch_handler(
+        self,
+        ledger_switch_handler : Callable[[str], None]
+    ) -> None:
+        # A newer choice supersedes a queued one:
+        self.ledger_switch_handler = self.wrap_handler(
+            ledger_switch_handler, key=lambda name: 'ledger')
+
+    # Direct operations:
+    def set_ledgers(self, names: list[str], active: str | None) -> None:
+        # May be called from the background thread:
+        self.invoker.call(lambda: self.show_ledgers(names, active))
+
+    def show_ledgers(self, names: list[str], active: str | None) -> None:
+        self.ledger_box.set_items(names)
+        if active is not None:
+            self.ledger_box.set_text(active)
+        self.ledger_box.show()
+
+    def switch_ledger(self, name: str) -> None:
+        self.ledger_switch_handler(name)
@@ -0,0 +1,160 @@
+import logging
+import threading
+from typing import Callable, Any, Hashable
+
+from PySide6.QtCore import QObject, QRunnable, QThread, QThreadPool, \
+                           Signal, Slot  # pylint: disable=no-name-in-module
+
+logger = logging.getLogger(__name__)
+
+class GuiInvoker(QObject):
+    """
+    Вызов функций в потоке интерфейса из любого потока.
+    """
+
+    invoke : Signal = Signal(object)
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+
+        # Emitted from another thread the signal is queued to the GUI thread:
+        self.invoke.connect(self.run_callback)
+
+    @Slot(object)
+    def run_callback(self, callback: Callable[[], Any]) -> None:
+        callback()
+
+    def call(self, callback: Callable[[], Any]) -> None:
+        if QThread.currentThread() == self.thread():
+            callback()
+        else:
+            self.invoke.emit(callback)
+
+class Task(QRunnable):
+    """
+    Операция, поставленная в очередь фонового исполнителя.
+    """
+
+    def __init__(
+        self,
+        worker     : 'Worker',
+        operation  : Callable[..., Any],
+        args       : tuple[Any, ...],
+        key        : Hashable | None,
+        generation : int
+    ):
+        super().__init__()
+
+        self.worker     = worker
+        self.operation  = operation
+        self.args       = args
+        self.key        = key
+        self.generation = generation
+
+    def run(self) -> None:
+        self.worker.execute(self)
+
+class Worker:
+    """
+    Фоновый исполнитель операций контроллера.
+
+    Операции выполняются по одной в отдельном потоке в порядке постановки
+    в очередь, поэтому зависимые изменения применяются последовательно,
+    а интерфейс не блокируется. Если в очереди есть еще не начатая
+    операция с тем же ключом key, она отменяется новой.
+
+    Ошибки (ValueError) и смена состояния занятости передаются в поток
+    интерфейса функциям on_error и on_busy.
+    """
+
+    def __init__(
+        self,
+        on_error : Callable[[str], None],
+        on_busy  : Callable[[bool], None]
+    ):
+        self.on_error = on_error
+        self.on_busy  = on_busy
+        self.invoker  = GuiInvoker()
+
+        # One thread for all the operations: they run in submission order.
+        # The thread never expires to keep its database connections:
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(1)
+        self.pool.setExpiryTimeout(-1)
+
+        self.lock        = threading.Lock()
+        self.pending     = 0
+        self.reported    = False  # Busy state last reported to on_busy
+        self.cancelled   = 0
+        self.generations : dict[Hashable, int] = {}
+
+    @property
+    def busy(self) -> bool:
+        return self.pending > 0
+
+    def submit(
+        self,
+        operation : Callable[..., Any],
+        *args     : Any,
+        key       : Hashable | None = None
+    ) -> None:
+        with self.lock:
+            self.pending += 1
+            became_busy = self.pending == 1
+
+            generation = self.generations.get(key, 0) + 1
+            if key is not None:
+                self.generations[key] = generation
+
+        if became_busy:
+            self.invoker.call(self.report_busy)
+
+        self.pool.start(Task(self, operation, args, key, generation))
+
+    def execute(self, task: Task) -> None:
+        try:
+            # Skip the operation superseded by a newer one with the same key:
+            if task.key is not None and self.generations[task.key] != task.generation:
+                with self.lock:
+                    self.cancelled += 1
+            else:
+                task.operation(*task.args)
+        except ValueError as exc:
+            message = str(exc)
+            self.invoker.call(lambda: self.on_error(message))
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Background operation %r failed", task.operation)
+            self.invoker.call(lambda: self.on_error("Внутренняя ошибка."))
+        finally:
+            with self.lock:
+                self.pending -= 1
+                became_idle = self.pending == 0
+
+            if became_idle:
+                self.invoker.call(self.report_busy)
+
+    def report_busy(self) -> None:
+        # Runs in the GUI thread. The notifications from the worker thread are
+        # queued and may come after a newer direct one, so the current state
+        # is reported (and only when it has changed):
+        busy = self.busy
+        if busy != self.reported:
+            self.reported = busy
+            self.on_busy(busy)
+
+    def wait(self, msecs: int = -1) -> bool:
+        # Wait for all the submitted operations to finish:
+        return self.pool.waitForDone(msecs)
+
+def in_background(
+    operation : Callable[..., Any],
+    worker    : Worker,
+    key       : Callable[..., Hashable] | None = None
+) -> Callable[..., None]:
+    """
+    Обернуть обработчик так, чтобы он выполнялся фоновым исполнителем.
+    key - функция аргументов обработчика, задающая ключ отмены.
+    """
+    def inner(*args: Any) -> None:
+        worker.submit(operation, *args, key=key(*args) if key is not None else None)
+    return inner
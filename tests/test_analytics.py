@@ -0,0 +1,117 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from bookkeeper.analytics import ExpenseAnalytics, ExpenseColumns
+from bookkeeper.events import EventBus, ExpenseAdded, ExpensesAdded, ExpenseChanged, \
+                              ExpensesDeleted
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.abstract_repository import AbstractRepository
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+
+EXPENSES = [(10, 1, datetime(2023, 1, 30, 9)),
+            (20, 2, datetime(2023, 1, 31, 18)),
+            (30, 1, "2023-02-01\t10:00"),
+            (40, 3, datetime(2023, 2, 3, 12)),
+            (100, 1, datetime(2023, 3, 1))]
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def repo(request, tmp_path):
+    if request.param == "memory":
+        repo = MemoryRepository()
+    else:
+        repo = SQLiteRepository(str(tmp_path / "analytics.db"), Expense)
+    repo.add_many([Expense(amount, cat, expense_date=date)
+                   for amount, cat, date in EXPENSES])
+    return repo
+
+
+def test_columns_grow_and_compact():
+    columns = ExpenseColumns(capacity=2)
+    columns.extend([(pk, pk * 10, pk % 3, datetime(2023, 1, pk)) for pk in range(1, 6)])
+    assert len(columns) == 5 and len(columns.pk) >= 5
+
+    columns.remove([1, 2, 7])
+    assert columns.view()['amount'].tolist() == [30, 40, 50]
+    assert columns.size == 5
+
+    # Replacing a row and removing the majority compacts the arrays:
+    columns.extend([(3, 33, 0, datetime(2023, 1, 3))])
+    columns.remove([4, 5])
+    assert columns.size == 1
+    assert columns.view()['amount'].tolist() == [33]
+    assert columns.rows == {3: 0} and columns.max_pk == 5
+
+
+def test_reports(repo):
+    analytics = ExpenseAnalytics(repo, chunk_size=2)
+
+    assert analytics.category_totals() == {1: 140, 2: 20, 3: 40}
+
+    days, totals = analytics.period_totals('day')
+    assert str(days[0]) == "2023-01-30" and len(days) == 31
+    assert totals.sum() == 200 and totals[:3].tolist() == [10, 20, 30]
+
+    months, totals = analytics.period_totals('month')
+    assert np.datetime_as_string(months).tolist() == ["2023-01", "2023-02", "2023-03"]
+    assert totals.tolist() == [30, 70, 100]
+
+    months, deltas, ratios = analytics.month_deltas()
+    assert deltas.tolist() == [40, 30]
+    assert ratios.tolist() == pytest.approx([40 / 30, 30 / 70])
+
+    assert analytics.percentiles([0, 50, 100]).tolist() == [10, 30, 100]
+    assert analytics.percentiles([50], category=1).tolist() == [30]
+    assert np.isnan(analytics.percentiles([50], category=9)).all()
+
+    days, averages = analytics.moving_average(3)
+    assert str(days[0]) == "2023-02-01"
+    assert averages[:2].tolist() == pytest.approx([20, 50 / 3])
+
+    with pytest.raises(ValueError):
+        analytics.period_totals('year')
+
+
+def test_empty_repository():
+    analytics = ExpenseAnalytics(MemoryRepository())
+    assert analytics.category_totals() == {}
+    assert analytics.period_totals('month')[1].size == 0
+    assert analytics.month_deltas()[1].size == 0
+    assert analytics.moving_average(7)[1].size == 0
+
+
+def test_incremental_load(repo):
+    analytics = ExpenseAnalytics(repo)
+    assert analytics.category_totals()[1] == 140
+
+    # Without a bus only the new rows are read before the next report:
+    repo.add(Expense(5, 1, expense_date=datetime(2023, 3, 2)))
+    assert analytics.category_totals()[1] == 145
+    assert analytics.columns.load(repo) == 0
+
+
+def test_refresh_on_events():
+    repo: AbstractRepository[Expense] = MemoryRepository()
+    bus = EventBus()
+    analytics = ExpenseAnalytics(repo, bus)
+
+    # Events before the first report are covered by the load:
+    exp = Expense(10, 1, expense_date=datetime(2023, 1, 1))
+    repo.add(exp)
+    bus.publish(ExpenseAdded(exp))
+    assert analytics.category_totals() == {1: 10}
+
+    exps = (Expense(20, 2, expense_date=datetime(2023, 1, 2)),
+            Expense(30, 2, expense_date=datetime(2023, 2, 1)))
+    repo.add_many(exps)
+    bus.publish(ExpensesAdded(exps))
+    assert analytics.category_totals() == {1: 10, 2: 50}
+
+    new = Expense(15, 1, expense_date=datetime(2023, 1, 1), pk=exp.pk)
+    bus.publish(ExpenseChanged(exp, new))
+    bus.publish(ExpensesDeleted(exps[:1]))
+    assert analytics.category_totals() == {1: 15, 2: 30}
+    assert analytics.period_totals('month')[1].tolist() == [15, 30]
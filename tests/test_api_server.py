@@ -0,0 +1,237 @@
+import asyncio
+import http.client
+import json
+import threading
+from datetime import datetime
+from urllib.parse import quote
+
+import pytest
+
+from bookkeeper.api_server import ApiServer, Request
+from bookkeeper.bookkeeper import Bookkeeper
+from bookkeeper.models.category import Category
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.abstract_repository import SUMMARY_FIELDS, \
+                                                repository_factory
+from bookkeeper.repository.archive_repository import ArchiveRepository
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+from bookkeeper.view.batch_view import BatchView
+
+
+@pytest.fixture
+def server(tmp_path):
+    # The server runs in its own event loop thread, the tests are clients:
+    db_file = str(tmp_path / "api.db")
+    SQLiteRepository(db_file, Category, closure="parent").add_many(
+        [Category("еда"), Category("мясо", 1), Category("книги")])
+    repo_gen = repository_factory(SQLiteRepository, db_file=db_file, closure="parent",
+                                  summary=SUMMARY_FIELDS)
+    api = ApiServer(Bookkeeper(BatchView(), repo_gen), workers=4)
+
+    loop = asyncio.new_event_loop()
+    aio_server = loop.run_until_complete(api.start(port=0))
+    thread = threading.Thread(target=loop.run_forever)
+    thread.start()
+    api.port = aio_server.sockets[0].getsockname()[1]
+    yield api
+
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    aio_server.close()
+    loop.run_until_complete(aio_server.wait_closed())
+    loop.close()
+    api.executor.shutdown()
+
+
+def request(server, method, path, body=None, headers=None, con=None):
+    con = con or http.client.HTTPConnection("127.0.0.1", server.port, timeout=5)
+    data = json.dumps(body).encode() if body is not None else None
+    con.request(method, path, body=data, headers=headers or {})
+    response = con.getresponse()
+    raw = response.read()
+    return response, json.loads(raw) if raw else None
+
+
+def test_categories(server):
+    response, cats = request(server, "GET", "/categories")
+    assert response.status == 200
+    assert [c["name"] for c in cats] == ["еда", "мясо", "книги"]
+
+    response, cat = request(server, "POST", "/categories",
+                            {"name": "фрукты", "parent": "еда"})
+    assert response.status == 201
+    assert cat == {"pk": 4, "name": "фрукты", "parent": 1}
+
+    response, error = request(server, "POST", "/categories", {"name": "еда"})
+    assert response.status == 400
+    assert "уже существует" in error["error"]
+
+
+def test_expenses_pagination(server):
+    response, created = request(server, "POST", "/expenses",
+                                [{"amount": i, "category": "мясо"} for i in range(1, 26)])
+    assert response.status == 201
+    assert created["pks"] == list(range(1, 26))
+
+    _, page = request(server, "GET", "/expenses?offset=20&limit=10")
+    assert (page["total"], len(page["items"])) == (25, 5)
+    assert page["items"][0]["amount"] == 21
+
+    # Expenses of a category include its subcategories:
+    _, page = request(server, "GET", f"/expenses?category={quote('еда')}&limit=1")
+    assert page["total"] == 25
+
+    response, _ = request(server, "DELETE", "/expenses/25")
+    assert response.status == 204
+    response, _ = request(server, "DELETE", "/expenses/25")
+    assert response.status == 404
+
+    response, _ = request(server, "POST", "/expenses", {"amount": -1, "category": "еда"})
+    assert response.status == 400
+    response, _ = request(server, "GET", "/expenses?limit=many")
+    assert response.status == 400
+
+
+def test_etag(server):
+    response, _ = request(server, "GET", "/budgets")
+    etag = response.getheader("ETag")
+
+    response, body = request(server, "GET", "/budgets", headers={"If-None-Match": etag})
+    assert response.status == 304
+    assert body is None
+
+    response, budgets = request(server, "PUT", "/budgets/day", {"limit": 500})
+    assert budgets[0]["limit"] == 500
+
+    response, budgets = request(server, "GET", "/budgets",
+                                headers={"If-None-Match": etag})
+    assert response.status == 200
+    assert response.getheader("ETag") != etag
+    assert [(b["period"], b["limit"]) for b in budgets] == [("day", 500)]
+
+    response, budgets = request(server, "PUT", "/budgets/7d", {"limit": 700})
+    assert [(b["period"], b["limit"]) for b in budgets] == [("day", 500), ("7d", 700)]
+
+
+def test_summary(server):
+    request(server, "POST", "/expenses", [{"amount": 10, "category": "еда"},
+                                          {"amount": 5, "category": "мясо"},
+                                          {"amount": 7, "category": "книги"}])
+    _, summary = request(server, "GET", "/summary")
+
+    assert summary["total"] == 22
+    assert summary["periods"]["day"] == 22
+    assert [(c["path"], c["own"], c["total"]) for c in summary["categories"]] == [
+        ("еда", 10, 15), ("еда → мясо", 5, 5), ("книги", 7, 7)]
+
+    # Monthly totals:
+    _, summary = request(server, "GET", f"/summary?month={datetime.now():%Y-%m}")
+    assert (summary["month"], summary["total"]) == (f"{datetime.now():%Y-%m}", 22)
+    _, summary = request(server, "GET", "/summary?month=2000-01")
+    assert summary["total"] == 0 and summary["periods"]["day"] == 22
+    response, _ = request(server, "GET", "/summary?month=01.2000")
+    assert response.status == 400
+
+
+def test_analytics(server):
+    request(server, "POST", "/expenses", [{"amount": 10, "category": "еда"},
+                                          {"amount": 30, "category": "книги"}])
+    _, report = request(server, "GET", "/analytics")
+    assert report["categories"] == {"1": 10, "3": 30}
+    assert report["percentiles"]["50"] == 20
+    assert report["months"] == []
+
+    # The cached columns follow the writes:
+    request(server, "DELETE", "/expenses/1")
+    _, report = request(server, "GET", "/analytics?days=1")
+    assert report["categories"] == {"3": 30}
+    assert report["moving_average"] == []
+
+    response, _ = request(server, "GET", "/analytics?days=0")
+    assert response.status == 400
+
+
+def test_reads_see_other_processes(server):
+    request(server, "POST", "/expenses", {"amount": 10, "category": "еда"})
+    response, page = request(server, "GET", "/expenses")
+    etag = response.getheader("ETag")
+    _, report = request(server, "GET", "/analytics")
+    assert report["categories"] == {"1": 10}
+
+    # Another process writes the same database file:
+    repo = SQLiteRepository(server.app.expense_repo.db_file, Expense,
+                            summary=SUMMARY_FIELDS)
+    repo.add(Expense(5, 3))
+    repo.delete(page["items"][0]["pk"])
+
+    response, page = request(server, "GET", "/expenses",
+                             headers={"If-None-Match": etag})
+    assert response.status == 200 and response.getheader("ETag") != etag
+    assert [item["amount"] for item in page["items"]] == [5]
+    _, report = request(server, "GET", "/analytics")
+    assert report["categories"] == {"3": 5}
+    _, summary = request(server, "GET", "/summary")
+    assert summary["total"] == 5 and summary["periods"]["day"] == 5
+
+
+def test_memory_reads_are_locked():
+    api = ApiServer(Bookkeeper(BatchView(), lambda model: MemoryRepository()),
+                    workers=1)
+    assert api.read_lock is api.write_lock
+    api.executor.shutdown()
+
+
+def test_reports_include_archive(tmp_path):
+    db_file = str(tmp_path / "api.db")
+    SQLiteRepository(db_file, Category, closure="parent").add(Category("еда"))
+    repo_gen = repository_factory(SQLiteRepository, db_file=db_file, closure="parent",
+                                  summary=SUMMARY_FIELDS)
+    archive = ArchiveRepository(str(tmp_path / "archive.db"))
+    archive.store([Expense(40, 1, expense_date=datetime(2020, 1, 5), pk=100)])
+    api = ApiServer(Bookkeeper(BatchView(), repo_gen), workers=1, archive=archive)
+    api.app.add_expense("2", "еда")
+
+    _, summary = api.get_summary(Request("GET", "/summary", {}))
+    assert summary["total"] == 42
+    _, summary = api.get_summary(Request("GET", "/summary?month=2020-01", {}))
+    assert summary["total"] == 40
+    _, report = api.get_analytics(Request("GET", "/analytics", {}))
+    assert report["categories"] == {1: 42}
+
+    api.executor.shutdown()
+    archive.close()
+
+
+def test_errors_and_keep_alive(server):
+    con = http.client.HTTPConnection("127.0.0.1", server.port, timeout=5)
+    response, _ = request(server, "GET", "/nowhere", con=con)
+    assert response.status == 404
+    response, _ = request(server, "PUT", "/categories", con=con)
+    assert response.status == 405
+    response, _ = request(server, "POST", "/categories", con=con, headers={
+        "Content-Type": "application/json"})
+    assert response.status == 400
+    response, _ = request(server, "GET", "/categories", con=con)
+    assert response.status == 200
+
+
+def test_concurrent_requests(server):
+    def client(i):
+        con = http.client.HTTPConnection("127.0.0.1", server.port, timeout=5)
+        for j in range(10):
+            response, _ = request(server, "POST", "/expenses",
+                                  {"amount": 1, "category": "еда", "comment": f"{i}/{j}"},
+                                  con=con)
+            assert response.status == 201
+            request(server, "GET", "/summary", con=con)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    _, page = request(server, "GET", "/expenses?limit=1")
+    assert page["total"] == 80
+    assert len(server.app.expense_repo.get_all()) == 80
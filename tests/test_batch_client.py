@@ -0,0 +1,151 @@
+import io
+import sqlite3
+from datetime import datetime
+from textwrap import dedent
+
+import pytest
+
+from bookkeeper.batch_client import BatchRunner, main
+from bookkeeper.bookkeeper import Bookkeeper
+from bookkeeper.repository.abstract_repository import SUMMARY_FIELDS, \
+                                                repository_factory
+from bookkeeper.repository.archive_repository import ArchiveRepository
+from bookkeeper.repository.instrumented_repository import RepositoryMetrics
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+from bookkeeper.view.batch_view import BatchView
+
+SCRIPT = dedent('''
+    # Categories first
+    category еда
+    category "сырое мясо" еда
+    budget month 1000
+
+    expense 100 еда
+    expense 200 "сырое мясо" "на шашлык"
+    expense 300 еда  # trailing comment
+    report еда
+    delete expense 1
+    report
+''')
+
+
+@pytest.fixture
+def runner(tmp_path):
+    repo_gen = repository_factory(SQLiteRepository, db_file=str(tmp_path / "batch.db"),
+                                  closure="parent")
+    output, errors = io.StringIO(), io.StringIO()
+    return BatchRunner(Bookkeeper(BatchView(output), repo_gen), batch_size=2,
+                       output=output, errors=errors)
+
+
+def test_run_script(runner):
+    stats = runner.run(SCRIPT.splitlines())
+
+    assert (stats.commands, stats.expenses, stats.batches, stats.errors) == (9, 3, 2, 0)
+    assert runner.output.getvalue().splitlines() == [
+        "еда: 600 (3 расходов)", "категорий: 2, расходов: 2", "month: 500 / 1000"]
+    exps = runner.app.expense_repo.get_all()
+    assert [(exp.amount, exp.comment) for exp in exps] == [(200, "на шашлык"), (300, "")]
+
+
+def test_errors_have_line_numbers(runner):
+    script = ['category еда', 'expense сто еда', 'expense 10 книги',
+              'fly away', 'expense 10 "еда', 'expense 20 еда']
+    stats = runner.run(script)
+
+    assert stats.errors == 4
+    assert [line.split(':')[0] for line in runner.errors.getvalue().splitlines()] == [
+        "строка 2", "строка 3", "строка 4", "строка 5"]
+    assert [exp.amount for exp in runner.app.expenses.values()] == [20]
+
+
+def test_rolling_budgets(runner):
+    runner.run(['category еда', 'budget 7d 50', 'budget hour 100', 'budget 0d 10',
+                'expense 30 еда', 'expense 30 еда', 'report', 'budget 7d 70', 'report'])
+
+    assert runner.errors.getvalue().startswith("строка 4")
+    assert runner.output.getvalue().splitlines() == [
+        "Внимание: бюджет превышен.",
+        "категорий: 1, расходов: 2", "7d: 60 / 50", "hour: 60 / 100",
+        "категорий: 1, расходов: 2", "7d: 60 / 70", "hour: 60 / 100"]
+    assert [budget.window for budget in runner.app.budget_repo.get_all()] == [7, 0]
+
+
+def test_undo_whole_batch(runner):
+    runner.batch_size = 10
+    runner.run(['category еда'] + ['expense 10 еда'] * 5 + ['undo'])
+    assert runner.app.expenses == {}
+    assert runner.app.expense_repo.get_all() == []
+
+    runner.run(['redo'])
+    assert len(runner.app.expense_repo.get_all()) == 5
+
+
+def test_batches_are_bulk_writes(tmp_path):
+    metrics = RepositoryMetrics()
+    repo_gen = repository_factory(SQLiteRepository, db_file=str(tmp_path / "batch.db"),
+                                  metrics=metrics)
+    runner = BatchRunner(Bookkeeper(BatchView(io.StringIO()), repo_gen), batch_size=1000,
+                         output=io.StringIO(), errors=io.StringIO())
+
+    stats = runner.run(['category еда'] + ['expense 1 еда'] * 2500)
+
+    assert stats.batches == 3
+    expense_calls = metrics.snapshot()["expense"]
+    assert expense_calls["add_many"]["count"] == 3
+    assert "add" not in expense_calls
+
+
+def test_main(tmp_path, capsys):
+    script = tmp_path / "script.txt"
+    script.write_text(SCRIPT, encoding="utf-8")
+
+    assert main([str(script), "--batch-size", "10"]) == 0
+    out = capsys.readouterr().out
+    assert "команд: 9, расходов: 3 (1 пакетов), ошибок: 0" in out
+
+
+def test_totals_commands(tmp_path):
+    db_file = str(tmp_path / "batch.db")
+    repo_gen = repository_factory(SQLiteRepository, db_file=db_file,
+                                  summary=SUMMARY_FIELDS)
+    output, errors = io.StringIO(), io.StringIO()
+    runner = BatchRunner(Bookkeeper(BatchView(output), repo_gen),
+                         output=output, errors=errors)
+    runner.run(['category еда', 'expense 100 еда', 'totals check'])
+    assert output.getvalue().splitlines()[-1] == "суммы верны"
+
+    with sqlite3.connect(db_file) as con:
+        con.execute("DELETE FROM expense_monthly")
+    con.close()
+    stats = runner.run(['totals check', 'totals rebuild', 'totals check', 'totals'])
+
+    assert stats.errors == 2
+    assert output.getvalue().splitlines()[-3:] == [
+        f"month {datetime.now().isoformat()[:7]}, категория 1: 0 (0) вместо 100 (1)",
+        "суммы пересчитаны", "суммы верны"]
+
+
+def test_archive_command(tmp_path):
+    repo_gen = repository_factory(SQLiteRepository, db_file=str(tmp_path / "batch.db"),
+                                  closure="parent")
+    archive = ArchiveRepository(str(tmp_path / "archive.db"))
+    output, errors = io.StringIO(), io.StringIO()
+    runner = BatchRunner(Bookkeeper(BatchView(output), repo_gen),
+                         output=output, errors=errors, archive=archive)
+    stats = runner.run(['category еда', 'category мясо еда', 'expense 100 еда',
+                        'expense 200 мясо', 'archive 2999-01-01', 'expense 5 еда',
+                        'report еда', 'archive вчера'])
+
+    assert stats.errors == 1
+    assert output.getvalue().splitlines()[-2:] == [
+        "в архив перенесено расходов: 2", "еда: 305 (3 расходов)"]
+    assert [exp.amount for exp in runner.app.expenses.values()] == [5]
+
+    # The expenses added before archiving can't be undone any more:
+    stats = runner.run(['undo', 'undo'])
+    assert stats.errors == 2
+    assert errors.getvalue().splitlines()[-1] == "строка 2: Нечего отменять."
+    assert runner.app.expenses == {}
+    assert [exp.amount for exp in archive.get_all()] == [100, 200]
+    archive.close()
@@ -0,0 +1,27 @@
+import json
+
+from benchmarks.repositories import main
+
+
+def test_benchmark_smoke(tmp_path, capsys):
+    output = tmp_path / "results.json"
+    args = ["--sizes", "50", "--calls", "5", "--scan-calls", "2",
+            "--bulk-size", "10", "--output", str(output)]
+
+    assert main(args) == 0
+    with open(output, encoding="utf-8") as file:
+        results = json.load(file)
+
+    assert set(results) >= {"memory/50/add", "sqlite/50/get_all_by_pattern",
+                             "sqlite/50/add_many", "memory/50/delete_many"}
+    assert results["sqlite/50/get"]["calls"] == 5
+    assert "get_all_where" in capsys.readouterr().out
+
+def test_benchmark_regression(tmp_path):
+    baseline = tmp_path / "baseline.json"
+    with open(baseline, "w", encoding="utf-8") as file:
+        json.dump({"memory/50/get_all": {"p50": 1e-12}}, file)
+
+    args = ["--sizes", "50", "--backends", "memory", "--calls", "5",
+            "--scan-calls", "2", "--bulk-size", "10", "--baseline", str(baseline)]
+    assert main(args) == 1
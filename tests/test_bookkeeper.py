@@ -0,0 +1,458 @@
+import pytest
+
+from bookkeeper.bookkeeper import Bookkeeper
+from bookkeeper.events import Event, ExpenseAdded, ExpensesAdded, BudgetsChanged, \
+                              CategoryAdded, CategoryRemoved, ExpensesDeleted, \
+                              ForecastsChanged
+from bookkeeper.models.budget import Budget
+from bookkeeper.models.category import Category
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.ledger_registry import LedgerRegistry
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+
+
+class RecordingView:
+    """ View stub remembering every call made by the presenter """
+
+    def __init__(self):
+        self.calls = []
+        self.handlers = {}
+
+    def __getattr__(self, name):
+        def record(*args):
+            self.calls.append((name, args))
+            if name.startswith('set_') and name.endswith(('handler', 'checker')):
+                self.handlers[name] = args[0]
+        return record
+
+    def names(self):
+        return [name for name, _ in self.calls]
+
+
+@pytest.fixture
+def bookkeeper(tmp_path):
+    db_file = str(tmp_path / "bookkeeper.db")
+    cat_repo = SQLiteRepository(db_file, Category)
+    cat_repo.add_many([Category("еда"), Category("книги")])
+    SQLiteRepository(db_file, Budget).add(Budget(1000, "month"))
+    SQLiteRepository(db_file, Expense).add_many([Expense(10, 1), Expense(20, 2)])
+
+    view = RecordingView()
+    return Bookkeeper(view, lambda model: SQLiteRepository(db_file, model,
+                                                           closure="parent"))
+
+
+def test_startup_sets_all_expenses(bookkeeper):
+    assert bookkeeper.view.names().count('set_expenses') == 1
+    assert [exp.amount for exp in bookkeeper.expenses.values()] == [10, 20]
+
+
+def test_add_expense_pushes_delta(bookkeeper):
+    bookkeeper.view.calls.clear()
+    bookkeeper.add_expense("30", "еда", "обед")
+
+    assert 'set_expenses' not in bookkeeper.view.names()
+    (exp,), = [args for name, args in bookkeeper.view.calls if name == 'expense_added']
+    assert (exp.amount, exp.category, exp.comment) == (30, 1, "обед")
+    assert bookkeeper.expenses[exp.pk] is exp
+    assert bookkeeper.budgets[0].spent == 60
+
+
+def test_add_expenses_in_bulk(bookkeeper):
+    received = []
+    bookkeeper.bus.subscribe(Event, received.append)
+    bookkeeper.view.calls.clear()
+
+    exps = [bookkeeper.make_expense(str(i), "еда") for i in range(1, 4)]
+    bookkeeper.add_expenses(exps)
+
+    assert [type(event) for event in received] == [ExpensesAdded, BudgetsChanged,
+                                                   ForecastsChanged]
+    assert bookkeeper.view.names().count('expense_added') == 3
+    assert bookkeeper.budgets[0].spent == 36
+    assert [exp.pk for exp in exps] == [3, 4, 5]
+
+    with pytest.raises(ValueError):
+        bookkeeper.make_expense("0", "еда")
+
+
+def test_modify_expense_pushes_delta(bookkeeper):
+    bookkeeper.view.calls.clear()
+    bookkeeper.modify_expense(2, "amount", "25")
+
+    assert 'set_expenses' not in bookkeeper.view.names()
+    (exp,), = [args for name, args in bookkeeper.view.calls if name == 'expense_changed']
+    assert (exp.pk, exp.amount) == (2, 25)
+    assert bookkeeper.expenses[2].amount == 25
+
+    # Invalid input restores the edited row:
+    bookkeeper.view.calls.clear()
+    with pytest.raises(ValueError):
+        bookkeeper.modify_expense(2, "amount", "-1")
+    assert bookkeeper.view.calls == [('expense_changed', (bookkeeper.expenses[2],))]
+    assert bookkeeper.expense_repo.get(2).amount == 25
+
+
+def test_delete_expenses_pushes_delta(bookkeeper):
+    bookkeeper.view.calls.clear()
+    bookkeeper.delete_expenses({1})
+
+    assert 'set_expenses' not in bookkeeper.view.names()
+    assert ('expenses_removed', ({1},)) in bookkeeper.view.calls
+    assert list(bookkeeper.expenses) == [2]
+    assert bookkeeper.expense_repo.get(1) is None
+
+
+def test_delete_category_removes_its_expenses(bookkeeper):
+    bookkeeper.view.calls.clear()
+    bookkeeper.delete_category("книги")
+
+    assert ('expenses_removed', ({2},)) in bookkeeper.view.calls
+    assert list(bookkeeper.expenses) == [1]
+
+
+def test_budgets_follow_expense_deltas(bookkeeper):
+    assert bookkeeper.budgets[0].spent == 30
+
+    bookkeeper.add_expense("5", "еда")
+    bookkeeper.modify_expense(1, "amount", "15")
+    bookkeeper.delete_expenses({2})
+
+    assert bookkeeper.budgets[0].spent == 20
+    assert bookkeeper.budget_repo.get(1).spent == 20
+
+
+def test_unchanged_budgets_are_not_written(bookkeeper, monkeypatch):
+    bookkeeper.modify_expense(1, "expense_date", "2001-01-01 10:00")
+    assert bookkeeper.budgets[0].spent == 20
+
+    def fail(budget):
+        raise AssertionError("budget written back")
+
+    # A change outside of the budget period writes nothing:
+    monkeypatch.setattr(bookkeeper.budget_repo, 'update', fail)
+    bookkeeper.view.calls.clear()
+    bookkeeper.modify_expense(1, "amount", "50")
+    assert 'set_budgets' not in bookkeeper.view.names()
+
+
+def test_category_index_is_shared(bookkeeper):
+    (index,), = [args for name, args in bookkeeper.view.calls
+                 if name == 'set_category_index']
+    assert index is bookkeeper.category_index
+    assert index.name_of(2) == "книги"
+
+
+def test_view_gets_category_snapshots(bookkeeper):
+    bookkeeper.view.calls.clear()
+    bookkeeper.add_category("фантастика", "книги")
+    (cats,), = [args for name, args in bookkeeper.view.calls
+                if name == 'set_categories']
+
+    # Later changes of the categories don't reach the list given to the view:
+    bookkeeper.move_category("фантастика", "еда")
+    assert [(cat.name, cat.parent) for cat in cats][-1] == ("фантастика", 2)
+    assert all(cat is not bookkeeper.category_index.by_pk[cat.pk] for cat in cats)
+
+
+def test_category_lookup_without_repository(bookkeeper, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("repository queried")
+
+    monkeypatch.setattr(bookkeeper.category_repo, 'get_all', fail)
+    monkeypatch.setattr(bookkeeper.category_repo, 'get', fail)
+
+    bookkeeper.cat_checker("Еда")
+    with pytest.raises(ValueError):
+        bookkeeper.cat_checker("нет")
+
+    bookkeeper.add_category("фрукты", "еда")
+    assert bookkeeper.category_index.get("Фрукты").parent == 1
+    with pytest.raises(ValueError):
+        bookkeeper.add_category("ФРУКТЫ")
+
+    bookkeeper.add_expense("5", "Фрукты")
+    bookkeeper.modify_expense(1, "category", "книги")
+    assert bookkeeper.expenses[1].category == 2
+
+
+def test_delete_category_reparents_children(bookkeeper):
+    bookkeeper.add_category("фрукты", "еда")
+    bookkeeper.delete_category("еда")
+
+    fruits = bookkeeper.category_index.get("фрукты")
+    assert fruits.parent is None
+    assert bookkeeper.category_repo.get(fruits.pk).parent is None
+    assert "еда" not in bookkeeper.category_index
+    assert [c.name for c in bookkeeper.categories] == ["книги", "фрукты"]
+
+
+def test_extra_subscriber_gets_events(bookkeeper):
+    received = []
+    bookkeeper.bus.subscribe(Event, received.append)
+
+    bookkeeper.add_expense("30", "еда")
+    bookkeeper.delete_category("книги")
+
+    assert [type(event) for event in received] == [
+        ExpenseAdded, BudgetsChanged, ForecastsChanged, CategoryRemoved,
+        ExpensesDeleted, BudgetsChanged, ForecastsChanged]
+    assert received[-3].expenses[0].pk == 2
+
+
+def test_user_action_refreshes_view_once(bookkeeper):
+    # Handlers registered in the view are batched:
+    handler = bookkeeper.view.handlers['set_category_delete_handler']
+    bookkeeper.add_category("фрукты", "книги")
+    bookkeeper.view.calls.clear()
+
+    flushes = bookkeeper.refresh.flush_count
+    handler("книги")
+
+    assert bookkeeper.refresh.flush_count == flushes + 1
+    assert sorted(bookkeeper.view.names()) == ['expenses_removed', 'set_budgets',
+                                               'set_categories', 'set_forecasts']
+
+
+def test_startup_is_one_refresh(bookkeeper):
+    assert bookkeeper.refresh.flush_count == 1
+    assert sorted(bookkeeper.view.names()) == sorted([
+        'set_category_index', 'set_categories', 'set_budgets', 'set_forecasts',
+        'set_expenses',
+        'set_category_add_handler', 'set_category_delete_handler',
+        'set_category_checker', 'set_budget_modify_handler',
+        'set_expense_add_handler', 'set_expense_delete_handler',
+        'set_expense_modify_handler', 'set_undo_handler', 'set_redo_handler'])
+
+
+def test_undo_redo_expenses(bookkeeper):
+    bookkeeper.add_expense("30", "еда")
+    bookkeeper.modify_expense(1, "amount", "15")
+    bookkeeper.delete_expenses({2})
+    assert bookkeeper.budgets[0].spent == 45
+
+    bookkeeper.undo()
+    assert bookkeeper.expense_repo.get(2).amount == 20
+    bookkeeper.undo()
+    assert bookkeeper.expense_repo.get(1).amount == 10
+    bookkeeper.undo()
+    assert sorted(bookkeeper.expenses) == [1, 2]
+    assert len(bookkeeper.expense_repo.get_all()) == 2
+    assert bookkeeper.budgets[0].spent == 30
+
+    with pytest.raises(ValueError):
+        bookkeeper.undo()
+
+    for _ in range(3):
+        bookkeeper.redo()
+    assert {pk: exp.amount for pk, exp in bookkeeper.expenses.items()} == {1: 15, 3: 30}
+    assert bookkeeper.budgets[0].spent == 45
+
+
+def test_undo_delete_category(bookkeeper):
+    bookkeeper.add_category("фантастика", "книги")
+    bookkeeper.delete_category("книги")
+    assert bookkeeper.category_index.get("фантастика").parent is None
+
+    bookkeeper.view.calls.clear()
+    bookkeeper.undo()
+
+    assert bookkeeper.category_index.get("книги").pk == 2
+    assert bookkeeper.category_repo.get(3).parent == 2
+    assert bookkeeper.expense_repo.get(2).category == 2
+    assert ('expense_added', (bookkeeper.expenses[2],)) in bookkeeper.view.calls
+
+    bookkeeper.undo()
+    assert "фантастика" not in bookkeeper.category_index
+    assert len(bookkeeper.category_repo.get_all()) == 2
+
+
+def test_undo_is_one_transaction(bookkeeper, monkeypatch):
+    bookkeeper.delete_category("книги")
+
+    def fail(*args):
+        raise ValueError("disk full")
+
+    # The category is put back, then restoring its expenses fails:
+    restore = bookkeeper.expense_repo.restore_many
+    monkeypatch.setattr(bookkeeper.expense_repo, 'restore_many', fail)
+    with pytest.raises(ValueError):
+        bookkeeper.undo()
+
+    assert bookkeeper.category_repo.get(2) is None
+    assert "книги" not in bookkeeper.category_index
+    assert bookkeeper.history.can_undo
+
+    monkeypatch.setattr(bookkeeper.expense_repo, 'restore_many', restore)
+    bookkeeper.undo()
+    assert bookkeeper.category_repo.get(2).name == "книги"
+    assert bookkeeper.expense_repo.get(2).category == 2
+
+
+def test_transaction_events_follow_commit(bookkeeper, monkeypatch):
+    bookkeeper.delete_category("книги")
+    received = []
+    bookkeeper.bus.subscribe(Event, lambda event: received.append(
+        (type(event), bookkeeper.in_transaction)))
+
+    def fail(*args):
+        raise ValueError("disk full")
+
+    # Nothing is published for the rolled back steps:
+    restore = bookkeeper.expense_repo.restore_many
+    monkeypatch.setattr(bookkeeper.expense_repo, 'restore_many', fail)
+    with pytest.raises(ValueError):
+        bookkeeper.undo()
+    assert CategoryAdded not in [event_type for event_type, _ in received]
+
+    monkeypatch.setattr(bookkeeper.expense_repo, 'restore_many', restore)
+    received.clear()
+    bookkeeper.undo()
+    assert (CategoryAdded, False) in received and (ExpensesAdded, False) in received
+    assert all(not in_transaction for _, in_transaction in received)
+
+
+def test_failed_undo_keeps_category_index(bookkeeper, monkeypatch):
+    bookkeeper.add_category("фантастика", "книги")
+    bookkeeper.delete_category("книги")
+
+    def fail(*args):
+        raise ValueError("disk full")
+
+    # Moving the subcategory back under the restored category fails:
+    monkeypatch.setattr(bookkeeper.category_repo, 'update_many', fail)
+    with pytest.raises(ValueError):
+        bookkeeper.undo()
+
+    assert "книги" not in bookkeeper.category_index
+    assert bookkeeper.category_index.get("фантастика").parent is None
+    assert bookkeeper.category_index.children_of(2) == []
+
+
+def test_undo_budget(bookkeeper):
+    bookkeeper.modify_budget(1, "500", "month")
+    bookkeeper.modify_budget(None, "100", "day")
+    bookkeeper.modify_budget(1, "", "month")
+    assert [b.limitation for b in bookkeeper.budgets] == [100]
+
+    bookkeeper.undo()
+    bookkeeper.undo()
+    assert [(b.pk, b.limitation) for b in bookkeeper.budget_repo.get_all()] == [(1, 500)]
+    bookkeeper.undo()
+    assert bookkeeper.budget_repo.get(1).limitation == 1000
+
+    bookkeeper.redo()
+    bookkeeper.redo()
+    assert [b.limitation for b in bookkeeper.budgets] == [500, 100]
+
+
+def test_delete_category_tree(bookkeeper):
+    bookkeeper.add_category("фантастика", "книги")
+    bookkeeper.add_category("космос", "фантастика")
+    bookkeeper.add_expense("5", "космос")
+
+    bookkeeper.delete_category_tree("книги")
+
+    assert [cat.name for cat in bookkeeper.categories] == ["еда"]
+    assert [cat.name for cat in bookkeeper.category_repo.get_all()] == ["еда"]
+    assert sorted(bookkeeper.expenses) == [1]
+    assert bookkeeper.budgets[0].spent == 10
+
+    bookkeeper.undo()
+    assert bookkeeper.category_index.get("космос").parent == 3
+    assert sorted(bookkeeper.expenses) == [1, 2, 3]
+    assert len(bookkeeper.category_repo.get_all()) == 4
+
+
+def test_move_category(bookkeeper):
+    bookkeeper.add_category("фантастика", "книги")
+    bookkeeper.move_category("книги", "еда")
+
+    assert bookkeeper.category_repo.get(2).parent == 1
+    assert bookkeeper.category_index.children_of(1) == [bookkeeper.get_category("книги")]
+
+    with pytest.raises(ValueError):
+        bookkeeper.move_category("еда", "фантастика")
+
+    bookkeeper.undo()
+    assert bookkeeper.category_repo.get(2).parent is None
+    assert bookkeeper.category_index.children_of(1) == []
+
+
+def test_failed_move_keeps_category_index(bookkeeper, monkeypatch):
+    def fail(*args):
+        raise ValueError("database is locked")
+
+    monkeypatch.setattr(bookkeeper.category_repo, 'move_subtree', fail)
+    with pytest.raises(ValueError):
+        bookkeeper.move_category("книги", "еда")
+
+    assert bookkeeper.get_category("книги").parent is None
+    assert bookkeeper.category_index.children_of(1) == []
+    assert not bookkeeper.history.can_undo
+
+
+def test_category_expenses_rollup(bookkeeper):
+    bookkeeper.add_category("мясо", "еда")
+    bookkeeper.add_category("сырое мясо", "мясо")
+    bookkeeper.add_expense("300", "сырое мясо")
+    bookkeeper.add_expense("7", "книги")
+
+    assert sorted(exp.amount for exp in bookkeeper.get_category_expenses("еда")) \
+        == [10, 300]
+    assert [exp.amount for exp in bookkeeper.get_category_expenses("мясо")] == [300]
+
+    # The closure table follows deletions with children moved up:
+    bookkeeper.delete_category("мясо")
+    assert sorted(exp.amount for exp in bookkeeper.get_category_expenses("еда")) \
+        == [10, 300]
+    bookkeeper.undo()
+    assert [exp.amount for exp in bookkeeper.get_category_expenses("мясо")] == [300]
+    bookkeeper.move_category("мясо", "книги")
+    assert sorted(exp.amount for exp in bookkeeper.get_category_expenses("книги")) \
+        == [7, 20, 300]
+
+
+
+def test_switch_ledger(tmp_path):
+    ledgers = LedgerRegistry(str(tmp_path), SQLiteRepository, closure="parent")
+    home = ledgers.open("дом")
+    home(Category).add(Category("еда"))
+
+    view = RecordingView()
+    bookkeeper = Bookkeeper(view, home, ledgers=ledgers)
+    assert ('set_ledgers', (["дом"], "дом")) in view.calls
+
+    bookkeeper.add_expense("30", "еда")
+    version = bookkeeper.version
+    view.calls.clear()
+
+    # Switch through the handler registered in the view, a new ledger is created:
+    view.handlers['set_ledger_switch_handler']("работа")
+    assert bookkeeper.ledger_name == "работа"
+    assert bookkeeper.categories == [] and bookkeeper.expenses == {}
+    assert not bookkeeper.history.can_undo
+    assert bookkeeper.version > version
+    assert ('set_ledgers', (["дом", "работа"], "работа")) in view.calls
+    assert view.names().count('set_expenses') == 1
+
+    # The pooled repositories of the first ledger are reused:
+    bookkeeper.open_ledger("дом")
+    assert bookkeeper.category_repo is home(Category)
+    assert [exp.amount for exp in bookkeeper.expenses.values()] == [30]
+    ledgers.close()
+
+
+def test_forecasts_follow_expenses(bookkeeper):
+    (forecasts,), = [args for name, args in bookkeeper.view.calls
+                     if name == 'set_forecasts']
+    assert [fct.period for fct in forecasts] == [bdg.period for bdg in bookkeeper.budgets]
+    assert forecasts[0].projected >= bookkeeper.budgets[0].spent
+
+    bookkeeper.view.calls.clear()
+    bookkeeper.add_expense("2000", "еда")
+
+    (forecasts,), = [args for name, args in bookkeeper.view.calls
+                     if name == 'set_forecasts']
+    assert forecasts == bookkeeper.forecasts
+    assert forecasts[0].breach == bookkeeper.expenses[3].expense_date.date()
@@ -0,0 +1,79 @@
+import pytest
+
+from bookkeeper.commands import CommandHistory, DeleteExpenses
+from bookkeeper.models.expense import Expense
+
+
+class RecordingApp:
+    """ Application stub remembering the inverse operations """
+
+    def __init__(self):
+        self.calls = []
+
+    def insert_expenses(self, exps):
+        self.calls.append(('insert', exps))
+
+    def remove_expenses(self, exps):
+        self.calls.append(('remove', exps))
+
+
+def delete_command(n):
+    return DeleteExpenses(tuple(Expense(1, 1, pk=pk) for pk in range(1, n + 1)))
+
+
+def test_undo_redo():
+    app = RecordingApp()
+    history = CommandHistory()
+    command = delete_command(2)
+    history.record(command)
+
+    assert history.undo(app) is command
+    assert app.calls == [('insert', command.expenses)]
+    assert not history.can_undo and history.can_redo
+
+    assert history.redo(app) is command
+    assert app.calls[-1] == ('remove', command.expenses)
+    assert history.can_undo and not history.can_redo
+
+
+def test_nothing_to_undo():
+    history = CommandHistory()
+    with pytest.raises(ValueError):
+        history.undo(RecordingApp())
+    with pytest.raises(ValueError):
+        history.redo(RecordingApp())
+
+
+def test_record_drops_redo():
+    app = RecordingApp()
+    history = CommandHistory()
+    history.record(delete_command(1))
+    history.undo(app)
+
+    history.record(delete_command(2))
+    assert not history.can_redo
+    assert history.rows == 2
+
+
+def test_history_is_bounded():
+    history = CommandHistory(limit=3, max_rows=10)
+    for _ in range(5):
+        history.record(delete_command(1))
+    assert len(history.done) == 3
+
+    # A large command pushes the oldest ones out:
+    history.record(delete_command(9))
+    assert len(history.done) == 2
+    assert history.rows == 10
+
+
+def test_failed_undo_is_kept():
+    class FailingApp(RecordingApp):
+        def insert_expenses(self, exps):
+            raise ValueError("no way")
+
+    history = CommandHistory()
+    history.record(delete_command(1))
+    with pytest.raises(ValueError):
+        history.undo(FailingApp())
+    assert history.can_undo and not history.can_redo
@@ -0,0 +1,117 @@
+import pytest
+
+from bookkeeper.events import EventBus, Event, ExpenseEvent, ExpenseAdded, \
+                              ExpensesDeleted, CategoryAdded
+from bookkeeper.models.category import Category
+from bookkeeper.models.expense import Expense
+
+
+@pytest.fixture
+def bus():
+    return EventBus()
+
+
+def test_sync_delivery(bus):
+    received = []
+    bus.subscribe(ExpenseAdded, received.append)
+
+    event = ExpenseAdded(Expense(100, 1))
+    bus.publish(event)
+    bus.publish(CategoryAdded(Category("cat")))
+
+    assert received == [event]
+    assert bus.pending == 0
+
+
+def test_base_class_subscription(bus):
+    expense_events, all_events = [], []
+    bus.subscribe(ExpenseEvent, expense_events.append)
+    bus.subscribe(Event, all_events.append)
+
+    events = [ExpenseAdded(Expense(100, 1)), ExpensesDeleted(()),
+              CategoryAdded(Category("cat"))]
+    for event in events:
+        bus.publish(event)
+
+    assert expense_events == events[:2]
+    assert all_events == events
+
+
+def test_delivery_order(bus):
+    calls = []
+    bus.subscribe(Event, lambda event: calls.append('first'))
+    bus.subscribe(ExpenseAdded, lambda event: calls.append('second'))
+    bus.publish(ExpenseAdded(Expense(100, 1)))
+    assert calls == ['first', 'second']
+
+
+def test_queued_delivery(bus):
+    queued, direct = [], []
+    bus.subscribe(ExpenseAdded, queued.append, queued=True)
+    bus.subscribe(ExpenseAdded, direct.append)
+
+    events = [ExpenseAdded(Expense(i, 1)) for i in range(3)]
+    for event in events:
+        bus.publish(event)
+
+    assert direct == events
+    assert queued == []
+    assert bus.pending == 3
+
+    assert bus.flush() == 3
+    assert queued == events
+    assert bus.flush() == 0
+
+
+def test_unsubscribe(bus):
+    received = []
+    unsubscribe = bus.subscribe(ExpenseAdded, received.append)
+    bus.publish(ExpenseAdded(Expense(1, 1)))
+    unsubscribe()
+    unsubscribe()
+    bus.publish(ExpenseAdded(Expense(2, 1)))
+    assert len(received) == 1
+
+
+def test_handler_error_propagates(bus):
+    def handler(event):
+        raise ValueError("test")
+
+    bus.subscribe(ExpenseAdded, handler)
+    with pytest.raises(ValueError):
+        bus.publish(ExpenseAdded(Expense(1, 1)))
+
+
+def test_handler_error_keeps_delivery(bus, caplog):
+    received = []
+    added = ExpenseAdded(Expense(1, 1))
+    deleted = ExpensesDeleted(())
+
+    def handler(event):
+        bus.publish(deleted)
+        raise ValueError("first")
+
+    def failing(event):
+        raise KeyError("second")
+
+    # The later subscribers and the queued event are still delivered:
+    bus.subscribe(ExpenseAdded, handler)
+    bus.subscribe(ExpensesDeleted, failing)
+    bus.subscribe(Event, received.append)
+    with pytest.raises(ValueError):
+        bus.publish(added)
+
+    assert received == [added, deleted]
+    assert "Event handler failed" in caplog.text
+
+
+def test_nested_publish_keeps_order(bus):
+    received = []
+    added = ExpenseAdded(Expense(1, 1))
+    deleted = ExpensesDeleted(())
+
+    bus.subscribe(ExpenseAdded, lambda event: bus.publish(deleted))
+    bus.subscribe(Event, received.append)
+    bus.publish(added)
+
+    assert received == [added, deleted]
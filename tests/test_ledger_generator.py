@@ -0,0 +1,92 @@
+from datetime import datetime
+
+import pytest
+
+from bookkeeper.ledger_generator import DEFAULT_END, LedgerGenerator, fill_ledger, \
+                                       main
+from bookkeeper.models.budget import Budget
+from bookkeeper.models.category import Category
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+
+END = datetime(2023, 3, 1)
+
+
+def test_same_seed_same_ledger():
+    first = list(LedgerGenerator(seed=7, end=END).expenses(100, [1, 2, 3]))
+    second = list(LedgerGenerator(seed=7, end=END).expenses(100, [1, 2, 3]))
+    other = list(LedgerGenerator(seed=8, end=END).expenses(100, [1, 2, 3]))
+    assert first == second
+    assert first != other
+
+
+def test_expenses_are_chronological():
+    exps = list(LedgerGenerator(seed=1, end=END, days=30).expenses(200, [1, 2]))
+    dates = [exp.expense_date for exp in exps]
+    assert dates == sorted(dates)
+    assert all(d <= END.replace(hour=23, minute=59, second=59) for d in dates)
+    assert all(exp.amount >= 1 for exp in exps)
+    assert all(exp.added_date >= exp.expense_date for exp in exps)
+
+
+@pytest.mark.parametrize('count', [3, 28, 200])
+def test_category_tree(count):
+    tree = LedgerGenerator(seed=2).category_tree(count)
+    names = [name for name, _ in tree]
+    assert len(tree) == count
+    assert len(set(names)) == count
+    seen = set()
+    for name, parent in tree:
+        assert parent is None or parent in seen
+        seen.add(name)
+
+
+def test_fill_memory_ledger():
+    cat_repo, exp_repo, budget_repo = (MemoryRepository(), MemoryRepository(),
+                                       MemoryRepository())
+    stats = fill_ledger(cat_repo, exp_repo, budget_repo,
+                        n_categories=40, n_expenses=500, seed=3, batch_size=64)
+    assert (stats.categories, stats.expenses, stats.budgets) == (40, 500, 3)
+    assert len(cat_repo.get_all()) == 40
+    assert len(exp_repo.get_all()) == 500
+    cat_pks = {cat.pk for cat in cat_repo.get_all()}
+    assert {exp.category for exp in exp_repo.get_all()} <= cat_pks
+
+
+def test_fill_sqlite_ledger(tmp_path):
+    db_file = str(tmp_path / "ledger.db")
+    repos = [SQLiteRepository(db_file=db_file, cls=model)
+             for model in [Category, Expense, Budget]]
+    stats = fill_ledger(*repos, n_categories=30, n_expenses=300, seed=4)
+    assert stats.rows_per_second > 0
+    cats = repos[0].get_all()
+    assert len(cats) == 30
+    by_pk = {cat.pk: cat for cat in cats}
+    assert all(cat.parent is None or cat.parent in by_pk for cat in cats)
+    assert len(repos[1].get_all()) == 300
+    assert {b.period.name for b in repos[2].get_all()} == {'DAY', 'WEEK', 'MONTH'}
+
+
+def test_main(tmp_path, capsys):
+    db_file = tmp_path / "cli.db"
+    assert main(['--db', str(db_file), '--categories', '10',
+                 '--expenses', '50', '--no-budgets']) == 0
+    assert "расходов: 50" in capsys.readouterr().out
+    assert len(SQLiteRepository(str(db_file), Expense).get_all()) == 50
+
+
+def test_fixed_end(tmp_path):
+    assert LedgerGenerator(seed=5).end == DEFAULT_END
+
+    exp_repo = MemoryRepository()
+    fill_ledger(MemoryRepository(), exp_repo, n_categories=5, n_expenses=20,
+                end=END)
+    assert max(exp.expense_date for exp in exp_repo.get_all()).date() <= END.date()
+
+    db_file = tmp_path / "cli.db"
+    assert main(['--db', str(db_file), '--categories', '5', '--expenses', '20',
+                 '--no-budgets', '--end', '2020-06-30']) == 0
+    dates = [exp.expense_date
+             for exp in SQLiteRepository(str(db_file), Expense).get_all()]
+    assert datetime(2018, 7, 1) <= min(dates) <= max(dates) < datetime(2020, 7, 1)
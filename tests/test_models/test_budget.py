@@ -1,9 +1,10 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 
 import pytest
 
 from bookkeeper.repository.memory_repository import MemoryRepository
-from bookkeeper.models.budget import Period, Budget
+from bookkeeper.models.budget import Period, Budget, SpendingTotals, SlidingWindowSum
+from bookkeeper.models.expense import Expense
 
 @pytest.fixture
 def repo():
@@ -26,8 +27,133 @@ def test_create_brief():
     assert b.pk         == 2
 
 
+def test_create_rolling_window():
+    b = Budget(100, "7d")
+    assert (b.period, b.window, b.name) == (Period.DAY, 7, "7d")
+    assert b.length == timedelta(days=7)
+    assert Budget(100, "day", window=7) == b
+    assert Budget(100, "24h").length == timedelta(hours=24)
+    assert Budget(100, "hour").name == "hour"
+
+    for period in ["year", "Day", "0d", "7m", "-1h"]:
+        with pytest.raises(ValueError):
+            Budget(100, period)
+    with pytest.raises(ValueError):
+        Budget(100, "month", window=2)
+
+
 def test_can_add_to_repo(repo):
     b  = Budget(100, "day", 10)
     pk = repo.add(b)
 
-    assert b.pk == pk
\ No newline at end of file
+    assert b.pk == pk
+
+
+def test_spending_totals():
+    now = datetime(2023, 3, 15, 12)  # Wednesday
+    exps = [Expense(1, 1, expense_date=datetime(2023, 3, 15, 9)),
+            Expense(10, 1, expense_date=datetime(2023, 3, 13, 9)),
+            Expense(100, 1, expense_date="2023-03-01\t10:00"),
+            Expense(1000, 1, expense_date=datetime(2023, 2, 28, 9))]
+    totals = SpendingTotals(exps, now=now)
+
+    assert totals.spent(Period.DAY)   == 1
+    assert totals.spent(Period.WEEK)  == 11
+    assert totals.spent(Period.MONTH) == 111
+
+    # Deltas:
+    totals.add(Expense(5, 1, expense_date=datetime(2023, 3, 15, 20)))
+    totals.remove(exps[1])
+    assert totals.spent(Period.DAY)   == 6
+    assert totals.spent(Period.WEEK)  == 6
+    assert totals.spent(Period.MONTH) == 106
+
+    # Rollover:
+    assert totals.is_current(datetime(2023, 3, 15, 12, 59))
+    assert not totals.is_current(datetime(2023, 3, 16, 12))
+
+def test_budget_spent_from_repository_totals(repo):
+    for amount, days_ago in [(1, 0), (2, 1), (4, 3), (8, 10), (16, 40)]:
+        date = (datetime.now() - timedelta(days=days_ago)).isoformat(sep='\t')
+        repo.add(Expense(amount, 1, expense_date=date))
+    totals = SpendingTotals(repo.get_all())
+    loaded = SpendingTotals()
+    loaded.load(repo)
+
+    for period in ["day", "week", "month"]:
+        b = Budget(100, period)
+        assert loaded.budget_spent(b) == totals.budget_spent(b)
+
+def test_spending_totals_load(repo):
+    now = datetime(2023, 3, 15, 12)  # Wednesday
+    for amount, date in [(1, datetime(2023, 3, 15, 12, 30)),
+                         (2, datetime(2023, 3, 15, 9)),
+                         (4, datetime(2023, 3, 13, 9)),
+                         (8, "2023-03-01\t10:00"),
+                         (16, datetime(2023, 2, 28, 9))]:
+        repo.add(Expense(amount, 1, expense_date=date))
+
+    totals = SpendingTotals()
+    totals.load(repo, now=now)
+    assert totals.totals == SpendingTotals(repo.get_all(), now=now).totals
+    assert totals.spent(Period.HOUR) == 1
+    assert totals.spent(Period.WEEK) == 7
+    assert totals.is_current(now)
+
+def test_sliding_window_sum():
+    now = datetime(2023, 3, 15, 12)
+    window = SlidingWindowSum(timedelta(days=7), now=now)
+    for amount, date in [(1, datetime(2023, 3, 8, 12)),  # just outside
+                         (2, datetime(2023, 3, 9, 9)),
+                         (4, datetime(2023, 3, 14, 9)),
+                         (8, datetime(2023, 3, 10, 9)),  # back in time
+                         (16, datetime(2023, 3, 15, 20))]:  # in the future
+        window.add(Expense(amount, 1, expense_date=date))
+    assert window.total == 14
+
+    window.remove(Expense(4, 1, expense_date=datetime(2023, 3, 14, 9)))
+    assert window.total == 10
+
+    # Old expenses expire, future ones come in:
+    window.advance(datetime(2023, 3, 16, 10))
+    assert window.total == 24
+    window.advance(datetime(2023, 3, 21, 10))
+    assert window.total == 16
+    assert len(window) == 1
+
+    # The window never moves back:
+    window.advance(now)
+    assert window.total == 16
+
+def test_spending_totals_track_windows():
+    now = datetime(2023, 3, 15, 12, 30)
+    exps = [Expense(1, 1, expense_date=datetime(2023, 3, 15, 12, 10)),
+            Expense(2, 1, expense_date=datetime(2023, 3, 14, 9)),
+            Expense(4, 1, expense_date=datetime(2023, 3, 1, 9))]
+    budgets = [Budget(100, "hour"), Budget(100, "7d"), Budget(100, "24h")]
+    totals = SpendingTotals(exps, now=now)
+    totals.track(budgets, exps, now=now)
+
+    assert [totals.budget_spent(b) for b in budgets] == [1, 3, 1]
+
+    totals.add(Expense(8, 1, expense_date=datetime(2023, 3, 15, 11, 45)))
+    totals.advance(datetime(2023, 3, 16, 11, 40))
+    assert totals.budget_spent(budgets[1]) == 11
+    assert totals.budget_spent(budgets[2]) == 9
+
+    # Windows without budgets are dropped:
+    totals.track(budgets[:1], exps)
+    assert totals.windows == {}
+
+def test_rolling_budget_spent(repo):
+    now = datetime.now()
+    for amount, hours_ago in [(1, 0), (2, 30), (4, 24 * 8)]:
+        repo.add(Expense(amount, 1, expense_date=now - timedelta(hours=hours_ago)))
+    totals = SpendingTotals(repo.get_all(), now=now)
+
+    b = Budget(100, "7d")
+    totals.track([b], repo.get_all(), now=now)
+    assert totals.budget_spent(b) == 3
+
+    b = Budget(100, "hour")
+    assert totals.budget_spent(b) == totals.spent(Period.HOUR) == 1
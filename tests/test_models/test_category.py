@@ -2,11 +2,13 @@
 Тесты для категорий расходов
 """
 from inspect import isgenerator
+from textwrap import dedent
 
 import pytest
 
 from bookkeeper.models.category import Category
 from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
 
 
 @pytest.fixture
@@ -106,3 +108,52 @@ def test_create_from_tree_error(repo):
     tree = [('1', 'parent'), ('parent', None)]
     with pytest.raises(KeyError):
         Category.create_from_tree(tree, repo)
+
+
+def test_import_tree(repo):
+    text = dedent('''
+        food
+            meat
+                raw meat
+
+            sweets
+        books
+    ''')
+    cats = Category.import_tree(text.splitlines(), repo)
+    assert [c.name for c in cats] == ['food', 'meat', 'raw meat', 'sweets', 'books']
+    assert [c.parent for c in cats] == [None, cats[0].pk, cats[1].pk, cats[0].pk, None]
+    assert repo.get_all() == cats
+
+
+def test_import_tree_merge(repo):
+    Category.import_tree(['food', '    meat'], repo)
+    cats = Category.import_tree(['food', '    meat', '        sausage', 'books'], repo)
+
+    assert [c.name for c in cats] == ['sausage', 'books']
+    meat = repo.get_all({'name': 'meat'})[0]
+    assert cats[0].parent == meat.pk
+    assert len(repo.get_all()) == 4
+
+
+def test_import_tree_errors(repo):
+    Category.import_tree(['food', '    meat'], repo)
+
+    with pytest.raises(ValueError, match='Строка 3'):
+        Category.import_tree(['books', '', '    meat'], repo)
+    with pytest.raises(IndentationError) as exc_info:
+        Category.import_tree(['books', '    novels', '  poems'], repo)
+    assert exc_info.value.lineno == 3
+
+
+def test_import_large_tree(tmp_path):
+    # 100 000 categories in a single transaction, parents are kept
+    # in the closure table by the insert trigger:
+    repo = SQLiteRepository(str(tmp_path / "tree.db"), Category, closure='parent')
+    lines = (f'{"    " * (i % 5)}category {i}' for i in range(100_000))
+
+    cats = Category.import_tree(lines, repo)
+    assert len(cats) == 100_000
+    assert cats[4].parent == cats[3].pk
+    assert [c.name for c in repo.get_ancestors(cats[-1].pk)] == [
+        'category 99998', 'category 99997', 'category 99996', 'category 99995']
+    assert len(repo.get_descendants(cats[0].pk)) == 4
@@ -0,0 +1,52 @@
+"""
+Тесты для индекса категорий
+"""
+from bookkeeper.models.category import Category
+from bookkeeper.models.category_index import CategoryIndex
+
+
+def make_index():
+    return CategoryIndex([Category('Еда', pk=1),
+                          Category('мясо', 1, pk=2),
+                          Category('хлеб', 1, pk=3),
+                          Category('книги', pk=4)])
+
+
+def test_lookup():
+    index = make_index()
+    assert len(index) == 4
+    assert index.get('  еДА ').pk == 1
+    assert index.get('нет') is None
+    assert 'Мясо' in index
+    assert 'нет' not in index
+    assert index.get_by_pk(3).name == 'хлеб'
+    assert index.name_of(4) == 'книги'
+    assert index.name_of(5) == ''
+
+
+def test_children():
+    index = make_index()
+    assert [c.pk for c in index.children_of(None)] == [1, 4]
+    assert [c.pk for c in index.children_of(1)] == [2, 3]
+    assert index.children_of(2) == []
+
+
+def test_add_remove_reparent():
+    index = make_index()
+    version = index.version
+
+    cat = Category('сыр', 1, pk=5)
+    index.add(cat)
+    assert index.get('СЫР') is cat
+    assert cat in index.children_of(1)
+
+    index.set_parent(cat, 4)
+    assert cat.parent == 4
+    assert cat not in index.children_of(1)
+    assert cat in index.children_of(4)
+
+    index.remove(cat)
+    assert 'сыр' not in index
+    assert index.get_by_pk(5) is None
+    assert index.children_of(4) == []
+    assert index.version > version
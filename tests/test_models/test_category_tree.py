@@ -0,0 +1,60 @@
+"""
+Тесты для дерева категорий
+"""
+from bookkeeper.models.category import Category
+from bookkeeper.models.category_index import CategoryIndex
+from bookkeeper.models.category_tree import CategoryTree
+
+
+def make_tree():
+    return CategoryTree([Category('еда', pk=1),
+                         Category('мясо', 1, pk=2),
+                         Category('сырое мясо', 2, pk=3),
+                         Category('хлеб', 1, pk=4),
+                         Category('книги', pk=5),
+                         Category('потерянная', 99, pk=6)])
+
+
+def test_preorder():
+    tree = make_tree()
+    assert [c.pk for c in tree] == [1, 2, 3, 4, 5, 6]
+    assert [c.pk for c in tree.children_of(None)] == [1, 5, 6]
+    assert [c.pk for c in tree.children_of(1)] == [2, 4]
+    assert tree.children_of(3) == []
+
+
+def test_depth_and_path():
+    tree = make_tree()
+    assert tree.depth_of(3) == 2
+    assert tree.depth_of(6) == 0
+    assert tree.path_of(3) == 'еда → мясо → сырое мясо'
+    assert tree.path_of(5) == 'книги'
+
+
+def test_subtree():
+    tree = make_tree()
+    assert [c.pk for c in tree.subtree(1)] == [1, 2, 3, 4]
+    assert [c.pk for c in tree.descendants(2)] == [3]
+    assert [c.pk for c in tree.ancestors(3)] == [2, 1]
+    assert tree.is_descendant(3, 1)
+    assert not tree.is_descendant(1, 3)
+    assert not tree.is_descendant(5, 1)
+    assert not tree.is_descendant(1, 1)
+
+
+def test_deep_tree():
+    cats = [Category('0', pk=1)] + [Category(str(i), i, pk=i + 1) for i in range(1, 5000)]
+    tree = CategoryTree(cats)
+    assert tree.depth_of(5000) == 4999
+    assert len(tree.descendants(1)) == 4999
+
+
+def test_index_caches_tree():
+    index = CategoryIndex([Category('еда', pk=1), Category('мясо', 1, pk=2)])
+    tree = index.tree()
+    assert index.tree() is tree
+
+    index.add(Category('сыр', 1, pk=3))
+    new_tree = index.tree()
+    assert new_tree is not tree
+    assert [c.pk for c in new_tree.descendants(1)] == [2, 3]
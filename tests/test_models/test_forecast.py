@@ -0,0 +1,74 @@
+from datetime import date, datetime, timedelta
+
+from bookkeeper.models.budget import Period, Budget
+from bookkeeper.models.expense import Expense
+from bookkeeper.models.forecast import DailyTotals, Forecast, epoch_day, \
+                                       forecast_budgets
+
+def test_epoch_day():
+    assert epoch_day(date(1970, 1, 2)) == 1
+    assert epoch_day(datetime(1970, 1, 2, 23, 59)) == 1
+    assert epoch_day("1970-01-11 10:00") == 10
+
+def test_daily_totals():
+    start = epoch_day(date(2023, 3, 12))
+    daily = DailyTotals([Expense(10, 1, expense_date=datetime(2023, 3, 13, 9)),
+                         Expense(5, 1, expense_date=datetime(2023, 3, 15, 9))])
+    assert daily.window(start, start + 5).tolist() == [0, 10, 0, 5, 0]
+    assert daily.first_spending() == start + 1
+
+    # The array grows in both directions:
+    old = Expense(3, 1, expense_date=datetime(2023, 1, 1, 9))
+    daily.add(old)
+    daily.add(Expense(7, 1, expense_date=datetime(2024, 1, 1, 9)))
+    assert daily.first_spending() == epoch_day(date(2023, 1, 1))
+    new_year = epoch_day(date(2024, 1, 1))
+    assert daily.window(new_year, new_year + 1).tolist() == [7]
+
+    daily.remove(old)
+    daily.remove(Expense(10, 1, expense_date=datetime(2023, 3, 13, 9)))
+    assert daily.window(start, start + 5).tolist() == [0, 0, 0, 5, 0]
+    assert daily.first_spending() == start + 3
+
+def test_daily_totals_empty():
+    daily = DailyTotals()
+    assert daily.first_spending() is None
+    assert daily.window(10, 13).tolist() == [0, 0, 0]
+
+def test_forecast_trailing_average():
+    now = datetime(2023, 3, 15, 12)  # Wednesday noon
+    daily = DailyTotals(Expense(10, 1, expense_date=now - timedelta(days=i))
+                        for i in range(1, 60))
+    budgets = [Budget(100, "day"), Budget(20, "week", spent=30),
+               Budget(300, "month", spent=140)]
+
+    day, week, month = forecast_budgets(daily, budgets, now)
+
+    # Half of today and 16 more days at 10 a day:
+    assert month == Forecast(Period.MONTH, 305, date(2023, 3, 31))
+    assert day == Forecast(Period.DAY, 5, None)
+
+    # Already over the limit:
+    assert week.breach == now.date()
+
+def test_forecast_weekday_profile():
+    now = datetime(2023, 3, 15, 18)  # Wednesday evening
+    saturdays = [datetime(2023, 3, 11, 10) - timedelta(weeks=i) for i in range(8)]
+    daily = DailyTotals(Expense(70, 1, expense_date=day) for day in saturdays)
+
+    # 40 on Saturday and 5 on the other days (half weekday mean, half
+    # the 10 a day trailing mean):
+    forecast, = forecast_budgets(daily, [Budget(50, "week")], now)
+    assert forecast.projected == 56
+    assert forecast.breach == date(2023, 3, 18)
+
+def test_forecast_without_history():
+    now = datetime(2023, 3, 15, 12)
+    forecast, = forecast_budgets(DailyTotals(), [Budget(100, "month", spent=40)], now)
+    assert forecast == Forecast(Period.MONTH, 40, None)
+
+def test_no_forecast_for_hours_and_windows():
+    now = datetime(2023, 3, 15, 12)
+    budgets = [Budget(100, "hour"), Budget(100, "7d"), Budget(100, "day")]
+    assert [fct.period for fct in forecast_budgets(DailyTotals(), budgets, now)] == [
+        Period.DAY]
@@ -1,3 +1,4 @@
+from bookkeeper.models.category import Category
 from bookkeeper.repository.abstract_repository import AbstractRepository
 
 import pytest
@@ -18,3 +19,20 @@ def test_can_create_subclass():
 
     t = Test()
     assert isinstance(t, AbstractRepository)
+
+
+def test_subclass_defaults():
+    class Test(AbstractRepository):
+        def __init__(self): self.objs = []
+        def add(self, obj): self.objs.append(obj)
+        def get(self, pk): pass
+        def get_all(self, where=None): return list(self.objs)
+        def update(self, obj): pass
+        def delete(self, pk): pass
+
+    t = Test()
+    t.add_many([Category("фрукты"), Category("овощи", parent=1)])
+    assert [cat.name for cat in t.get_all_by_pattern({'name': "фрук"})] == ["фрукты"]
+    assert [cat.name for cat in t.get_all_by_pattern({'parent': "1"})] == ["овощи"]
+    with pytest.raises(NotImplementedError):
+        t.restore_many(t.get_all())
@@ -0,0 +1,166 @@
+from datetime import datetime
+
+import pytest
+
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.abstract_repository import SUMMARY_FIELDS
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.retry_policy import RetryPolicy
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+from bookkeeper.repository.archive_repository import ArchiveRepository, \
+                                                     UnionRepository, \
+                                                     archive_expenses
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = ArchiveRepository(str(tmp_path / "archive.db"))
+    yield archive
+    archive.close()
+
+@pytest.fixture
+def hot_repo():
+    repo = MemoryRepository()
+    for date, amount, cat in [(datetime(2022, 1, 5), 100, 1),
+                              (datetime(2022, 1, 20), 50, 1),
+                              (datetime(2022, 1, 21), 70, 2),
+                              (datetime(2022, 2, 1), 30, 1),
+                              (datetime(2023, 3, 1), 10, 1)]:
+        repo.add(Expense(amount, cat, expense_date=date, added_date=date))
+    return repo
+
+def test_archive_expenses(hot_repo, archive):
+    moved = archive_expenses(hot_repo, archive, cutoff=datetime(2023, 1, 1))
+
+    assert moved == 4
+    assert [e.amount for e in hot_repo.get_all()] == [10]
+    assert [e.amount for e in archive.get_all()] == [100, 50, 70, 30]
+
+def test_archived_expenses_keep_values(hot_repo, archive):
+    exp = hot_repo.get(1)
+    archive_expenses(hot_repo, archive, cutoff=datetime(2023, 1, 1))
+
+    assert archive.get(1) == exp
+    assert archive.get(100) is None
+
+def test_month_totals(hot_repo, archive):
+    archive_expenses(hot_repo, archive, cutoff=datetime(2023, 1, 1))
+
+    assert archive.month_totals() == {('2022-01', 1): (150, 2),
+                                      ('2022-01', 2): (70, 1),
+                                      ('2022-02', 1): (30, 1)}
+    assert archive.month_totals('2022-02') == {('2022-02', 1): (30, 1)}
+
+def test_archive_is_idempotent(hot_repo, archive):
+    exps = hot_repo.get_all()
+    archive.store(exps)
+    archive.store(exps)
+
+    assert len(archive.get_all()) == len(exps)
+    assert archive.month_totals('2022-01')[('2022-01', 1)] == (150, 2)
+
+def test_archive_queries(hot_repo, archive):
+    archive_expenses(hot_repo, archive, cutoff=datetime(2023, 1, 1))
+
+    assert [e.amount for e in archive.get_all({'category': 2})] == [70]
+    assert [e.amount for e in archive.get_all_by_pattern(
+                {'expense_date': '2022-01'})] == [100, 50, 70]
+    assert [e.amount for e in archive.get_between(
+                datetime(2022, 1, 10), datetime(2022, 2, 1))] == [50, 70]
+
+    with pytest.raises(ValueError):
+        archive.get_all({'unknown': 1})
+
+def test_archive_is_read_only(archive):
+    with pytest.raises(ValueError):
+        archive.add(Expense(100, 1))
+    with pytest.raises(ValueError):
+        archive.update(Expense(100, 1, pk=1))
+    with pytest.raises(ValueError):
+        archive.delete(1)
+
+def test_union_repository(hot_repo, archive):
+    archive_expenses(hot_repo, archive, cutoff=datetime(2023, 1, 1))
+    union = UnionRepository(hot_repo, archive)
+
+    assert [e.amount for e in union.get_all()] == [100, 50, 70, 30, 10]
+    assert union.get(5).amount == 10
+    assert union.get(1).amount == 100
+    assert len(union.get_all({'category': 1})) == 4
+
+    # Writes go to the hot repository only:
+    pk = union.add(Expense(5, 2))
+    assert hot_repo.get(pk).amount == 5
+    union.delete(pk)
+    assert hot_repo.get(pk) is None
+
+def test_union_without_duplicates(hot_repo, archive):
+    # Archiving interrupted after the copy, before the deletion:
+    archive.store(hot_repo.get_all()[:4])
+    union = UnionRepository(hot_repo, archive)
+
+    assert [e.pk for e in union.get_all()] == [1, 2, 3, 4, 5]
+    assert [row[0] for chunk in union.iter_columns(['amount'], chunk_size=2)
+            for row in chunk] == [1, 2, 3, 4, 5]
+    assert union.get_totals('month', '2022-01', '2022-01') == {
+        ('2022-01', 1): (150, 2), ('2022-01', 2): (70, 1)}
+
+def test_union_totals(hot_repo, archive):
+    archive_expenses(hot_repo, archive, cutoff=datetime(2022, 1, 21))
+    union = UnionRepository(hot_repo, archive)
+
+    assert union.get_totals('month') == {('2022-01', 1): (150, 2),
+                                         ('2022-01', 2): (70, 1),
+                                         ('2022-02', 1): (30, 1),
+                                         ('2023-03', 1): (10, 1)}
+    assert union.get_totals('day', '2022-01-20', '2022-01-21') == {
+        ('2022-01-20', 1): (50, 1), ('2022-01-21', 2): (70, 1)}
+
+def test_union_totals_read_no_hot_records(tmp_path, archive, monkeypatch):
+    hot_repo = SQLiteRepository(str(tmp_path / "hot.db"), Expense,
+                                summary=SUMMARY_FIELDS)
+    hot_repo.add_many([Expense(100, 1, expense_date=datetime(2022, 1, 5)),
+                       Expense(10, 1, expense_date=datetime(2023, 3, 1))])
+    archive_expenses(hot_repo, archive, cutoff=datetime(2023, 1, 1))
+    union = UnionRepository(hot_repo, archive)
+
+    # Only the stored totals are read when no copies are left:
+    def fail(*args):
+        raise AssertionError("hot records read")
+    monkeypatch.setattr(hot_repo, 'get_all', fail)
+    monkeypatch.setattr(hot_repo, 'get_all_by_pattern', fail)
+    assert union.get_totals('month') == {('2022-01', 1): (100, 1),
+                                         ('2023-03', 1): (10, 1)}
+    hot_repo.close()
+
+def test_archive_pk_is_unique(archive):
+    exp = Expense(100, 1, expense_date=datetime(2022, 1, 5), pk=1)
+    archive.store([exp])
+    archive.store([Expense(100, 1, expense_date=datetime(2022, 3, 5), pk=1)])
+
+    assert [e.expense_date.month for e in archive.get_all()] == [3]
+    assert archive.month_totals() == {('2022-03', 1): (100, 1)}
+
+def test_pks_not_reused_after_archiving(tmp_path, archive):
+    db_file = str(tmp_path / "hot.db")
+    hot_repo = SQLiteRepository(db_file, Expense)
+    hot_repo.add_many([Expense(100, 1, expense_date=datetime(2022, 1, 5)),
+                       Expense(50, 1, expense_date=datetime(2022, 1, 20))])
+    archive_expenses(hot_repo, archive, cutoff=datetime(2023, 1, 1))
+    hot_repo.close()
+
+    # The floor of the keys survives reopening the database:
+    hot_repo = SQLiteRepository(db_file, Expense)
+    assert hot_repo.add(Expense(10, 1)) == 3
+    assert hot_repo.add_many([Expense(20, 1)]) == [4]
+    assert len(UnionRepository(hot_repo, archive).get_all()) == 4
+    hot_repo.close()
+
+def test_archive_connection_settings(tmp_path):
+    retry = RetryPolicy(attempts=2)
+    archive = ArchiveRepository(str(tmp_path / "archive.db"), wal=True,
+                                busy_timeout=50, retry=retry)
+    con = archive.connection()
+    assert con.execute("PRAGMA busy_timeout").fetchone()[0] == 50
+    assert con.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert archive.retry is retry
+    archive.close()
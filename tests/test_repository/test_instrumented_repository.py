@@ -0,0 +1,112 @@
+import json
+from dataclasses import dataclass
+
+import pytest
+
+from bookkeeper.repository.memory_repository import MemoryRepository
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+from bookkeeper.repository.instrumented_repository import LatencyHistogram, \
+                                                         RepositoryMetrics, \
+                                                         InstrumentedRepository, \
+                                                         instrumented_factory
+
+
+@dataclass
+class Custom:
+    pk        : int = 0
+    field_int : int = 0
+    field_str : str = "abcd"
+
+@pytest.fixture
+def metrics():
+    return RepositoryMetrics()
+
+@pytest.fixture
+def repo(metrics):
+    return InstrumentedRepository(MemoryRepository(), "custom", metrics)
+
+def test_histogram_percentiles():
+    hist = LatencyHistogram()
+    for i in range(1, 101):
+        hist.add(i * 1e-3)
+
+    assert hist.count == 100
+    assert hist.max == pytest.approx(0.1)
+    # Estimates are within one bucket (2**0.25) of the exact value:
+    assert 0.050 <= hist.percentile(50) <= 0.050 * 2 ** 0.25
+    assert 0.095 <= hist.percentile(95) <= 0.095 * 2 ** 0.25
+    assert hist.percentile(100) == hist.max
+
+def test_empty_histogram():
+    assert LatencyHistogram().percentile(99) == 0.0
+
+def test_wrapper_counts_calls(repo, metrics):
+    for i in range(3):
+        repo.add(Custom(field_int=i))
+    repo.get(1)
+    repo.get(100)
+    repo.get_all()
+    repo.get_all({'field_int': 1})
+    repo.update(Custom(field_int=5, pk=1))
+    repo.delete(1)
+    repo.delete_many([2, 3])
+
+    stats = metrics.snapshot()['custom']
+    assert stats['add']['count'] == 3
+    assert stats['get']['count'] == 2
+    assert stats['get']['rows'] == 1
+    assert stats['get_all']['count'] == 2
+    assert stats['get_all']['rows'] == 4
+    assert stats['update']['count'] == 1
+    assert stats['delete']['count'] == 1
+    assert stats['delete_many']['rows'] == 2
+    assert stats['add']['p50'] <= stats['add']['p99']
+
+def test_wrapper_counts_column_chunks(repo, metrics):
+    repo.add_many([Custom(field_int=i) for i in range(5)])
+    chunks = list(repo.iter_columns(['field_int'], after=1, chunk_size=3))
+
+    assert chunks == [[(2, 1), (3, 2), (4, 3)], [(5, 4)]]
+    stats = metrics.snapshot()['custom']['iter_columns']
+    assert (stats['count'], stats['rows']) == (3, 4)
+
+def test_wrapper_passes_attributes_through(metrics):
+    inner = MemoryRepository()
+    repo = InstrumentedRepository(inner, "custom", metrics)
+    assert repo._container is inner._container
+
+def test_factory(metrics):
+    repo_gen = instrumented_factory(lambda model: MemoryRepository(), metrics)
+    repo = repo_gen(Custom)
+    repo.add(Custom())
+
+    assert metrics.snapshot()['custom']['add']['count'] == 1
+
+def test_sqlite_hooks(tmp_path, metrics):
+    repo = SQLiteRepository(db_file=str(tmp_path / "metrics.db"), cls=Custom,
+                            metrics=metrics)
+    for i in range(4):
+        repo.add(Custom(field_int=i))
+    repo.get_all()
+    repo.get_all_by_pattern({'field_str': 'abcd'})
+    repo.get(1)
+
+    stats = metrics.snapshot()['custom']
+    assert stats['add']['count'] == 4
+    assert stats['get_all']['rows'] == 4
+    # pk and field_int are 8 bytes each, field_str is 4 characters:
+    assert stats['get_all']['bytes'] == 4 * (8 + 8 + 4)
+    assert stats['get_all_by_pattern']['count'] == 1
+    assert stats['get']['rows'] == 1
+    repo.close()
+
+def test_dump(repo, metrics, tmp_path):
+    repo.add(Custom())
+    metrics.dump(str(tmp_path / "metrics.json"))
+
+    with open(tmp_path / "metrics.json", encoding="utf-8") as file:
+        dumped = json.load(file)
+    assert dumped['custom']['add']['count'] == 1
+
+    metrics.reset()
+    assert metrics.snapshot() == {}
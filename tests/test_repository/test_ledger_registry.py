@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from bookkeeper.models.category import Category
+from bookkeeper.repository.ledger_registry import LedgerRegistry
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+
+
+@pytest.fixture
+def registry(tmp_path):
+    registry = LedgerRegistry(str(tmp_path / "ledgers"), SQLiteRepository, capacity=2,
+                              idle_timeout=60, closure="parent")
+    yield registry
+    registry.close()
+
+
+def test_open_creates_ledger(registry):
+    ledger = registry.open("дом")
+    ledger(Category).add(Category("еда"))
+
+    assert os.path.exists(registry.path("дом"))
+    assert registry.names() == ["дом"]
+    assert ledger(Category) is ledger(Category)
+    assert registry.open("дом") is ledger
+    assert ledger(Category).closure_table == "category_closure"
+
+
+def test_lru_eviction(registry):
+    home = registry.open("дом")
+    repo = home(Category)
+    registry.open("дача")(Category)
+    registry.open("дом")
+    registry.open("проект")
+
+    # "дача" was used least recently:
+    assert list(registry.ledgers) == ["дом", "проект"]
+    assert registry.names() == ["дача", "дом", "проект"]
+
+    # A reopened ledger gets new repositories over the same file:
+    repo.add(Category("еда"))
+    assert registry.open("дача") is not None
+    assert [c.name for c in registry.open("дом")(Category).get_all()] == ["еда"]
+
+
+def test_idle_eviction(registry):
+    home = registry.open("дом")
+    home(Category)
+    work = registry.open("работа")
+
+    assert registry.evict_idle(now=home.last_used + 30) == []
+    assert registry.evict_idle(now=home.last_used + 61) == ["дом"]
+    assert home.repos == {}
+
+    # The most recently used ledger is never evicted:
+    assert registry.evict_idle(now=work.last_used + 1000) == []
+
+
+@pytest.mark.parametrize("name", ["", "../дом", "a/b", " дом", ".скрытый"])
+def test_invalid_name(registry, name):
+    with pytest.raises(ValueError):
+        registry.open(name)
@@ -1,3 +1,7 @@
+from dataclasses import dataclass
+from datetime import datetime
+
+from bookkeeper.models.expense import Expense
 from bookkeeper.repository.memory_repository import MemoryRepository
 
 import pytest
@@ -69,3 +73,100 @@ def test_get_all_with_condition(repo, custom_class):
         objects.append(o)
     assert repo.get_all({'name': '0'}) == [objects[0]]
     assert repo.get_all({'test': 'test'}) == objects
+
+
+def test_add_many(repo, custom_class):
+    objects = [custom_class() for i in range(5)]
+    pks = repo.add_many(objects)
+    assert pks == [o.pk for o in objects]
+    assert repo.get_all() == objects
+
+
+def test_update_many(repo, custom_class):
+    objs = [custom_class() for _ in range(3)]
+    repo.add_many(objs)
+    new_objs = [custom_class() for _ in range(3)]
+    for obj, new_obj in zip(objs, new_objs):
+        new_obj.pk = obj.pk
+    repo.update_many(new_objs)
+    assert repo.get_all() == new_objs
+
+
+def test_restore_many(repo, custom_class):
+    objs = [custom_class() for _ in range(3)]
+    repo.add_many(objs)
+    repo.delete(objs[1].pk)
+    repo.restore_many([objs[1]])
+    assert repo.get(objs[1].pk) == objs[1]
+    with pytest.raises(ValueError):
+        repo.restore_many([objs[0]])
+    with pytest.raises(ValueError):
+        repo.restore_many([custom_class()])
+
+
+@pytest.fixture
+def tree_repo():
+    @dataclass
+    class Node:
+        name: str
+        parent: int | None = None
+        pk: int = 0
+
+    # 1 -> (2 -> (4 -> 5), 3), 6
+    repo = MemoryRepository()
+    repo.add_many([Node("1"), Node("2", 1), Node("3", 1), Node("4", 2),
+                   Node("5", 4), Node("6")])
+    return repo
+
+
+def test_tree_operations(tree_repo):
+    assert [n.name for n in tree_repo.get_descendants(1)] == ["2", "3", "4", "5"]
+    assert [n.name for n in tree_repo.get_ancestors(5)] == ["4", "2", "1"]
+
+    tree_repo.move_subtree(2, 6)
+    assert [n.name for n in tree_repo.get_ancestors(5)] == ["4", "2", "6"]
+    assert [n.name for n in tree_repo.get_descendants(1)] == ["3"]
+    with pytest.raises(ValueError):
+        tree_repo.move_subtree(6, 4)
+
+    assert [n.name for n in tree_repo.delete_subtree(6)] == ["6", "2", "4", "5"]
+    assert [n.name for n in tree_repo.get_all()] == ["1", "3"]
+
+
+def test_tree_index_follows_updates(tree_repo):
+    assert tree_repo.get_descendants(6) == []
+
+    node = tree_repo.get(3)
+    node.parent = 6
+    tree_repo.update(node)
+    tree_repo.delete(2)
+
+    assert [n.name for n in tree_repo.get_descendants(6)] == ["3"]
+    assert tree_repo.get_descendants(1) == []
+    assert tree_repo.get_ancestors(5) == [tree_repo.get(4)]
+
+
+def test_totals_follow_changes():
+    repo = MemoryRepository()
+    repo.add_many([Expense(10, 1, expense_date=datetime(2023, 3, 1, 9)),
+                   Expense(5, 1, expense_date="2023-03-01\t20:00"),
+                   Expense(7, 2, expense_date=datetime(2023, 4, 2))])
+    assert repo.get_totals('day') == {('2023-03-01', 1): (15, 2),
+                                      ('2023-04-02', 2): (7, 1)}
+
+    # The index keeps the old values of an updated object to subtract them:
+    exp = repo.get(1)
+    exp.amount, exp.category = 20, 2
+    repo.update(exp)
+    repo.delete(3)
+    assert repo.get_totals('month', '2023-03', '2023-03') == {
+        ('2023-03', 1): (5, 1), ('2023-03', 2): (20, 1)}
+    assert repo.get_totals('month', first='2023-04') == {}
+
+    # Changes not written with update are found and fixed by a rebuild:
+    exp.amount = 30
+    assert repo.check_totals() == {('day', '2023-03-01', 2): ((20, 1), (30, 1)),
+                                   ('month', '2023-03', 2): ((20, 1), (30, 1))}
+    repo.rebuild_totals()
+    assert repo.get_totals('month')[('2023-03', 2)] == (30, 1)
+    assert repo.check_totals() == {}
@@ -0,0 +1,106 @@
+import logging
+import sqlite3
+from dataclasses import dataclass
+
+import pytest
+
+from bookkeeper.repository.query_tracer import QueryTracer
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+
+
+@dataclass
+class Custom:
+    pk        : int = 0
+    field_int : int = 0
+
+@pytest.fixture
+def con():
+    con = sqlite3.connect(":memory:")
+    con.execute("CREATE TABLE custom (field_int)")
+    con.executemany("INSERT INTO custom VALUES (?)", [[i] for i in range(100)])
+    yield con
+    con.close()
+
+def test_records_every_query(con):
+    tracer = QueryTracer(slow_threshold=10)
+    entry = tracer.trace(con, "SELECT * FROM custom WHERE field_int = ?", [1], 0.001)
+
+    assert list(tracer.queries) == [entry]
+    assert entry.params == [1]
+    assert entry.plan is None
+    assert len(tracer.slow_queries) == 0
+
+def test_slow_query_explained(con, caplog):
+    tracer = QueryTracer(slow_threshold=0, large_table_rows=50)
+
+    with caplog.at_level(logging.WARNING, logger="bookkeeper.sql"):
+        entry = tracer.trace(con, "SELECT * FROM custom WHERE field_int = ?", [1], 0.1)
+
+    assert list(tracer.slow_queries) == [entry]
+    assert any("SCAN" in detail for detail in entry.plan)
+    assert entry.full_scans == ["custom"]
+    assert "full scan of large table custom" in caplog.text
+
+def test_index_scan_not_flagged(con):
+    con.execute("CREATE INDEX custom_field_int ON custom (field_int)")
+    tracer = QueryTracer(slow_threshold=0, large_table_rows=50)
+
+    entry = tracer.trace(con, "SELECT * FROM custom WHERE field_int = ?", [1], 0.1)
+    assert entry.full_scans == []
+
+def test_small_table_not_flagged(con):
+    tracer = QueryTracer(slow_threshold=0, large_table_rows=1000)
+
+    entry = tracer.trace(con, "SELECT * FROM custom WHERE field_int = ?", [1], 0.1)
+    assert entry.full_scans == []
+
+def test_repository_queries_traced(tmp_path):
+    tracer = QueryTracer(slow_threshold=0, large_table_rows=1)
+    repo = SQLiteRepository(db_file=str(tmp_path / "trace.db"), cls=Custom,
+                            tracer=tracer)
+    repo.add(Custom(field_int=1))
+    repo.get_all({'field_int': 1})
+    repo.update(Custom(field_int=2, pk=1))
+
+    sqls = [entry.sql for entry in tracer.queries]
+    assert any(sql.startswith("INSERT") for sql in sqls)
+    assert any(sql.startswith("UPDATE") for sql in sqls)
+    assert tracer.slow_queries[-1].params == [2, 1]
+
+    select = next(e for e in tracer.queries
+                  if e.sql.startswith("SELECT") and "WHERE field_int" in e.sql)
+    assert select.full_scans == ["custom"]
+
+    tracer.clear()
+    assert len(tracer.queries) == 0
+    repo.close()
+
+def test_recursive_cte_traced(con):
+    tracer = QueryTracer(slow_threshold=0, large_table_rows=50)
+    entry = tracer.trace(
+        con, "WITH RECURSIVE w(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM w "
+             "WHERE n < 100) SELECT * FROM w JOIN custom AS c ON c.field_int = w.n",
+        [], 0.1)
+
+    # The CTE is not a table, the alias is resolved to the table:
+    assert entry.full_scans == ["custom"]
+
+def test_table_rows_never_fails(con):
+    assert QueryTracer.table_rows(con, "missing") == 0
+    assert not QueryTracer.is_table(con, "missing")
+
+def test_closure_repository_traced(tmp_path):
+    @dataclass
+    class Node:
+        parent : int | None = None
+        pk     : int = 0
+
+    tracer = QueryTracer(slow_threshold=0, large_table_rows=1)
+    repo = SQLiteRepository(db_file=str(tmp_path / "tree.db"), cls=Node,
+                            closure="parent", tracer=tracer)
+    repo.add_many([Node(), Node(1), Node(2)])
+    repo.rebuild_closure()
+
+    assert [node.pk for node in repo.get_descendants(1)] == [2, 3]
+    assert len(tracer.slow_queries) > 0
+    repo.close()
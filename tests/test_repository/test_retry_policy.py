@@ -0,0 +1,109 @@
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+import pytest
+
+from bookkeeper.repository.retry_policy import RetryPolicy, LockStats, \
+                                               DatabaseBusyError, is_lock_error
+from bookkeeper.repository.sqlite_repository import SQLiteRepository
+
+
+@dataclass
+class Custom:
+    pk        : int = 0
+    field_int : int = 0
+
+@pytest.fixture
+def db_file(tmp_path):
+    return str(tmp_path / "retry.db")
+
+@pytest.fixture
+def repo(db_file):
+    repo = SQLiteRepository(db_file=db_file, cls=Custom, busy_timeout=0,
+                            retry=RetryPolicy(attempts=50, base_delay=0.005,
+                                              max_delay=0.02))
+    yield repo
+    repo.close()
+
+@pytest.fixture
+def locker(db_file, repo):
+    # Another "process" holding the write lock:
+    con = sqlite3.connect(db_file, isolation_level=None, check_same_thread=False)
+    con.execute("BEGIN IMMEDIATE")
+    yield con
+    con.close()
+
+def test_delays_are_bounded():
+    policy = RetryPolicy(attempts=10, base_delay=0.01, max_delay=0.05, jitter=0.5)
+    delays = list(policy.delays())
+
+    assert len(delays) == 9
+    assert all(0.005 <= d <= 0.05 for d in delays)
+
+def test_is_lock_error():
+    assert is_lock_error(sqlite3.OperationalError("database is locked"))
+    assert not is_lock_error(sqlite3.OperationalError("no such table: x"))
+    assert not is_lock_error(ValueError("database is locked"))
+
+def test_run_retries_lock_errors():
+    calls = []
+
+    def operation():
+        calls.append(1)
+        if len(calls) < 3:
+            raise sqlite3.OperationalError("database is locked")
+        return "done"
+
+    stats = LockStats()
+    assert RetryPolicy(base_delay=0.001).run(operation, stats) == "done"
+    assert len(calls) == 3
+    assert stats.retries == 2
+
+def test_run_stops_at_max_wait():
+    calls = []
+
+    def operation():
+        # Every attempt blocks as if in busy_timeout:
+        calls.append(1)
+        time.sleep(0.03)
+        raise sqlite3.OperationalError("database is locked")
+
+    stats = LockStats()
+    policy = RetryPolicy(attempts=100, base_delay=0.001, max_delay=0.001,
+                         max_wait=0.1)
+    with pytest.raises(DatabaseBusyError):
+        policy.run(operation, stats)
+    assert len(calls) <= 4
+    assert stats.failures == 1
+
+def test_run_does_not_retry_other_errors():
+    def operation():
+        raise sqlite3.OperationalError("no such table: x")
+
+    with pytest.raises(sqlite3.OperationalError):
+        RetryPolicy(base_delay=0.001).run(operation)
+
+def test_writer_waits_for_lock(repo, locker):
+    # Release the lock a bit later:
+    timer = threading.Timer(0.05, lambda: locker.execute("COMMIT"))
+    timer.start()
+
+    pk = repo.add(Custom(field_int=1))
+    timer.join()
+
+    assert repo.get(pk).field_int == 1
+    assert repo.lock_stats.retries > 0
+    assert repo.lock_stats.wait_time > 0
+
+def test_writer_gives_up(repo, locker):
+    repo.retry = RetryPolicy(attempts=2, base_delay=0.001)
+
+    with pytest.raises(DatabaseBusyError):
+        repo.add(Custom(field_int=1))
+    assert repo.lock_stats.failures == 1
+
+    # The failed write was rolled back:
+    locker.execute("COMMIT")
+    assert repo.get_all() == []
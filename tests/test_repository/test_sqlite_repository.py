@@ -1,9 +1,15 @@
 import pytest
 import sqlite3
+import threading
 from dataclasses import dataclass
 from datetime import datetime
 
+from bookkeeper.models.budget import Budget, Period
+from bookkeeper.models.expense import Expense
+from bookkeeper.repository.abstract_repository import SUMMARY_FIELDS
+from bookkeeper.repository.retry_policy import RetryPolicy
 from bookkeeper.repository.sqlite_repository import SQLiteRepository
+from bookkeeper.repository.query_tracer import QueryTracer
 
 ##################################
 ## Testing stand initialization ##
@@ -123,4 +129,435 @@ def test_cannot_update_without_pk_property(repo, custom_class):
 
 def test_cannot_delete_nonexistent(repo):
     with pytest.raises(ValueError):
-        repo.delete(-1)
\ No newline at end of file
+        repo.delete(-1)
+
+##################################
+## Concurrent access (WAL mode) ##
+##################################
+
+@pytest.fixture
+def wal_repo(tmp_path, custom_class):
+    repo = SQLiteRepository(db_file=str(tmp_path / "wal.db"), cls=custom_class,
+                            wal=True, synchronous="NORMAL", cache_size=-2000,
+                            mmap_size=1 << 20, busy_timeout=10000)
+    yield repo
+    repo.close()
+
+def test_wal_pragmas(wal_repo):
+    con = wal_repo.connection()
+    assert con.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert con.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    assert con.execute("PRAGMA busy_timeout").fetchone()[0] == 10000
+
+def test_connection_per_thread(wal_repo):
+    connections = []
+    thread = threading.Thread(target=lambda: connections.append(wal_repo.connection()))
+    thread.start()
+    thread.join()
+
+    assert wal_repo.connection() is wal_repo.connection()
+    assert connections[0] is not wal_repo.connection()
+
+def test_concurrent_readers_and_writer(wal_repo, custom_class):
+    n_writes  = 300
+    n_readers = 4
+    errors    = []
+    done      = threading.Event()
+
+    def writer():
+        try:
+            for i in range(n_writes):
+                wal_repo.add(custom_class(field_int=i))
+        except Exception as exc:  # pylint: disable=broad-except
+            errors.append(exc)
+        finally:
+            done.set()
+
+    def reader():
+        try:
+            seen = 0
+            while not done.is_set():
+                count = len(wal_repo.get_all())
+                # Readers observe a consistent, growing snapshot:
+                assert count >= seen
+                seen = count
+        except Exception as exc:  # pylint: disable=broad-except
+            errors.append(exc)
+
+    threads = [threading.Thread(target=reader) for _ in range(n_readers)]
+    threads.append(threading.Thread(target=writer))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(wal_repo.get_all()) == n_writes
+
+def test_delete_many(repo, custom_class):
+    objs = [custom_class(field_int=i) for i in range(5)]
+    for obj in objs:
+        repo.add(obj)
+
+    repo.delete_many([objs[1].pk, objs[3].pk])
+    assert repo.get_all() == [objs[0], objs[2], objs[4]]
+
+    # Nothing is deleted if one of the objects does not exist:
+    with pytest.raises(ValueError):
+        repo.delete_many([objs[0].pk, -1])
+    assert len(repo.get_all()) == 3
+
+def test_add_many(repo, custom_class):
+    repo.add(custom_class(field_int=-1))
+
+    objs = [custom_class(field_int=i) for i in range(5)]
+    pks = repo.add_many(objs)
+
+    assert pks == [obj.pk for obj in objs]
+    assert len(set(pks)) == 5
+    assert repo.get_all()[1:] == objs
+
+def test_cannot_add_many_with_filled_pk(repo, custom_class):
+    with pytest.raises(ValueError):
+        repo.add_many([custom_class(), custom_class(pk=1)])
+    assert repo.get_all() == []
+
+def test_add_many_from_generator(repo, custom_class):
+    # Each object has its pk before the next one is requested:
+    def objs():
+        prev = custom_class(field_int=-1)
+        yield prev
+        for _ in range(3):
+            prev = custom_class(field_int=prev.pk)
+            yield prev
+
+    pks = repo.add_many(objs())
+    assert [obj.field_int for obj in repo.get_all()] == [-1] + pks[:-1]
+
+def test_add_many_generator_error_rolls_back(repo, custom_class):
+    objs = [custom_class() for _ in range(3)]
+
+    def failing():
+        yield from objs
+        raise KeyError("parent")
+
+    with pytest.raises(KeyError):
+        repo.add_many(failing())
+    assert repo.get_all() == []
+    assert [obj.pk for obj in objs] == [0, 0, 0]
+
+def test_get_all_by_pattern(repo, custom_class):
+    objs = [custom_class(field_str=s) for s in ["apple", "pineapple", "pear"]]
+    for obj in objs:
+        repo.add(obj)
+
+    assert repo.get_all_by_pattern({'field_str': 'apple'}) == objs[:2]
+
+def test_update_many(repo, custom_class):
+    objs = [custom_class(field_int=i) for i in range(3)]
+    repo.add_many(objs)
+
+    for obj in objs:
+        obj.field_int += 10
+    repo.update_many(objs)
+    assert [obj.field_int for obj in repo.get_all()] == [10, 11, 12]
+
+    # Nothing is updated if one of the objects does not exist:
+    with pytest.raises(ValueError):
+        repo.update_many([custom_class(field_int=0, pk=objs[0].pk),
+                          custom_class(pk=-1)])
+    assert repo.get(objs[0].pk).field_int == 10
+
+def test_restore_many(repo, custom_class):
+    objs = [custom_class(field_int=i) for i in range(3)]
+    repo.add_many(objs)
+    repo.delete_many([objs[0].pk, objs[2].pk])
+
+    repo.restore_many([objs[0], objs[2]])
+    assert repo.get_all() == objs
+
+    # Taken primary keys are not overwritten:
+    with pytest.raises(ValueError):
+        repo.restore_many([custom_class(field_int=-1, pk=objs[1].pk)])
+    assert repo.get(objs[1].pk) == objs[1]
+
+def test_transaction_spans_repositories(tmp_path, custom_class):
+    db_file = str(tmp_path / "transaction.db")
+    repo = SQLiteRepository(db_file, custom_class)
+    budget_repo = SQLiteRepository(db_file, Budget)
+
+    # Writes of both repositories (and nested transactions) are one unit:
+    with pytest.raises(ValueError):
+        with repo.transaction():
+            repo.add(custom_class(field_int=1))
+            with budget_repo.transaction():
+                budget_repo.add(Budget(100, "day"))
+            raise ValueError("second step failed")
+    assert repo.get_all() == [] and budget_repo.get_all() == []
+
+    with repo.transaction():
+        repo.add(custom_class(field_int=1))
+        budget_repo.add(Budget(100, "day"))
+    assert len(repo.get_all()) == 1 and len(budget_repo.get_all()) == 1
+
+def test_data_version(tmp_path, custom_class):
+    db_file = str(tmp_path / "version.db")
+    repo = SQLiteRepository(db_file, custom_class)
+    version = repo.data_version()
+
+    # Writes made through another object (or process) count as well:
+    other = SQLiteRepository(db_file, Budget)
+    other.add(Budget(100, "day"))
+    assert repo.data_version() > version
+
+    # A transaction is one change, a failed one is none:
+    version = repo.data_version()
+    with repo.transaction():
+        repo.add(custom_class(field_int=1))
+        other.add(Budget(200, "week"))
+    assert repo.data_version() == version + 1
+    with pytest.raises(ValueError):
+        with repo.transaction():
+            repo.add(custom_class(field_int=2))
+            raise ValueError("rolled back")
+    assert repo.data_version() == version + 1
+
+#####################
+## Tree operations ##
+#####################
+
+@dataclass
+class Node:
+    name   : str
+    parent : int | None = None
+    pk     : int = 0
+
+@pytest.fixture(params=[None, "parent"], ids=["recursive", "closure"])
+def tree_repo(request):
+    with sqlite3.connect(DB_FILE) as con:
+        con.execute("DROP TABLE IF EXISTS node")
+        con.execute("DROP TABLE IF EXISTS node_closure")
+    con.close()
+
+    # 1 -> (2 -> (4 -> 5), 3), 6
+    repo = SQLiteRepository(db_file=DB_FILE, cls=Node, tracer=QueryTracer(10),
+                            closure=request.param)
+    repo.add_many([Node("1"), Node("2", 1), Node("3", 1), Node("4", 2),
+                   Node("5", 4), Node("6")])
+    repo.tracer.clear()
+    return repo
+
+def test_get_descendants(tree_repo):
+    assert [n.name for n in tree_repo.get_descendants(1)] == ["2", "3", "4", "5"]
+    assert tree_repo.get_descendants(6) == []
+    assert len(tree_repo.tracer.queries) == 2
+
+def test_get_ancestors(tree_repo):
+    assert [n.name for n in tree_repo.get_ancestors(5)] == ["4", "2", "1"]
+    assert tree_repo.get_ancestors(1) == []
+
+def test_unknown_tree_field(tree_repo):
+    with pytest.raises(ValueError):
+        tree_repo.get_descendants(1, field="name; DROP TABLE node")
+
+def test_delete_subtree(tree_repo):
+    deleted = tree_repo.delete_subtree(2)
+
+    assert [n.name for n in deleted] == ["2", "4", "5"]
+    assert [n.name for n in tree_repo.get_all()] == ["1", "3", "6"]
+
+    with pytest.raises(ValueError):
+        tree_repo.delete_subtree(2)
+
+def test_move_subtree(tree_repo):
+    tree_repo.move_subtree(2, 6)
+    assert [n.name for n in tree_repo.get_ancestors(5)] == ["4", "2", "6"]
+
+    tree_repo.move_subtree(2, None)
+    assert tree_repo.get(2).parent is None
+
+    # No cycles:
+    with pytest.raises(ValueError):
+        tree_repo.move_subtree(2, 5)
+    assert tree_repo.get(2).parent is None
+
+def test_tree_with_cycle_terminates(tree_repo):
+    tree_repo.update(Node("1", 5, pk=1))
+    assert {n.name for n in tree_repo.get_descendants(1)} == {"2", "3", "4", "5"}
+    assert [n.name for n in tree_repo.get_ancestors(1)] == ["5", "4", "2"]
+
+def test_large_subtree_single_statement(tree_repo):
+    # A 5000-node tree (four children per node) is handled by one
+    # statement per operation:
+    first = len(tree_repo.get_all()) + 1
+    nodes = [Node("root")] + [Node(str(i), first + i // 4) for i in range(4999)]
+    tree_repo.add_many(nodes)
+    root = nodes[0]
+    tree_repo.tracer.clear()
+
+    assert len(tree_repo.get_descendants(root.pk)) == 4999
+    assert len(tree_repo.get_ancestors(nodes[-1].pk)) == 6
+    assert len(tree_repo.delete_subtree(root.pk)) == 5000
+    assert len(tree_repo.tracer.queries) == 4
+
+def test_closure_table_follows_changes(tree_repo):
+    if tree_repo.closure_table is None:
+        pytest.skip("no closure table")
+
+    def pairs():
+        with sqlite3.connect(DB_FILE) as con:
+            rows = con.execute("SELECT ancestor, descendant, depth FROM node_closure "
+                               "WHERE depth > 0").fetchall()
+        con.close()
+        return set(rows)
+
+    assert pairs() == {(1, 2, 1), (1, 3, 1), (1, 4, 2), (1, 5, 3),
+                       (2, 4, 1), (2, 5, 2), (4, 5, 1)}
+
+    tree_repo.move_subtree(4, 6)
+    assert pairs() == {(1, 2, 1), (1, 3, 1), (6, 4, 1), (6, 5, 2), (4, 5, 1)}
+
+    # Children of a removed node become roots:
+    tree_repo.delete(6)
+    assert pairs() == {(1, 2, 1), (1, 3, 1), (4, 5, 1)}
+
+    before = pairs()
+    tree_repo.rebuild_closure()
+    assert pairs() == before
+
+def test_closure_filled_for_existing_tree(tree_repo):
+    repo = SQLiteRepository(db_file=DB_FILE, cls=Node, closure="parent")
+    assert [n.name for n in repo.get_ancestors(5)] == ["4", "2", "1"]
+
+def test_get_all_in_subtree(tree_repo, custom_class):
+    @dataclass
+    class Leaf:
+        node : int
+        pk   : int = 0
+
+    with sqlite3.connect(DB_FILE) as con:
+        con.execute("DROP TABLE IF EXISTS leaf")
+    con.close()
+
+    leaves = SQLiteRepository(db_file=DB_FILE, cls=Leaf, indexes=("node", "missing"))
+    leaves.add_many([Leaf(node) for node in [1, 2, 5, 3, 6]])
+
+    subtree = leaves.get_all_in_subtree("node", tree_repo, 2)
+    assert [leaf.node for leaf in subtree] == [2, 5]
+    assert len(leaves.get_all_in_subtree("node", tree_repo, 1)) == 4
+
+
+
+#####################
+## Summary methods ##
+#####################
+
+@pytest.fixture(params=[None, SUMMARY_FIELDS], ids=["scan", "summary"])
+def expense_repo(request, tmp_path):
+    repo = SQLiteRepository(db_file=str(tmp_path / "summary.db"), cls=Expense,
+                            summary=request.param)
+    repo.add_many([Expense(10, 1, expense_date=datetime(2023, 3, 1, 9)),
+                   Expense(5, 1, expense_date=datetime(2023, 3, 1, 20)),
+                   Expense(7, 2, expense_date=datetime(2023, 3, 2)),
+                   Expense(100, 1, expense_date="2023-04-01\t10:00")])
+    yield repo
+    repo.close()
+
+def test_get_totals(expense_repo):
+    assert expense_repo.get_totals('day') == {('2023-03-01', 1): (15, 2),
+                                              ('2023-03-02', 2): (7, 1),
+                                              ('2023-04-01', 1): (100, 1)}
+    assert expense_repo.get_totals('month', '2023-03', '2023-03') == {
+        ('2023-03', 1): (15, 2), ('2023-03', 2): (7, 1)}
+    assert expense_repo.get_totals('day', first='2023-03-02') == {
+        ('2023-03-02', 2): (7, 1), ('2023-04-01', 1): (100, 1)}
+
+    with pytest.raises(ValueError):
+        expense_repo.get_totals('year')
+
+def test_totals_follow_changes(expense_repo):
+    exp = expense_repo.get(1)
+    exp.amount, exp.category = 20, 2
+    expense_repo.update(exp)
+    expense_repo.delete(2)
+    expense_repo.delete_many([4])
+    expense_repo.restore_many([Expense(5, 1, expense_date=datetime(2023, 3, 1), pk=2)])
+
+    assert expense_repo.get_totals('month') == {('2023-03', 1): (5, 1),
+                                                ('2023-03', 2): (27, 2)}
+    assert expense_repo.check_totals() == {}
+
+def test_check_and_rebuild_totals(tmp_path):
+    db_file = str(tmp_path / "summary.db")
+    repo = SQLiteRepository(db_file=db_file, cls=Expense, summary=SUMMARY_FIELDS)
+    repo.add(Expense(10, 1, expense_date=datetime(2023, 3, 1)))
+
+    # Changes made around the triggers:
+    with sqlite3.connect(db_file) as con:
+        con.execute("UPDATE expense_monthly SET total = 1")
+        con.execute("DELETE FROM expense_daily")
+    con.close()
+
+    assert repo.check_totals() == {('day', '2023-03-01', 1): ((0, 0), (10, 1)),
+                                   ('month', '2023-03', 1): ((1, 1), (10, 1))}
+    repo.rebuild_totals()
+    assert repo.check_totals() == {}
+    assert repo.get_totals('day') == {('2023-03-01', 1): (10, 1)}
+    repo.close()
+
+def test_check_totals_does_not_block_writers(tmp_path):
+    db_file = str(tmp_path / "check.db")
+    repo = SQLiteRepository(db_file=db_file, cls=Expense, summary=SUMMARY_FIELDS,
+                            wal=True, retry=RetryPolicy(max_wait=0.1))
+    repo.add(Expense(10, 1, expense_date=datetime(2023, 3, 1)))
+    version = repo.data_version()
+
+    # Another connection holds the write lock during the check:
+    con = sqlite3.connect(db_file, isolation_level=None)
+    con.execute("BEGIN IMMEDIATE")
+    assert repo.check_totals() == {}
+    con.execute("ROLLBACK")
+    con.close()
+
+    # Nothing is written by the check:
+    assert repo.data_version() == version
+    repo.close()
+
+def test_summary_filled_for_existing_rows(tmp_path):
+    db_file = str(tmp_path / "summary.db")
+    SQLiteRepository(db_file=db_file, cls=Expense).add(
+        Expense(10, 1, expense_date=datetime(2023, 3, 1)))
+
+    repo = SQLiteRepository(db_file=db_file, cls=Expense, summary=SUMMARY_FIELDS)
+    assert repo.get_totals('month') == {('2023-03', 1): (10, 1)}
+
+    # Models without the summed up fields get no summary tables:
+    assert SQLiteRepository(db_file=db_file, cls=Node,
+                            summary=SUMMARY_FIELDS).summary_fields is None
+
+def test_new_fields_added_as_columns(tmp_path):
+    db_file = str(tmp_path / "budget.db")
+    with sqlite3.connect(db_file) as con:
+        con.execute("CREATE TABLE budget (limitation, period, spent)")
+        con.execute("INSERT INTO budget VALUES (100, 'day', 5)")
+    con.close()
+
+    repo = SQLiteRepository(db_file=db_file, cls=Budget)
+    old, = repo.get_all()
+    assert (old.period, old.spent, old.window) == (Period.DAY, 5, 0)
+
+    repo.add(Budget(1000, "7d"))
+    assert repo.get(2).name == "7d"
+    repo.close()
+
+    # The columns are added once:
+    assert len(SQLiteRepository(db_file=db_file, cls=Budget).get_all()) == 2
+
+def test_iter_columns(expense_repo):
+    chunks = list(expense_repo.iter_columns(['amount', 'category'], after=1,
+                                            chunk_size=2))
+    assert chunks == [[(2, 5, 1), (3, 7, 2)], [(4, 100, 1)]]
+    assert list(expense_repo.iter_columns(['amount'], after=4)) == []
+
+    with pytest.raises(ValueError):
+        next(expense_repo.iter_columns(['unknown']))
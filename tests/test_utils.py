@@ -1,9 +1,10 @@
 import tempfile
+from datetime import datetime
 from textwrap import dedent
 
 import pytest
 
-from bookkeeper.utils import read_tree
+from bookkeeper.utils import iter_tree, read_tree, to_datetime, to_epoch
 
 
 def test_create_tree():
@@ -53,6 +54,26 @@ def test_indentation_error():
         read_tree(text.splitlines())
 
 
+def test_iter_tree_line_numbers():
+    lines = ['parent1', '', '    child1', '        grandchild', '      child2']
+    tree = iter_tree(lines)
+    assert next(tree) == (1, 'parent1', None)
+    assert next(tree) == (3, 'child1', 'parent1')
+    assert next(tree) == (4, 'grandchild', 'child1')
+    with pytest.raises(IndentationError) as exc_info:
+        next(tree)
+    assert exc_info.value.lineno == 5
+    assert 'line 5' in str(exc_info.value)
+
+
+def test_iter_tree_is_lazy():
+    def lines():
+        yield 'parent'
+        raise AssertionError('read too far')
+
+    assert next(iter_tree(lines())) == (1, 'parent', None)
+
+
 def test_with_file():
     text = dedent('''
         parent1
@@ -71,3 +92,17 @@ def test_with_file():
             ('child2', 'parent1'),
             ('parent2', None)
         ]
+
+
+def test_to_datetime():
+    date = datetime(2023, 3, 13, 15, 30)
+    assert to_datetime(date) is date
+    assert to_datetime("2023-03-13 15:30") == date
+    assert to_datetime("2023-03-13\t15:30") == date
+    with pytest.raises(ValueError):
+        to_datetime("13.03.2023")
+
+
+def test_to_epoch():
+    assert to_epoch([datetime(1970, 1, 2), "1970-01-01\t00:01",
+                     "1970-01-01 00:00:01.500000"]).tolist() == [86400, 60, 1]
@@ -1,8 +1,11 @@
+from datetime import date
+
 from pytestqt.qt_compat import qt_api
 
 from bookkeeper.view.budget_table import BudgetTableWidget, LabeledBudgetTable
 
-from bookkeeper.models.budget import Budget
+from bookkeeper.models.budget   import Budget, Period
+from bookkeeper.models.forecast import Forecast
 
 test_data = [["1_1", "1_2", "1_3", 1],
              ["2_1", "2_2", "2_3", 2],]
@@ -95,4 +98,52 @@ def test_set_budgets(qtbot):
         assert str(int(b.limitation) - int(b.spent)) == w_data[2]
         assert str(b.pk)                             == w_data[3]
 
-    assert widget.data[2] == ["- Не установлен -", "", "", ""]
\ No newline at end of file
+    assert widget.data[2] == ["- Не установлен -", "", "", ""]
+
+def test_set_forecasts(qtbot):
+    widget = LabeledBudgetTable(budget_modify_handler)
+    qtbot.addWidget(widget)
+
+    widget.set_forecasts([Forecast(Period.WEEK, 8000, date(2023, 3, 18)),
+                          Forecast(Period.DAY, 500)])
+    assert widget.forecast_data == [["500", "-"], ["8000", "18.03.2023"],
+                                    ["", ""], ["", ""]]
+
+    # Forecasts are read-only and stay after the budgets update:
+    widget.set_budgets([Budget(1000, "day", spent=100)])
+    assert widget.table.item(1, 3).text() == "8000"
+    assert widget.table.item(1, 4).text() == "18.03.2023"
+    assert widget.table.item(0, 3).flags() == qt_api.QtCore.Qt.ItemIsEnabled
+
+def test_rolling_budgets_are_shown(qtbot):
+    periods = []
+    widget = LabeledBudgetTable(lambda pk, new_limit, period: periods.append(period))
+    qtbot.addWidget(widget)
+
+    widget.set_forecasts([Forecast(Period.DAY, 500)])
+    widget.set_budgets([Budget(7000, "7d", spent=10, pk=1),
+                        Budget(100, "hour", pk=2),
+                        Budget(300, "24h", pk=3)])
+
+    # Hourly and rolling budgets get own rows after the calendar ones:
+    assert widget.data[0] == ["- Не установлен -", "", "", ""]
+    assert widget.periods == ["day", "week", "month", "hour", "24h", "7d"]
+    assert widget.data[3:] == [["100", "0", "100", "2"],
+                               ["300", "0", "300", "3"],
+                               ["7000", "10", "6990", "1"]]
+    assert widget.table.rowCount() == 6
+    assert widget.table.verticalHeaderItem(5).text() == "7d"
+
+    # Their forecast cells stay empty:
+    assert widget.forecast_data[0] == ["500", "-"]
+    assert widget.forecast_data[3:] == [["", ""]] * 3
+    assert widget.table.item(5, 3).text() == ""
+
+    # The rolling budget can be edited from its row:
+    widget.table.cellDoubleClicked.emit(5, 0)
+    widget.table.cellChanged.emit(5, 0)
+    assert periods == ["7d"]
+
+    # Removed rolling budgets drop their rows:
+    widget.set_budgets([])
+    assert widget.table.rowCount() == 4
@@ -124,4 +124,34 @@ def test_delete_expenses(qtbot):
         )
 
     # Expect delete handler to be called:
-    assert exp_delete_handler.was_called == True
\ No newline at end of file
+    assert exp_delete_handler.was_called == True
+
+
+def test_incremental_updates(qtbot):
+    # Create widget with initial expenses:
+    widget = LabeledExpenseTable(category_pk_to_name,
+                                 expense_modify_handler,
+                                 exp_delete_handler)
+    qtbot.addWidget(widget)
+
+    exps = [Expense(100 * i, 1, pk=i) for i in range(1, 26)]
+    widget.set_expenses(exps[:24])
+
+    # Add rows one by one (the table grows past the initial size):
+    widget.expense_added(exps[24])
+    assert widget.table.rowCount() == 25
+    assert widget.table.item(24, 1).text() == "2500"
+    assert widget.rows[25] == 24
+
+    # Change a row in place:
+    widget.expense_changed(Expense(7, 1, pk=3))
+    assert widget.table.item(2, 1).text() == "7"
+    assert widget.data[2][1] == "7"
+
+    # Remove rows, the rows below are shifted:
+    widget.expenses_removed({2, 4, 100})
+    assert [exp.pk for exp in widget.expenses[:3]] == [1, 3, 5]
+    assert widget.table.item(2, 1).text() == "500"
+    assert [row[-1] for row in widget.data] == [str(exp.pk) for exp in widget.expenses]
+    assert widget.rows == {exp.pk: i for i, exp in enumerate(widget.expenses)}
+    assert widget.table.rowCount() == 23
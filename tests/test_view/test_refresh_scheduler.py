@@ -0,0 +1,125 @@
+from bookkeeper.view.refresh_scheduler import RefreshScheduler
+
+from bookkeeper.models.category import Category
+from bookkeeper.models.expense  import Expense
+from bookkeeper.models.budget   import Budget, Period
+from bookkeeper.models.forecast import Forecast
+
+class RecordingView:
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name, args))
+
+def test_immediate_flush_without_batch():
+    view    = RecordingView()
+    refresh = RefreshScheduler(view)
+
+    cats = [Category("cat", pk=1)]
+    refresh.set_categories(cats)
+
+    assert view.calls       == [("set_categories", (cats,))]
+    assert refresh.dirty    == False
+
+def test_batch_coalesces_sections():
+    view    = RecordingView()
+    refresh = RefreshScheduler(view)
+
+    bdgs = [Budget(100, "day")]
+    with refresh.batch():
+        refresh.set_categories([])
+        refresh.set_budgets([])
+        refresh.set_categories([Category("cat", pk=1)])
+        refresh.set_budgets(bdgs)
+
+        # Nested batch does not flush:
+        with refresh.batch():
+            refresh.set_budgets(bdgs)
+        assert view.calls == []
+
+    # Each section is pushed once with the latest value:
+    assert [name for name, _ in view.calls] == ["set_categories", "set_budgets"]
+    assert view.calls[1][1] == (bdgs,)
+    assert refresh.flush_count == 1
+
+def test_forecasts_follow_budgets():
+    view    = RecordingView()
+    refresh = RefreshScheduler(view)
+
+    fcts = [Forecast(Period.DAY, 50)]
+    with refresh.batch():
+        refresh.set_forecasts([])
+        refresh.set_budgets([])
+        refresh.set_forecasts(fcts)
+        assert refresh.dirty == True
+
+    assert view.calls == [("set_budgets", ([],)), ("set_forecasts", (fcts,))]
+
+def test_expense_deltas_are_merged():
+    view    = RecordingView()
+    refresh = RefreshScheduler(view)
+
+    exp1, exp2, exp3 = [Expense(i, 1, pk=i) for i in (1, 2, 3)]
+    exp2_new = Expense(20, 1, pk=2)
+    with refresh.batch():
+        refresh.expense_added(exp1)
+        refresh.expense_changed(exp1)
+        refresh.expense_changed(exp2)
+        refresh.expense_changed(exp2_new)
+        refresh.expense_added(exp3)
+        refresh.expenses_removed({3, 4})
+
+    assert view.calls == [("expenses_removed", ({4},)),
+                          ("expense_added",    (exp1,)),
+                          ("expense_changed",  (exp2_new,))]
+
+def test_full_list_supersedes_deltas():
+    view    = RecordingView()
+    refresh = RefreshScheduler(view)
+
+    exps = [Expense(1, 1, pk=1)]
+    new_exp = Expense(2, 1, pk=2)
+    with refresh.batch():
+        refresh.expense_changed(exps[0])
+        refresh.set_expenses(exps)
+        refresh.expense_added(new_exp)
+
+    assert view.calls == [("set_expenses",  (exps,)),
+                          ("expense_added", (new_exp,))]
+
+def test_debounced_schedule():
+    view      = RecordingView()
+    scheduled = []
+    refresh   = RefreshScheduler(view, delay=0.05,
+                                 schedule=lambda delay, cb: scheduled.append((delay, cb)))
+
+    refresh.set_categories([])
+    refresh.set_budgets([])
+
+    # One pending callback for all the changes:
+    assert len(scheduled) == 1
+    assert scheduled[0][0] == 0.05
+    assert view.calls == []
+
+    scheduled[0][1]()
+    assert [name for name, _ in view.calls] == ["set_categories", "set_budgets"]
+
+    # Nothing to do on a spare callback:
+    scheduled[0][1]()
+    assert refresh.flush_count == 1
+
+def test_batched_flushes_on_error():
+    view    = RecordingView()
+    refresh = RefreshScheduler(view)
+
+    def operation():
+        refresh.set_budgets([])
+        raise ValueError("test")
+
+    try:
+        refresh.batched(operation)()
+    except ValueError:
+        pass
+
+    assert view.calls == [("set_budgets", ([],))]
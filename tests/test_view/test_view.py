@@ -2,6 +2,7 @@ from pytestqt.qt_compat import qt_api
 
 from bookkeeper.view.view       import View, try_for_widget
 from bookkeeper.models.category import Category
+from bookkeeper.models.category_index import CategoryIndex
 from bookkeeper.models.expense  import Expense
 from bookkeeper.models.budget   import Budget
 
@@ -226,4 +227,43 @@ def test_not_on_budget_message(monkeypatch):
     view.not_on_budget_message()
 
     # Expect message to appear:
-    assert monkey_func.was_called == True
\ No newline at end of file
+    assert monkey_func.was_called == True
+def test_shared_category_index():
+    view = View()
+
+    index = CategoryIndex([Category("cat1", pk=1)])
+    view.set_category_index(index)
+    view.set_categories([])
+
+    # The shared index is maintained by the presenter:
+    assert view.category_pk_to_name(1) == "cat1"
+    index.add(Category("cat2", pk=2))
+    assert view.category_pk_to_name(2) == "cat2"
+
+def test_call_later(qtbot):
+    view = View()
+
+    def callback():
+        callback.was_called = True
+
+    callback.was_called = False
+
+    view.call_later(0.001, callback)
+    assert callback.was_called == False
+
+    qtbot.waitUntil(lambda: callback.was_called)
+
+def test_ledgers(qtbot):
+    view = View()
+    assert view.ledger_box.isHidden()
+
+    switched = []
+    view.set_ledger_switch_handler(switched.append)
+    view.set_ledgers(["дача", "дом"], "дом")
+
+    assert not view.ledger_box.isHidden()
+    assert view.ledger_box.items == ["дача", "дом"]
+    assert view.ledger_box.text() == "дом"
+
+    view.ledger_box.combo_box.textActivated.emit("дача")
+    assert switched == ["дача"]
@@ -0,0 +1,151 @@
+import threading
+
+from pytestqt.qt_compat import qt_api
+
+from bookkeeper.models.category       import Category
+from bookkeeper.models.category_index import CategoryIndex
+from bookkeeper.view.worker import GuiInvoker, Worker, in_background
+from bookkeeper.view.view   import View
+
+class Recorder:
+    def __init__(self):
+        self.errors  = []
+        self.busy    = []
+        self.threads = set()
+
+    def on_error(self, msg):
+        self.threads.add(threading.current_thread())
+        self.errors.append(msg)
+
+    def on_busy(self, busy):
+        self.threads.add(threading.current_thread())
+        self.busy.append(busy)
+
+def test_invoker_runs_in_gui_thread(qtbot):
+    invoker = GuiInvoker()
+    threads = []
+
+    thread = threading.Thread(
+        target=lambda: invoker.call(lambda: threads.append(threading.current_thread())))
+    thread.start()
+    thread.join()
+
+    qtbot.waitUntil(lambda: len(threads) == 1)
+    assert threads == [threading.main_thread()]
+
+def test_operations_run_in_order(qtbot):
+    rec    = Recorder()
+    worker = Worker(rec.on_error, rec.on_busy)
+
+    done    = []
+    threads = set()
+    def operation(i):
+        threads.add(threading.current_thread())
+        done.append(i)
+
+    for i in range(20):
+        worker.submit(operation, i)
+    assert worker.wait(5000)
+
+    assert done == list(range(20))
+    assert threading.main_thread() not in threads
+
+    # Busy state alternates (the worker may go idle between submissions),
+    # ends idle and is reported in the GUI thread:
+    qtbot.waitUntil(lambda: rec.busy[-1:] == [False])
+    assert rec.busy == [True, False] * (len(rec.busy) // 2)
+    assert rec.threads == {threading.main_thread()}
+
+def test_errors_are_marshalled(qtbot):
+    rec    = Recorder()
+    worker = Worker(rec.on_error, rec.on_busy)
+
+    def operation():
+        raise ValueError("test")
+
+    in_background(operation, worker)()
+    assert worker.wait(5000)
+
+    qtbot.waitUntil(lambda: rec.errors == ["test"])
+    assert rec.threads == {threading.main_thread()}
+
+def test_superseded_operations_are_cancelled(qtbot):
+    rec    = Recorder()
+    worker = Worker(rec.on_error, rec.on_busy)
+
+    release = threading.Event()
+    done    = []
+
+    worker.submit(release.wait, 5)
+    for i in range(3):
+        worker.submit(done.append, i, key="budget")
+    worker.submit(done.append, "other", key="other")
+
+    release.set()
+    assert worker.wait(5000)
+
+    assert done         == [2, "other"]
+    assert worker.cancelled == 2
+
+def test_view_background_handlers(qtbot, monkeypatch):
+    view = View(background=True)
+
+    def monkey_critical(widget, title, msg):
+        monkey_critical.messages.append(msg)
+
+    monkey_critical.messages = []
+    monkeypatch.setattr(qt_api.QtWidgets.QMessageBox, "critical", monkey_critical)
+
+    threads = []
+    def handler(amount, cat_name, comment):
+        threads.append(threading.current_thread())
+        raise ValueError("Введите сумму целым числом.")
+
+    view.set_expense_add_handler(handler)
+    view.add_expense("x", "cat")
+    view.wait_idle()
+
+    assert threads and threads[0] is not threading.main_thread()
+    qtbot.waitUntil(lambda: monkey_critical.messages == ["Введите сумму целым числом."])
+
+def test_background_view_keeps_own_index(qtbot):
+    view  = View(background=True)
+    index = CategoryIndex([Category("cat1", pk=1)])
+
+    # The presenter changes its index in the worker thread, the view
+    # draws the snapshots it is given:
+    view.set_category_index(index)
+    view.set_categories([Category("cat1", pk=1)])
+    index.add(Category("cat2", pk=2))
+
+    assert view.category_index is not index
+    assert view.category_pk_to_name(1) == "cat1"
+    assert view.category_index.get_by_pk(2) is None
+
+def test_refresh_waits_for_queued_operations(qtbot):
+    view    = View(background=True)
+    release = threading.Event()
+    flushes = []
+
+    view.worker.submit(release.wait, 5)
+    view.schedule_refresh(0, lambda: flushes.append(view.worker.busy))
+    qtbot.wait(50)
+    assert flushes == []
+
+    release.set()
+    qtbot.waitUntil(lambda: flushes == [False])
+
+def test_superseded_expense_edits_are_cancelled(qtbot):
+    view    = View(background=True)
+    release = threading.Event()
+    edits   = []
+
+    view.set_expense_modify_handler(lambda pk, attr, value: edits.append(value))
+    view.worker.submit(release.wait, 5)
+    for value in ["1", "2", "3"]:
+        view.modify_expense(1, "amount", value)
+    view.modify_expense(1, "comment", "x")
+
+    release.set()
+    view.wait_idle()
+    assert edits == ["3", "x"]